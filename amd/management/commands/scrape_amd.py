@@ -0,0 +1,35 @@
+"""Scrape processors from AMD's website."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+
+from amd.scraping.processors import get_processor_data
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class Command(BaseCommand):
+    """Scrape processors from AMD's website."""
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Read the page from the response archive instead of amd.com",
+        )
+
+    def handle(self: Command, *args: str, **options: bool) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        try:
+            get_processor_data(replay=options["replay"])
+        except KeyboardInterrupt:
+            msg = "Got keyboard interrupt while scraping AMD"
+            raise CommandError(msg) from KeyboardInterrupt
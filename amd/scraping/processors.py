@@ -4,27 +4,31 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import hishel
 from django.core.management.base import CommandError
 from selectolax.lexbor import LexborHTMLParser, LexborNode
 
 from data_converters import bytes_to_bytes, dollar_to_cents, hertz_an_hertz
+from panso.scraping import get_client
 
 if TYPE_CHECKING:
     from httpx import Response
 
-storage = hishel.FileStorage(ttl=60 * 60 * 24 * 7)  # 1 week
+    from panso.scraping import ScrapingClient
 
 # TODO(TheLovinator): #35 We should email/send Discord webhook if AMD adds or removes product from their site.
 # https://github.com/TheLovinator1/panso.se/issues/35
 
 
-def get_processor_data() -> None:  # noqa: C901, PLR0915, PLR0912
-    """Get all processor data from AMD's website."""
+def get_processor_data(*, replay: bool = False) -> None:  # noqa: C901, PLR0915, PLR0912
+    """Get all processor data from AMD's website.
+
+    Args:
+        replay: Read the page from the response archive instead of amd.com.
+    """
     url = "https://www.amd.com/en/products/specifications/processors"
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0"
-    with hishel.CacheClient(storage=storage) as client:
-        response: Response = client.get(url=url, timeout=5, headers={"User-Agent": user_agent})
+    client: ScrapingClient = get_client(cache=True, replay=replay)
+    response: Response = client.get(url=url, timeout=5, headers={"User-Agent": user_agent})
 
     if response.is_client_error:
         msg: str = f"Got client error while getting processor data. {response.text}"
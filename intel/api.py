@@ -7,22 +7,57 @@ API endpoints:
     - Return the filter data from https://ark.intel.com/content/www/us/en/ark/search/featurefilter.html.
 - /api/v1/intel/processors
     - Return a list of ids for all processors. You can use this to get the data for all processors with the /processors/{id} endpoint.
+    - With ?after=, ?limit= and ?fields=, return a page of processors with the fields asked for, see panso/pagination.py.
 - /api/v1/intel/processors/{product_id}
     - Return the data for a specific processor.
 """  # noqa: E501
 
 from __future__ import annotations
 
-from typing import Any
+from typing import ClassVar
 
-from django.http import HttpRequest, JsonResponse
-from django.shortcuts import get_object_or_404
-from ninja import Router
+from django.db.models import F
+from django.http import HttpRequest  # noqa: TCH002
+from ninja import Field, ModelSchema, Query, Router, Schema
+from ninja.decorators import decorate_view
 
 from intel.models import ArkFilterData, Processor
+from panso.pagination import PageParams, paginate
+from panso.renderers import ErrorOut, ORJSONResponse, schema_fields
+from products.versions import conditional_as
 
 router = Router()
 
+
+class ProcessorIdOut(Schema):
+    """The ID and name of a processor."""
+
+    id: int  # noqa: A003
+    name: str | None
+
+
+class ProcessorOut(ModelSchema):
+    """All the data we have for a processor."""
+
+    # Pydantic fields can't start with an underscore, so these get their name from an alias
+    bit_64: bool | None = Field(None, alias="_64_bit")
+    support_4k: str | None = Field(None, alias="_4k_support")
+
+    class Meta:
+        """Every field but when we added the processor."""
+
+        model = Processor
+        exclude: ClassVar[list[str]] = ["created", "_64_bit", "_4k_support"]
+
+
+# Fields of a processor that ?fields= can ask for, and the fields of ProcessorOut
+PROCESSOR_FIELDS: tuple[str, ...] = tuple(
+    field.name
+    for field in Processor._meta.concrete_fields  # noqa: SLF001
+    if field.name != "product_brief"
+)
+PROCESSOR_OUT_FIELDS: tuple[str, ...] = schema_fields(ProcessorOut)
+
 # TODO(TheLovinator): #30 We should add more OpenAPI documentation for each endpoint.
 # https://github.com/TheLovinator1/panso.se/issues/30
 
@@ -32,47 +67,47 @@ router = Router()
     summary="Return the filter data from https://ark.intel.com/content/www/us/en/ark/search/featurefilter.html.",
     description="Return the filter data from https://ark.intel.com/content/www/us/en/ark/search/featurefilter.html.",
 )
-def return_filter_data(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@decorate_view(conditional_as(ArkFilterData))
+def return_filter_data(request: HttpRequest) -> ORJSONResponse:  # noqa: ARG001
     """Return the filter data from https://ark.intel.com/content/www/us/en/ark/search/featurefilter.html."""
-    try:
-        filters: ArkFilterData = ArkFilterData.objects.get(pk=1)
-        return JsonResponse(filters.json_data, safe=False)
-    except ArkFilterData.DoesNotExist:
-        return JsonResponse([], safe=False)
-    except Exception as e:  # noqa: BLE001
-        return JsonResponse(data={"error": str(e)}, status=500)
+    filters: list = list(ArkFilterData.objects.filter(pk=1).values_list("json_data", flat=True))
+    return ORJSONResponse(filters[0] if filters else [])
 
 
 @router.get(
     path="/processors",
+    response=list[ProcessorIdOut],
     summary="Return a list of ids for all processors.",
-    description="Return a list of ids for all processors. You can use this to get the data for all processors with the /processors/{id} endpoint.",  # noqa: E501
+    description="Return a list of ids for all processors. You can use this to get the data for all processors with the /processors/{id} endpoint.\n\n"  # noqa: E501
+    "With `after`, `limit` or `fields`, return a page of processors ordered by ID, with the fields asked for. "
+    "The `Link` header has the URL of the next page.",
 )
-def return_processor_ids(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
-    """Return a list of ids for all processors."""
-    try:
-        processors = Processor.objects.values_list("product_id", "name")
-        processors = [{"id": p[0], "name": p[1]} for p in processors]
-        return JsonResponse(processors, safe=False)
-    except Exception as e:  # noqa: BLE001
-        return JsonResponse(data={"error": str(e)}, status=500)
+@decorate_view(conditional_as(Processor))
+def return_processor_ids(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
+    """Return a list of ids for all processors, or a page of processors."""
+    if page.requested:
+        return paginate(
+            request,
+            Processor.objects.all(),
+            page,
+            key="product_id",
+            allowed=PROCESSOR_FIELDS,
+            default=("name",),
+            key_as="id",
+        )
+    return ORJSONResponse(list(Processor.objects.values("name", id=F("product_id"))))
 
 
 @router.get(
     path="/processors/{product_id}",
+    response={200: ProcessorOut, 404: ErrorOut},
     summary="Return the data for a specific processor.",
     description="Return the data for a specific processor.",
 )
-def return_processor_data(request: HttpRequest, product_id: int) -> JsonResponse:  # noqa: ARG001
+@decorate_view(conditional_as(Processor))
+def return_processor_data(request: HttpRequest, product_id: int) -> ORJSONResponse:  # noqa: ARG001
     """Return the data for a specific processor."""
-    try:
-        processor: Processor = get_object_or_404(Processor, product_id=product_id)
-        processor_data: dict[str, Any] = processor.__dict__
-        excluded_fields: list[str] = ["created", "modified", "history", "_state"]
-        processor_data = {key: value for key, value in processor_data.items() if key not in excluded_fields}
-        return JsonResponse(data=processor_data, safe=False)
-
-    except Processor.DoesNotExist:
-        return JsonResponse(data=[], safe=False)
-    except Exception as e:  # noqa: BLE001
-        return JsonResponse(data={"error": str(e)}, status=500)
+    processor: dict | None = Processor.objects.filter(product_id=product_id).values(*PROCESSOR_OUT_FIELDS).first()
+    if processor is None:
+        return ORJSONResponse({"error": f"Processor with ID {product_id} not found."}, status=404)
+    return ORJSONResponse(processor)
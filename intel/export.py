@@ -0,0 +1,52 @@
+"""Write every Intel processor to snapshot files, served from /snapshots/intel-processors.<format>.
+
+See panso/snapshots.py.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import orjson
+
+from intel.models import Processor
+from panso.snapshots import write_snapshot
+from panso.streams import STREAM_CHUNK_SIZE, encode_csv, encode_json_array, encode_ndjson
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+# The name of the processor dump in /snapshots/
+PROCESSORS_SNAPSHOT: str = "intel-processors"
+
+# Every column of a processor, in the order they are in the table
+PROCESSOR_COLUMNS: tuple[str, ...] = tuple(field.attname for field in Processor._meta.concrete_fields)  # noqa: SLF001
+
+
+def processor_rows() -> Iterator[tuple]:
+    """Return the values of every processor in the order of PROCESSOR_COLUMNS, read from a server-side cursor."""
+    return (
+        Processor.objects.order_by("product_id").values_list(*PROCESSOR_COLUMNS).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    )
+
+
+def processor_documents() -> Iterator[str]:
+    """Return every processor as JSON text."""
+    for row in processor_rows():
+        yield orjson.dumps(dict(zip(PROCESSOR_COLUMNS, row, strict=True)), default=str).decode()
+
+
+def write_processors_snapshot() -> dict:
+    """Write every processor to a new snapshot, as JSON, NDJSON and CSV.
+
+    Returns:
+        dict: The manifest of the new snapshot.
+    """
+    return write_snapshot(
+        PROCESSORS_SNAPSHOT,
+        {
+            "json": lambda: encode_json_array(processor_documents()),
+            "ndjson": lambda: encode_ndjson(processor_documents()),
+            "csv": lambda: encode_csv(PROCESSOR_COLUMNS, processor_rows()),
+        },
+    )
@@ -0,0 +1,36 @@
+"""Scrape processors from Intel ARK."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+
+from intel.scrape_intel_ark import get_html, process_html
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class Command(BaseCommand):
+    """Scrape processors from Intel ARK."""
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Read the pages from the response archive instead of intel.com",
+        )
+
+    def handle(self: Command, *args: str, **options: bool) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        try:
+            for data in get_html(replay=options["replay"]):
+                process_html(processor_data=data)
+        except KeyboardInterrupt:
+            msg = "Got keyboard interrupt while scraping Intel ARK"
+            raise CommandError(msg) from KeyboardInterrupt
@@ -8,7 +8,6 @@ from itertools import batched
 from typing import TYPE_CHECKING, Any
 
 import dateparser
-import hishel
 from django.db import Error, transaction
 from rich import print
 from rich.console import Console
@@ -39,6 +38,7 @@ from intel.data_mappings import (
     watt_bois,
 )
 from intel.models import Processor
+from panso.scraping import get_client
 
 if TYPE_CHECKING:
     from collections.abc import Callable, Generator
@@ -47,7 +47,6 @@ if TYPE_CHECKING:
     from httpx import Response
 
 
-storage = hishel.FileStorage(ttl=60 * 60 * 24 * 7)  # 1 week
 err_console = Console(stderr=True)
 
 
@@ -59,16 +58,19 @@ class ProcessorData:
     ids: str
 
 
-def get_html() -> Generator[ProcessorData, Any, None]:
-    """Get the HTML from Intel ARK so we can parse it."""
+def get_html(*, replay: bool = False) -> Generator[ProcessorData, Any, None]:
+    """Get the HTML from Intel ARK so we can parse it.
+
+    Args:
+        replay: Read the pages from the response archive instead of intel.com.
+    """
     for batch in list(batched(product_ids, 100)):
         ids: str = ",".join(batch)
         url: str = f"https://www.intel.com/content/www/us/en/products/compare.html?productIds={ids}"
         print(f"Visiting {url}")
-        with hishel.CacheClient(storage=storage) as client:
-            response: Response = client.get(url=url, timeout=60)
-            processor_data: ProcessorData = ProcessorData(html=response.text, ids=ids)
-            yield processor_data
+        response: Response = get_client(cache=True, replay=replay).get(url=url, timeout=60)
+        processor_data: ProcessorData = ProcessorData(html=response.text, ids=ids)
+        yield processor_data
 
 
 def get_recommended_customer_price(node_attributes: dict[str, str | None]) -> int | None:
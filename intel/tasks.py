@@ -3,6 +3,7 @@
 Tasks:
     scrape_intel_ark: Scrape https://www.intel.com/content/www/us/en/products/compare.html.
     get_data_from_ark: Get the data from https://ark.intel.com/content/www/us/en/ark/search/featurefilter.html.
+    write_intel_snapshot: Write every processor to the pre-compressed snapshot files.
 """
 
 from __future__ import annotations
@@ -12,6 +13,7 @@ from playwright.sync_api import Browser, BrowserContext, Page, sync_playwright
 from rich import print
 from rich.pretty import pprint
 
+from intel.export import write_processors_snapshot
 from intel.models import ArkFilterData
 from intel.scrape_intel_ark import get_html, process_html
 
@@ -29,6 +31,7 @@ def scrape_intel_ark() -> None:
     print("Scraping Intel ARK")
     for data in get_html():
         process_html(processor_data=data)
+    write_intel_snapshot.delay()
 
 
 @shared_task(
@@ -55,3 +58,19 @@ def get_data_from_ark() -> None:
         print("Added data to database")
     else:
         print("Result is empty")
+
+
+@shared_task(
+    name="write_intel_snapshot",
+    soft_time_limit=60 * 10,
+    queue="intel_ark",
+)
+def write_intel_snapshot() -> dict:
+    """Write every processor to the pre-compressed snapshot files.
+
+    Returns:
+        dict: The manifest of the new snapshot.
+    """
+    manifest: dict = write_processors_snapshot()
+    print(f"Wrote snapshot {manifest['version']} of {len(manifest['formats'])} formats")
+    return manifest
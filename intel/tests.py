@@ -22,6 +22,8 @@ from data_converters import (
     temp_to_temp,
     watt_to_watt,
 )
+from intel.api import PROCESSOR_OUT_FIELDS, ProcessorOut
+from intel.models import Processor
 
 if TYPE_CHECKING:
     from django.http import HttpResponse
@@ -46,6 +48,32 @@ class IntelTests(TestCase):
         assert response["Content-Type"] == "application/json"
         assert response.json() == []
 
+    def test_get_processor_pages(self: IntelTests) -> None:
+        """Test that the processors can be paged through by ID with the fields asked for."""
+        for product_id in (30, 10, 20):
+            Processor.objects.create(product_id=product_id, name=f"Core {product_id}", total_cores=product_id // 10)
+
+        response: HttpResponse = self.client.get("/api/v1/intel/processors?limit=2&fields=total_cores")
+        assert response.json() == [{"id": 10, "total_cores": 1}, {"id": 20, "total_cores": 2}]
+        assert 'after=20>; rel="next"' in response["Link"]
+        assert self.client.get("/api/v1/intel/processors?after=20").json() == [{"id": 30, "name": "Core 30"}]
+        assert self.client.get("/api/v1/intel/processors?after=x").status_code == 400
+
+    def test_get_processor_data(self: IntelTests) -> None:
+        """Test that a processor has every field of ProcessorOut, and that a missing processor is 404."""
+        Processor.objects.create(product_id=10, name="Core 10", total_cores=4, _64_bit=True)
+
+        response: HttpResponse = self.client.get("/api/v1/intel/processors/10")
+        assert response.status_code == 200
+        processor: dict = response.json()
+        assert set(processor) == set(PROCESSOR_OUT_FIELDS)
+        assert ProcessorOut.model_validate(processor).bit_64 is True
+        assert processor["total_cores"] == 4
+
+        response = self.client.get("/api/v1/intel/processors/20")
+        assert response.status_code == 404
+        assert response.json() == {"error": "Processor with ID 20 not found."}
+
 
 class HertzConversionTest(TestCase):
     """Tests the hertz_an_hertz function."""
@@ -14,13 +14,18 @@ from django.urls import URLPattern, path
 
 from intel.feeds import AtomLatestProcessorsFeed, LatestProcessorsFeed
 from intel.models import Processor
+from products.versions import conditional_as
 
 from . import views
 
 app_name: str = "intel"
 
 urlpatterns: list[URLPattern] = [
-    path(route="", view=cached_view_as(Processor)(views.ProcessorsListView.as_view()), name="index"),
+    path(
+        route="",
+        view=conditional_as(Processor)(cached_view_as(Processor)(views.ProcessorsListView.as_view())),
+        name="index",
+    ),
     path(
         route="processors/<int:processor_id>/",
         view=views.processor,
@@ -31,8 +36,8 @@ urlpatterns: list[URLPattern] = [
         view=views.processor,
         name="detail",
     ),
-    path(route="rss", view=LatestProcessorsFeed()),
-    path(route="atom", view=AtomLatestProcessorsFeed()),
+    path(route="rss", view=conditional_as(Processor)(LatestProcessorsFeed())),
+    path(route="atom", view=conditional_as(Processor)(AtomLatestProcessorsFeed())),
     path(route="xml", view=views.export_as_xml, name="export_as_xml"),
     path(route="json", view=views.export_as_json, name="export_as_json"),
 ]
@@ -23,6 +23,7 @@ from django.views.generic import ListView
 from django_filters import CharFilter, FilterSet, NumberFilter
 
 from intel.models import Processor
+from products.versions import conditional_as
 
 
 class ProcessorsListView(ListView):
@@ -201,6 +202,7 @@ def generate_cpu_information_html(processor: Processor) -> str:  # noqa: C901, P
     """
 
 
+@conditional_as(Processor)
 @cached_view_as(Processor, extra="processor_id")
 def processor(request: HttpRequest, processor_id: int, slug: str | None = None) -> HttpResponse:
     """/intel/processors/{processor_id} page.
@@ -231,6 +233,7 @@ def processor(request: HttpRequest, processor_id: int, slug: str | None = None)
     return HttpResponse(content=template.render(context=context, request=request))
 
 
+@conditional_as(Processor)
 @cached_view_as(Processor)
 def export_as_xml(request: HttpRequest) -> HttpResponse:  # noqa: ARG001
     """Export all processors as XML."""
@@ -241,6 +244,7 @@ def export_as_xml(request: HttpRequest) -> HttpResponse:  # noqa: ARG001
     return response
 
 
+@conditional_as(Processor)
 @cached_view_as(Processor)
 def export_as_json(request: HttpRequest) -> HttpResponse:  # noqa: ARG001
     """Export all processors as JSON."""
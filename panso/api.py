@@ -4,6 +4,9 @@ This contains our API client.
 
 Each Django app has its own router that we add here.
 
+GET endpoints send an ETag and Last-Modified, and answer If-None-Match and If-Modified-Since with
+304 Not Modified when the tables they read haven't changed, see products/versions.py.
+
 We have docs here:
     https://panso.se/api
     https://panso.se/api/v1/docs/redoc
@@ -22,6 +25,7 @@ from ninja.openapi.docs import DocsBase, Redoc, Swagger
 from ninja.parser import Parser
 
 from intel.api import router as intel_router
+from panso.renderers import ORJSONRenderer
 from products.api import router as panso_router
 from webhallen.api import router as webhallen_router
 
@@ -31,7 +35,7 @@ if TYPE_CHECKING:
 
 
 class ORJSONParser(Parser):
-    """Use orjson instead of json for parsing.
+    """Use orjson instead of json for parsing. Responses are encoded with orjson too, see panso/renderers.py.
 
     Args:
         Parser: _description_
@@ -77,6 +81,7 @@ api = NinjaAPI(
     description="API for Panso.se",
     urls_namespace="api-v1",
     parser=ORJSONParser(),
+    renderer=ORJSONRenderer(),
     docs_url="/docs/<engine>",
     docs=MixedDocs(),
 )
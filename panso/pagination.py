@@ -0,0 +1,170 @@
+"""Keyset pagination and field projection for the bulk API endpoints.
+
+Without ?after=, ?limit= or ?fields=, the bulk endpoints return every row like they always have. With any of them
+they return one page: up to `limit` rows with a key after `after`, ordered by the key. If there are more rows,
+the response has a Link header (RFC 8288) with the URL of the next page, which is the same URL with ?after= set
+to the last key of this page. Every page is a range scan on the primary key index, however deep into the table
+it is, instead of an OFFSET that reads and throws away every row before it.
+
+?fields= is a comma-separated list of the fields to return. They are selected in SQL, so a field that isn't asked
+for is never read. The key is always returned.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.db.models import F
+from ninja import Field, Schema
+
+from panso.renderers import ORJSONResponse
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+    from django.db.models import QuerySet
+    from django.http import HttpRequest
+
+# Rows in a page if ?limit= isn't given, and the most it can be
+PAGE_DEFAULT_LIMIT: int = 100
+PAGE_MAX_LIMIT: int = 1000
+
+# Most fields in one ?fields=
+FIELDS_MAX: int = 50
+
+
+class PageParams(Schema):
+    """Query parameters for a page of a bulk endpoint."""
+
+    after: str | None = Field(
+        None,
+        description="Return the rows after this key. Follow the `Link` header instead of building the URL yourself.",
+    )
+    limit: int | None = Field(
+        None,
+        ge=1,
+        le=PAGE_MAX_LIMIT,
+        description=f"Rows in the page, defaults to {PAGE_DEFAULT_LIMIT}.",
+    )
+    fields: str | None = Field(None, description="Comma-separated fields to return, e.g. `ean,name`.")
+
+    @property
+    def requested(self: PageParams) -> bool:
+        """If a page was asked for, instead of every row."""
+        return self.after is not None or self.limit is not None or self.fields is not None
+
+
+def parse_fields(fields: str | None, allowed: Iterable[str], default: Sequence[str]) -> list[str]:
+    """Return the fields in a ?fields= value.
+
+    Args:
+        fields: The comma-separated fields, or None for the default.
+        allowed: The fields that can be asked for.
+        default: The fields to return if none were asked for.
+
+    Raises:
+        ValueError: If no fields, too many fields or unknown fields were asked for.
+
+    Returns:
+        list[str]: The fields, without duplicates.
+    """
+    if fields is None:
+        return list(default)
+
+    names: list[str] = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    if not names or len(names) > FIELDS_MAX:
+        msg: str = f"Ask for between 1 and {FIELDS_MAX} fields"
+        raise ValueError(msg)
+
+    allowed = set(allowed)
+    unknown: list[str] = [name for name in names if name not in allowed]
+    if unknown:
+        msg = f"Unknown fields: {', '.join(unknown)}. Pick from: {', '.join(sorted(allowed))}"
+        raise ValueError(msg)
+    return names
+
+
+def keyset_page(  # noqa: PLR0913
+    rows: QuerySet,
+    key: str,
+    after: object,
+    limit: int,
+    *,
+    descending: bool = False,
+    key_as: str | None = None,
+) -> tuple[list[dict], object]:
+    """Return a page of rows after a key.
+
+    Args:
+        rows: The rows, as dicts from .values(). They must include the key.
+        key: The field to page on. It has to be unique, e.g. the primary key.
+        after: Return the rows after this key, or None for the first page.
+        limit: Rows in the page.
+        descending: Page from the highest key down.
+        key_as: The name of the key in the rows, if .values() renamed it.
+
+    Raises:
+        ValueError: If `after` isn't a valid value for the key.
+
+    Returns:
+        tuple[list[dict], object]: The page and the key to ask for the next page with, or None if this is the last.
+    """
+    if after is not None:
+        rows = rows.filter(**{f"{key}__{'lt' if descending else 'gt'}": after})
+    page: list[dict] = list(rows.order_by(f"-{key}" if descending else key)[: limit + 1])
+
+    # One extra row tells us if there is a next page without asking for an empty one
+    if len(page) <= limit:
+        return page, None
+    return page[:limit], page[limit - 1][key_as or key]
+
+
+def page_response(request: HttpRequest, page: list[dict], next_key: object) -> ORJSONResponse:
+    """Return a page as JSON, with a Link header to the next page if there is one.
+
+    Args:
+        request: The request, its query parameters are kept in the link.
+        page: The rows.
+        next_key: The key from keyset_page().
+
+    Returns:
+        ORJSONResponse: The rows as a JSON array.
+    """
+    response = ORJSONResponse(page)
+    if next_key is not None:
+        query = request.GET.copy()
+        query["after"] = str(next_key)
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"'
+    return response
+
+
+def paginate(  # noqa: PLR0913, PLR0917
+    request: HttpRequest,
+    rows: QuerySet,
+    params: PageParams,
+    key: str,
+    allowed: Iterable[str],
+    default: Sequence[str],
+    key_as: str | None = None,
+) -> ORJSONResponse:
+    """Return a page of a model's rows with the fields that were asked for.
+
+    Args:
+        request: The request.
+        rows: The rows, not yet limited to any fields.
+        params: The query parameters.
+        key: The field to page on, it is always returned.
+        allowed: The fields that can be asked for.
+        default: The fields to return if ?fields= isn't given.
+        key_as: Return the key under this name instead.
+
+    Returns:
+        ORJSONResponse: The page, or an error with status 400.
+    """
+    try:
+        fields: list[str] = [field for field in parse_fields(params.fields, allowed, default) if field != key]
+        values: QuerySet = rows.values(*fields, **{key_as: F(key)}) if key_as else rows.values(key, *fields)
+        page, next_key = keyset_page(values, key, params.after, params.limit or PAGE_DEFAULT_LIMIT, key_as=key_as)
+    except ValueError as e:
+        return ORJSONResponse({"error": str(e)}, status=400)
+    return page_response(request, page, next_key)
@@ -0,0 +1,95 @@
+"""Encode API responses with orjson instead of the json module.
+
+ORJSONRenderer renders everything Ninja builds a response for itself, like validation errors. Our endpoints
+return ORJSONResponse, a JsonResponse that is encoded with orjson. They read the rows with .values() and the
+fields of their response schema, so the rows already have the shape of the schema, and are encoded as they are
+instead of being validated by Ninja again for every request. See the benchmark_api command for how much faster
+this is.
+
+The output is the same as DjangoJSONEncoder's, except that times keep their microseconds.
+"""
+
+from __future__ import annotations
+
+import datetime
+import decimal
+import ipaddress
+from typing import TYPE_CHECKING, Any
+
+import orjson
+from django.http import HttpResponse
+from django.utils.duration import duration_iso_string
+from django.utils.functional import Promise
+from ninja import Schema
+from ninja.renderers import BaseRenderer
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from django.http import HttpRequest
+
+JSON_CONTENT_TYPE: str = "application/json"
+
+# Non-str dict keys like product IDs are allowed, like the json module allows them, and UTC is written as Z
+ORJSON_OPTIONS: int = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+class ErrorOut(Schema):
+    """The body of an error response."""
+
+    error: str
+
+
+def schema_fields(schema: type[Schema]) -> tuple[str, ...]:
+    """Return the fields of a response schema by the name they have in the JSON, to read with .values()."""
+    return tuple(field.alias or name for name, field in schema.model_fields.items())
+
+
+def orjson_default(value: object) -> Any:  # noqa: ANN401
+    """Return a value orjson can encode for the types it doesn't know, like DjangoJSONEncoder does.
+
+    Args:
+        value: The value orjson couldn't encode.
+
+    Raises:
+        TypeError: If we don't know how to encode it either.
+
+    Returns:
+        Any: A value orjson can encode.
+    """
+    if isinstance(value, decimal.Decimal | Promise | ipaddress.IPv4Address | ipaddress.IPv6Address):
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    msg: str = f"Object of type {type(value).__name__} is not JSON serializable"
+    raise TypeError(msg)
+
+
+def orjson_dumps(data: object) -> bytes:
+    """Encode data as JSON with orjson."""
+    return orjson.dumps(data, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """Render Ninja responses with orjson."""
+
+    media_type: str = JSON_CONTENT_TYPE
+
+    def render(self: ORJSONRenderer, request: HttpRequest, data: object, *, response_status: int) -> bytes:  # noqa: ARG002, PLR6301
+        """Encode the data of a response."""
+        return orjson_dumps(data)
+
+
+class ORJSONResponse(HttpResponse):
+    """A JsonResponse that is encoded with orjson. Anything can be encoded, not only dicts."""
+
+    def __init__(self: ORJSONResponse, data: object, **kwargs: Any) -> None:  # noqa: ANN401
+        """Encode the data.
+
+        Args:
+            data: The data to encode.
+            **kwargs: Passed to HttpResponse, e.g. status.
+        """
+        kwargs.setdefault("content_type", JSON_CONTENT_TYPE)
+        super().__init__(content=orjson_dumps(data), **kwargs)
@@ -0,0 +1,28 @@
+"""HTTP subsystem shared by the Webhallen, Intel and AMD scrapers."""
+
+from __future__ import annotations
+
+from panso.scraping.archive import NotArchivedError, PruneStats, ResponseArchive, archive_if_enabled, get_archive
+from panso.scraping.client import AsyncScrapingClient, RetryableStatusError, ScrapingClient, get_client
+from panso.scraping.limits import HostPolicy
+from panso.scraping.metrics import RequestMetric, ScrapeMetrics, metrics
+from panso.scraping.sitemap import SitemapEntry, parse_sitemap, stream_sitemap
+
+__all__: list[str] = [
+    "AsyncScrapingClient",
+    "HostPolicy",
+    "NotArchivedError",
+    "PruneStats",
+    "RequestMetric",
+    "ResponseArchive",
+    "RetryableStatusError",
+    "ScrapeMetrics",
+    "ScrapingClient",
+    "SitemapEntry",
+    "archive_if_enabled",
+    "get_archive",
+    "get_client",
+    "metrics",
+    "parse_sitemap",
+    "stream_sitemap",
+]
@@ -0,0 +1,583 @@
+"""Archive of every raw response our scrapers get, and transports that write to and replay from it.
+
+Layout of the archive directory (SCRAPING_ARCHIVE_DIR in settings.py):
+    objects/ab/abcdef....zst    Response bodies, zstd-compressed and named after the SHA-256 of the body.
+    index.sqlite3               One row per fetch: URL, fetch time, status, headers and which body it got.
+
+Bodies are content-addressed, so a product that hasn't changed since the last scrape costs one index row
+and no extra disk space. ResponseArchive.prune() removes old fetches and the bodies only they used, see the
+prune_archive command.
+
+ArchiveTransport saves responses as they come in from the network. Bodies are decoded, hashed and
+compressed while the client reads them, so archiving a large sitemap doesn't mean holding it in memory.
+AsyncArchiveTransport does the compressing in a thread, so it doesn't hold up the event loop.
+ReplayTransport answers requests with the latest archived response for the URL instead of going to the
+network, so parsers can be re-run over a full catalog without hitting the vendors.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import brotli
+import httpx
+import zstandard
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator
+
+# How much of a body we compress or decompress at a time
+CHUNK_SIZE: int = 64 * 1024
+
+# The body we store is already decoded, so these no longer describe it
+SKIPPED_HEADERS: frozenset[str] = frozenset({"content-encoding", "content-length", "transfer-encoding"})
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_url_fetched_at ON responses (url, fetched_at);
+"""
+
+
+class NotArchivedError(httpx.RequestError):
+    """We are replaying and the archive has no response for the URL."""
+
+
+@dataclass(frozen=True)
+class ArchivedResponse:
+    """One fetch of a URL."""
+
+    url: str
+    fetched_at: datetime.datetime
+    status: int
+    headers: list[tuple[str, str]]
+    digest: str
+    size: int
+
+
+@dataclass(frozen=True)
+class PruneStats:
+    """What ResponseArchive.prune() removed."""
+
+    fetches: int
+    bodies: int
+    freed_bytes: int
+
+
+class BodyWriter:
+    """Hash and compress a response body into the archive while it is being downloaded.
+
+    Nothing shows up in the archive until commit() is called, so a body that was only partly downloaded
+    is never archived.
+    """
+
+    def __init__(
+        self: BodyWriter,
+        archive: ResponseArchive,
+        url: str,
+        status: int,
+        headers: list[tuple[str, str]],
+    ) -> None:
+        """Start a new body in a temporary file."""
+        self.archive: ResponseArchive = archive
+        self.url: str = url
+        self.status: int = status
+        self.headers: list[tuple[str, str]] = [
+            (key, value) for key, value in headers if key.lower() not in SKIPPED_HEADERS
+        ]
+        self.size: int = 0
+        self.closed: bool = False
+        self._hash = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=archive.root / "objects", suffix=".tmp")
+        self._tmp = Path(tmp)
+        self._compressor = zstandard.ZstdCompressor(level=archive.level).stream_writer(os.fdopen(fd, "wb"))
+
+    def write(self: BodyWriter, data: bytes) -> None:
+        """Add decoded body bytes."""
+        self._hash.update(data)
+        self.size += len(data)
+        self._compressor.write(data)
+
+    def commit(self: BodyWriter, fetched_at: datetime.datetime | None = None) -> ArchivedResponse:
+        """Add the body and its index entry to the archive.
+
+        Args:
+            fetched_at: When the response was fetched. Defaults to now.
+
+        Returns:
+            ArchivedResponse: The new index entry.
+        """
+        self._compressor.close()
+        self.closed = True
+        entry = ArchivedResponse(
+            url=self.url,
+            fetched_at=fetched_at or datetime.datetime.now(tz=datetime.UTC),
+            status=self.status,
+            headers=self.headers,
+            digest=self._hash.hexdigest(),
+            size=self.size,
+        )
+        self.archive.add(self._tmp, entry)
+        return entry
+
+    def discard(self: BodyWriter) -> None:
+        """Throw the body away."""
+        if self.closed:
+            return
+        self._compressor.close()
+        self.closed = True
+        self._tmp.unlink(missing_ok=True)
+
+
+class ResponseArchive:
+    """Content-addressed, zstd-compressed store of raw responses, indexed by URL and fetch time.
+
+    Safe to share between threads. Several processes can write to the same directory.
+
+    Args:
+        root: Directory to keep the archive in. Created if it doesn't exist.
+        level: zstd compression level.
+    """
+
+    def __init__(self: ResponseArchive, root: Path, level: int = 10) -> None:
+        """Open the archive, creating it if needed."""
+        self.root: Path = Path(root)
+        self.level: int = level
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite3", timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _object_path(self: ResponseArchive, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.zst"
+
+    def writer(self: ResponseArchive, url: str, status: int, headers: list[tuple[str, str]]) -> BodyWriter:
+        """Start archiving a response whose body we will get in pieces.
+
+        Args:
+            url: The URL we requested.
+            status: HTTP status code.
+            headers: Response headers.
+
+        Returns:
+            BodyWriter: Write the decoded body to it and then commit it.
+        """
+        return BodyWriter(self, url, status, headers)
+
+    def add(self: ResponseArchive, body: Path, entry: ArchivedResponse) -> None:
+        """Move a compressed body into place, unless we already have it, and add the index entry.
+
+        Args:
+            body: Temporary file with the compressed body. It is moved or deleted.
+            entry: The index entry.
+        """
+        path: Path = self._object_path(entry.digest)
+        try:
+            # Bump the modification time, so prune() doesn't remove a body a new fetch is using
+            os.utime(path)
+        except FileNotFoundError:
+            path.parent.mkdir(exist_ok=True)
+            body.replace(path)
+        else:
+            body.unlink()
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO responses (url, fetched_at, status, headers, digest, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.url,
+                    entry.fetched_at.isoformat(),
+                    entry.status,
+                    json.dumps(entry.headers),
+                    entry.digest,
+                    entry.size,
+                ),
+            )
+
+    def store(  # noqa: PLR0913
+        self: ResponseArchive,
+        url: str,
+        status: int,
+        headers: list[tuple[str, str]],
+        content: bytes,
+        *,
+        fetched_at: datetime.datetime | None = None,
+    ) -> ArchivedResponse:
+        """Add a response we already have in memory to the archive.
+
+        Args:
+            url: The URL we requested.
+            status: HTTP status code.
+            headers: Response headers.
+            content: The decoded response body.
+            fetched_at: When the response was fetched. Defaults to now.
+
+        Returns:
+            ArchivedResponse: The new index entry.
+        """
+        writer: BodyWriter = self.writer(url, status, headers)
+        writer.write(content)
+        return writer.commit(fetched_at)
+
+    def iter_body(self: ResponseArchive, digest: str) -> Iterator[bytes]:
+        """Decompress a body piece by piece.
+
+        Args:
+            digest: SHA-256 of the body.
+
+        Yields:
+            bytes: The next piece of the body.
+        """
+        with self._object_path(digest).open("rb") as f:
+            yield from zstandard.ZstdDecompressor().read_to_iter(f, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+    def read_body(self: ResponseArchive, digest: str) -> bytes:
+        """Return the decompressed body with the given digest.
+
+        Args:
+            digest: SHA-256 of the body.
+
+        Returns:
+            bytes: The body.
+        """
+        return b"".join(self.iter_body(digest))
+
+    def _rows(self: ResponseArchive, query: str, params: tuple) -> Iterator[ArchivedResponse]:
+        with self._lock:
+            rows: list[tuple] = self._db.execute(query, params).fetchall()
+        for url, fetched_at, status, headers, digest, size in rows:
+            yield ArchivedResponse(
+                url=url,
+                fetched_at=datetime.datetime.fromisoformat(fetched_at),
+                status=status,
+                headers=[tuple(header) for header in json.loads(headers)],
+                digest=digest,
+                size=size,
+            )
+
+    def latest(self: ResponseArchive, url: str, before: datetime.datetime | None = None) -> ArchivedResponse | None:
+        """Return the newest fetch of a URL.
+
+        Args:
+            url: The URL.
+            before: Only consider fetches made before this time, e.g. to replay the catalog as it was last week.
+
+        Returns:
+            ArchivedResponse | None: The newest fetch, or None if we never fetched the URL.
+        """
+        before = before or datetime.datetime.max.replace(tzinfo=datetime.UTC)
+        query: str = (
+            "SELECT url, fetched_at, status, headers, digest, size FROM responses "
+            "WHERE url = ? AND fetched_at < ? ORDER BY fetched_at DESC LIMIT 1"
+        )
+        return next(self._rows(query, (url, before.isoformat())), None)
+
+    def fetches(self: ResponseArchive, url: str) -> list[ArchivedResponse]:
+        """Return every fetch of a URL, oldest first.
+
+        Args:
+            url: The URL.
+
+        Returns:
+            list[ArchivedResponse]: The fetches.
+        """
+        query: str = (
+            "SELECT url, fetched_at, status, headers, digest, size FROM responses WHERE url = ? ORDER BY fetched_at"
+        )
+        return list(self._rows(query, (url,)))
+
+    def response_for(self: ResponseArchive, request: httpx.Request) -> httpx.Response:
+        """Build a response for a request from the archive.
+
+        Args:
+            request: The request we would have sent.
+
+        Raises:
+            NotArchivedError: If the URL isn't in the archive.
+
+        Returns:
+            httpx.Response: The newest archived response for the URL.
+        """
+        entry: ArchivedResponse | None = self.latest(str(request.url))
+        if not entry:
+            msg: str = f"{request.url} is not in the archive"
+            raise NotArchivedError(msg, request=request)
+
+        return httpx.Response(
+            status_code=entry.status,
+            headers=entry.headers,
+            stream=_ArchivedBodyStream(self, entry.digest),
+            request=request,
+            extensions={"from_archive": True},
+        )
+
+    def prune(self: ResponseArchive, before: datetime.datetime) -> PruneStats:
+        """Remove fetches made before a time, and the bodies no fetch uses anymore.
+
+        The newest fetch of every URL is kept, so replaying still has an answer for every URL we have seen.
+        Bodies changed after `before` are kept even if nothing uses them, they could belong to a fetch that is
+        being committed right now. Temporary files from downloads that never finished are removed too.
+
+        Args:
+            before: Remove fetches made before this time.
+
+        Returns:
+            PruneStats: How much was removed.
+        """
+        cutoff: str = before.astimezone(datetime.UTC).isoformat()
+        with self._lock, self._db:
+            fetches: int = self._db.execute(
+                "DELETE FROM responses WHERE fetched_at < ? AND EXISTS ("
+                "SELECT 1 FROM responses AS newer WHERE newer.url = responses.url "
+                "AND newer.fetched_at > responses.fetched_at)",
+                (cutoff,),
+            ).rowcount
+            used: set[str] = {digest for (digest,) in self._db.execute("SELECT DISTINCT digest FROM responses")}
+
+        bodies: int = 0
+        freed_bytes: int = 0
+        for path in (self.root / "objects").rglob("*"):
+            if path.suffix not in {".zst", ".tmp"} or (path.suffix == ".zst" and path.stem in used):
+                continue
+            try:
+                stat: os.stat_result = path.stat()
+                if stat.st_mtime >= before.timestamp():
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            if path.suffix == ".zst":
+                bodies += 1
+            freed_bytes += stat.st_size
+        return PruneStats(fetches=fetches, bodies=bodies, freed_bytes=freed_bytes)
+
+    def close(self: ResponseArchive) -> None:
+        """Close the index."""
+        self._db.close()
+
+
+class _ArchivedBodyStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Body of a replayed response, decompressed while it is read."""
+
+    def __init__(self: _ArchivedBodyStream, archive: ResponseArchive, digest: str) -> None:
+        self.archive: ResponseArchive = archive
+        self.digest: str = digest
+
+    def __iter__(self: _ArchivedBodyStream) -> Iterator[bytes]:
+        yield from self.archive.iter_body(self.digest)
+
+    async def __aiter__(self: _ArchivedBodyStream) -> AsyncIterator[bytes]:
+        for chunk in self.archive.iter_body(self.digest):
+            yield chunk
+
+
+class _ContentDecoder:
+    """Undo the Content-Encoding of a body piece by piece, so we archive what the client ends up with."""
+
+    def __init__(self: _ContentDecoder, content_encoding: str) -> None:
+        encoding: str = content_encoding.strip().lower()
+        self.supported: bool = encoding in {"", "identity", "gzip", "deflate", "br"}
+        self._zlib = zlib.decompressobj(zlib.MAX_WBITS | 32) if encoding in {"gzip", "deflate"} else None
+        self._brotli = brotli.Decompressor() if encoding == "br" else None
+
+    def decode(self: _ContentDecoder, chunk: bytes) -> bytes:
+        if self._zlib:
+            return self._zlib.decompress(chunk)
+        if self._brotli:
+            return self._brotli.process(chunk)
+        return chunk
+
+    def flush(self: _ContentDecoder) -> bytes:
+        return self._zlib.flush() if self._zlib else b""
+
+
+class _Archiver:
+    """Feeds the raw chunks of a response to a BodyWriter.
+
+    If the body can't be decoded we stop archiving it, but the response itself is left alone.
+    """
+
+    def __init__(self: _Archiver, writer: BodyWriter, decoder: _ContentDecoder) -> None:
+        self.writer: BodyWriter = writer
+        self.decoder: _ContentDecoder = decoder
+
+    def feed(self: _Archiver, chunk: bytes) -> None:
+        if self.writer.closed:
+            return
+        try:
+            self.writer.write(self.decoder.decode(chunk))
+        except (zlib.error, brotli.error):
+            self.writer.discard()
+
+    def finish(self: _Archiver) -> None:
+        if self.writer.closed:
+            return
+        try:
+            self.writer.write(self.decoder.flush())
+        except zlib.error:
+            self.writer.discard()
+            return
+        self.writer.commit()
+
+
+def _start_archiving(archive: ResponseArchive, request: httpx.Request, response: httpx.Response) -> _Archiver | None:
+    decoder = _ContentDecoder(response.headers.get("content-encoding", ""))
+    if not decoder.supported:
+        return None
+    writer: BodyWriter = archive.writer(str(request.url), response.status_code, response.headers.multi_items())
+    return _Archiver(writer, decoder)
+
+
+class _ArchivingStream(httpx.SyncByteStream):
+    """Passes the body through to the client and archives it on the way."""
+
+    def __init__(self: _ArchivingStream, stream: httpx.SyncByteStream, archiver: _Archiver) -> None:
+        self.stream: httpx.SyncByteStream = stream
+        self.archiver: _Archiver = archiver
+
+    def __iter__(self: _ArchivingStream) -> Iterator[bytes]:
+        for chunk in self.stream:
+            self.archiver.feed(chunk)
+            yield chunk
+        self.archiver.finish()
+
+    def close(self: _ArchivingStream) -> None:
+        # Does nothing if the body was read to the end and committed
+        self.archiver.writer.discard()
+        self.stream.close()
+
+
+class _AsyncArchivingStream(httpx.AsyncByteStream):
+    """Passes the body through to the client and archives it on the way."""
+
+    def __init__(self: _AsyncArchivingStream, stream: httpx.AsyncByteStream, archiver: _Archiver) -> None:
+        self.stream: httpx.AsyncByteStream = stream
+        self.archiver: _Archiver = archiver
+
+    async def __aiter__(self: _AsyncArchivingStream) -> AsyncIterator[bytes]:
+        async for chunk in self.stream:
+            await asyncio.to_thread(self.archiver.feed, chunk)
+            yield chunk
+        await asyncio.to_thread(self.archiver.finish)
+
+    async def aclose(self: _AsyncArchivingStream) -> None:
+        self.archiver.writer.discard()
+        await self.stream.aclose()
+
+
+class ArchiveTransport(httpx.BaseTransport):
+    """Send requests with another transport and archive every response as it is read."""
+
+    def __init__(self: ArchiveTransport, transport: httpx.BaseTransport, archive: ResponseArchive) -> None:
+        """Wrap `transport`."""
+        self.transport: httpx.BaseTransport = transport
+        self.archive: ResponseArchive = archive
+
+    def handle_request(self: ArchiveTransport, request: httpx.Request) -> httpx.Response:
+        """Send the request and archive the body while the client reads it."""
+        response: httpx.Response = self.transport.handle_request(request)
+        archiver: _Archiver | None = _start_archiving(self.archive, request, response)
+        if not archiver:
+            return response
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ArchivingStream(response.stream, archiver),
+            extensions=response.extensions,
+        )
+
+    def close(self: ArchiveTransport) -> None:
+        """Close the wrapped transport."""
+        self.transport.close()
+
+
+class AsyncArchiveTransport(httpx.AsyncBaseTransport):
+    """Send requests with another transport and archive every response as it is read."""
+
+    def __init__(self: AsyncArchiveTransport, transport: httpx.AsyncBaseTransport, archive: ResponseArchive) -> None:
+        """Wrap `transport`."""
+        self.transport: httpx.AsyncBaseTransport = transport
+        self.archive: ResponseArchive = archive
+
+    async def handle_async_request(self: AsyncArchiveTransport, request: httpx.Request) -> httpx.Response:
+        """Send the request and archive the body while the client reads it."""
+        response: httpx.Response = await self.transport.handle_async_request(request)
+        archiver: _Archiver | None = _start_archiving(self.archive, request, response)
+        if not archiver:
+            return response
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_AsyncArchivingStream(response.stream, archiver),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self: AsyncArchiveTransport) -> None:
+        """Close the wrapped transport."""
+        await self.transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Answer requests from the archive instead of the network."""
+
+    def __init__(self: ReplayTransport, archive: ResponseArchive) -> None:
+        """Replay from `archive`."""
+        self.archive: ResponseArchive = archive
+
+    def handle_request(self: ReplayTransport, request: httpx.Request) -> httpx.Response:
+        """Return the newest archived response for the URL."""
+        return self.archive.response_for(request)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    """Answer requests from the archive instead of the network."""
+
+    def __init__(self: AsyncReplayTransport, archive: ResponseArchive) -> None:
+        """Replay from `archive`."""
+        self.archive: ResponseArchive = archive
+
+    async def handle_async_request(self: AsyncReplayTransport, request: httpx.Request) -> httpx.Response:
+        """Return the newest archived response for the URL."""
+        return await asyncio.to_thread(self.archive.response_for, request)
+
+
+@lru_cache(maxsize=1)
+def get_archive() -> ResponseArchive:
+    """Return the archive in SCRAPING_ARCHIVE_DIR.
+
+    Returns:
+        ResponseArchive: The archive, shared by every client in the process.
+    """
+    return ResponseArchive(settings.SCRAPING_ARCHIVE_DIR)
+
+
+def archive_if_enabled() -> ResponseArchive | None:
+    """Return the archive new responses should be saved in, or None if SCRAPING_ARCHIVE is off.
+
+    Returns:
+        ResponseArchive | None: The shared archive.
+    """
+    return get_archive() if settings.SCRAPING_ARCHIVE else None
@@ -0,0 +1,370 @@
+"""HTTP clients shared by all our scrapers.
+
+ScrapingClient and AsyncScrapingClient wrap httpx with:
+    - One keep-alive HTTP/2 connection pool per client, instead of a new connection per request.
+    - Optional HTTP caching with hishel, for pages that rarely change (Intel ARK, AMD).
+    - Per-host rate and concurrency limits that adapt to how the host is doing and can be shared by every
+      worker through Redis, see limits.py and ratelimit.py.
+    - The same retry policy everywhere: connection errors, 429 and 5xx are retried with exponential backoff.
+    - Metrics for every request, see metrics.py.
+    - Every response archived on disk when SCRAPING_ARCHIVE is on, and a replay mode that reads from the archive,
+      see archive.py.
+
+Use get_client() to get the synchronous client for the current process.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Self
+
+import hishel
+import httpx
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from panso.scraping.archive import (
+    ArchiveTransport,
+    AsyncArchiveTransport,
+    AsyncReplayTransport,
+    ReplayTransport,
+    ResponseArchive,
+    archive_if_enabled,
+    get_archive,
+)
+from panso.scraping.limits import AsyncHostLimiter, HostLimiter, HostPolicy
+from panso.scraping.metrics import RequestMetric, ScrapeMetrics, metrics
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from types import TracebackType
+
+# Responses with these status codes are retried
+RETRY_STATUSES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+# How long hishel keeps cached responses
+CACHE_TTL: int = 60 * 60 * 24 * 7  # 1 week
+
+
+class RetryableStatusError(httpx.HTTPStatusError):
+    """The server answered with a status code that is worth retrying, e.g. 429 or 503."""
+
+
+def _retry_options() -> dict[str, Any]:
+    """Retry policy shared by the sync and async clients."""
+    return {
+        "retry": retry_if_exception_type((httpx.TransportError, RetryableStatusError)),
+        "stop": stop_after_attempt(3),
+        "wait": wait_random_exponential(multiplier=1, max=30),
+        "reraise": True,
+    }
+
+
+def _pool_limits() -> httpx.Limits:
+    """Connection pool size. The per-host limits are enforced by the HostLimiter, not the pool."""
+    return httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+
+def _record(
+    collector: ScrapeMetrics,
+    url: str,
+    started: float,
+    response: httpx.Response | None = None,
+    error: Exception | None = None,
+) -> RequestMetric:
+    """Record a request in the metrics.
+
+    Returns:
+        RequestMetric: What we recorded, for the limiter.
+    """
+    metric: RequestMetric = _metric(url, started, response, error)
+    collector.record(metric)
+    return metric
+
+
+def _metric(
+    url: str,
+    started: float,
+    response: httpx.Response | None = None,
+    error: Exception | None = None,
+) -> RequestMetric:
+    return RequestMetric(
+        url=url,
+        host=httpx.URL(url).host,
+        status=response.status_code if response is not None else None,
+        latency=time.perf_counter() - started,
+        size=response.num_bytes_downloaded if response is not None else 0,
+        cache_hit=_from_cache(response),
+        error=type(error).__name__ if error else None,
+    )
+
+
+def _from_cache(response: httpx.Response | None) -> bool:
+    """If the response came from the hishel cache or the archive instead of the network."""
+    if response is None:
+        return False
+    return bool(response.extensions.get("from_cache") or response.extensions.get("from_archive"))
+
+
+def _raise_for_retry(response: httpx.Response) -> None:
+    """Raise RetryableStatusError if the response should be retried."""
+    if response.status_code in RETRY_STATUSES:
+        response.close()
+        msg: str = f"Got {response.status_code} from {response.request.url}"
+        raise RetryableStatusError(msg, request=response.request, response=response)
+
+
+class ScrapingClient:
+    """Synchronous HTTP client for scraping.
+
+    Args:
+        cache: Cache responses on disk with hishel.
+        hosts: Policies that take precedence over SCRAPING_HOSTS in settings.py.
+        timeout: Timeout in seconds.
+        collector: Where metrics are recorded. Defaults to the shared collector.
+        transport: Transport to send requests with. Defaults to a pooled HTTP/2 transport.
+        archive: Save every response from the network in this archive.
+        replay: Answer requests from `archive`, or SCRAPING_ARCHIVE_DIR, instead of the network.
+            Rate limits don't apply.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: ScrapingClient,
+        *,
+        cache: bool = False,
+        hosts: dict[str, HostPolicy] | None = None,
+        timeout: float = 30.0,
+        collector: ScrapeMetrics | None = None,
+        transport: httpx.BaseTransport | None = None,
+        archive: ResponseArchive | None = None,
+        replay: bool = False,
+    ) -> None:
+        """Create a client with its own connection pool."""
+        if replay:
+            transport = ReplayTransport(archive or get_archive())
+        else:
+            transport = transport or httpx.HTTPTransport(http2=True, limits=_pool_limits())
+            if archive:
+                transport = ArchiveTransport(transport=transport, archive=archive)
+            if cache:
+                transport = hishel.CacheTransport(transport=transport, storage=hishel.FileStorage(ttl=CACHE_TTL))
+
+        self.replay: bool = replay
+        self.metrics: ScrapeMetrics = collector or metrics
+        self._limiter = HostLimiter(overrides=hosts)
+        self._client = httpx.Client(transport=transport, timeout=timeout, follow_redirects=True)
+
+    def _send(self: ScrapingClient, url: str, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        host: str = httpx.URL(url).host
+        with contextlib.nullcontext() if self.replay else self._limiter.slot(host):
+            started: float = time.perf_counter()
+            try:
+                response: httpx.Response = self._client.get(url, **kwargs)
+            except httpx.HTTPError as e:
+                self._observe(_record(self.metrics, url, started, error=e))
+                raise
+
+        self._observe(_record(self.metrics, url, started, response=response))
+        _raise_for_retry(response)
+        return response
+
+    def _observe(self: ScrapingClient, metric: RequestMetric) -> None:
+        if not self.replay:
+            self._limiter.observe(metric)
+
+    def get(self: ScrapingClient, url: str, *, retry: bool = True, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        """Send a GET request, retrying connection errors, 429 and 5xx.
+
+        Args:
+            url: The URL.
+            retry: Retry failed requests, sleeping in between. Turn it off if the caller schedules its own retries.
+            **kwargs: Passed to httpx.Client.get, e.g. headers or timeout.
+
+        Raises:
+            httpx.HTTPError: If the request still fails after the last retry.
+
+        Returns:
+            httpx.Response: The response. 4xx responses other than 429 are returned, not raised.
+        """
+        if not retry:
+            return self._send(url, **kwargs)
+        return Retrying(**_retry_options())(self._send, url, **kwargs)
+
+    def _open(self: ScrapingClient, url: str, **kwargs: Any) -> tuple[httpx.Response, float]:  # noqa: ANN401
+        host: str = httpx.URL(url).host
+        with contextlib.nullcontext() if self.replay else self._limiter.slot(host):
+            started: float = time.perf_counter()
+            request: httpx.Request = self._client.build_request("GET", url, **kwargs)
+            try:
+                response: httpx.Response = self._client.send(request, stream=True)
+            except httpx.HTTPError as e:
+                self._observe(_record(self.metrics, url, started, error=e))
+                raise
+
+        if response.status_code in RETRY_STATUSES:
+            self._observe(_record(self.metrics, url, started, response=response))
+            _raise_for_retry(response)
+
+        # The body can take any amount of time to read, so the limiter gets the time until the headers arrived
+        self._observe(_metric(url, started, response))
+        return response, started
+
+    @contextlib.contextmanager
+    def stream(self: ScrapingClient, url: str, **kwargs: Any) -> Iterator[httpx.Response]:  # noqa: ANN401
+        """Send a GET request and read the body as it arrives, e.g. with response.iter_bytes().
+
+        Sending the request is retried like in get(). Once we have started reading the body, errors are raised.
+        Only the rate limit applies to streamed requests; the concurrency limit is released once we have
+        the headers.
+
+        Args:
+            url: The URL.
+            **kwargs: Passed to httpx.Client.build_request, e.g. headers or timeout.
+
+        Yields:
+            httpx.Response: The response, with the body not read yet.
+        """
+        response, started = Retrying(**_retry_options())(self._open, url, **kwargs)
+        try:
+            yield response
+        finally:
+            response.close()
+            _record(self.metrics, url, started, response=response)
+
+    def close(self: ScrapingClient) -> None:
+        """Close the connection pool."""
+        self._client.close()
+
+    def __enter__(self: ScrapingClient) -> Self:
+        """Use the client as a context manager."""
+        return self
+
+    def __exit__(
+        self: ScrapingClient,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the client when leaving the context manager."""
+        self.close()
+
+
+class AsyncScrapingClient:
+    """Asynchronous HTTP client for scraping.
+
+    Must be used with `async with` inside the event loop it will be used in.
+
+    Args:
+        cache: Cache responses on disk with hishel.
+        hosts: Policies that take precedence over SCRAPING_HOSTS in settings.py.
+        timeout: Timeout in seconds.
+        collector: Where metrics are recorded. Defaults to the shared collector.
+        transport: Transport to send requests with. Defaults to a pooled HTTP/2 transport.
+        archive: Save every response from the network in this archive.
+        replay: Answer requests from `archive`, or SCRAPING_ARCHIVE_DIR, instead of the network.
+            Rate limits don't apply.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: AsyncScrapingClient,
+        *,
+        cache: bool = False,
+        hosts: dict[str, HostPolicy] | None = None,
+        timeout: float = 30.0,
+        collector: ScrapeMetrics | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        archive: ResponseArchive | None = None,
+        replay: bool = False,
+    ) -> None:
+        """Create a client with its own connection pool."""
+        if replay:
+            transport = AsyncReplayTransport(archive or get_archive())
+        else:
+            transport = transport or httpx.AsyncHTTPTransport(http2=True, limits=_pool_limits())
+            if archive:
+                transport = AsyncArchiveTransport(transport=transport, archive=archive)
+            if cache:
+                transport = hishel.AsyncCacheTransport(
+                    transport=transport,
+                    storage=hishel.AsyncFileStorage(ttl=CACHE_TTL),
+                )
+
+        self.replay: bool = replay
+        self.metrics: ScrapeMetrics = collector or metrics
+        self._limiter = AsyncHostLimiter(overrides=hosts)
+        self._client = httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+
+    async def _send(self: AsyncScrapingClient, url: str, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        host: str = httpx.URL(url).host
+        async with contextlib.nullcontext() if self.replay else self._limiter.slot(host):
+            started: float = time.perf_counter()
+            try:
+                response: httpx.Response = await self._client.get(url, **kwargs)
+            except httpx.HTTPError as e:
+                await self._observe(_record(self.metrics, url, started, error=e))
+                raise
+
+        await self._observe(_record(self.metrics, url, started, response=response))
+        _raise_for_retry(response)
+        return response
+
+    async def _observe(self: AsyncScrapingClient, metric: RequestMetric) -> None:
+        if not self.replay:
+            await self._limiter.observe(metric)
+
+    async def get(self: AsyncScrapingClient, url: str, **kwargs: Any) -> httpx.Response:  # noqa: ANN401
+        """Send a GET request, retrying connection errors, 429 and 5xx.
+
+        Args:
+            url: The URL.
+            **kwargs: Passed to httpx.AsyncClient.get, e.g. headers or timeout.
+
+        Raises:
+            httpx.HTTPError: If the request still fails after the last retry.
+
+        Returns:
+            httpx.Response: The response. 4xx responses other than 429 are returned, not raised.
+        """
+        return await AsyncRetrying(**_retry_options())(self._send, url, **kwargs)
+
+    async def aclose(self: AsyncScrapingClient) -> None:
+        """Close the connection pool."""
+        await self._client.aclose()
+        await self._limiter.aclose()
+
+    async def __aenter__(self: AsyncScrapingClient) -> Self:
+        """Use the client as an async context manager."""
+        return self
+
+    async def __aexit__(
+        self: AsyncScrapingClient,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the client when leaving the context manager."""
+        await self.aclose()
+
+
+@lru_cache(maxsize=4)
+def get_client(*, cache: bool = False, replay: bool = False) -> ScrapingClient:
+    """Return the synchronous client for this process.
+
+    The client is created on first use and then reused, so every scraper in the process shares
+    the same connection pool and limits.
+
+    Args:
+        cache: Get the client that caches responses on disk.
+        replay: Get the client that reads from the response archive instead of the network.
+
+    Returns:
+        ScrapingClient: The shared client.
+    """
+    return ScrapingClient(cache=cache, archive=archive_if_enabled(), replay=replay)
@@ -0,0 +1,248 @@
+"""Per-host politeness limits for our scrapers.
+
+Every host gets a HostPolicy with a maximum number of requests per second and a maximum number of
+requests in flight. The defaults come from SCRAPING_DEFAULT_RATE and SCRAPING_DEFAULT_CONCURRENCY and can
+be changed per host with SCRAPING_HOSTS in settings.py.
+
+The rate limit works with a "next free slot" per host. A request takes the slot and pushes it forward by
+1/rate seconds, then sleeps until its slot comes up. The rate itself adapts to how the host is doing, between
+min_rate and max_rate, see ratelimit.py.
+
+With SCRAPING_SHARED_LIMITS enabled the slots and rates live in Redis and are shared by every process. If Redis
+can't be reached we use a schedule of our own until it is back. The concurrency limit is always per process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import redis
+from django.conf import settings
+from rich.console import Console
+
+from panso.scraping.ratelimit import AdaptiveRate, AsyncRedisRateLimiter, RedisRateLimiter, get_shared_limiter
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator
+
+    from panso.scraping.metrics import RequestMetric
+
+err_console = Console(stderr=True)
+
+# Seconds we use our own schedule after Redis failed, before we try Redis again
+REDIS_RETRY_AFTER: float = 30.0
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    """How hard we are allowed to hit a host.
+
+    `rate` is where we start. The rate goes up to `max_rate` while the host is healthy and down to `min_rate`
+    when it isn't. By default max_rate is the same as rate and min_rate is a tenth of it.
+    """
+
+    rate: float
+    concurrency: int
+    min_rate: float = None  # type: ignore[assignment]
+    max_rate: float = None  # type: ignore[assignment]
+
+    def __post_init__(self: HostPolicy) -> None:
+        """Fill in the defaults for min_rate and max_rate."""
+        if self.max_rate is None:
+            object.__setattr__(self, "max_rate", self.rate)
+        if self.min_rate is None:
+            object.__setattr__(self, "min_rate", self.rate / 10)
+
+
+def get_host_policy(host: str, overrides: dict[str, HostPolicy] | None = None) -> HostPolicy:
+    """Return the policy for a host.
+
+    Args:
+        host: The hostname, e.g. www.webhallen.com
+        overrides: Policies that take precedence over settings.py.
+
+    Returns:
+        HostPolicy: The policy for the host.
+    """
+    if overrides and host in overrides:
+        return overrides[host]
+
+    configured: dict[str, float] = settings.SCRAPING_HOSTS.get(host, {})
+    rate = float(configured.get("rate", settings.SCRAPING_DEFAULT_RATE))
+    return HostPolicy(
+        rate=rate,
+        concurrency=int(configured.get("concurrency", settings.SCRAPING_DEFAULT_CONCURRENCY)),
+        min_rate=float(configured.get("min_rate", rate / 10)),
+        max_rate=float(configured.get("max_rate", rate)),
+    )
+
+
+class _RateSchedule:
+    """Keeps track of the next free request slot and the adaptive rate for each host in this process."""
+
+    def __init__(self: _RateSchedule) -> None:
+        self._next_slot: dict[str, float] = {}
+        self._rates: dict[str, AdaptiveRate] = {}
+        self._redis_down_until: float = 0.0
+
+    def rate(self: _RateSchedule, host: str, policy: HostPolicy) -> AdaptiveRate:
+        """Return the adaptive rate for the host."""
+        return self._rates.setdefault(host, AdaptiveRate.for_policy(policy))
+
+    def reserve(self: _RateSchedule, host: str, rate: float) -> float:
+        """Take the next free slot for the host.
+
+        Returns:
+            float: Seconds to sleep before sending the request.
+        """
+        now: float = time.monotonic()
+        slot: float = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + 1 / rate
+        return slot - now
+
+    @property
+    def use_redis(self: _RateSchedule) -> bool:
+        """If we should try Redis, or if it failed a moment ago."""
+        return time.monotonic() >= self._redis_down_until
+
+    def redis_failed(self: _RateSchedule, error: redis.RedisError) -> None:
+        """Use our own schedule for a while."""
+        err_console.print(f"Shared rate limits unavailable, using local limits for {REDIS_RETRY_AFTER:.0f}s: {error}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+
+class HostLimiter:
+    """Thread-safe per-host rate and concurrency limiter for the synchronous client.
+
+    Args:
+        overrides: Policies that take precedence over settings.py.
+        shared: Where the shared limits are kept. Defaults to get_shared_limiter().
+    """
+
+    def __init__(
+        self: HostLimiter,
+        overrides: dict[str, HostPolicy] | None = None,
+        shared: RedisRateLimiter | None = None,
+    ) -> None:
+        """Create a limiter."""
+        self.overrides: dict[str, HostPolicy] | None = overrides
+        self.shared: RedisRateLimiter | None = shared or get_shared_limiter()
+        self._schedule = _RateSchedule()
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self: HostLimiter, host: str, policy: HostPolicy) -> float:
+        if self.shared and self._schedule.use_redis:
+            try:
+                return self.shared.reserve(host, policy)
+            except redis.RedisError as e:
+                self._schedule.redis_failed(e)
+
+        with self._lock:
+            return self._schedule.reserve(host, self._schedule.rate(host, policy).rate)
+
+    def observe(self: HostLimiter, metric: RequestMetric) -> None:
+        """Adjust the rate for the host after a request. Responses from a cache or the archive are ignored."""
+        if metric.cache_hit:
+            return
+
+        policy: HostPolicy = get_host_policy(metric.host, self.overrides)
+        if self.shared and self._schedule.use_redis:
+            try:
+                self.shared.observe(metric.host, policy, metric.status, metric.latency)
+            except redis.RedisError as e:
+                self._schedule.redis_failed(e)
+            else:
+                return
+
+        with self._lock:
+            self._schedule.rate(metric.host, policy).observe(metric.status, metric.latency)
+
+    @contextmanager
+    def slot(self: HostLimiter, host: str) -> Iterator[None]:
+        """Wait until we are allowed to send a request to the host and hold a concurrency slot while we do."""
+        policy: HostPolicy = get_host_policy(host, self.overrides)
+        with self._lock:
+            semaphore: threading.BoundedSemaphore = self._semaphores.setdefault(
+                host,
+                threading.BoundedSemaphore(policy.concurrency),
+            )
+
+        with semaphore:
+            delay: float = self._reserve(host, policy)
+            if delay > 0:
+                time.sleep(delay)
+            yield
+
+
+class AsyncHostLimiter:
+    """Per-host rate and concurrency limiter for the asynchronous client.
+
+    All coroutines using the limiter must run in the same event loop. Reserving a local slot doesn't await,
+    so two coroutines can't take the same slot. Shared slots are taken atomically in Redis.
+
+    Args:
+        overrides: Policies that take precedence over settings.py.
+        shared: Where the shared limits are kept. Defaults to SCRAPING_REDIS_URL if SCRAPING_SHARED_LIMITS is on.
+    """
+
+    def __init__(
+        self: AsyncHostLimiter,
+        overrides: dict[str, HostPolicy] | None = None,
+        shared: AsyncRedisRateLimiter | None = None,
+    ) -> None:
+        """Create a limiter."""
+        if shared is None and settings.SCRAPING_SHARED_LIMITS:
+            shared = AsyncRedisRateLimiter(settings.SCRAPING_REDIS_URL)
+
+        self.overrides: dict[str, HostPolicy] | None = overrides
+        self.shared: AsyncRedisRateLimiter | None = shared
+        self._schedule = _RateSchedule()
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def _reserve(self: AsyncHostLimiter, host: str, policy: HostPolicy) -> float:
+        if self.shared and self._schedule.use_redis:
+            try:
+                return await self.shared.reserve(host, policy)
+            except redis.RedisError as e:
+                self._schedule.redis_failed(e)
+
+        return self._schedule.reserve(host, self._schedule.rate(host, policy).rate)
+
+    async def observe(self: AsyncHostLimiter, metric: RequestMetric) -> None:
+        """Adjust the rate for the host after a request. Responses from a cache or the archive are ignored."""
+        if metric.cache_hit:
+            return
+
+        policy: HostPolicy = get_host_policy(metric.host, self.overrides)
+        if self.shared and self._schedule.use_redis:
+            try:
+                await self.shared.observe(metric.host, policy, metric.status, metric.latency)
+            except redis.RedisError as e:
+                self._schedule.redis_failed(e)
+            else:
+                return
+
+        self._schedule.rate(metric.host, policy).observe(metric.status, metric.latency)
+
+    async def aclose(self: AsyncHostLimiter) -> None:
+        """Close the connection to Redis."""
+        if self.shared:
+            await self.shared.aclose()
+
+    @asynccontextmanager
+    async def slot(self: AsyncHostLimiter, host: str) -> AsyncIterator[None]:
+        """Wait until we are allowed to send a request to the host and hold a concurrency slot while we do."""
+        policy: HostPolicy = get_host_policy(host, self.overrides)
+        semaphore: asyncio.Semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(policy.concurrency))
+
+        async with semaphore:
+            delay: float = await self._reserve(host, policy)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
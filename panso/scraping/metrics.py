@@ -0,0 +1,99 @@
+"""Per-request metrics for our scrapers.
+
+Every request made through ScrapingClient or AsyncScrapingClient is recorded here with its latency,
+size, status code and whether it came from the HTTP cache. The numbers are kept per process and
+aggregated per host, so a task can print a summary when it is done.
+"""
+
+from __future__ import annotations
+
+import statistics
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+from rich import print
+
+
+@dataclass(frozen=True)
+class RequestMetric:
+    """What happened when we sent one request."""
+
+    url: str
+    host: str
+    status: int | None
+    latency: float
+    size: int
+    cache_hit: bool = False
+    error: str | None = None
+
+
+@dataclass
+class HostStats:
+    """Aggregated metrics for one host."""
+
+    requests: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    size: int = 0
+    statuses: dict[int, int] = field(default_factory=dict)
+    latencies: deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def as_dict(self: HostStats) -> dict[str, int | float | dict[int, int]]:
+        """Return the stats as a dict with latency percentiles over the last 1000 requests."""
+        latencies: list[float] = sorted(self.latencies)
+        p95: float = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "bytes": self.size,
+            "statuses": dict(self.statuses),
+            "latency_p50": statistics.median(latencies) if latencies else 0.0,
+            "latency_p95": p95,
+        }
+
+
+class ScrapeMetrics:
+    """Collects RequestMetrics from every client in the process."""
+
+    def __init__(self: ScrapeMetrics) -> None:
+        """Create an empty collector."""
+        self.hosts: dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self: ScrapeMetrics, metric: RequestMetric) -> None:
+        """Add a request to the stats for its host."""
+        with self._lock:
+            stats: HostStats = self.hosts.setdefault(metric.host, HostStats())
+            stats.requests += 1
+            stats.size += metric.size
+            stats.latencies.append(metric.latency)
+            if metric.cache_hit:
+                stats.cache_hits += 1
+            if metric.error:
+                stats.errors += 1
+            if metric.status is not None:
+                stats.statuses[metric.status] = stats.statuses.get(metric.status, 0) + 1
+
+    def summary(self: ScrapeMetrics) -> dict[str, dict[str, int | float | dict[int, int]]]:
+        """Return the stats for every host we have sent requests to."""
+        with self._lock:
+            return {host: stats.as_dict() for host, stats in self.hosts.items()}
+
+    def print_summary(self: ScrapeMetrics) -> None:
+        """Print one line per host."""
+        for host, stats in self.summary().items():
+            print(
+                f"{host}: {stats['requests']} requests, {stats['errors']} errors, {stats['cache_hits']} cache hits, "
+                f"{stats['bytes']} bytes, p50 {stats['latency_p50']:.3f}s, p95 {stats['latency_p95']:.3f}s",
+            )
+
+    def reset(self: ScrapeMetrics) -> None:
+        """Forget everything we have recorded."""
+        with self._lock:
+            self.hosts = {}
+
+
+# Shared by every client in the process
+metrics = ScrapeMetrics()
@@ -0,0 +1,271 @@
+"""Adaptive request rates, shared by every worker through Redis.
+
+Each host starts at the rate in its HostPolicy and then adjusts it from the responses we get:
+
+    - A 429, a 5xx, a connection error or a latency more than LATENCY_FACTOR times the usual latency halves
+      the rate, at most once every DECREASE_COOLDOWN seconds so a burst of errors from requests that were
+      already in flight only counts once.
+    - Every other response adds RATE_INCREASE of the host's max_rate, up to max_rate.
+
+The rate never goes below min_rate. This is additive increase/multiplicative decrease, the same thing TCP does
+with its congestion window.
+
+With SCRAPING_SHARED_LIMITS enabled the rate and the next free request slot of every host are kept in Redis,
+so all Celery workers and management commands share one budget per host, and adding workers doesn't add
+requests per second. Slots are taken with a Lua script (a token bucket with room for one request), so two
+workers can never take the same slot. Updating the rate is best-effort: two workers reporting at the same time
+can overwrite each other's update, which only makes the rate move a little slower.
+
+If Redis can't be reached, HostLimiter falls back to its own per-process schedule, see limits.py.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from panso.scraping.limits import HostPolicy
+
+# Responses with these status codes mean the host wants us to slow down
+BACKOFF_STATUSES: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+# How much of max_rate we add after every healthy response
+RATE_INCREASE: float = 0.02
+
+# What we multiply the rate with when the host is struggling
+RATE_DECREASE: float = 0.5
+
+# Seconds between two decreases
+DECREASE_COOLDOWN: float = 5.0
+
+# The latency is "rising" when the moving average is this many times the baseline
+LATENCY_FACTOR: float = 2.0
+
+# Weight of the newest latency in the moving average
+LATENCY_SMOOTHING: float = 0.2
+
+# The baseline follows the lowest moving average, but creeps up by this factor every response so a host that
+# got slower for good doesn't keep us at min_rate forever
+BASELINE_DRIFT: float = 1.01
+
+# Forget hosts we haven't talked to in a day
+STATE_TTL: int = 60 * 60 * 24
+
+# Take the next free slot for a host. Returns the seconds to wait as a string, Redis truncates Lua numbers.
+RESERVE_SCRIPT: str = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local min_rate = tonumber(ARGV[2])
+local max_rate = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'rate', 'next')
+local rate = tonumber(state[1]) or tonumber(ARGV[1])
+rate = math.min(math.max(rate, min_rate), max_rate)
+local slot = math.max(now, tonumber(state[2]) or now)
+redis.call('HSET', KEYS[1], 'rate', tostring(rate), 'next', tostring(slot + 1 / rate))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return tostring(slot - now)
+"""
+
+KEY_PREFIX: str = "panso:scraping:host"
+
+# Fail fast if Redis is down, HostLimiter falls back to its own schedule
+REDIS_OPTIONS: dict[str, float] = {"socket_timeout": 1.0, "socket_connect_timeout": 1.0}
+
+# Fields of the host hash that belong to AdaptiveRate
+STATE_FIELDS: tuple[str, ...] = ("rate", "latency", "baseline", "decreased_at")
+
+
+@dataclass
+class AdaptiveRate:
+    """The current request rate for a host and what we need to adjust it."""
+
+    rate: float
+    min_rate: float
+    max_rate: float
+    latency: float | None = None
+    baseline: float | None = None
+    decreased_at: float = 0.0
+
+    @classmethod
+    def for_policy(
+        cls: type[AdaptiveRate],
+        policy: HostPolicy,
+        state: dict[str, float | None] | None = None,
+    ) -> AdaptiveRate:
+        """Create the rate for a host, continuing from `state` if we have one.
+
+        Args:
+            policy: The host's policy.
+            state: What state() returned earlier, e.g. read back from Redis.
+
+        Returns:
+            AdaptiveRate: The rate, clamped to the policy's limits.
+        """
+        state = state or {}
+        rate: float = state.get("rate") or policy.rate
+        return cls(
+            rate=min(max(rate, policy.min_rate), policy.max_rate),
+            min_rate=policy.min_rate,
+            max_rate=policy.max_rate,
+            latency=state.get("latency"),
+            baseline=state.get("baseline"),
+            decreased_at=state.get("decreased_at") or 0.0,
+        )
+
+    def state(self: AdaptiveRate) -> dict[str, float]:
+        """Return the fields that change, for saving them somewhere."""
+        fields: dict[str, float | None] = {
+            "rate": self.rate,
+            "latency": self.latency,
+            "baseline": self.baseline,
+            "decreased_at": self.decreased_at,
+        }
+        return {name: value for name, value in fields.items() if value is not None}
+
+    @property
+    def congested(self: AdaptiveRate) -> bool:
+        """If the moving average of the latency is well above the baseline."""
+        if self.latency is None or self.baseline is None:
+            return False
+        return self.latency > LATENCY_FACTOR * self.baseline
+
+    def observe(self: AdaptiveRate, status: int | None, latency: float, now: float | None = None) -> float:
+        """Adjust the rate after a response.
+
+        Args:
+            status: The status code, or None if the request failed without a response.
+            latency: Seconds the request took.
+            now: The current time, time.time() if not given.
+
+        Returns:
+            float: The new rate.
+        """
+        now = time.time() if now is None else now
+        if status is not None:
+            self.latency = (
+                latency if self.latency is None else self.latency + LATENCY_SMOOTHING * (latency - self.latency)
+            )
+            self.baseline = self.latency if self.baseline is None else min(self.latency, self.baseline * BASELINE_DRIFT)
+
+        if status is None or status in BACKOFF_STATUSES or self.congested:
+            if now - self.decreased_at >= DECREASE_COOLDOWN:
+                self.rate = max(self.min_rate, self.rate * RATE_DECREASE)
+                self.decreased_at = now
+        else:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_INCREASE)
+        return self.rate
+
+
+def _parse_state(values: list[bytes | None]) -> dict[str, float | None]:
+    """Turn the HMGET of STATE_FIELDS into what AdaptiveRate.for_policy() wants."""
+    return {name: float(value) if value is not None else None for name, value in zip(STATE_FIELDS, values, strict=True)}
+
+
+def _reserve_args(policy: HostPolicy) -> list[float]:
+    return [policy.rate, policy.min_rate, policy.max_rate, STATE_TTL]
+
+
+class RedisRateLimiter:
+    """Per-host request slots and adaptive rates stored in Redis.
+
+    Args:
+        url: Redis URL, e.g. redis://:password@redis:6379/2
+        prefix: Prefix for the keys, one hash per host.
+    """
+
+    def __init__(self: RedisRateLimiter, url: str, prefix: str = KEY_PREFIX) -> None:
+        """Create a limiter. Nothing is sent to Redis until the first request."""
+        self.prefix: str = prefix
+        self._redis: redis.Redis = redis.Redis.from_url(url, **REDIS_OPTIONS)
+        self._reserve = self._redis.register_script(RESERVE_SCRIPT)
+
+    def reserve(self: RedisRateLimiter, host: str, policy: HostPolicy) -> float:
+        """Take the next free slot for the host, shared with every other process.
+
+        Raises:
+            redis.RedisError: If Redis can't be reached.
+
+        Returns:
+            float: Seconds to sleep before sending the request.
+        """
+        return float(self._reserve(keys=[f"{self.prefix}:{host}"], args=_reserve_args(policy)))
+
+    def observe(self: RedisRateLimiter, host: str, policy: HostPolicy, status: int | None, latency: float) -> float:
+        """Adjust the shared rate for the host after a response.
+
+        Raises:
+            redis.RedisError: If Redis can't be reached.
+
+        Returns:
+            float: The new rate.
+        """
+        key: str = f"{self.prefix}:{host}"
+        rate = AdaptiveRate.for_policy(policy, _parse_state(self._redis.hmget(key, STATE_FIELDS)))
+        rate.observe(status, latency)
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=rate.state())
+            pipe.expire(key, STATE_TTL)
+            pipe.execute()
+        return rate.rate
+
+    def close(self: RedisRateLimiter) -> None:
+        """Close the connection pool."""
+        self._redis.close()
+
+
+class AsyncRedisRateLimiter:
+    """RedisRateLimiter for the asynchronous client.
+
+    asyncio connections belong to the event loop they were opened in, so every AsyncHostLimiter creates
+    its own instead of sharing one per process.
+
+    Args:
+        url: Redis URL, e.g. redis://:password@redis:6379/2
+        prefix: Prefix for the keys, one hash per host.
+    """
+
+    def __init__(self: AsyncRedisRateLimiter, url: str, prefix: str = KEY_PREFIX) -> None:
+        """Create a limiter. Nothing is sent to Redis until the first request."""
+        self.prefix: str = prefix
+        self._redis: redis.asyncio.Redis = redis.asyncio.Redis.from_url(url, **REDIS_OPTIONS)
+        self._reserve = self._redis.register_script(RESERVE_SCRIPT)
+
+    async def reserve(self: AsyncRedisRateLimiter, host: str, policy: HostPolicy) -> float:
+        """Take the next free slot for the host, like RedisRateLimiter does."""
+        return float(await self._reserve(keys=[f"{self.prefix}:{host}"], args=_reserve_args(policy)))
+
+    async def observe(
+        self: AsyncRedisRateLimiter,
+        host: str,
+        policy: HostPolicy,
+        status: int | None,
+        latency: float,
+    ) -> float:
+        """Adjust the shared rate for the host after a response, like RedisRateLimiter does."""
+        key: str = f"{self.prefix}:{host}"
+        rate = AdaptiveRate.for_policy(policy, _parse_state(await self._redis.hmget(key, STATE_FIELDS)))
+        rate.observe(status, latency)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=rate.state())
+            pipe.expire(key, STATE_TTL)
+            await pipe.execute()
+        return rate.rate
+
+    async def aclose(self: AsyncRedisRateLimiter) -> None:
+        """Close the connection pool."""
+        await self._redis.aclose()
+
+
+@lru_cache(maxsize=1)
+def get_shared_limiter() -> RedisRateLimiter | None:
+    """Return the Redis limiter for this process, or None if SCRAPING_SHARED_LIMITS is off."""
+    if not settings.SCRAPING_SHARED_LIMITS:
+        return None
+    return RedisRateLimiter(settings.SCRAPING_REDIS_URL)
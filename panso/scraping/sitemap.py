@@ -0,0 +1,115 @@
+"""Streaming reader for sitemap.xml files.
+
+The sitemap is parsed while it is being downloaded and every <url> or <sitemap> entry is yielded as soon as
+its closing tag arrives. Entries we have yielded are removed from the parse tree, so memory use doesn't grow
+with the size of the sitemap.
+
+Usage:
+    for entry in stream_sitemap("https://www.webhallen.com/sitemap.product.xml"):
+        print(entry.loc, entry.priority)
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from xml.etree.ElementTree import XMLPullParser
+
+from panso.scraping.client import get_client
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from xml.etree.ElementTree import Element
+
+    from panso.scraping.client import ScrapingClient
+
+# <url> in a sitemap, <sitemap> in a sitemap index
+ENTRY_TAGS: frozenset[str] = frozenset({"url", "sitemap"})
+
+
+@dataclass(frozen=True)
+class SitemapEntry:
+    """One <url> or <sitemap> in a sitemap."""
+
+    loc: str
+    priority: float | None = None
+    lastmod: str | None = None
+
+
+def _local_name(tag: str) -> str:
+    """Return the tag without its namespace, e.g. url for {http://www.sitemaps.org/schemas/sitemap/0.9}url."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_priority(priority: str | None) -> float | None:
+    try:
+        return float(priority) if priority else None
+    except ValueError:
+        return None
+
+
+def _entry(element: Element) -> SitemapEntry | None:
+    """Return the entry for a <url> or <sitemap> element, or None if it has no <loc>."""
+    fields: dict[str, str] = {_local_name(child.tag): (child.text or "").strip() for child in element}
+    if not fields.get("loc"):
+        return None
+
+    return SitemapEntry(
+        loc=fields["loc"],
+        priority=_parse_priority(fields.get("priority")),
+        lastmod=fields.get("lastmod") or None,
+    )
+
+
+def parse_sitemap(chunks: Iterable[bytes]) -> Iterator[SitemapEntry]:
+    """Parse a sitemap or sitemap index piece by piece.
+
+    Args:
+        chunks: The sitemap XML, in pieces of any size.
+
+    Yields:
+        SitemapEntry: Entries in the order they appear in the sitemap.
+    """
+    parser = XMLPullParser(events=("start", "end"))
+    root: Element | None = None
+
+    def entries() -> Iterator[SitemapEntry]:
+        nonlocal root
+        for event, element in parser.read_events():
+            if event == "start":
+                root = element if root is None else root
+                continue
+
+            if _local_name(element.tag) not in ENTRY_TAGS:
+                continue
+
+            entry: SitemapEntry | None = _entry(element)
+            if entry:
+                yield entry
+
+            # Forget the entries we are done with
+            if root is not None:
+                root.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from entries()
+
+    parser.close()
+    yield from entries()
+
+
+def stream_sitemap(url: str, client: ScrapingClient | None = None) -> Iterator[SitemapEntry]:
+    """Download a sitemap and yield its entries while it is being downloaded.
+
+    Args:
+        url: URL to the sitemap, e.g. https://www.webhallen.com/sitemap.product.xml
+        client: The client to use. Defaults to the shared client.
+
+    Yields:
+        SitemapEntry: Entries in the order they appear in the sitemap.
+    """
+    client = client or get_client()
+    with client.stream(url) as response:
+        response.raise_for_status()
+        yield from parse_sitemap(response.iter_bytes())
@@ -213,6 +213,12 @@ CACHEOPS: dict[str, dict[str, str | tuple[str, str]]] = {
     "auth.*": {"ops": ("fetch", "get")},
     "products.*": {"ops": "all"},
     "webhallen.*": {"ops": "all"},
+    "webhallen.webhallenproductqueue": {},  # Work queue, changes all the time
+    "webhallen.webhallenproductretry": {},  # Claimed with .update() and read with a new timestamp every time
+    "webhallen.webhallenpricepoint": {},  # Appended to with SQL on every scrape
+    "webhallen.webhallenjsonrevision": {},  # Appended to with bulk_create on every scrape
+    "products.tableversion": {},  # Written by triggers, cacheops would never see the writes
+    "products.tableversionbump": {},  # Written by triggers too
     "intel.*": {"ops": "all"},
     "amd.*": {"ops": "all"},
     "*.*": {},
@@ -223,3 +229,84 @@ CACHEOPS_ENABLED = bool(not DEBUG)
 
 # Our site ID
 SITE_ID = 1
+
+# How many scraped Webhallen products we buffer before writing them to the database in one batch,
+# and how many seconds we wait at most before writing a batch that isn't full.
+WEBHALLEN_WRITER_BATCH_SIZE: int = int(os.getenv(key="WEBHALLEN_WRITER_BATCH_SIZE", default="500"))
+WEBHALLEN_WRITER_FLUSH_INTERVAL: float = float(os.getenv(key="WEBHALLEN_WRITER_FLUSH_INTERVAL", default="10"))
+
+# Products that fail to fetch are retried by delayed Celery tasks, WEBHALLEN_RETRY_BASE_DELAY seconds after the first
+# failure and twice as long after every failure after that, up to WEBHALLEN_RETRY_MAX_DELAY. After
+# WEBHALLEN_RETRY_MAX_ATTEMPTS failures we give up. See webhallen/retries.py.
+WEBHALLEN_RETRY_MAX_ATTEMPTS: int = int(os.getenv(key="WEBHALLEN_RETRY_MAX_ATTEMPTS", default="6"))
+WEBHALLEN_RETRY_BASE_DELAY: float = float(os.getenv(key="WEBHALLEN_RETRY_BASE_DELAY", default="60"))
+WEBHALLEN_RETRY_MAX_DELAY: float = float(os.getenv(key="WEBHALLEN_RETRY_MAX_DELAY", default=str(60 * 60 * 6)))
+
+# How the history of Webhallen product JSON is stored. "full" keeps a copy of the JSON for every change in
+# webhallen_history. "delta" stores a JSON Patch from the version before, with a full snapshot every
+# WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL versions, in webhallen_json_revision. See webhallen/revisions.py.
+WEBHALLEN_HISTORY_MODE: str = os.getenv(key="WEBHALLEN_HISTORY_MODE", default="full")
+WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL: int = int(os.getenv(key="WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL", default="20"))
+
+# The django-simple-history tables are partitioned by month, see products/history.py. The retention job creates
+# partitions HISTORY_PARTITION_MONTHS_AHEAD months ahead, keeps the last version per object per week in partitions
+# older than HISTORY_DOWNSAMPLE_MONTHS months and removes partitions older than HISTORY_RETENTION_MONTHS months.
+# A retention of 0 keeps them forever.
+HISTORY_PARTITION_MONTHS_AHEAD: int = int(os.getenv(key="HISTORY_PARTITION_MONTHS_AHEAD", default="3"))
+HISTORY_DOWNSAMPLE_MONTHS: int = int(os.getenv(key="HISTORY_DOWNSAMPLE_MONTHS", default="6"))
+HISTORY_RETENTION_MONTHS: int = int(os.getenv(key="HISTORY_RETENTION_MONTHS", default="0"))
+
+# Pre-compressed dumps of whole datasets are written here after every scrape and served from /snapshots/.
+# The last SNAPSHOT_KEEP versions of every dataset are kept. See panso/snapshots.py.
+SNAPSHOT_DIR: Path = Path(os.getenv(key="SNAPSHOT_DIR", default=str(BASE_DIR / "data" / "snapshots")))
+SNAPSHOT_KEEP: int = int(os.getenv(key="SNAPSHOT_KEEP", default="2"))
+
+# Every write to the tables of these models bumps their version, so the views that read them can answer
+# If-None-Match and If-Modified-Since with 304 Not Modified. Change VERSION_ETAG_SALT to give every response a new
+# ETag, e.g. after a deploy that changes how the responses look. See products/versions.py.
+VERSIONED_MODELS: list[str] = [
+    "intel.arkfilterdata",
+    "intel.processor",
+    "products.eans",
+    "webhallen.webhallenjson",
+    "webhallen.webhallenjsonrevision",
+    "webhallen.webhallenpricepoint",
+    "webhallen.webhallensection",
+    "webhallen.sitemaparticle",
+    "webhallen.sitemapcampaign",
+    "webhallen.sitemapcampaignlist",
+    "webhallen.sitemapcategory",
+    "webhallen.sitemaphome",
+    "webhallen.sitemapinfopages",
+    "webhallen.sitemapmanufacturer",
+    "webhallen.sitemapproduct",
+    "webhallen.sitemaproot",
+    "webhallen.sitemapsection",
+]
+VERSION_ETAG_SALT: str = os.getenv(key="VERSION_ETAG_SALT", default="")
+# Every write adds a row to table_version_bump. Reading a version folds the rows of its tables into table_version
+# once there are this many of them.
+VERSION_FOLD_AFTER: int = int(os.getenv(key="VERSION_FOLD_AFTER", default="1000"))
+
+# How hard our scrapers are allowed to hit other sites. Requests per second and requests in flight per host.
+# Hosts that are not in SCRAPING_HOSTS get the defaults. See panso/scraping/limits.py.
+SCRAPING_DEFAULT_RATE: float = 2.0
+SCRAPING_DEFAULT_CONCURRENCY: int = 4
+SCRAPING_HOSTS: dict[str, dict[str, float]] = {
+    "www.webhallen.com": {"rate": 8.0, "concurrency": 16, "max_rate": 16.0},
+    "www.intel.com": {"rate": 1.0, "concurrency": 2},
+    "www.amd.com": {"rate": 1.0, "concurrency": 1},
+}
+
+# Share the rate limits above between every Celery worker and management command through Redis, so adding workers
+# doesn't add requests per second. Rates start at "rate" and adapt between "min_rate" (default rate/10) and
+# "max_rate" (default rate) depending on how the host responds. See panso/scraping/ratelimit.py.
+SCRAPING_SHARED_LIMITS: bool = os.getenv(key="SCRAPING_SHARED_LIMITS", default=str(not DEBUG)).lower() == "true"
+SCRAPING_REDIS_URL: str = os.getenv(key="SCRAPING_REDIS_URL", default=f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:6379/2")
+
+# Save every response our scrapers get from the network here, so parsers can be re-run with --replay without
+# scraping the sites again. See panso/scraping/archive.py. The prune_archive command removes fetches older than
+# SCRAPING_ARCHIVE_RETENTION_DAYS days, except the newest one of every URL. Run it from cron when the archive is on.
+SCRAPING_ARCHIVE: bool = os.getenv(key="SCRAPING_ARCHIVE", default="False").lower() == "true"
+SCRAPING_ARCHIVE_DIR: Path = Path(os.getenv(key="SCRAPING_ARCHIVE_DIR", default=str(BASE_DIR / "data" / "archive")))
+SCRAPING_ARCHIVE_RETENTION_DAYS: int = int(os.getenv(key="SCRAPING_ARCHIVE_RETENTION_DAYS", default="30"))
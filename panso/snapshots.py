@@ -0,0 +1,400 @@
+"""Pre-built, pre-compressed snapshots of whole datasets, and the view that serves them.
+
+A dump of every Webhallen product is 130 MB+ and takes seconds to build, so instead of building it for every
+request, write_snapshot() writes it to disk once after a scrape, in every format and compressed ahead of time
+with gzip, brotli and zstd. Serving a download is then reading a file.
+
+Layout of SNAPSHOT_DIR:
+    <dataset>/manifest.json                 The current version, and the size and SHA-256 of every file in it.
+    <dataset>/<version>/<dataset>.<format>  The uncompressed file, with .gz, .br and .zst copies next to it.
+
+A version is written to a temporary directory and renamed when it is done, and the manifest is replaced in one
+rename after that, so a request either gets the old version or the new one and never half of one. The last
+SNAPSHOT_KEEP versions are kept, so a download that read the old manifest can still open its file.
+
+serve_snapshot() picks the smallest file the client accepts from Accept-Encoding. The ETag is the SHA-256 of that
+file, so it is a strong validator and changes with the data, and clients can use it with If-None-Match to get a
+304 and with If-Range to resume a download with Range.
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import re
+import shutil
+import zlib
+from contextlib import ExitStack
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+import brotli
+import orjson
+import zstandard
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+    from django.http import HttpRequest
+
+# Formats a snapshot can be written in, and their Content-Type
+SNAPSHOT_CONTENT_TYPES: dict[str, str] = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Content-Encoding of every file in a snapshot, and the suffix of its file name
+ENCODING_SUFFIXES: dict[str, str] = {
+    "identity": "",
+    "gzip": ".gz",
+    "br": ".br",
+    "zstd": ".zst",
+}
+
+# Compression levels. The files are compressed once and downloaded many times, so we use high ones.
+GZIP_LEVEL: int = 9
+BROTLI_QUALITY: int = 9
+ZSTD_LEVEL: int = 19
+
+# How much of a file is read at a time when serving a range of it
+READ_CHUNK_SIZE: int = 64 * 1024
+
+MANIFEST_NAME: str = "manifest.json"
+
+# One range in a Range header: bytes=0-499, bytes=500- or bytes=-500
+_RANGE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+
+
+class RangeNotSatisfiableError(Exception):
+    """The Range header asks for bytes the file doesn't have."""
+
+
+class Compressor(Protocol):
+    """What zlib.compressobj() and zstandard's compressobj() have in common."""
+
+    def compress(self: Compressor, data: bytes) -> bytes:  # noqa: D102
+        ...
+
+    def flush(self: Compressor) -> bytes:  # noqa: D102
+        ...
+
+
+class BrotliCompressor:
+    """brotli.Compressor with the same methods as the others."""
+
+    def __init__(self: BrotliCompressor) -> None:
+        """Start a new brotli stream."""
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self: BrotliCompressor, data: bytes) -> bytes:
+        """Compress some data, returns what is ready so far."""
+        return self._compressor.process(data)
+
+    def flush(self: BrotliCompressor) -> bytes:
+        """Finish the stream."""
+        return self._compressor.finish()
+
+
+def _compressors() -> dict[str, Compressor]:
+    # wbits 31 writes a gzip header. zlib leaves the timestamp in it at 0, so the same data gives the same file.
+    return {
+        "gzip": zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31),
+        "br": BrotliCompressor(),
+        "zstd": zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(),
+    }
+
+
+def snapshot_dir(dataset: str) -> Path:
+    """Return the directory of a dataset's snapshots."""
+    return Path(settings.SNAPSHOT_DIR) / dataset
+
+
+def _write_format(directory: Path, name: str, chunks: Iterable[bytes]) -> dict[str, dict[str, str | int]]:
+    """Write a file and its compressed copies in one pass over the chunks.
+
+    Args:
+        directory: Where to write the files.
+        name: The name of the uncompressed file.
+        chunks: The content of the file.
+
+    Returns:
+        dict[str, dict[str, str | int]]: The file name, size and SHA-256 of every file, keyed by Content-Encoding.
+    """
+    paths: dict[str, Path] = {encoding: directory / f"{name}{suffix}" for encoding, suffix in ENCODING_SUFFIXES.items()}
+    hashes = {encoding: hashlib.sha256() for encoding in paths}
+    compressors: dict[str, Compressor] = _compressors()
+    with ExitStack() as stack:
+        files = {encoding: stack.enter_context(path.open("wb")) for encoding, path in paths.items()}
+
+        def write(encoding: str, data: bytes) -> None:
+            if data:
+                files[encoding].write(data)
+                hashes[encoding].update(data)
+
+        for chunk in chunks:
+            write("identity", chunk)
+            for encoding, compressor in compressors.items():
+                write(encoding, compressor.compress(chunk))
+        for encoding, compressor in compressors.items():
+            write(encoding, compressor.flush())
+
+    return {
+        encoding: {"file": path.name, "size": path.stat().st_size, "sha256": hashes[encoding].hexdigest()}
+        for encoding, path in paths.items()
+    }
+
+
+def _prune(directory: Path, keep: int) -> list[str]:
+    """Delete all but the newest `keep` versions in a dataset directory, returns the deleted versions."""
+    versions: list[Path] = sorted(
+        (path for path in directory.iterdir() if path.is_dir() and not path.name.startswith(".")),
+        key=lambda path: path.name,
+    )
+    expired: list[Path] = versions[:-keep] if keep > 0 else versions
+    for path in expired:
+        shutil.rmtree(path)
+    return [path.name for path in expired]
+
+
+def write_snapshot(
+    dataset: str,
+    formats: dict[str, Callable[[], Iterable[bytes]]],
+    created: datetime.datetime | None = None,
+) -> dict:
+    """Write a new version of a dataset in every format, with compressed copies, and make it the current one.
+
+    Args:
+        dataset: The name of the dataset, e.g. "webhallen-products". It is used in URLs and file names.
+        formats: A function that returns the content of the file as bytes chunks, for every format.
+        created: When the data was read, now if not given.
+
+    Raises:
+        ValueError: If a format is not in SNAPSHOT_CONTENT_TYPES.
+
+    Returns:
+        dict: The new manifest.
+    """
+    unknown: list[str] = [name for name in formats if name not in SNAPSHOT_CONTENT_TYPES]
+    if unknown:
+        msg: str = f"Unknown snapshot formats: {', '.join(unknown)}"
+        raise ValueError(msg)
+
+    created = created or datetime.datetime.now(tz=datetime.UTC)
+    version: str = created.astimezone(datetime.UTC).strftime("%Y%m%dT%H%M%S%fZ")
+    directory: Path = snapshot_dir(dataset)
+    tmp: Path = directory / f".{version}.tmp"
+    tmp.mkdir(parents=True)
+    try:
+        files: dict[str, dict] = {
+            name: _write_format(tmp, f"{dataset}.{name}", chunks()) for name, chunks in formats.items()
+        }
+        tmp.rename(directory / version)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    manifest: dict = {"dataset": dataset, "version": version, "created": created.isoformat(), "formats": files}
+    manifest_tmp: Path = directory / f".{MANIFEST_NAME}.tmp"
+    manifest_tmp.write_bytes(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    manifest_tmp.replace(directory / MANIFEST_NAME)
+
+    _prune(directory, settings.SNAPSHOT_KEEP)
+    return manifest
+
+
+def load_manifest(dataset: str) -> dict | None:
+    """Return the manifest of the current version of a dataset, or None if it has never been written."""
+    try:
+        return orjson.loads((snapshot_dir(dataset) / MANIFEST_NAME).read_bytes())
+    except FileNotFoundError:
+        return None
+
+
+def _accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """Return the q-value of every coding in an Accept-Encoding header."""
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, parameters = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality: float = 1.0
+        for parameter in parameters.split(";"):
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate_encoding(accept_encoding: str, variants: dict[str, dict]) -> str:
+    """Pick the Content-Encoding to send from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: The Accept-Encoding header, empty if there was none.
+        variants: The files of a format from the manifest, keyed by Content-Encoding.
+
+    Returns:
+        str: The encoding with the highest q-value, the smallest file if there is a tie, or "identity".
+    """
+    qualities: dict[str, float] = _accepted_encodings(accept_encoding)
+    if "x-gzip" in qualities:
+        qualities.setdefault("gzip", qualities["x-gzip"])
+
+    def quality(encoding: str) -> float:
+        return qualities.get(encoding, qualities.get("*", 0.0))
+
+    accepted: list[str] = [encoding for encoding in variants if encoding != "identity" and quality(encoding) > 0]
+    if not accepted:
+        return "identity"
+    return min(accepted, key=lambda encoding: (-quality(encoding), variants[encoding]["size"]))
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Return the first and last byte of a Range header.
+
+    Only one range is supported. A header we don't understand is ignored, like the RFC allows, and the whole
+    file is sent.
+
+    Args:
+        header: The Range header.
+        size: The size of the file.
+
+    Raises:
+        RangeNotSatisfiableError: If the range starts after the end of the file.
+
+    Returns:
+        tuple[int, int] | None: The first and last byte, or None to send the whole file.
+    """
+    match: re.Match | None = _RANGE.match(header)
+    if match is None or not (match[1] or match[2]):
+        return None
+
+    if not match[1]:
+        # bytes=-500 is the last 500 bytes
+        suffix: int = int(match[2])
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiableError
+        return max(size - suffix, 0), size - 1
+
+    start: int = int(match[1])
+    end: int = int(match[2]) if match[2] else size - 1
+    if match[2] and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiableError
+    return start, min(end, size - 1)
+
+
+def _read_range(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        f.seek(start)
+        while length > 0:
+            data: bytes = f.read(min(READ_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _requested_range(request: HttpRequest, size: int, validators: set[str]) -> tuple[int, int] | None:
+    """Return the range of the file a request asks for, or None for the whole file.
+
+    Args:
+        request: The request.
+        size: The size of the file.
+        validators: The ETag and Last-Modified of the file. A Range with an If-Range that is neither of them is
+            for another version of the file, so the whole file is sent instead.
+
+    Raises:
+        RangeNotSatisfiableError: If the range starts after the end of the file.
+
+    Returns:
+        tuple[int, int] | None: The first and last byte, or None to send the whole file.
+    """
+    range_header: str | None = request.headers.get("Range")
+    if_range: str | None = request.headers.get("If-Range")
+    if request.method != "GET" or not range_header or (if_range is not None and if_range not in validators):
+        return None
+    return parse_range(range_header, size)
+
+
+def _file_response(request: HttpRequest, path: Path, size: int, byte_range: tuple[int, int] | None) -> HttpResponse:
+    """Return a file, or a range of it, as a response without any other headers."""
+    if byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+        return response
+    if request.method == "HEAD":
+        response = HttpResponse()
+        response["Content-Length"] = str(size)
+        return response
+    return FileResponse(path.open("rb"))
+
+
+def serve_snapshot(request: HttpRequest, dataset: str, format: str) -> HttpResponse:  # noqa: A002
+    """Serve the current version of a dataset in a format.
+
+    Args:
+        request: The request.
+        dataset: The name of the dataset.
+        format: json, ndjson or csv.
+
+    Raises:
+        Http404: If the dataset has never been written in that format.
+
+    Returns:
+        HttpResponse: The file, a part of it, 304 Not Modified or 416 Range Not Satisfiable.
+    """
+    if request.method not in {"GET", "HEAD"}:
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+
+    manifest: dict | None = load_manifest(dataset)
+    if manifest is None or format not in manifest["formats"]:
+        msg: str = f"There is no {format} snapshot of {dataset}"
+        raise Http404(msg)
+
+    variants: dict[str, dict] = manifest["formats"][format]
+    encoding: str = negotiate_encoding(request.headers.get("Accept-Encoding", ""), variants)
+    variant: dict = variants[encoding]
+    etag: str = f'"{variant["sha256"]}"'
+    last_modified: int = int(datetime.datetime.fromisoformat(manifest["created"]).timestamp())
+    headers: dict[str, str] = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "public, no-cache",
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    response: HttpResponse | None = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            byte_range = _requested_range(request, variant["size"], {etag, headers["Last-Modified"]})
+        except RangeNotSatisfiableError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{variant['size']}"
+            response["Accept-Ranges"] = "bytes"
+            return response
+
+        path: Path = snapshot_dir(dataset) / manifest["version"] / variant["file"]
+        response = _file_response(request, path, variant["size"], byte_range)
+        # The name the file has when it is decoded, clients that save the download decode it first
+        response["Content-Type"] = SNAPSHOT_CONTENT_TYPES[format]
+        response["Content-Disposition"] = f'attachment; filename="{dataset}.{format}"'
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
@@ -0,0 +1,83 @@
+"""Encode rows as a stream of bytes chunks, for streaming responses and snapshot files.
+
+The encoders take JSON text or row tuples one at a time and yield one bytes chunk per `chunk_size` rows, so
+whatever reads from them never has more than a chunk in memory.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator, Sequence
+
+# Rows in one chunk
+STREAM_CHUNK_SIZE: int = 500
+
+
+def batches(rows: Iterable, size: int) -> Iterator[list]:
+    """Split rows into lists of `size` rows, the last one can be shorter."""
+    batch: list = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_json_array(documents: Iterable[str], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode JSON documents as one JSON array, `chunk_size` documents per chunk.
+
+    Args:
+        documents: JSON text.
+        chunk_size: Documents in one chunk.
+
+    Yields:
+        bytes: Parts of the array.
+    """
+    separator: bytes = b"["
+    for batch in batches(documents, chunk_size):
+        yield separator + ",".join(batch).encode()
+        separator = b","
+    yield b"]" if separator == b"," else b"[]"
+
+
+def encode_ndjson(documents: Iterable[str], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode JSON documents as NDJSON, `chunk_size` lines per chunk.
+
+    Args:
+        documents: JSON text without raw newlines, which is what Postgres and orjson give us.
+        chunk_size: Documents in one chunk.
+
+    Yields:
+        bytes: Lines ending with a newline.
+    """
+    for batch in batches(documents, chunk_size):
+        yield ("\n".join(batch) + "\n").encode()
+
+
+def encode_csv(header: Sequence[str], rows: Iterable[Sequence], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode rows as CSV with a header row, `chunk_size` rows per chunk.
+
+    Args:
+        header: The column names.
+        rows: The values of every row, in the same order as the header. None is an empty field.
+        chunk_size: Rows in one chunk.
+
+    Yields:
+        bytes: UTF-8 CSV lines.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -7,9 +7,41 @@ https://docs.djangoproject.com/en/5.0/topics/testing/
 
 from __future__ import annotations
 
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from decimal import Decimal
+from pathlib import Path
 from typing import TYPE_CHECKING
 
-from django.test import TestCase
+import brotli
+import httpx
+import orjson
+import pytest
+import zstandard
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import SimpleTestCase, TestCase
+from django.utils.translation import gettext_lazy
+
+from panso.renderers import ORJSONResponse, orjson_dumps
+from panso.scraping import (
+    HostPolicy,
+    NotArchivedError,
+    ResponseArchive,
+    ScrapeMetrics,
+    ScrapingClient,
+    SitemapEntry,
+    parse_sitemap,
+)
+from panso.scraping.limits import HostLimiter, get_host_policy
+from panso.scraping.metrics import RequestMetric
+from panso.scraping.ratelimit import DECREASE_COOLDOWN, AdaptiveRate, RedisRateLimiter
+from panso.snapshots import load_manifest, write_snapshot
+from panso.streams import encode_csv, encode_ndjson
 
 if TYPE_CHECKING:
     from django.http import HttpResponse
@@ -41,3 +73,358 @@ class PansoTests(TestCase):
     #     assert response3.status_code == 200
     #     response4: HttpResponse = self.client.get("/admin/login/")
     #     assert response4.status_code == 200
+
+
+class RendererTests(TestCase):
+    """Tests for encoding API responses with orjson."""
+
+    def test_same_output_as_django(self: RendererTests) -> None:
+        """Test that the types orjson doesn't know are encoded like DjangoJSONEncoder encodes them."""
+        data: dict = {
+            "price": Decimal("1990.00"),
+            "name": gettext_lazy("Price"),
+            "duration": datetime.timedelta(days=1, seconds=5),
+            "tags": ("a", "b"),
+            "when": datetime.date(2024, 1, 2),
+            1: None,
+        }
+        assert orjson.loads(orjson_dumps(data)) == json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+        assert orjson_dumps(datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.UTC)) == b'"2024-01-02T03:04:05Z"'
+
+        with pytest.raises(TypeError):
+            orjson_dumps(object())
+
+    def test_renderer(self: RendererTests) -> None:
+        """Test that Ninja renders its own responses, like validation errors, with orjson."""
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products/1/prices?days=0")
+        assert response.status_code == 422
+        assert response["Content-Type"] == "application/json; charset=utf-8"
+        assert response.json()["detail"][0]["loc"] == ["query", "days"]
+
+        response = ORJSONResponse([{"price": Decimal("1.50")}], status=201)
+        assert response.status_code == 201
+        assert response["Content-Type"] == "application/json"
+        assert response.content == b'[{"price":"1.50"}]'
+
+
+class ScrapingClientTests(SimpleTestCase):
+    """Tests for the shared scraping client."""
+
+    def test_host_policy_from_settings(self: ScrapingClientTests) -> None:
+        """Test that hosts use their settings and unknown hosts get the defaults."""
+        policy: HostPolicy = get_host_policy("www.webhallen.com")
+        assert policy == HostPolicy(rate=8.0, concurrency=16, max_rate=16.0)
+        assert policy.min_rate == 0.8
+
+        default: HostPolicy = get_host_policy("example.com")
+        assert default.rate == settings.SCRAPING_DEFAULT_RATE
+        assert default.concurrency == settings.SCRAPING_DEFAULT_CONCURRENCY
+
+        override = HostPolicy(rate=1.0, concurrency=1)
+        assert get_host_policy("www.webhallen.com", overrides={"www.webhallen.com": override}) == override
+
+    def test_retry_and_metrics(self: ScrapingClientTests) -> None:
+        """Test that 503 is retried and that every attempt is recorded."""
+        statuses: list[int] = [503, 200]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(statuses.pop(0), json={"url": str(request.url)})
+
+        collector = ScrapeMetrics()
+        hosts: dict[str, HostPolicy] = {"example.com": HostPolicy(rate=100.0, concurrency=1)}
+        with ScrapingClient(hosts=hosts, collector=collector, transport=httpx.MockTransport(handler)) as client:
+            response: httpx.Response = client.get("https://example.com/test")
+
+        assert response.status_code == 200
+        stats: dict = collector.summary()["example.com"]
+        assert stats["requests"] == 2
+        assert stats["statuses"] == {503: 1, 200: 1}
+
+    def test_client_errors_are_not_retried(self: ScrapingClientTests) -> None:
+        """Test that a 404 is returned straight away."""
+        calls: list[httpx.Request] = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            return httpx.Response(404)
+
+        with ScrapingClient(collector=ScrapeMetrics(), transport=httpx.MockTransport(handler)) as client:
+            response: httpx.Response = client.get("https://example.com/missing")
+
+        assert response.status_code == 404
+        assert len(calls) == 1
+
+
+class AdaptiveRateTests(SimpleTestCase):
+    """Tests for the adaptive per-host rate."""
+
+    def test_backs_off_once_per_cooldown(self: AdaptiveRateTests) -> None:
+        """Test that 429 halves the rate and that errors right after it don't halve it again."""
+        rate = AdaptiveRate.for_policy(HostPolicy(rate=8.0, concurrency=1, min_rate=1.0, max_rate=16.0))
+        assert rate.observe(429, 0.1, now=100.0) == 4.0
+        assert rate.observe(503, 0.1, now=101.0) == 4.0
+        assert rate.observe(None, 0.1, now=100.0 + DECREASE_COOLDOWN) == 2.0
+        assert rate.observe(503, 0.1, now=200.0) == 1.0
+        assert rate.observe(503, 0.1, now=300.0) == 1.0
+
+    def test_probes_up_to_max_rate(self: AdaptiveRateTests) -> None:
+        """Test that healthy responses raise the rate until max_rate, and that 404 counts as healthy."""
+        rate = AdaptiveRate.for_policy(HostPolicy(rate=8.0, concurrency=1, max_rate=10.0))
+        assert rate.observe(200, 0.1, now=0.0) > 8.0
+        for _ in range(100):
+            rate.observe(404, 0.1, now=0.0)
+        assert rate.rate == 10.0
+
+    def test_backs_off_on_rising_latency(self: AdaptiveRateTests) -> None:
+        """Test that responses getting much slower lower the rate even if they are 200."""
+        rate = AdaptiveRate.for_policy(HostPolicy(rate=8.0, concurrency=1))
+        for _ in range(10):
+            rate.observe(200, 0.1, now=0.0)
+        assert rate.rate == 8.0
+
+        for _ in range(5):
+            rate.observe(200, 1.0, now=100.0)
+        assert rate.congested
+        assert rate.rate == 4.0
+
+    def test_state_round_trip(self: AdaptiveRateTests) -> None:
+        """Test that a rate read back from its state is clamped to the policy."""
+        rate = AdaptiveRate.for_policy(HostPolicy(rate=8.0, concurrency=1))
+        rate.observe(429, 0.5, now=10.0)
+        restored = AdaptiveRate.for_policy(HostPolicy(rate=8.0, concurrency=1), rate.state())
+        assert restored == rate
+
+        lowered = AdaptiveRate.for_policy(HostPolicy(rate=2.0, concurrency=1), {"rate": 8.0})
+        assert lowered.rate == 2.0
+
+    def test_local_fallback_without_redis(self: AdaptiveRateTests) -> None:
+        """Test that the limiter keeps working with its own schedule when Redis can't be reached."""
+        policy = HostPolicy(rate=1000.0, concurrency=1)
+        limiter = HostLimiter(
+            overrides={"example.com": policy},
+            shared=RedisRateLimiter("redis://localhost:1/0"),
+        )
+        with limiter.slot("example.com"):
+            pass
+        assert not limiter._schedule.use_redis  # noqa: SLF001
+
+        limiter.observe(RequestMetric("https://example.com/", "example.com", 429, 0.1, 0, cache_hit=False))
+        assert limiter._schedule.rate("example.com", policy).rate == 500.0  # noqa: SLF001
+
+
+class ResponseArchiveTests(SimpleTestCase):
+    """Tests for the raw response archive and replay mode."""
+
+    def setUp(self: ResponseArchiveTests) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = ResponseArchive(Path(self.tmp.name))
+
+    def tearDown(self: ResponseArchiveTests) -> None:
+        self.archive.close()
+        self.tmp.cleanup()
+
+    def test_identical_bodies_are_stored_once(self: ResponseArchiveTests) -> None:
+        """Test that two fetches with the same body share one compressed object."""
+        first = self.archive.store("https://example.com/a", 200, [("content-type", "text/html")], b"<html></html>")
+        second = self.archive.store("https://example.com/a", 200, [("content-type", "text/html")], b"<html></html>")
+
+        assert first.digest == second.digest
+        assert len(self.archive.fetches("https://example.com/a")) == 2
+        assert len(list((Path(self.tmp.name) / "objects").rglob("*.zst"))) == 1
+        assert self.archive.read_body(first.digest) == b"<html></html>"
+
+    def test_replay(self: ResponseArchiveTests) -> None:
+        """Test that a response fetched through the archive can be replayed without the network."""
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, json={"id": 1}, headers={"x-test": "yes"})
+
+        transport = httpx.MockTransport(handler)
+        with ScrapingClient(archive=self.archive, collector=ScrapeMetrics(), transport=transport) as client:
+            client.get("https://example.com/product/1")
+
+        collector = ScrapeMetrics()
+        with ScrapingClient(archive=self.archive, collector=collector, replay=True) as client:
+            response: httpx.Response = client.get("https://example.com/product/1")
+            assert response.json() == {"id": 1}
+            assert response.headers["x-test"] == "yes"
+            assert collector.summary()["example.com"]["cache_hits"] == 1
+
+            with pytest.raises(NotArchivedError):
+                client.get("https://example.com/product/2")
+
+    def test_encoded_bodies_are_archived_decoded(self: ResponseArchiveTests) -> None:
+        """Test that a gzipped response is stored as the body the client sees."""
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=gzip.compress(b"<urlset/>"), headers={"content-encoding": "gzip"})
+
+        transport = httpx.MockTransport(handler)
+        client = ScrapingClient(archive=self.archive, collector=ScrapeMetrics(), transport=transport)
+        with client, client.stream("https://example.com/sitemap.xml") as response:
+            assert response.read() == b"<urlset/>"
+
+        entry = self.archive.latest("https://example.com/sitemap.xml")
+        assert entry is not None
+        assert self.archive.read_body(entry.digest) == b"<urlset/>"
+        assert ("content-encoding", "gzip") not in entry.headers
+
+    def test_prune(self: ResponseArchiveTests) -> None:
+        """Test that pruning removes old fetches and their bodies, but keeps the newest fetch of every URL."""
+        now = datetime.datetime.now(tz=datetime.UTC)
+        old = now - datetime.timedelta(days=60)
+        old_body = self.archive.store("https://example.com/a", 200, [], b"old", fetched_at=old)
+        new_body = self.archive.store("https://example.com/a", 200, [], b"new", fetched_at=now)
+        only_fetch = self.archive.store("https://example.com/b", 200, [], b"only", fetched_at=old)
+        for path in (Path(self.tmp.name) / "objects").rglob("*.zst"):
+            os.utime(path, (old.timestamp(), old.timestamp()))
+
+        stats = self.archive.prune(now - datetime.timedelta(days=30))
+
+        assert (stats.fetches, stats.bodies) == (1, 1)
+        assert self.archive.fetches("https://example.com/a") == [new_body]
+        assert self.archive.fetches("https://example.com/b") == [only_fetch]
+        assert self.archive.read_body(new_body.digest) == b"new"
+        assert not self.archive._object_path(old_body.digest).exists()  # noqa: SLF001
+
+
+class SitemapParserTests(SimpleTestCase):
+    """Tests for the streaming sitemap reader."""
+
+    def test_parse_sitemap_in_small_pieces(self: SitemapParserTests) -> None:
+        """Test that entries are found no matter where the chunks are split."""
+        xml: bytes = (
+            b'<?xml version="1.0" encoding="UTF-8"?>'
+            b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            b"<url><loc>https://www.webhallen.com/se/product/1-A</loc><priority>0.8</priority></url>"
+            b"<url><loc>https://www.webhallen.com/se/product/2-B</loc><lastmod>2024-01-01</lastmod></url>"
+            b"<url><priority>0.1</priority></url>"
+            b"</urlset>"
+        )
+        chunks: list[bytes] = [xml[i : i + 7] for i in range(0, len(xml), 7)]
+        assert list(parse_sitemap(chunks)) == [
+            SitemapEntry(loc="https://www.webhallen.com/se/product/1-A", priority=0.8),
+            SitemapEntry(loc="https://www.webhallen.com/se/product/2-B", lastmod="2024-01-01"),
+        ]
+
+    def test_parse_sitemap_index(self: SitemapParserTests) -> None:
+        """Test that <sitemap> entries in a sitemap index are found."""
+        xml: bytes = (
+            b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            b"<sitemap><loc>https://www.webhallen.com/sitemap.home.xml</loc></sitemap>"
+            b"</sitemapindex>"
+        )
+        assert list(parse_sitemap([xml])) == [SitemapEntry(loc="https://www.webhallen.com/sitemap.home.xml")]
+
+
+class SnapshotTests(SimpleTestCase):
+    """Tests for writing and serving pre-compressed snapshots."""
+
+    def setUp(self: SnapshotTests) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(SNAPSHOT_DIR=Path(self.tmp.name), SNAPSHOT_KEEP=2)
+        self.settings_override.enable()
+        self.rows: list[tuple] = [(i, f"Product {i}", None) for i in range(2000)]
+        self.manifest: dict = write_snapshot(
+            "test-products",
+            {
+                "ndjson": lambda: encode_ndjson(orjson.dumps({"id": i}).decode() for i, _, _ in self.rows),
+                "csv": lambda: encode_csv(("id", "name", "price"), self.rows),
+            },
+        )
+        self.url: str = "/snapshots/test-products.ndjson"
+        self.identity: bytes = self.client.get(self.url).getvalue()
+
+    def tearDown(self: SnapshotTests) -> None:
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def test_files_and_manifest(self: SnapshotTests) -> None:
+        """Test that every format is written with compressed copies that decode to the same bytes."""
+        assert load_manifest("test-products") == self.manifest
+        assert self.identity.splitlines()[1999] == b'{"id":1999}'
+
+        directory: Path = Path(self.tmp.name) / "test-products" / self.manifest["version"]
+        csv: bytes = (directory / "test-products.csv").read_bytes()
+        assert csv.splitlines()[:2] == [b"id,name,price", b"0,Product 0,"]
+        assert gzip.decompress((directory / "test-products.csv.gz").read_bytes()) == csv
+        assert brotli.decompress((directory / "test-products.csv.br").read_bytes()) == csv
+        assert (
+            zstandard.ZstdDecompressor().decompressobj().decompress((directory / "test-products.csv.zst").read_bytes())
+            == csv
+        )
+
+    def test_old_versions_are_pruned(self: SnapshotTests) -> None:
+        """Test that only the last SNAPSHOT_KEEP versions are kept."""
+        for _ in range(2):
+            write_snapshot("test-products", {"csv": lambda: encode_csv(("id",), [(1,)])})
+
+        versions: list[str] = sorted(p.name for p in (Path(self.tmp.name) / "test-products").iterdir() if p.is_dir())
+        assert len(versions) == 2
+        assert self.manifest["version"] not in versions
+        assert self.client.get(self.url).status_code == 404
+
+    def test_content_encoding(self: SnapshotTests) -> None:
+        """Test that the smallest accepted encoding is served with its own strong ETag."""
+        variants: dict = self.manifest["formats"]["ndjson"]
+        response: HttpResponse = self.client.get(self.url, headers={"Accept-Encoding": "gzip, deflate, br, zstd"})
+        smallest: str = min(("gzip", "br", "zstd"), key=lambda encoding: variants[encoding]["size"])
+        assert response["Content-Encoding"] == smallest
+        assert response["ETag"] == f'"{variants[smallest]["sha256"]}"'
+        assert response["Vary"] == "Accept-Encoding"
+        assert response["Content-Type"] == "application/x-ndjson"
+
+        response = self.client.get(self.url, headers={"Accept-Encoding": "gzip"})
+        assert response["Content-Encoding"] == "gzip"
+        assert gzip.decompress(response.getvalue()) == self.identity
+
+        response = self.client.get(self.url, headers={"Accept-Encoding": "br;q=0.5, zstd;q=0"})
+        assert response["Content-Encoding"] == "br"
+        assert brotli.decompress(response.getvalue()) == self.identity
+
+        response = self.client.get(self.url, headers={"Accept-Encoding": "identity"})
+        assert not response.has_header("Content-Encoding")
+        assert response["ETag"] == f'"{variants["identity"]["sha256"]}"'
+        assert hashlib.sha256(self.identity).hexdigest() == variants["identity"]["sha256"]
+
+    def test_not_modified(self: SnapshotTests) -> None:
+        """Test that If-None-Match with the current ETag gets a 304."""
+        etag: str = self.client.get(self.url, headers={"Accept-Encoding": "br"})["ETag"]
+
+        response: HttpResponse = self.client.get(self.url, headers={"Accept-Encoding": "br", "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not response.content
+
+        # Another encoding is another representation with another ETag
+        assert self.client.get(self.url, headers={"If-None-Match": etag}).status_code == 200
+
+    def test_range(self: SnapshotTests) -> None:
+        """Test that downloads can be resumed with Range and If-Range."""
+        etag: str = self.client.get(self.url)["ETag"]
+        size: int = len(self.identity)
+
+        response: HttpResponse = self.client.get(self.url, headers={"Range": "bytes=100-199", "If-Range": etag})
+        assert response.status_code == 206
+        assert response["Content-Range"] == f"bytes 100-199/{size}"
+        assert response.getvalue() == self.identity[100:200]
+
+        response = self.client.get(self.url, headers={"Range": "bytes=-10"})
+        assert response.getvalue() == self.identity[-10:]
+        response = self.client.get(self.url, headers={"Range": f"bytes={size - 5}-"})
+        assert response.getvalue() == self.identity[-5:]
+
+        # The file changed since the client got the first part, so it gets all of the new one
+        response = self.client.get(self.url, headers={"Range": "bytes=100-199", "If-Range": '"old"'})
+        assert response.status_code == 200
+        assert response.getvalue() == self.identity
+
+        response = self.client.get(self.url, headers={"Range": f"bytes={size}-"})
+        assert response.status_code == 416
+        assert response["Content-Range"] == f"bytes */{size}"
+
+    def test_unknown_snapshot(self: SnapshotTests) -> None:
+        """Test that datasets and formats that have not been written are 404."""
+        assert self.client.get("/snapshots/test-products.json").status_code == 404
+        assert self.client.get("/snapshots/nothing.csv").status_code == 404
+        assert self.client.post(self.url).status_code == 405
@@ -15,6 +15,8 @@ Contains the following routes:
         - Our main sitemap, contains links to all other sitemaps.
     - /sitemap-webhallen.xml
         - Sitemap for Webhallen. Add more sections in panso/sitemaps.py
+    - /snapshots/<dataset>.<format>
+        - Pre-compressed dump of a whole dataset, e.g. /snapshots/webhallen-products.ndjson. See panso/snapshots.py
     - /testboi/
         - So we can test stuff without creating a new URL route.
 See:
@@ -36,6 +38,8 @@ from django.utils.text import slugify
 from intel.models import Processor
 from panso.api import api
 from panso.sitemaps import IntelProcessorSitemap, StaticViewSitemap, WebhallenJSONSitemap
+from panso.snapshots import serve_snapshot
+from products.versions import conditional_as
 from webhallen.models.json import WebhallenJSON
 
 
@@ -113,10 +117,17 @@ urlpatterns: list = [
     # Sitemap for other sections. Add more sections in panso/sitemaps.py
     path(
         route="sitemap-<section>.xml",
-        view=cached_view_as(WebhallenJSON, Processor)(sitemaps_views.sitemap),
+        view=conditional_as(WebhallenJSON, Processor)(cached_view_as(WebhallenJSON, Processor)(sitemaps_views.sitemap)),
         kwargs={"sitemaps": sitemaps},
         name="django.contrib.sitemaps.views.sitemap",
     ),
+    # /snapshots/webhallen-products.ndjson
+    # Pre-compressed dump of a whole dataset
+    path(
+        route="snapshots/<slug:dataset>.<slug:format>",
+        view=serve_snapshot,
+        name="snapshot",
+    ),
     # Debug toolbar
     path("__debug__/", include("debug_toolbar.urls")),
 ]
@@ -4,45 +4,122 @@ See https://django-ninja.dev/ for more information.
 
 API endpoints:
 - /api/v1/eans
+    - Return all EANs, or a page of them with ?after=, ?limit= and ?fields=, see panso/pagination.py.
 - /api/v1/eans/{ean}
+- /api/v1/eans/lookup (POST)
 """
 
 from __future__ import annotations
 
-from django.http import Http404, HttpRequest, JsonResponse
-from django.shortcuts import get_object_or_404
-from ninja import Router
+from django.http import HttpRequest  # noqa: TCH002
+from ninja import Field, Query, Router, Schema
+from ninja.decorators import decorate_view
 
+from panso.pagination import PageParams, paginate
+from panso.renderers import ErrorOut, ORJSONResponse, schema_fields
+from products.gtin import InvalidGTINError, format_gtin, normalize_gtin
 from products.models import Eans
+from products.versions import conditional_as
 
 router = Router()
 
+
+class EanOut(Schema):
+    """An EAN and the name of its product."""
+
+    ean: str
+    name: str | None
+
+
+class EanMatchOut(EanOut):
+    """An EAN that was found by /eans/lookup."""
+
+    query: str = Field(..., description="The code as it was asked for.")
+    gtin: str = Field(..., description="The code as a GTIN-14.")
+
+
+class EanLookupOut(Schema):
+    """Response of /eans/lookup."""
+
+    found: list[EanMatchOut]
+    not_found: list[str]
+    invalid: list[str]
+
+
+# Fields of an EAN that ?fields= can ask for, and the fields of EanOut
+EAN_FIELDS: tuple[str, ...] = ("ean", "name", "gtin", "created", "updated")
+EAN_OUT_FIELDS: tuple[str, ...] = schema_fields(EanOut)
+
+# Maximum number of EANs in one lookup
+EAN_LOOKUP_LIMIT: int = 1000
+
 # TODO(TheLovinator): #30 We should add more OpenAPI documentation for each endpoint.
 # https://github.com/TheLovinator1/panso.se/issues/30
 
 
 @router.get(
     path="/eans",
+    response=list[EanOut],
     summary="Return all EANs.",
-    description="Return all EANs as JSON.  \n\n **Note:** This will return a JSON array of 12k+ EANs so don't try to load this via the Swagger UI.",  # noqa: E501
+    description="Return all EANs as JSON.  \n\n **Note:** This will return a JSON array of 12k+ EANs so don't try to load this via the Swagger UI.\n\n"  # noqa: E501
+    "With `after`, `limit` or `fields`, return a page of EANs ordered by EAN instead. "
+    "The `Link` header has the URL of the next page.",
+)
+@decorate_view(conditional_as(Eans))
+def list_eans(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
+    """Return all EANs, or a page of them."""
+    if page.requested:
+        return paginate(request, Eans.objects.all(), page, key="ean", allowed=EAN_FIELDS, default=("name",))
+    return ORJSONResponse(list(Eans.objects.values(*EAN_OUT_FIELDS)))
+
+
+class EanLookupIn(Schema):
+    """Body for /eans/lookup."""
+
+    eans: list[str] = Field(
+        ...,
+        max_length=EAN_LOOKUP_LIMIT,
+        description="GTIN-8, GTIN-12 (UPC-A), GTIN-13 (EAN-13) or GTIN-14 codes. Spaces and dashes are ignored.",
+    )
+
+
+# Must be defined before /eans/{ean}, or {ean} would match "lookup"
+@router.post(
+    path="/eans/lookup",
+    response=EanLookupOut,
+    summary="Look up many EANs at once.",
+    description=f"Look up to {EAN_LOOKUP_LIMIT} EANs in one request.  \n\n"
+    "Codes are matched by their GTIN, so the same product is found as EAN-13, UPC-A or GTIN-14. "
+    "Codes with a wrong length or check digit are returned in `invalid`.",
 )
-def list_eans(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
-    """Return all EANs."""
-    eans = list(Eans.objects.values("ean", "name"))
-    return JsonResponse(data=eans, safe=False)
+def lookup_eans(request: HttpRequest, payload: EanLookupIn) -> ORJSONResponse:  # noqa: ARG001
+    """Return the EANs we know of out of a list of EANs."""
+    gtins: dict[str, int] = {}
+    invalid: list[str] = []
+    for code in dict.fromkeys(payload.eans):
+        try:
+            gtins[code] = normalize_gtin(code)
+        except InvalidGTINError:  # noqa: PERF203
+            invalid.append(code)
+
+    # One row per GTIN. The same GTIN can be stored as both EAN-13 and UPC-A, take the first.
+    known: dict[int, dict[str, str | None]] = {}
+    rows = Eans.objects.filter(gtin__in=set(gtins.values())).order_by("ean").values_list("gtin", "ean", "name")
+    for gtin, ean, name in rows:
+        known.setdefault(gtin, {"ean": ean, "name": name})
+
+    found: list[dict[str, str | None]] = [
+        {"query": code, "gtin": format_gtin(gtin), **known[gtin]} for code, gtin in gtins.items() if gtin in known
+    ]
+    not_found: list[str] = [code for code, gtin in gtins.items() if gtin not in known]
+    return ORJSONResponse({"found": found, "not_found": not_found, "invalid": invalid})
 
 
-@router.get(path="/eans/{ean}")
-def get_ean(request: HttpRequest, ean: str) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/eans/{ean}", response={200: EanOut, 404: ErrorOut})
+@decorate_view(conditional_as(Eans))
+def get_ean(request: HttpRequest, ean: str) -> ORJSONResponse:  # noqa: ARG001
     """Return EAN."""
-    try:
-        _ean: Eans = get_object_or_404(Eans, ean=ean)
-        ean_data: dict[str, str] = {
-            "ean": str(_ean.ean),
-            "name": str(_ean.name),
-        }
-        return JsonResponse(data=ean_data, safe=False)
-    except Http404:
-        return JsonResponse(data={"error": f"EAN with ID {ean} not found."}, status=404)
-    except Exception as e:  # noqa: BLE001
-        return JsonResponse(data={"error": str(e)}, status=500)
+    ean_data: dict | None = Eans.objects.filter(ean=ean).values(*EAN_OUT_FIELDS).first()
+    if ean_data is None:
+        return ORJSONResponse({"error": f"EAN with ID {ean} not found."}, status=404)
+    return ORJSONResponse(ean_data)
@@ -1,6 +1,9 @@
 """Django application configuration for our main application."""
 
+from __future__ import annotations
+
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
@@ -8,3 +11,9 @@ class ProductsConfig(AppConfig):
 
     default_auto_field: str = "django.db.models.BigAutoField"
     name: str = "products"
+
+    def ready(self: ProductsConfig) -> None:
+        """Create the triggers behind conditional GET after every migrate, see products/versions.py."""
+        from products.versions import install_version_triggers  # noqa: PLC0415
+
+        post_migrate.connect(install_version_triggers, sender=self)
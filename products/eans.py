@@ -0,0 +1,86 @@
+"""Derive the EAN table from the Webhallen products in the database.
+
+derive_eans() is one INSERT ... SELECT: every EAN in product_json -> 'product' -> 'eans' is unnested with
+jsonb_array_elements_text() and upserted with its product's name and its GTIN number, see products/gtin.py. EANs
+whose name didn't change are not written.
+
+By default only products updated since the last run are read, see webhallen/watermarks.py. full=True reads every
+product, for example after the table has been emptied.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from cacheops import invalidate_model
+from django.db import connection, transaction
+
+from products.models import Eans
+from webhallen.watermarks import ADVANCE_WATERMARK_SQL, SINCE_SQL, watermark_params
+
+# Name of the watermark in webhallen_watermark
+EANS_WATERMARK: str = "eans"
+
+# The same EAN can be on more than one product; the most recently updated product wins.
+DERIVE_EANS_SQL: str = f"""
+WITH changed AS (
+    SELECT j.product_json -> 'product' AS product, j.updated
+    FROM webhallen_json j
+    WHERE j.updated > ({SINCE_SQL})
+), eans AS (
+    SELECT DISTINCT ON (ean) ean, product ->> 'name' AS name
+    FROM changed, jsonb_array_elements_text(
+        CASE WHEN jsonb_typeof(product -> 'eans') = 'array' THEN product -> 'eans' ELSE '[]'::jsonb END
+    ) AS ean
+    WHERE ean <> '' AND coalesce(product ->> 'name', '') <> ''
+    ORDER BY ean, updated DESC
+), upserted AS (
+    INSERT INTO eans AS e (ean, name, gtin, created, updated)
+    SELECT ean, name, gtin_to_bigint(ean), now(), now() FROM eans
+    ON CONFLICT (ean) DO UPDATE SET name = excluded.name, updated = now()
+    WHERE e.name IS DISTINCT FROM excluded.name
+    RETURNING e.ean, e.xmax = 0 AS created
+), watermark AS ({ADVANCE_WATERMARK_SQL})
+SELECT
+    (SELECT count(*) FROM changed),
+    array(SELECT ean FROM upserted WHERE created),
+    array(SELECT ean FROM upserted WHERE NOT created)
+"""  # noqa: S608
+
+
+@dataclass
+class EanChanges:
+    """What a derive_eans() run did."""
+
+    scanned: int = 0
+    created: int = 0
+    changed: int = 0
+
+
+def _create_history(eans: list[str], *, update: bool, chunk_size: int) -> None:
+    """Create history rows for the EANs we inserted or updated with SQL."""
+    for start in range(0, len(eans), chunk_size):
+        objects: list[Eans] = list(Eans.objects.nocache().filter(ean__in=eans[start : start + chunk_size]))
+        Eans.history.bulk_history_create(objects, update=update, batch_size=chunk_size)
+
+
+def derive_eans(*, full: bool = False, chunk_size: int = 1000) -> EanChanges:
+    """Create and rename EANs from the products that changed since the last run.
+
+    Args:
+        full: Read every product instead of the ones updated since the watermark.
+        chunk_size: How many history rows we create at a time.
+
+    Returns:
+        EanChanges: How many products were read and how many EANs were created and renamed.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(DERIVE_EANS_SQL, watermark_params(EANS_WATERMARK, full=full))
+        scanned, created, changed = cursor.fetchone()
+
+        if created or changed:
+            _create_history(created, update=False, chunk_size=chunk_size)
+            _create_history(changed, update=True, chunk_size=chunk_size)
+            invalidate_model(Eans)
+
+    return EanChanges(scanned=scanned, created=len(created), changed=len(changed))
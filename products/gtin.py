@@ -0,0 +1,73 @@
+"""GTIN (EAN/UPC) normalisation.
+
+EAN-8, UPC-A (GTIN-12), EAN-13 and GTIN-14 are all the same number with a different amount of leading zeros, so
+every code is stored as its GTIN-14 value in a bigint. "5907814951762", "05907814951762" and "5907814951762 "
+are the same product.
+
+The last digit is a check digit: the other digits are weighted 3, 1, 3, 1, ... from the right, and the check digit
+brings the sum up to a multiple of 10.
+
+The database has the same logic in the gtin_to_bigint() SQL function, see
+products/migrations/0005_gtin_to_bigint_separators.py, so EANs can be normalised in SQL when they are derived.
+"""
+
+from __future__ import annotations
+
+# Lengths of GTIN-8, GTIN-12 (UPC-A), GTIN-13 (EAN-13) and GTIN-14
+GTIN_LENGTHS: frozenset[int] = frozenset({8, 12, 13, 14})
+
+# Characters people and scanners put in barcodes that are not part of the number. They are removed wherever they
+# are. gtin_to_bigint() in the database removes the same ones, so the two always agree.
+GTIN_SEPARATORS: str = " \t\n\r-"
+
+
+class InvalidGTINError(ValueError):
+    """The code is not a GTIN-8, GTIN-12, GTIN-13 or GTIN-14, or its check digit is wrong."""
+
+
+def gtin_check_digit(digits: str) -> int:
+    """Return the check digit for a GTIN without its check digit.
+
+    Args:
+        digits: The GTIN without the last digit, e.g. 590781495176 for 5907814951762.
+
+    Returns:
+        int: The check digit, e.g. 2.
+    """
+    total: int = sum(int(digit) * (3 if position % 2 == 0 else 1) for position, digit in enumerate(reversed(digits)))
+    return (10 - total % 10) % 10
+
+
+def normalize_gtin(code: str) -> int:
+    """Validate a GTIN and return it as a number.
+
+    Args:
+        code: GTIN-8, GTIN-12, GTIN-13 or GTIN-14. Spaces, tabs, line breaks and dashes are ignored.
+
+    Raises:
+        InvalidGTINError: If the code has the wrong length, has other characters than digits or a wrong check digit.
+
+    Returns:
+        int: The GTIN-14 value, e.g. 5907814951762.
+    """
+    digits: str = code.translate(str.maketrans("", "", GTIN_SEPARATORS))
+    if not digits.isascii() or not digits.isdigit() or len(digits) not in GTIN_LENGTHS:
+        msg: str = f"{code!r} is not a GTIN-8, GTIN-12, GTIN-13 or GTIN-14"
+        raise InvalidGTINError(msg)
+
+    if gtin_check_digit(digits[:-1]) != int(digits[-1]):
+        msg = f"{code!r} has the wrong check digit"
+        raise InvalidGTINError(msg)
+    return int(digits)
+
+
+def format_gtin(gtin: int) -> str:
+    """Return a GTIN as 14 digits.
+
+    Args:
+        gtin: What normalize_gtin() returned.
+
+    Returns:
+        str: The GTIN-14, e.g. 05907814951762.
+    """
+    return f"{gtin:014d}"
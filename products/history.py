@@ -0,0 +1,286 @@
+"""Monthly partitions and retention for the django-simple-history tables.
+
+Every model with HistoricalRecords gets a history table that is only ever appended to. partition_table()
+converts one to a table partitioned by month on history_date, with a partition named <table>_pYYYYMM for every
+month that has history, the next HISTORY_PARTITION_MONTHS_AHEAD months, and <table>_default for anything outside
+them. Queries that filter on history_date only read the partitions that can match.
+
+maintain_partitions() is the retention job:
+    - It creates the partitions for the coming months, so new history never ends up in the default partition.
+    - Partitions older than HISTORY_DOWNSAMPLE_MONTHS are cut down to the last version per object per week.
+      A downsampled partition gets a comment, so it is only read once.
+    - Partitions older than HISTORY_RETENTION_MONTHS are dropped, or detached with detach=True so they can be
+      archived first. Either way the history is gone in an instant, without a DELETE.
+
+The history_id column stays unique because it still comes from a sequence, but Postgres requires the partition
+key in the primary key, so the primary key is (history_id, history_date).
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from simple_history.models import HistoricalChanges
+
+if TYPE_CHECKING:
+    from django.db import models
+
+# The comment on a partition that has been downsampled
+DOWNSAMPLED_COMMENT: str = "Downsampled to the last version per object per week"
+
+# Partitions of a table, with their comment
+PARTITIONS_SQL: str = """
+SELECT c.relname, obj_description(c.oid, 'pg_class')
+FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = %(table)s::regclass
+"""
+
+# Indexes to create again on the partitioned table. The primary key is replaced.
+INDEXES_SQL: str = """
+SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %(table)s::regclass AND NOT indisprimary
+"""
+
+# Foreign keys to create again on the partitioned table, e.g. history_user_id
+FOREIGN_KEYS_SQL: str = """
+SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %(table)s::regclass AND contype = 'f'
+"""
+
+# Delete every version of an object in a partition but the last one of each week
+DOWNSAMPLE_SQL: str = """
+DELETE FROM {partition} h
+USING (
+    SELECT history_id, row_number() OVER (
+        PARTITION BY {key}, date_trunc('week', history_date) ORDER BY history_date DESC, history_id DESC
+    ) AS position
+    FROM {partition}
+) w
+WHERE h.history_id = w.history_id AND w.position > 1
+"""
+
+_MONTHLY_PARTITION = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+@dataclass
+class RetentionStats:
+    """What maintain_partitions() did to a table."""
+
+    created: int = 0
+    downsampled: int = 0
+    deleted_rows: int = 0
+    dropped: int = 0
+    detached: int = 0
+
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _add_months(month: datetime.date, months: int) -> datetime.date:
+    """Return the first day of the month `months` months after `month`."""
+    index: int = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _this_month() -> datetime.date:
+    return datetime.datetime.now(tz=datetime.UTC).date().replace(day=1)
+
+
+def _bound(month: datetime.date) -> str:
+    """Return a partition bound for the start of a month, in UTC."""
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def history_models() -> list[type[models.Model]]:
+    """Return every history model created by HistoricalRecords."""
+    return [model for model in apps.get_models() if issubclass(model, HistoricalChanges)]
+
+
+def is_partitioned(table: str) -> bool:
+    """If a table is partitioned."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%(table)s)", {"table": table})
+        row: tuple[str] | None = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def partition_name(table: str, month: datetime.date) -> str:
+    """Return the name of the partition of a table for a month."""
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def monthly_partitions(table: str) -> dict[datetime.date, tuple[str, str | None]]:
+    """Return the monthly partitions of a table with their comments, keyed by the first day of their month."""
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONS_SQL, {"table": table})
+        rows: list[tuple[str, str | None]] = cursor.fetchall()
+
+    partitions: dict[datetime.date, tuple[str, str | None]] = {}
+    for name, comment in rows:
+        if match := _MONTHLY_PARTITION.search(name):
+            partitions[datetime.date(int(match[1]), int(match[2]), 1)] = (name, comment)
+    return partitions
+
+
+def create_partition(table: str, month: datetime.date, parent: str | None = None) -> str:
+    """Create the partition of a table for a month.
+
+    History from that month that ended up in the default partition is moved to the new partition, otherwise
+    Postgres wouldn't let us attach it.
+
+    Args:
+        table: The partitioned table.
+        month: The first day of the month.
+        parent: The table to attach the partition to, if it isn't `table` yet. Used by partition_table().
+
+    Returns:
+        str: The name of the partition.
+    """
+    name: str = partition_name(table, month)
+    parent = parent or table
+    start, end = _bound(month), _bound(_add_months(month, 1))
+    default: str = _quote(f"{table}_default")
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {_quote(name)} (LIKE {_quote(parent)} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE history_date >= {start} AND history_date < {end} RETURNING *
+            )
+            INSERT INTO {_quote(name)} SELECT * FROM moved
+            """,  # noqa: S608
+        )
+        cursor.execute(
+            f"ALTER TABLE {_quote(parent)} ATTACH PARTITION {_quote(name)} FOR VALUES FROM ({start}) TO ({end})",
+        )
+    return name
+
+
+def partition_table(model: type[models.Model], months_ahead: int | None = None) -> int:
+    """Convert the table of a history model to a table partitioned by month.
+
+    The table is locked while its rows are copied, so writes to it wait until we are done.
+
+    Args:
+        model: The history model, e.g. WebhallenJSON.history.model.
+        months_ahead: How many months after this one to create partitions for.
+
+    Returns:
+        int: How many rows were copied, or -1 if the table already was partitioned.
+    """
+    table: str = model._meta.db_table  # noqa: SLF001
+    if is_partitioned(table):
+        return -1
+
+    months_ahead = settings.HISTORY_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    new_table: str = f"{table}_partitioned"
+    sequence: str = f"{table}_history_id_seq"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Check deferred foreign keys now, Postgres won't drop a table with pending trigger events
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(INDEXES_SQL, {"table": table})
+        indexes: list[str] = [definition for (definition,) in cursor.fetchall()]
+        cursor.execute(FOREIGN_KEYS_SQL, {"table": table})
+        foreign_keys: list[tuple[str, str]] = cursor.fetchall()
+        cursor.execute(f"SELECT min(history_date), max(history_id) FROM {_quote(table)}")  # noqa: S608
+        oldest, last_id = cursor.fetchone()
+
+        cursor.execute(
+            f"CREATE TABLE {_quote(new_table)} (LIKE {_quote(table)} INCLUDING DEFAULTS INCLUDING COMMENTS) "
+            "PARTITION BY RANGE (history_date)",
+        )
+        cursor.execute(f"CREATE TABLE {_quote(table + '_default')} PARTITION OF {_quote(new_table)} DEFAULT")
+        first_month: datetime.date = _this_month() if oldest is None else oldest.date().replace(day=1)
+        last_month: datetime.date = _add_months(_this_month(), months_ahead)
+        month: datetime.date = first_month
+        while month <= last_month:
+            create_partition(table, month, parent=new_table)
+            month = _add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {_quote(new_table)} SELECT * FROM {_quote(table)}")  # noqa: S608
+        copied: int = cursor.rowcount
+        cursor.execute(f"DROP TABLE {_quote(table)}")
+        cursor.execute(f"ALTER TABLE {_quote(new_table)} RENAME TO {_quote(table)}")
+        cursor.execute(f"ALTER TABLE {_quote(table)} ADD PRIMARY KEY (history_id, history_date)")
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}")
+
+        # The identity column was dropped with the old table. Partitioned tables can't have one before Postgres 17.
+        cursor.execute(f"CREATE SEQUENCE {_quote(sequence)} OWNED BY {_quote(table)}.history_id")
+        cursor.execute(
+            "SELECT setval(%(sequence)s, %(value)s, false)",
+            {"sequence": sequence, "value": (last_id or 0) + 1},
+        )
+        cursor.execute(
+            f"ALTER TABLE {_quote(table)} ALTER COLUMN history_id SET DEFAULT nextval(%(sequence)s::regclass)",
+            {"sequence": sequence},
+        )
+    return copied
+
+
+def downsample_partition(model: type[models.Model], partition: str) -> int:
+    """Keep only the last version per object per week in a partition.
+
+    Args:
+        model: The history model.
+        partition: The partition.
+
+    Returns:
+        int: How many rows were deleted.
+    """
+    # The primary key of the tracked model, e.g. product_id for WebhallenJSON
+    key: str = model._meta.get_field(model.instance_type._meta.pk.name).column  # noqa: SLF001
+    with connection.cursor() as cursor:
+        cursor.execute(DOWNSAMPLE_SQL.format(partition=_quote(partition), key=_quote(key)))
+        deleted: int = cursor.rowcount
+        cursor.execute(f"COMMENT ON TABLE {_quote(partition)} IS %(comment)s", {"comment": DOWNSAMPLED_COMMENT})
+    return deleted
+
+
+def maintain_partitions(model: type[models.Model], *, detach: bool = False) -> RetentionStats:
+    """Create the coming partitions of a partitioned history table, downsample old ones and drop expired ones.
+
+    Args:
+        model: The history model.
+        detach: Detach expired partitions instead of dropping them, so they can be archived first.
+
+    Returns:
+        RetentionStats: What was done.
+    """
+    table: str = model._meta.db_table  # noqa: SLF001
+    stats = RetentionStats()
+    this_month: datetime.date = _this_month()
+    partitions: dict[datetime.date, tuple[str, str | None]] = monthly_partitions(table)
+    retention: int = settings.HISTORY_RETENTION_MONTHS
+    expired_before: datetime.date | None = _add_months(this_month, -retention) if retention else None
+    downsample_before: datetime.date = _add_months(this_month, -settings.HISTORY_DOWNSAMPLE_MONTHS)
+
+    with transaction.atomic():
+        for months in range(settings.HISTORY_PARTITION_MONTHS_AHEAD + 1):
+            month: datetime.date = _add_months(this_month, months)
+            if month not in partitions:
+                create_partition(table, month)
+                stats.created += 1
+
+        for month, (name, comment) in sorted(partitions.items()):
+            # A partition expires when all of it is older than the retention period
+            if expired_before is not None and _add_months(month, 1) <= expired_before:
+                with connection.cursor() as cursor:
+                    if detach:
+                        cursor.execute(f"ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}")
+                        stats.detached += 1
+                    else:
+                        cursor.execute(f"DROP TABLE {_quote(name)}")
+                        stats.dropped += 1
+            elif _add_months(month, 1) <= downsample_before and comment != DOWNSAMPLED_COMMENT:
+                stats.deleted_rows += downsample_partition(model, name)
+                stats.downsampled += 1
+    return stats
@@ -0,0 +1,216 @@
+"""Measure how fast the API responses are encoded, the way they were and the way they are now."""
+
+from __future__ import annotations
+
+import datetime
+import json
+import random
+import time
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.json import KeyTransform
+from ninja import Schema
+from ninja.operation import ResponseObject
+from ninja.responses import NinjaJSONEncoder
+from pydantic import create_model
+from rich import print
+from rich.table import Table
+
+from intel.api import PROCESSOR_OUT_FIELDS, ProcessorOut
+from intel.models import Processor
+from panso.renderers import orjson_dumps
+from products.api import EAN_OUT_FIELDS, EanOut
+from webhallen.api import SITEMAP_FIELDS, PriceHistoryOut, SitemapUrlOut
+from webhallen.models import WebhallenJSON
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from django.core.management.base import CommandParser
+
+
+# Rows in every payload before --scale, about what the endpoints return today
+PAYLOAD_ROWS: dict[str, int] = {
+    "eans": 12_000,
+    "sitemap urls": 50_000,
+    "processors": 3_000,
+    "price history": 365,
+    "products": 1_000,
+}
+
+
+def _fake_value(field: object, rng: random.Random) -> object:  # noqa: PLR0911
+    """Return a value that looks like what a model field holds."""
+    kind: str = field.get_internal_type()
+    if kind in {"IntegerField", "BigIntegerField", "PositiveSmallIntegerField", "PositiveIntegerField"}:
+        return rng.randrange(1, 5_000_000_000 if kind == "BigIntegerField" else 100_000)
+    if kind == "FloatField":
+        return rng.random() * 100
+    if kind == "BooleanField":
+        return rng.random() < 0.5  # noqa: PLR2004
+    if kind == "DateTimeField":
+        return datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC) + datetime.timedelta(seconds=rng.randrange(10**8))
+    if kind == "DateField":
+        return datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(1000))
+    if kind == "DecimalField":
+        return Decimal(rng.randrange(100_000)) / 100
+    return f"{field.name.replace('_', ' ').title()} {rng.randrange(10_000)}"
+
+
+def _product_documents(count: int, rng: random.Random) -> list[dict]:
+    """Return Webhallen product JSON, from the database if there is any."""
+    documents: list[dict] = list(
+        WebhallenJSON.objects.filter(product_json__product__isnull=False)
+        .annotate(document=KeyTransform("product", "product_json"))
+        .values_list("document", flat=True)[:count],
+    )
+    if not documents:
+        documents = [
+            {
+                "id": product_id,
+                "name": f"Grafikkort {product_id} 12GB GDDR6X",
+                "price": {"price": f"{rng.randrange(500, 30000)}.00", "vat": 398, "type": None},
+                "regularPrice": {"price": "2490.00", "type": "regular"},
+                "stock": {"web": rng.randrange(100), "supplier": None, "displayCap": "50", "orders": {}},
+                "section": {"id": 8, "metaTitle": "Grafikkort", "active": True, "icon": "gpu", "name": "Grafikkort"},
+                "description": "Lorem ipsum dolor sit amet. " * 60,
+                "images": [{"zoom": f"/images/{product_id}/{i}/zoom", "thumb": f"/{i}/thumb"} for i in range(6)],
+                "eans": [f"{rng.randrange(10**12, 10**13)}" for _ in range(2)],
+                "data": {str(key): {"value": f"Value {key}", "unit": "GB"} for key in range(40)},
+            }
+            for product_id in range(count)
+        ]
+    return [documents[i % len(documents)] for i in range(count)]
+
+
+def build_payloads(scale: float, seed: int = 0) -> dict[str, tuple[list | dict, type[Schema] | None]]:
+    """Return the payloads to encode, and the response schema of each, if it has one.
+
+    Args:
+        scale: Multiply the rows in every payload by this.
+        seed: Seed for the fake values, so every run encodes the same data.
+
+    Returns:
+        dict[str, tuple[list | dict, type[Schema] | None]]: The payloads, keyed by name.
+    """
+    rng = random.Random(seed)
+    rows: dict[str, int] = {name: max(1, int(count * scale)) for name, count in PAYLOAD_ROWS.items()}
+    created = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+    processor_fields: dict[str, object] = {
+        field.attname: field
+        for field in Processor._meta.concrete_fields  # noqa: SLF001
+        if field.attname in PROCESSOR_OUT_FIELDS
+    }
+
+    eans: list[dict] = [
+        dict(zip(EAN_OUT_FIELDS, (f"{rng.randrange(10**12, 10**13)}", f"Produkt {i}"), strict=True))
+        for i in range(rows["eans"])
+    ]
+    sitemap_urls: list[dict] = [
+        {
+            "loc": f"https://www.webhallen.com/se/product/{i}-Produkt-{i}",
+            "active": True,
+            "created": created + datetime.timedelta(seconds=i),
+            "updated": created + datetime.timedelta(seconds=i * 2),
+            "priority": 0.8,
+        }
+        for i in range(rows["sitemap urls"])
+    ]
+    assert set(sitemap_urls[0]) == set(SITEMAP_FIELDS)  # noqa: S101
+    processors: list[dict] = [
+        {name: _fake_value(field, rng) for name, field in processor_fields.items()} for _ in range(rows["processors"])
+    ]
+    prices: dict = {
+        "product_id": 1,
+        "prices": [
+            {
+                "recorded_at": created + datetime.timedelta(days=day),
+                "price": Decimal(rng.randrange(100_000, 300_000)) / 100,
+                "regular_price": Decimal("2490.00"),
+                "stock_web": rng.randrange(100),
+                "stock_stores": rng.randrange(100),
+                "stock_supplier": None,
+            }
+            for day in range(rows["price history"])
+        ],
+    }
+    return {
+        "eans": (eans, list[EanOut]),
+        "sitemap urls": (sitemap_urls, list[SitemapUrlOut]),
+        "processors": (processors, list[ProcessorOut]),
+        "price history": (prices, PriceHistoryOut),
+        "products": (_product_documents(rows["products"], rng), None),
+    }
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    """Return the fastest of `repeat` calls of a function, in seconds."""
+    best: float = float("inf")
+    for _ in range(repeat):
+        started: float = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def response_model(annotation: object) -> type[Schema]:
+    """Return the model Ninja wraps the response= of an operation in, it builds it once per operation."""
+    return create_model("Response", __base__=Schema, response=(annotation, ...))
+
+
+def validate_and_encode(data: object, model: type[Schema]) -> str:
+    """Encode data like Ninja does for an operation with response=: validate it, dump it, then use the json module."""
+    dumped = model.model_validate(ResponseObject(data)).model_dump()["response"]
+    return json.dumps(dumped, cls=NinjaJSONEncoder)
+
+
+class Command(BaseCommand):
+    """Measure how fast the API responses are encoded, the way they were and the way they are now.
+
+    JsonResponse is how every endpoint encoded its response before, with the json module and DjangoJSONEncoder.
+    "Ninja schema" is what declaring a response schema costs if Ninja validates every response against it.
+    orjson is what the endpoints do now, see panso/renderers.py.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument("--repeat", type=int, default=5, help="Encode every payload this many times, keep the best")
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiply the rows in every payload by this")
+
+    def handle(self: Command, *args: str, **options: float) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        repeat: int = max(1, int(options["repeat"]))
+        try:
+            payloads = build_payloads(options["scale"])
+        except KeyboardInterrupt:
+            msg = "Interrupted"
+            raise CommandError(msg) from None
+
+        table = Table(title=f"Encoding API responses, best of {repeat}")
+        for column in ("Payload", "Size", "JsonResponse", "Ninja schema", "orjson", "Throughput", "Speedup"):
+            table.add_column(column, justify="left" if column == "Payload" else "right")
+
+        for name, (data, schema) in payloads.items():
+            size: int = len(orjson_dumps(data))
+            before: float = best_time(lambda data=data: json.dumps(data, cls=DjangoJSONEncoder), repeat)
+            after: float = best_time(lambda data=data: orjson_dumps(data), repeat)
+            validated: str = "-"
+            if schema is not None:
+                model: type[Schema] = response_model(schema)
+                seconds: float = best_time(lambda data=data, model=model: validate_and_encode(data, model), repeat)
+                validated = f"{seconds * 1000:.1f} ms"
+            table.add_row(
+                name,
+                f"{size / 1024:,.0f} KiB",
+                f"{before * 1000:.1f} ms",
+                validated,
+                f"{after * 1000:.1f} ms",
+                f"{size / before / 1e6:,.0f} → {size / after / 1e6:,.0f} MB/s",
+                f"{before / after:.1f}x",
+            )
+        print(table)
@@ -0,0 +1,41 @@
+"""Create, downsample and drop the monthly partitions of the django-simple-history tables."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand
+from rich import print
+
+from products.tasks import history_retention
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class Command(BaseCommand):
+    """Create, downsample and drop the monthly partitions of the django-simple-history tables.
+
+    Runs the history_retention task in this process. Tables that are not partitioned yet are skipped, see the
+    partition_history command.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--detach",
+            action="store_true",
+            help="Detach expired partitions instead of dropping them, so they can be archived",
+        )
+
+    def handle(self: Command, *args: str, **options: bool) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        done: dict[str, dict[str, int]] = history_retention(detach=options["detach"])
+        for table, stats in done.items():
+            print(
+                f"{table}: {stats['created']} partitions created, {stats['downsampled']} downsampled "
+                f"({stats['deleted_rows']} rows deleted), {stats['dropped']} dropped, {stats['detached']} detached",
+            )
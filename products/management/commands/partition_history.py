@@ -0,0 +1,57 @@
+"""Convert the django-simple-history tables to tables partitioned by month."""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+from rich import print
+
+from products.history import history_models, partition_table
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+    from django.db import models
+
+
+class Command(BaseCommand):
+    """Convert the django-simple-history tables to tables partitioned by month.
+
+    Every table is converted in its own transaction and is locked while it is copied. Tables that already are
+    partitioned are skipped, so the command can be run again after a new history model has been added.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument("tables", nargs="*", help="Only convert these tables, e.g. webhallen_history")
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=None,
+            help="Months after this one to create partitions for, HISTORY_PARTITION_MONTHS_AHEAD by default",
+        )
+
+    def handle(self: Command, *args: str, **options: list[str] | int | None) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        tracked: list[type[models.Model]] = history_models()
+        tables: list[str] = options["tables"] or [model._meta.db_table for model in tracked]  # noqa: SLF001
+        unknown: set[str] = set(tables) - {model._meta.db_table for model in tracked}  # noqa: SLF001
+        if unknown:
+            msg: str = f"Not history tables: {', '.join(sorted(unknown))}"
+            raise CommandError(msg)
+
+        for model in tracked:
+            table: str = model._meta.db_table  # noqa: SLF001
+            if table not in tables:
+                continue
+
+            started: float = time.perf_counter()
+            copied: int = partition_table(model, months_ahead=options["months_ahead"])
+            if copied < 0:
+                print(f"{table} is already partitioned")
+            else:
+                print(f"Partitioned {table}, copied {copied} rows in {time.perf_counter() - started:.1f}s")
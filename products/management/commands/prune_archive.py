@@ -0,0 +1,48 @@
+"""Remove old fetches from the scraper response archive, and the bodies only they used."""
+
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rich import print
+
+from panso.scraping import get_archive
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+    from panso.scraping import PruneStats
+
+
+class Command(BaseCommand):
+    """Remove old fetches from the scraper response archive, and the bodies only they used.
+
+    The newest fetch of every URL is kept, so --replay still works for every URL we have scraped.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SCRAPING_ARCHIVE_RETENTION_DAYS,
+            help="Remove fetches older than this many days. Defaults to SCRAPING_ARCHIVE_RETENTION_DAYS.",
+        )
+
+    def handle(self: Command, *args: str, **options: int) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        if options["days"] < 1:
+            msg = "--days has to be at least 1"
+            raise CommandError(msg)
+
+        before: datetime.datetime = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(days=options["days"])
+        stats: PruneStats = get_archive().prune(before)
+        print(
+            f"{stats.fetches} fetches and {stats.bodies} bodies removed from {settings.SCRAPING_ARCHIVE_DIR}, "
+            f"{stats.freed_bytes / 1024**2:,.1f} MiB freed",
+        )
@@ -0,0 +1,53 @@
+"""Write the pre-compressed snapshot files that are served from /snapshots/."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+from rich import print
+
+from intel.export import PROCESSORS_SNAPSHOT, write_processors_snapshot
+from webhallen.export import PRODUCTS_SNAPSHOT, write_products_snapshot
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from django.core.management.base import CommandParser
+
+# Every dataset we write snapshots of, and the function that writes it
+SNAPSHOT_WRITERS: dict[str, Callable[[], dict]] = {
+    PRODUCTS_SNAPSHOT: write_products_snapshot,
+    PROCESSORS_SNAPSHOT: write_processors_snapshot,
+}
+
+
+class Command(BaseCommand):
+    """Write the pre-compressed snapshot files that are served from /snapshots/.
+
+    The Webhallen CSV is read from WebhallenProduct, run rewrite_webhallen first if it is out of date.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "datasets",
+            nargs="*",
+            choices=[[], *SNAPSHOT_WRITERS],
+            help="Datasets to write, all of them if none are given",
+        )
+
+    def handle(self: Command, *args: str, **options: list[str]) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        try:
+            for dataset in options["datasets"] or SNAPSHOT_WRITERS:
+                manifest: dict = SNAPSHOT_WRITERS[dataset]()
+                for name, files in manifest["formats"].items():
+                    sizes: str = ", ".join(f"{encoding} {file['size']:,}" for encoding, file in files.items())
+                    print(f"{dataset}.{name} {manifest['version']}: {sizes} bytes")
+        except KeyboardInterrupt:
+            msg = "Interrupted, the snapshot being written was thrown away"
+            raise CommandError(msg) from None
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+# Same as products.gtin.normalize_gtin(), but returns NULL instead of raising
+CREATE_GTIN_TO_BIGINT = """
+CREATE OR REPLACE FUNCTION gtin_to_bigint(code text) RETURNS bigint
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN digits !~ '^[0-9]+$' OR length(digits) NOT IN (8, 12, 13, 14) THEN NULL
+        WHEN (
+            SELECT (10 - sum(substr(lpad(digits, 14, '0'), i, 1)::integer * CASE WHEN i % 2 = 1 THEN 3 ELSE 1 END) % 10) % 10
+            FROM generate_series(1, 13) AS i
+        ) = right(digits, 1)::integer THEN digits::bigint
+    END
+    FROM (SELECT translate(btrim(code), ' -', '') AS digits) AS normalized
+$$
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eans',
+            name='gtin',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='The EAN as a GTIN-14 number, see products/gtin.py. Empty if the EAN is not a valid GTIN.', null=True),
+        ),
+        migrations.RunSQL(CREATE_GTIN_TO_BIGINT, reverse_sql="DROP FUNCTION IF EXISTS gtin_to_bigint(text)"),
+        migrations.RunSQL("UPDATE eans SET gtin = gtin_to_bigint(ean)", reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:41
+
+from django.db import migrations, models
+
+# Bumps the row of the table in table_version, once per statement. The triggers that call it are created after
+# every migrate for the models in settings.VERSIONED_MODELS, see products/versions.py.
+CREATE_BUMP_TABLE_VERSION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_version (table_name, counter, updated) VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET counter = table_version.counter + 1, updated = greatest(table_version.updated, excluded.updated);
+    RETURN NULL;
+END
+$$
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_eans_gtin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table_name', models.TextField(help_text='The database table', primary_key=True, serialize=False)),
+                ('counter', models.BigIntegerField(default=0, help_text='Statements that have written to the table')),
+                ('updated', models.DateTimeField(help_text='When the table was last written to')),
+            ],
+            options={
+                'verbose_name': 'Table version',
+                'verbose_name_plural': 'Table versions',
+                'db_table': 'table_version',
+                'db_table_comment': 'Write counter and last write of the tables behind conditional GET',
+            },
+        ),
+        migrations.RunSQL(CREATE_BUMP_TABLE_VERSION, reverse_sql="DROP FUNCTION IF EXISTS bump_table_version() CASCADE"),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:10
+
+from django.db import migrations
+
+# Bumps the row of the table in table_version, but only if the statement changed a row: Postgres runs statement
+# triggers for statements that change nothing too. TRUNCATE has no transition table and always bumps. The
+# triggers are created after every migrate, see products/versions.py.
+CREATE_BUMP_TABLE_VERSION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO table_version (table_name, counter, updated) VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET counter = table_version.counter + 1, updated = greatest(table_version.updated, excluded.updated);
+    RETURN NULL;
+END
+$$
+"""
+
+# The function from 0003, which bumps on every statement
+CREATE_BUMP_TABLE_VERSION_EVERY_STATEMENT = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_version (table_name, counter, updated) VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET counter = table_version.counter + 1, updated = greatest(table_version.updated, excluded.updated);
+    RETURN NULL;
+END
+$$
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_tableversion'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_BUMP_TABLE_VERSION, reverse_sql=CREATE_BUMP_TABLE_VERSION_EVERY_STATEMENT),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.8 on 2026-10-18 07:30
+
+from django.db import migrations
+
+# Same as products.gtin.normalize_gtin(), but returns NULL instead of raising. Removes the same separators as
+# products.gtin.GTIN_SEPARATORS, wherever they are.
+CREATE_GTIN_TO_BIGINT = """
+CREATE OR REPLACE FUNCTION gtin_to_bigint(code text) RETURNS bigint
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN digits !~ '^[0-9]+$' OR length(digits) NOT IN (8, 12, 13, 14) THEN NULL
+        WHEN (
+            SELECT (10 - sum(substr(lpad(digits, 14, '0'), i, 1)::integer * CASE WHEN i % 2 = 1 THEN 3 ELSE 1 END) % 10) % 10
+            FROM generate_series(1, 13) AS i
+        ) = right(digits, 1)::integer THEN digits::bigint
+    END
+    FROM (SELECT translate(code, E' \\t\\n\\r-', '') AS digits) AS normalized
+$$
+"""
+
+# The function from 0002, which only trimmed spaces
+CREATE_GTIN_TO_BIGINT_SPACES = """
+CREATE OR REPLACE FUNCTION gtin_to_bigint(code text) RETURNS bigint
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN digits !~ '^[0-9]+$' OR length(digits) NOT IN (8, 12, 13, 14) THEN NULL
+        WHEN (
+            SELECT (10 - sum(substr(lpad(digits, 14, '0'), i, 1)::integer * CASE WHEN i % 2 = 1 THEN 3 ELSE 1 END) % 10) % 10
+            FROM generate_series(1, 13) AS i
+        ) = right(digits, 1)::integer THEN digits::bigint
+    END
+    FROM (SELECT translate(btrim(code), ' -', '') AS digits) AS normalized
+$$
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_bump_table_version_changed_rows'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_GTIN_TO_BIGINT, reverse_sql=CREATE_GTIN_TO_BIGINT_SPACES),
+        migrations.RunSQL(
+            "UPDATE eans SET gtin = gtin_to_bigint(ean) WHERE gtin IS DISTINCT FROM gtin_to_bigint(ean)",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.8 on 2026-10-18 06:05
+
+from django.db import migrations, models
+
+# Adds a row to table_version_bump for every statement that changed a row. Inserting a new row doesn't lock
+# anything other writers need, unlike updating the table's row in table_version did, so concurrent writes to the
+# same table no longer wait for each other to commit. TRUNCATE has no transition table and always bumps.
+CREATE_BUMP_TABLE_VERSION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO table_version_bump (table_name, updated) VALUES (TG_TABLE_NAME, clock_timestamp());
+    RETURN NULL;
+END
+$$
+"""
+
+# The function from 0004, which updates the row in table_version
+CREATE_BUMP_TABLE_VERSION_ROW = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'TRUNCATE' THEN
+        IF NOT EXISTS (SELECT FROM changed_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO table_version (table_name, counter, updated) VALUES (TG_TABLE_NAME, 1, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET counter = table_version.counter + 1, updated = greatest(table_version.updated, excluded.updated);
+    RETURN NULL;
+END
+$$
+"""
+
+# Fold the bumps into table_version before going back to the function that doesn't know about them
+FOLD_BUMPS = """
+INSERT INTO table_version AS v (table_name, counter, updated)
+SELECT table_name, count(*), max(updated) FROM table_version_bump GROUP BY table_name
+ON CONFLICT (table_name) DO UPDATE
+SET counter = v.counter + excluded.counter, updated = greatest(v.updated, excluded.updated)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_gtin_to_bigint_separators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersionBump',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.TextField(help_text='The database table')),
+                ('updated', models.DateTimeField(help_text='When the statement ran')),
+            ],
+            options={
+                'verbose_name': 'Table version bump',
+                'verbose_name_plural': 'Table version bumps',
+                'db_table': 'table_version_bump',
+                'db_table_comment': 'Writes to the tables behind conditional GET that are not in table_version yet',
+                'indexes': [models.Index(fields=['table_name'], name='table_version_bump_table')],
+            },
+        ),
+        migrations.RunSQL(CREATE_BUMP_TABLE_VERSION, reverse_sql=[CREATE_BUMP_TABLE_VERSION_ROW, FOLD_BUMPS]),
+    ]
@@ -3,10 +3,16 @@
 Models:
     - Eans (https://en.wikipedia.org/wiki/International_Article_Number)
         All our EANs in our database and the corresponding product name.
+    - TableVersion
+        How many times a table has been written to, and when. Used for conditional GET, see products/versions.py.
+    - TableVersionBump
+        Writes to a table that haven't been added to its TableVersion yet.
 """
 
 from __future__ import annotations
 
+import typing
+
 from django.db import models
 from simple_history.models import HistoricalRecords
 
@@ -16,12 +22,21 @@ class Eans(models.Model):
 
     ean = models.TextField(primary_key=True, help_text="EAN")
     name = models.TextField(null=True, blank=True, help_text="Product name")
+    # Lookups by barcode use this bigint index. It is an extra index next to the primary key on the text, which is
+    # kept because the API, derive_eans() and the history all use the EAN as it was written, so the indexes of the
+    # table take more space than before, not less.
+    gtin = models.BigIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="The EAN as a GTIN-14 number, see products/gtin.py. Empty if the EAN is not a valid GTIN.",
+    )
 
     created = models.DateTimeField(auto_now_add=True, help_text="Created")
     updated = models.DateTimeField(auto_now=True, help_text="Updated")
     history = HistoricalRecords(
         table_name="eans_history",
-        excluded_fields=["created", "updated"],
+        excluded_fields=["created", "updated", "gtin"],
     )
 
     class Meta:
@@ -35,3 +50,51 @@ class Eans(models.Model):
     def __str__(self: Eans) -> str:
         """EAN and product name."""
         return f"{self.ean} - {self.name}"
+
+
+class TableVersion(models.Model):
+    """How many times a table has been written to, and when it was written to last.
+
+    Doesn't include the TableVersionBump rows of the table that haven't been folded into it yet, see
+    products/versions.py.
+    """
+
+    table_name = models.TextField(primary_key=True, help_text="The database table")
+    counter = models.BigIntegerField(default=0, help_text="Statements that have written to the table")
+    updated = models.DateTimeField(help_text="When the table was last written to")
+
+    class Meta:
+        """Django metadata."""
+
+        verbose_name: str = "Table version"
+        verbose_name_plural: str = "Table versions"
+        db_table: str = "table_version"
+        db_table_comment: str = "Write counter and last write of the tables behind conditional GET"
+
+    def __str__(self: TableVersion) -> str:
+        """Table name and counter."""
+        return f"{self.table_name} #{self.counter}"
+
+
+class TableVersionBump(models.Model):
+    """A statement that changed rows in a versioned table.
+
+    Added by a trigger on the table, one row per statement, so writers never wait for each other on the
+    TableVersion row. The rows are folded into TableVersion once there are enough of them, see products/versions.py.
+    """
+
+    table_name = models.TextField(help_text="The database table")
+    updated = models.DateTimeField(help_text="When the statement ran")
+
+    class Meta:
+        """Django metadata."""
+
+        verbose_name: str = "Table version bump"
+        verbose_name_plural: str = "Table version bumps"
+        db_table: str = "table_version_bump"
+        db_table_comment: str = "Writes to the tables behind conditional GET that are not in table_version yet"
+        indexes: typing.ClassVar[list] = [models.Index(fields=["table_name"], name="table_version_bump_table")]
+
+    def __str__(self: TableVersionBump) -> str:
+        """Table name and when."""
+        return f"{self.table_name} at {self.updated}"
@@ -2,48 +2,64 @@
 
 Tasks:
     - create_eans
-        Loop through all JSON objects and create eans.
+        Create and rename EANs from the Webhallen products that changed since the last run.
+    - history_retention
+        Create, downsample and drop the monthly partitions of the history tables.
 """
 
 from __future__ import annotations
 
+from dataclasses import asdict
+from typing import TYPE_CHECKING
+
 from celery import shared_task
 from rich import print
-from rich.progress import track
 
-from products.models import Eans
-from webhallen.models import WebhallenJSON
+from products.eans import derive_eans
+from products.history import history_models, is_partitioned, maintain_partitions
+
+if TYPE_CHECKING:
+    from products.eans import EanChanges
 
 
 @shared_task(
-    bind=True,
     name="create_eans",
     max_retries=7,
     retry_backoff=5,
     soft_time_limit=60,
     queue="webhallen",
 )
-def create_eans() -> None:
-    """Loop through all JSON objects and create eans."""
-    eans_to_create: list[Eans] = []
-    products = WebhallenJSON.objects.all()
-    for json in track(products, description="Processing...", total=products.count()):
-        product_json = dict(json.product_json)
-        if not product_json:
-            print(f"Product JSON is empty for {json.product_id}")
-            continue
-        product: dict = product_json.get("product", {})
-        eans: dict = product.get("eans", {})
-        if not eans:
-            continue
-
-        name = product.get("name", "")
-        if not name:
-            print(f"No name for {json.product_id}")
-            continue
-
-        eans_to_create.extend([Eans(ean=ean, name=name) for ean in eans])
-        print(f"Created {len(eans_to_create)} EANs so far")
-
-    Eans.objects.bulk_create(eans_to_create, update_fields=["name"], ignore_conflicts=True)
-    print(f"Created {len(eans_to_create)} EANs")
+def create_eans(*, full: bool = False) -> dict[str, int]:
+    """Create and rename EANs from the Webhallen products that changed since the last run.
+
+    Args:
+        full: Read every product instead of only the ones updated since the last run.
+
+    Returns:
+        dict[str, int]: How many products were read and how many EANs were created and renamed.
+    """
+    changes: EanChanges = derive_eans(full=full)
+    print(f"Read the EANs of {changes.scanned} products: {changes.created} EANs created, {changes.changed} renamed")
+    return asdict(changes)
+
+
+@shared_task(
+    name="history_retention",
+    soft_time_limit=60 * 30,
+)
+def history_retention(*, detach: bool = False) -> dict[str, dict[str, int]]:
+    """Create, downsample and drop the monthly partitions of the history tables that are partitioned.
+
+    Args:
+        detach: Detach expired partitions instead of dropping them.
+
+    Returns:
+        dict[str, dict[str, int]]: What was done, keyed by table.
+    """
+    done: dict[str, dict[str, int]] = {}
+    for model in history_models():
+        table: str = model._meta.db_table  # noqa: SLF001
+        if is_partitioned(table):
+            done[table] = asdict(maintain_partitions(model, detach=detach))
+    print(f"Maintained the partitions of {len(done)} history tables")
+    return done
@@ -7,10 +7,29 @@ https://docs.djangoproject.com/en/5.0/topics/testing/
 
 from __future__ import annotations
 
+import datetime
 from typing import TYPE_CHECKING
 
-from django.test import SimpleTestCase, TestCase
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from products.eans import EanChanges, derive_eans
+from products.gtin import InvalidGTINError, format_gtin, gtin_check_digit, normalize_gtin
+from products.history import (
+    DOWNSAMPLED_COMMENT,
+    is_partitioned,
+    maintain_partitions,
+    monthly_partitions,
+    partition_name,
+    partition_table,
+)
+from products.models import Eans, TableVersion, TableVersionBump
+from products.versions import READ_VERSIONS_SQL, conditional_as, models_version
+from webhallen.models import WebhallenJSON, WebhallenProductQueue, WebhallenWatermark
 
 if TYPE_CHECKING:
     from django.http import HttpResponse
@@ -96,6 +115,23 @@ class PansoAPITests(TestCase):
         assert response["Content-Type"] == "application/json"
         assert response.json() == []
 
+    def test_api_eans_pages(self: PansoAPITests) -> None:
+        """Test that the EANs can be paged through by following the Link header, with only some fields."""
+        for ean in ("3", "1", "2"):
+            Eans.objects.create(ean=ean, name=f"Product {ean}", gtin=int(ean))
+
+        response: HttpResponse = self.client.get("/api/v1/eans?limit=2")
+        assert response.json() == [{"ean": "1", "name": "Product 1"}, {"ean": "2", "name": "Product 2"}]
+        assert response["Link"] == '<http://testserver/api/v1/eans?limit=2&after=2>; rel="next"'
+
+        response = self.client.get("/api/v1/eans?limit=2&after=2&fields=gtin")
+        assert response.json() == [{"ean": "3", "gtin": 3}]
+        assert "Link" not in response
+
+        response = self.client.get("/api/v1/eans?fields=name,secret")
+        assert response.status_code == 400
+        assert response.json()["error"].startswith("Unknown fields: secret")
+
     def test_api_ean(self: PansoAPITests) -> None:
         """Test the API endpoint for a single EAN."""
         response: HttpResponse = self.client.get("/api/v1/eans/1")
@@ -140,3 +176,233 @@ class PansoAPITests(TestCase):
         # assert updated[11:13].isdigit()
         # assert updated[14:16].isdigit()
         # assert updated[17:19].isdigit()
+
+
+class DeriveEansTests(TestCase):
+    """Tests for creating EANs from the Webhallen products."""
+
+    def setUp(self: DeriveEansTests) -> None:
+        WebhallenJSON.objects.create(product_id=1, product_json={"product": {"name": "One", "eans": ["111", "112"]}})
+        WebhallenJSON.objects.create(product_id=2, product_json={"product": {"name": "Two", "eans": ["222"]}})
+        WebhallenJSON.objects.create(product_id=3, product_json={"product": {"name": "No EANs"}})
+        WebhallenJSON.objects.create(product_id=4, product_json={"product": {"eans": ["444"]}})
+
+    def test_derive_eans(self: DeriveEansTests) -> None:
+        """Test that every EAN of every named product is created, with history."""
+        assert derive_eans() == EanChanges(scanned=4, created=3, changed=0)
+        assert dict(Eans.objects.values_list("ean", "name")) == {"111": "One", "112": "One", "222": "Two"}
+        assert Eans.history.count() == 3
+
+    def test_incremental_rename(self: DeriveEansTests) -> None:
+        """Test that only products updated since the last run are read and that renamed products rename EANs."""
+        derive_eans()
+        WebhallenJSON.objects.update(updated=timezone.now() - datetime.timedelta(days=1))
+        WebhallenWatermark.objects.update(watermark=timezone.now() - datetime.timedelta(hours=1))
+        assert derive_eans() == EanChanges(scanned=0, created=0, changed=0)
+
+        product: WebhallenJSON = WebhallenJSON.objects.get(product_id=2)
+        product.product_json = {"product": {"name": "Two v2", "eans": ["222", "223"]}}
+        product.save()
+
+        assert derive_eans() == EanChanges(scanned=1, created=1, changed=1)
+        assert Eans.objects.get(ean="222").name == "Two v2"
+        assert derive_eans(full=True) == EanChanges(scanned=4, created=0, changed=0)
+
+
+class GtinTests(TestCase):
+    """Tests for GTIN normalisation."""
+
+    valid: tuple[str, ...] = (
+        "5907814951762",
+        "05907814951762",
+        "036000291452",
+        "96385074",
+        " 590-7814951762 ",
+        "\t5907814951762\r\n",
+    )
+    invalid: tuple[str, ...] = ("5907814951763", "12345", "abc", "", "59078149517a2", "\u00a05907814951762")
+
+    def test_normalize_gtin(self: GtinTests) -> None:
+        """Test that every GTIN length is accepted and that leading zeros and separators don't matter."""
+        assert gtin_check_digit("590781495176") == 2
+        assert normalize_gtin("5907814951762") == normalize_gtin("05907814951762") == 5907814951762
+        assert normalize_gtin("036000291452") == normalize_gtin("0036000291452") == 36000291452
+        assert normalize_gtin("96385074") == 96385074
+        assert format_gtin(96385074) == "00000096385074"
+
+        for code in self.invalid:
+            with pytest.raises(InvalidGTINError):
+                normalize_gtin(code)
+
+    def test_sql_function_matches_python(self: GtinTests) -> None:
+        """Test that gtin_to_bigint() in the database agrees with normalize_gtin()."""
+        with connection.cursor() as cursor:
+            for code in self.valid:
+                cursor.execute("SELECT gtin_to_bigint(%s)", [code])
+                assert cursor.fetchone()[0] == normalize_gtin(code), code
+            for code in self.invalid:
+                cursor.execute("SELECT gtin_to_bigint(%s)", [code])
+                assert cursor.fetchone()[0] is None, code
+
+
+class EanLookupTests(TestCase):
+    """Tests for the batch EAN lookup endpoint."""
+
+    def setUp(self: EanLookupTests) -> None:
+        WebhallenJSON.objects.create(
+            product_id=1,
+            product_json={"product": {"name": "Carcassonne", "eans": ["5907814951762", "123"]}},
+        )
+        derive_eans()
+
+    def test_gtin_is_derived(self: EanLookupTests) -> None:
+        """Test that derived EANs get their GTIN and invalid EANs are kept without one."""
+        assert dict(Eans.objects.values_list("ean", "gtin")) == {"5907814951762": 5907814951762, "123": None}
+
+    def test_lookup(self: EanLookupTests) -> None:
+        """Test that known, unknown and invalid codes are sorted out in one request."""
+        response: HttpResponse = self.client.post(
+            "/api/v1/eans/lookup",
+            data={"eans": ["05907814951762", "96385074", "5907814951763", "05907814951762"]},
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "found": [
+                {"query": "05907814951762", "gtin": "05907814951762", "ean": "5907814951762", "name": "Carcassonne"},
+            ],
+            "not_found": ["96385074"],
+            "invalid": ["5907814951763"],
+        }
+
+    def test_lookup_limit(self: EanLookupTests) -> None:
+        """Test that too many codes are rejected."""
+        response: HttpResponse = self.client.post(
+            "/api/v1/eans/lookup",
+            data={"eans": ["96385074"] * 1001},
+            content_type="application/json",
+        )
+        assert response.status_code == 422
+
+
+class HistoryPartitionTests(TestCase):
+    """Tests for the monthly partitions of the history tables."""
+
+    def setUp(self: HistoryPartitionTests) -> None:
+        self.model = Eans.history.model
+        now: datetime.datetime = timezone.now()
+        # Monday noon, so the versions a few hours apart are in the same week
+        monday: datetime.datetime = (now - datetime.timedelta(days=70)).replace(hour=12, minute=0)
+        self.week = monday - datetime.timedelta(days=monday.weekday())
+        self.expired = now - datetime.timedelta(days=200)
+
+        Eans.history.bulk_history_create([Eans(ean="1", name="Old")], default_date=self.expired)
+        for hours, name in enumerate(["A", "B", "C"]):
+            Eans.history.bulk_history_create(
+                [Eans(ean="1", name=name)],
+                default_date=self.week + datetime.timedelta(hours=hours),
+            )
+        Eans.history.bulk_history_create([Eans(ean="1", name="D")], default_date=self.week + datetime.timedelta(days=7))
+        self.last_id: int = Eans.history.order_by("-history_id").values_list("history_id", flat=True).first()
+
+    def test_partition_table(self: HistoryPartitionTests) -> None:
+        """Test that the rows are copied, new history still gets IDs and recent history skips old partitions."""
+        assert partition_table(self.model) == 5
+        assert partition_table(self.model) == -1
+        assert is_partitioned("eans_history")
+        assert Eans.history.count() == 5
+
+        Eans.objects.create(ean="2", name="New")
+        assert Eans.history.get(ean="2").history_id == self.last_id + 1
+
+        plan: str = Eans.history.filter(history_date__gte=timezone.now() - datetime.timedelta(days=1)).explain()
+        assert partition_name("eans_history", self.expired.date().replace(day=1)) not in plan
+        assert partition_name("eans_history", self.week.date().replace(day=1)) not in plan
+
+    @override_settings(HISTORY_DOWNSAMPLE_MONTHS=1, HISTORY_RETENTION_MONTHS=4, HISTORY_PARTITION_MONTHS_AHEAD=1)
+    def test_maintain_partitions(self: HistoryPartitionTests) -> None:
+        """Test that old partitions keep one version per week and expired partitions are dropped."""
+        partition_table(self.model, months_ahead=0)
+        stats = maintain_partitions(self.model)
+        # Every month since the oldest version has a partition, the ones from before the retention are dropped
+        assert (stats.created, stats.deleted_rows) == (1, 2)
+        assert stats.dropped >= 1
+        assert list(Eans.history.order_by("history_date").values_list("name", flat=True)) == ["C", "D"]
+
+        partitions: dict = monthly_partitions("eans_history")
+        assert partitions[self.week.date().replace(day=1)][1] == DOWNSAMPLED_COMMENT
+        assert self.expired.date().replace(day=1) not in partitions
+        assert maintain_partitions(self.model).downsampled == 0
+
+
+class ConditionalGetTests(TestCase):
+    """Test the table versions and the 304 responses built on them, see products/versions.py."""
+
+    def counter(self: ConditionalGetTests) -> int:
+        """Return the counter of the eans table, with the bumps that haven't been folded into it."""
+        with connection.cursor() as cursor:
+            cursor.execute(READ_VERSIONS_SQL, [["eans"]])
+            return cursor.fetchone()[1]
+
+    def test_writes_bump_version(self: ConditionalGetTests) -> None:
+        """Test that every statement that changes rows in a versioned table bumps its counter once."""
+        before: int = self.counter()
+        Eans.objects.create(ean="1", name="Product 1")
+        assert self.counter() == before + 1
+
+        Eans.objects.bulk_create([Eans(ean=str(ean)) for ean in range(2, 10)])
+        assert self.counter() == before + 2
+
+        Eans.objects.filter(name__isnull=True).update(name="Renamed")
+        Eans.objects.filter(ean="1").delete()
+        assert self.counter() == before + 4
+
+        # Statements that don't change a row leave the version alone
+        Eans.objects.filter(name__isnull=True).update(name="Renamed")
+        Eans.objects.filter(ean="1").delete()
+        Eans.objects.bulk_create([Eans(ean="2")], ignore_conflicts=True)
+        assert self.counter() == before + 4
+
+    @override_settings(VERSION_FOLD_AFTER=3)
+    def test_bumps_are_folded(self: ConditionalGetTests) -> None:
+        """Test that writes add bump rows and that folding them into table_version leaves the version alone."""
+        Eans.objects.create(ean="1", name="Product 1")
+        Eans.objects.create(ean="2", name="Product 2")
+        version: str | None = models_version(Eans)
+        assert TableVersionBump.objects.filter(table_name="eans").count() == 2
+
+        Eans.objects.create(ean="3", name="Product 3")
+        folded: str | None = models_version(Eans)
+        assert folded != version
+        assert not TableVersionBump.objects.filter(table_name="eans").exists()
+        assert models_version(Eans) == folded
+        assert TableVersion.objects.get(table_name="eans").counter == self.counter()
+
+    def test_not_modified(self: ConditionalGetTests) -> None:
+        """Test that an unchanged resource is answered with 304 and a changed one with the new version."""
+        response: HttpResponse = self.client.get("/api/v1/eans")
+        assert response.status_code == 200
+        etag: str = response["ETag"]
+        assert etag.startswith('W/"')
+
+        response = self.client.get("/api/v1/eans", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert not response.content
+
+        response = self.client.get("/api/v1/eans", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        assert response.status_code == 304
+
+        Eans.objects.create(ean="1", name="Product 1")
+        response = self.client.get("/api/v1/eans", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+        assert response.json() == [{"ean": "1", "name": "Product 1"}]
+
+        response = self.client.get("/intel/")
+        assert response.status_code == 200
+        assert self.client.get("/intel/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+
+    def test_unversioned_model(self: ConditionalGetTests) -> None:
+        """Test that a view can't depend on a table whose writes are not counted."""
+        with pytest.raises(ImproperlyConfigured):
+            conditional_as(WebhallenProductQueue)
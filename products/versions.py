@@ -0,0 +1,245 @@
+"""Conditional GET for the views that show what is in a few tables.
+
+Every table of the models in settings.VERSIONED_MODELS has triggers that add a TableVersionBump row after every
+INSERT, UPDATE, DELETE and TRUNCATE that changed a row. The triggers run once per statement, not once per row, so
+bulk_create(), QuerySet.update() and raw SQL are counted too, and a batch of 500 products costs one extra insert.
+A statement that changes nothing, like a sitemap diff that finds no changes, adds nothing. Writers only ever
+insert new rows, so two workers writing to the same table don't wait for each other to commit.
+install_version_triggers() creates the triggers after every migrate, the trigger function is in
+products/migrations/.
+
+The version of a table is its TableVersion row plus its bumps: the counter plus the number of bumps, and the
+newest updated of them all. A bump only counts once the write has committed. updated starts out as max(updated)
+of the table and moves with every write after that, deletes included, which max(updated) alone would miss. The
+counter tells two writes in the same second apart, which Last-Modified can't. When a table has
+VERSION_FOLD_AFTER bumps, the next read folds them into its TableVersion row, which leaves the version the same.
+
+@conditional_as(Model, ...) reads the versions of the tables in one query before the view runs. The ETag is a hash
+of the versions, and Last-Modified is the newest updated. If-None-Match, or If-Modified-Since when there is no
+If-None-Match, is answered with 304 Not Modified without running the view. Because the versions are read first,
+a write while the view runs can only make the ETag older than the response. The client then gets a full response
+next time, never an outdated 304.
+
+models_version() is the same version for things cached outside of views, like the Webhallen section index in
+webhallen/sections.py.
+
+The whole Webhallen product dump has its own ETag, see panso/snapshots.py.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from functools import wraps
+from typing import TYPE_CHECKING
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from products.models import TableVersion
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from django.db import models
+    from django.http import HttpRequest, HttpResponse
+
+# Bump the version of a table after every statement that changed a row in it. A transition table can only be
+# given to a trigger for one event, so there is one trigger per event. TRUNCATE doesn't have one.
+CREATE_TRIGGERS_SQL: tuple[str, ...] = (
+    "DROP TRIGGER IF EXISTS table_version ON {table}",
+    "CREATE OR REPLACE TRIGGER table_version_insert AFTER INSERT ON {table} REFERENCING NEW TABLE AS changed_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE OR REPLACE TRIGGER table_version_update AFTER UPDATE ON {table} REFERENCING NEW TABLE AS changed_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE OR REPLACE TRIGGER table_version_delete AFTER DELETE ON {table} REFERENCING OLD TABLE AS changed_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    "CREATE OR REPLACE TRIGGER table_version_truncate AFTER TRUNCATE ON {table} "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+)
+
+# The first version of a table, from the newest row in it
+SEED_VERSION_SQL: str = """
+INSERT INTO table_version (table_name, counter, updated) VALUES (%s, 0, coalesce({newest}, clock_timestamp()))
+ON CONFLICT (table_name) DO NOTHING
+"""
+
+
+# The version of every table: its TableVersion row plus the bumps that haven't been folded into it
+READ_VERSIONS_SQL: str = """
+SELECT v.table_name, v.counter + count(b.id), greatest(v.updated, max(b.updated)), count(b.id)
+FROM table_version AS v LEFT JOIN table_version_bump AS b ON b.table_name = v.table_name
+WHERE v.table_name = ANY(%s)
+GROUP BY v.table_name
+ORDER BY v.table_name
+"""
+
+# Move bumps into their TableVersion rows. Bumps another fold has locked are skipped instead of waited for.
+FOLD_BUMPS_SQL: str = """
+WITH folded AS (
+    DELETE FROM table_version_bump
+    WHERE id IN (SELECT id FROM table_version_bump WHERE table_name = ANY(%s) FOR UPDATE SKIP LOCKED)
+    RETURNING table_name, updated
+)
+UPDATE table_version AS v
+SET counter = v.counter + f.bumps, updated = greatest(v.updated, f.updated)
+FROM (SELECT table_name, count(*) AS bumps, max(updated) AS updated FROM folded GROUP BY table_name) AS f
+WHERE v.table_name = f.table_name
+"""
+
+
+def versioned_models() -> list[type[models.Model]]:
+    """Return the models in settings.VERSIONED_MODELS."""
+    return [apps.get_model(label) for label in settings.VERSIONED_MODELS]
+
+
+def install_version_triggers(using: str = "default", **kwargs: object) -> None:  # noqa: ARG001
+    """Create the version triggers on the tables of every versioned model, and their first version.
+
+    Connected to post_migrate, so new models in settings.VERSIONED_MODELS get their trigger with the next migrate.
+
+    Args:
+        using: The database to create them in.
+        **kwargs: The rest of the post_migrate arguments.
+    """
+    connection = connections[using]
+    tables: list[str] = connection.introspection.table_names()
+    if TableVersion._meta.db_table not in tables:  # noqa: SLF001
+        return
+
+    with connection.cursor() as cursor:
+        for model in versioned_models():
+            table: str = model._meta.db_table  # noqa: SLF001
+            if table not in tables:
+                continue
+            has_updated: bool = any(field.attname == "updated" for field in model._meta.concrete_fields)  # noqa: SLF001
+            quoted: str = connection.ops.quote_name(table)
+            newest: str = f"(SELECT max(updated) FROM {quoted})" if has_updated else "NULL"  # noqa: S608
+            cursor.execute(SEED_VERSION_SQL.format(newest=newest), [table])
+            for sql in CREATE_TRIGGERS_SQL:
+                cursor.execute(sql.format(table=quoted))
+
+
+def versioned_tables(versioned: tuple[type[models.Model], ...]) -> tuple[str, ...]:
+    """Return the tables of the models, sorted.
+
+    Args:
+        versioned: The models. Every one of them has to be in settings.VERSIONED_MODELS.
+
+    Raises:
+        ImproperlyConfigured: If a model isn't in settings.VERSIONED_MODELS.
+
+    Returns:
+        tuple[str, ...]: The tables.
+    """
+    for model in versioned:
+        if model._meta.label_lower not in settings.VERSIONED_MODELS:  # noqa: SLF001
+            msg: str = f"{model._meta.label_lower} is not in settings.VERSIONED_MODELS, its writes are not counted"  # noqa: SLF001
+            raise ImproperlyConfigured(msg)
+    return tuple(sorted({model._meta.db_table for model in versioned}))  # noqa: SLF001
+
+
+def table_versions(tables: tuple[str, ...]) -> tuple[str | None, int | None]:
+    """Return a hash of the versions of the tables and their Last-Modified timestamp.
+
+    Args:
+        tables: The tables, sorted.
+
+    Returns:
+        tuple[str | None, int | None]: The hash and Last-Modified, or None if a table has no version yet.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(READ_VERSIONS_SQL, [list(tables)])
+        rows: list[tuple] = cursor.fetchall()
+    if len(rows) != len(tables):
+        # The trigger isn't there, so a version could be old
+        return None, None
+
+    if sum(bumps for *_, bumps in rows) >= settings.VERSION_FOLD_AFTER:
+        fold_bumps(tables)
+
+    versions: list[tuple] = [(table, counter, updated) for table, counter, updated, _ in rows]
+    digest: str = hashlib.blake2b(
+        repr((settings.VERSION_ETAG_SALT, versions)).encode(),
+        digest_size=12,
+    ).hexdigest()
+    last_modified: int = int(max(updated for _, _, updated in versions).timestamp())
+    return digest, last_modified
+
+
+def fold_bumps(tables: tuple[str, ...]) -> None:
+    """Fold the bumps of the tables into their TableVersion rows.
+
+    The versions stay the same, there are just fewer rows to read. Only tables that have a TableVersion row
+    should be folded, bumps of other tables would be lost.
+
+    Args:
+        tables: The tables.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(FOLD_BUMPS_SQL, [list(tables)])
+
+
+def models_version(*versioned: type[models.Model]) -> str | None:
+    """Return a version of what is in the tables of the models, to cache things built from them under.
+
+    The version changes with every statement that changes a row in one of the tables, in one query.
+
+    Args:
+        *versioned: The models. Every one of them has to be in settings.VERSIONED_MODELS.
+
+    Returns:
+        str | None: The version, or None if a table has no version yet and nothing should be cached.
+    """
+    digest, _ = table_versions(versioned_tables(versioned))
+    return digest
+
+
+def conditional_as(
+    *versioned: type[models.Model],
+) -> Callable[[Callable[..., HttpResponse]], Callable[..., HttpResponse]]:
+    """Answer GET and HEAD requests with 304 Not Modified if the tables of the models haven't changed.
+
+    Works like Django's @condition, with the ETag and Last-Modified from the versions of the tables. Put it
+    outside of cacheops' @cached_view_as, so a 304 doesn't read the cache either. Use it with
+    @decorate_view(conditional_as(...)) for Ninja operations.
+
+    Args:
+        *versioned: The models the view reads. Every one of them has to be in settings.VERSIONED_MODELS.
+
+    Raises:
+        ImproperlyConfigured: If a model isn't in settings.VERSIONED_MODELS.
+
+    Returns:
+        Callable: The decorator.
+    """
+    tables: tuple[str, ...] = versioned_tables(versioned)
+
+    def decorator(view: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+        @wraps(view)
+        def inner(request: HttpRequest, *args: object, **kwargs: object) -> HttpResponse:
+            if request.method not in {"GET", "HEAD"}:
+                return view(request, *args, **kwargs)
+
+            digest, last_modified = table_versions(tables)
+            etag: str | None = f'W/"{digest}"' if digest else None
+            response: HttpResponse | None = get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=last_modified,
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+
+            if last_modified and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault("ETag", etag)
+            return response
+
+        return inner
+
+    return decorator
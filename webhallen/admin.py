@@ -16,6 +16,11 @@ from webhallen.models import (
     SitemapRoot,
     SitemapSection,
     WebhallenJSON,
+    WebhallenJSONRevision,
+    WebhallenPricePoint,
+    WebhallenProduct,
+    WebhallenProductQueue,
+    WebhallenProductRetry,
     WebhallenSection,
 )
 
@@ -157,3 +162,165 @@ class WebhallenSectionModelAdmin(admin.ModelAdmin):
     ) -> bool:
         """Disable change permission."""
         return False
+
+
+@admin.register(WebhallenProductQueue)
+class WebhallenProductQueueModelAdmin(admin.ModelAdmin):
+    """ModelAdmin with read-only permissions for the Webhallen product queue.
+
+    The queue is managed by the scraping tasks, we only want to look at it.
+    """
+
+    list_display: tuple = (
+        "product_id",
+        "next_fetch_at",
+        "attempts",
+        "last_status",
+        "last_fetched_at",
+        "lease_owner",
+        "lease_expires_at",
+    )
+    list_display_links: tuple = ("product_id",)
+    list_filter: tuple = ("last_status",)
+    ordering: tuple = ("next_fetch_at",)
+
+    def has_delete_permission(  # noqa: PLR6301
+        self: WebhallenProductQueueModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable delete permission."""
+        return False
+
+    def has_change_permission(  # noqa: PLR6301
+        self: WebhallenProductQueueModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable change permission."""
+        return False
+
+
+@admin.register(WebhallenProductRetry)
+class WebhallenProductRetryModelAdmin(admin.ModelAdmin):
+    """ModelAdmin with read-only permissions for Webhallen products that failed to fetch.
+
+    The retries are managed by the scraping tasks, we only want to look at them.
+    """
+
+    list_display: tuple = (
+        "product_id",
+        "status",
+        "attempts",
+        "error_class",
+        "next_attempt_at",
+        "last_failed_at",
+    )
+    list_display_links: tuple = ("product_id",)
+    list_filter: tuple = ("status", "error_class")
+    ordering: tuple = ("next_attempt_at",)
+
+    def has_delete_permission(  # noqa: PLR6301
+        self: WebhallenProductRetryModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable delete permission."""
+        return False
+
+    def has_change_permission(  # noqa: PLR6301
+        self: WebhallenProductRetryModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable change permission."""
+        return False
+
+
+@admin.register(WebhallenProduct)
+class WebhallenProductModelAdmin(admin.ModelAdmin):
+    """ModelAdmin with read-only permissions for converted Webhallen products.
+
+    The products are converted from WebhallenJSON by rewrite_webhallen, we only want to look at them.
+    """
+
+    list_display: tuple = ("product_id", "name", "price", "section_id", "discontinued", "source_updated")
+    list_display_links: tuple = ("product_id",)
+    list_filter: tuple = ("section_id", "discontinued")
+    search_fields: tuple = ("name",)
+    ordering: tuple = ("-product_id",)
+
+    def has_delete_permission(  # noqa: PLR6301
+        self: WebhallenProductModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable delete permission."""
+        return False
+
+    def has_change_permission(  # noqa: PLR6301
+        self: WebhallenProductModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable change permission."""
+        return False
+
+
+@admin.register(WebhallenPricePoint)
+class WebhallenPricePointModelAdmin(admin.ModelAdmin):
+    """ModelAdmin with read-only permissions for the Webhallen price history.
+
+    The points are added when products are scraped, we only want to look at them.
+    """
+
+    list_display: tuple = ("product_id", "recorded_at", "price", "regular_price", "stock_web", "stock_stores")
+    list_display_links: tuple = ("product_id",)
+    search_fields: tuple = ("product_id",)
+    ordering: tuple = ("-recorded_at",)
+
+    def has_delete_permission(  # noqa: PLR6301
+        self: WebhallenPricePointModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable delete permission."""
+        return False
+
+    def has_change_permission(  # noqa: PLR6301
+        self: WebhallenPricePointModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable change permission."""
+        return False
+
+
+@admin.register(WebhallenJSONRevision)
+class WebhallenJSONRevisionModelAdmin(admin.ModelAdmin):
+    """ModelAdmin with read-only permissions for the Webhallen JSON revisions.
+
+    A patch only makes sense together with the revisions before it, so they can't be changed or deleted here.
+    """
+
+    list_display: tuple = ("product_id", "recorded_at", "history_type", "depth")
+    list_display_links: tuple = ("product_id",)
+    list_filter: tuple = ("history_type",)
+    search_fields: tuple = ("product_id",)
+    ordering: tuple = ("-recorded_at",)
+
+    def has_delete_permission(  # noqa: PLR6301
+        self: WebhallenJSONRevisionModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable delete permission."""
+        return False
+
+    def has_change_permission(  # noqa: PLR6301
+        self: WebhallenJSONRevisionModelAdmin,
+        request: HttpRequest,  # noqa: ARG002
+        obj: models.Model | None = None,  # noqa: ARG002
+    ) -> bool:
+        """Disable change permission."""
+        return False
@@ -4,9 +4,21 @@ See https://django-ninja.dev/ for more information.
 
 API endpoints:
 - /api/v1/webhallen/products
-    - Return all Webhallen products as JSON.
+    - Stream all Webhallen products as a JSON array, or as NDJSON with Accept: application/x-ndjson.
+    - With ?q=, ?section=, ?manufacturer=, ?min_price=, ?max_price=, ?discontinued= or ?sort=, return the
+      matching products instead, up to ?limit=.
+    - ?after= pages through the products by product ID and ?fields= returns only some of the JSON, e.g.
+      ?fields=name,price.price. See panso/pagination.py.
 - /api/v1/webhallen/products/{product_id}
     - Return Webhallen product as JSON.
+- /api/v1/webhallen/products/{product_id}/prices
+    - Return the price and stock history of a Webhallen product.
+- /api/v1/webhallen/products/{product_id}/revisions
+    - Return the stored versions of a Webhallen product.
+- /api/v1/webhallen/products/{product_id}/revisions/{revision_id}
+    - Return a stored version of a Webhallen product as JSON.
+- /api/v1/webhallen/sitemaps/*
+    - Every sitemap endpoint returns a page of URLs with ?after=, ?limit= and ?fields=, see panso/pagination.py.
 - /api/v1/webhallen/sitemaps/root
     - Return all URLs from https://www.webhallen.com/sitemap.xml.
 - /api/v1/webhallen/sitemaps/home
@@ -33,12 +45,30 @@ API endpoints:
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
-
-from django.http import Http404, HttpRequest, JsonResponse
-from django.shortcuts import get_object_or_404
-from ninja import Router
-
+import datetime  # noqa: TCH003
+import re
+from decimal import Decimal  # noqa: TCH003
+from typing import TYPE_CHECKING, Literal
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models.fields.json import KeyTransform
+from django.http import HttpRequest, StreamingHttpResponse
+from ninja import Field, Query, Router, Schema
+from ninja.decorators import decorate_view
+
+from panso.pagination import FIELDS_MAX, PageParams, keyset_page, page_response, paginate
+from panso.renderers import ErrorOut, ORJSONResponse, schema_fields
+from panso.streams import encode_json_array, encode_ndjson
+from products.versions import conditional_as
+from webhallen.export import JSON_CONTENT_TYPE, NDJSON_CONTENT_TYPE, product_documents, wants_ndjson
+from webhallen.expressions import (
+    SEARCH_CONFIG,
+    product_discontinued,
+    product_manufacturer_id,
+    product_name_vector,
+    product_price,
+    product_section_id,
+)
 from webhallen.models import (
     SitemapArticle,
     SitemapCampaign,
@@ -51,134 +81,429 @@ from webhallen.models import (
     SitemapRoot,
     SitemapSection,
     WebhallenJSON,
+    WebhallenJSONRevision,
+    WebhallenPricePoint,
     WebhallenSection,
 )
+from webhallen.prices import price_history
+from webhallen.revisions import list_revisions, reconstruct
 
 if TYPE_CHECKING:
-    from datetime import datetime
-
     from django.db import models
+    from django.db.models import QuerySet
 
 router = Router()
 
+# Products returned by a filtered /products request if ?limit= isn't given, and the most it can be
+PRODUCT_QUERY_DEFAULT_LIMIT: int = 100
+PRODUCT_QUERY_MAX_LIMIT: int = 1000
+
+# A ?fields= path into the product JSON, e.g. price.price
+PRODUCT_FIELD_PATH: re.Pattern[str] = re.compile(r"^[A-Za-z0-9_]+(\.[A-Za-z0-9_]+)*$")
+
+# Most days of price history in one request
+PRICE_HISTORY_MAX_DAYS: int = 3650
+
+
+class SitemapRootOut(Schema):
+    """A URL in https://www.webhallen.com/sitemap.xml."""
+
+    loc: str
+    active: bool | None
+    created: datetime.datetime
+    updated: datetime.datetime
+
+
+class SitemapUrlOut(SitemapRootOut):
+    """A URL in one of the other sitemaps."""
+
+    priority: float | None
+
+
+class SectionOut(Schema):
+    """A section of the store, e.g. graphics cards."""
+
+    section_id: int
+    url: str | None
+    meta_title: str | None
+    active: bool | None
+    icon: str | None
+    icon_url: str | None
+    name: str | None
+
+
+class PricePointOut(Schema):
+    """The price and stock of a product from when they changed."""
+
+    recorded_at: datetime.datetime
+    price: Decimal | None
+    regular_price: Decimal | None
+    stock_web: int | None
+    stock_stores: int | None
+    stock_supplier: int | None
+
+
+class PriceHistoryOut(Schema):
+    """Response of /products/{product_id}/prices."""
+
+    product_id: int
+    prices: list[PricePointOut]
+
+
+class RevisionOut(Schema):
+    """A stored version of a product."""
+
+    id: int  # noqa: A003
+    recorded_at: datetime.datetime
+    history_type: str = Field(..., description="+ for created, ~ for changed, - for deleted.")
+    depth: int = Field(..., description="0 for a snapshot, otherwise patches since the snapshot.")
+
+
+class RevisionsOut(Schema):
+    """Response of /products/{product_id}/revisions."""
+
+    product_id: int
+    revisions: list[RevisionOut]
+
+
+# Fields of a sitemap URL that ?fields= can ask for, and the fields of the response schemas
+SITEMAP_FIELDS: tuple[str, ...] = schema_fields(SitemapUrlOut)
+SITEMAP_ROOT_FIELDS: tuple[str, ...] = schema_fields(SitemapRootOut)
+SECTION_FIELDS: tuple[str, ...] = schema_fields(SectionOut)
+
 # TODO(TheLovinator): #30 We should add more OpenAPI documentation for each endpoint.
 # https://github.com/TheLovinator1/panso.se/issues/30
 
 
+class ProductFilters(Schema):
+    """Query parameters for /products. Every filter and sort uses an index, see webhallen/expressions.py."""
+
+    q: str | None = Field(None, description="Search the product names, e.g. `rtx 4070`.")
+    section: int | None = Field(None, description="Section ID, see /sections.")
+    manufacturer: int | None = Field(None, description="Manufacturer ID.")
+    min_price: Decimal | None = Field(None, description="Lowest price in SEK.")
+    max_price: Decimal | None = Field(None, description="Highest price in SEK.")
+    discontinued: bool | None = Field(None, description="Only discontinued, or only not discontinued, products.")
+    sort: Literal["product_id", "-product_id", "price", "-price", "relevance"] | None = Field(
+        None,
+        description="Sort order. Defaults to `relevance` with `q` and to `-product_id` otherwise. "
+        "Sorting by price leaves out products without a price.",
+    )
+    limit: int | None = Field(
+        None,
+        ge=1,
+        le=PRODUCT_QUERY_MAX_LIMIT,
+        description=f"Products to return, defaults to {PRODUCT_QUERY_DEFAULT_LIMIT}.",
+    )
+    after: int | None = Field(
+        None,
+        description="Return the products after this product ID. Only when sorting by product ID. "
+        "Follow the `Link` header instead of building the URL yourself.",
+    )
+    fields: str | None = Field(
+        None,
+        description="Comma-separated paths in the product JSON to return, e.g. `name,price.price`. "
+        "`id` is always returned.",
+    )
+
+
+def parse_product_fields(fields: str | None) -> list[tuple[str, ...]]:
+    """Return the JSON paths in a ?fields= value for /products.
+
+    Args:
+        fields: The comma-separated paths, or None for the whole product.
+
+    Raises:
+        ValueError: If a path is invalid, or is inside another path.
+
+    Returns:
+        list[tuple[str, ...]]: The paths as keys, always with id. Empty for the whole product.
+    """
+    if fields is None:
+        return []
+
+    names: list[str] = list(dict.fromkeys(["id", *(name.strip() for name in fields.split(",") if name.strip())]))
+    if len(names) > FIELDS_MAX:
+        msg: str = f"Ask for at most {FIELDS_MAX} fields"
+        raise ValueError(msg)
+    for name in names:
+        if not PRODUCT_FIELD_PATH.match(name):
+            msg = f"Invalid field {name!r}, use keys separated by dots, e.g. price.price"
+            raise ValueError(msg)
+        if any(other.startswith(f"{name}.") for other in names):
+            msg = f"Field {name!r} already includes the other fields in it"
+            raise ValueError(msg)
+    return [tuple(name.split(".")) for name in names]
+
+
+def _product_path(path: tuple[str, ...]) -> KeyTransform:
+    """Return `product_json #> '{product,...path}'`."""
+    expression = KeyTransform("product", "product_json")
+    for key in path:
+        expression = KeyTransform(key, expression)
+    return expression
+
+
+def _project_product(row: dict, paths: list[tuple[str, ...]]) -> object:
+    """Put the selected values of a product back into their place in the JSON."""
+    if not paths:
+        return row["document"]
+
+    product: dict = {}
+    for index, path in enumerate(paths):
+        parent: dict = product
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        parent[path[-1]] = row[f"field_{index}"]
+    return product
+
+
+def filter_products(filters: ProductFilters) -> QuerySet[WebhallenJSON]:
+    """Return the products that match the filters, sorted.
+
+    Args:
+        filters: The query parameters.
+
+    Raises:
+        ValueError: If the products are sorted by relevance without a search.
+
+    Returns:
+        QuerySet[WebhallenJSON]: The products, not limited.
+    """
+    products: QuerySet[WebhallenJSON] = WebhallenJSON.objects.filter(product_json__product__isnull=False)
+    if filters.section is not None:
+        products = products.alias(section_id=product_section_id()).filter(section_id=filters.section)
+    if filters.manufacturer is not None:
+        products = products.alias(manufacturer_id=product_manufacturer_id()).filter(
+            manufacturer_id=filters.manufacturer,
+        )
+    if filters.discontinued is not None:
+        products = products.alias(discontinued=product_discontinued()).filter(discontinued=filters.discontinued)
+
+    sort: str = filters.sort or ("relevance" if filters.q else "-product_id")
+    if filters.min_price is not None or filters.max_price is not None or sort in {"price", "-price"}:
+        products = products.alias(price=product_price()).filter(price__isnull=False)
+        if filters.min_price is not None:
+            products = products.filter(price__gte=filters.min_price)
+        if filters.max_price is not None:
+            products = products.filter(price__lte=filters.max_price)
+
+    if filters.q:
+        query = SearchQuery(filters.q, config=SEARCH_CONFIG, search_type="websearch")
+        products = products.alias(search=product_name_vector()).filter(search=query)
+        if sort == "relevance":
+            products = products.alias(rank=SearchRank(product_name_vector(), query))
+    elif sort == "relevance":
+        msg = "Sorting by relevance needs a search, add ?q="
+        raise ValueError(msg)
+
+    orderings: dict[str, tuple[str, ...]] = {
+        "product_id": ("product_id",),
+        "-product_id": ("-product_id",),
+        "price": ("price", "product_id"),
+        "-price": ("-price", "-product_id"),
+        "relevance": ("-rank", "-product_id"),
+    }
+    return products.order_by(*orderings[sort])
+
+
 @router.get(
     path="/products",
-    summary="Return all Webhallen products as JSON.",
-    description="Return all Webhallen products as JSON.\n\n **Note:** This will return 130 MB+ of JSON so don't try to load this via the Swagger UI.",  # noqa: E501
+    summary="Return all Webhallen products as JSON, or search and filter them.",
+    description="Return all Webhallen products as JSON.\n\n **Note:** This will return 130 MB+ of JSON so don't try to load this via the Swagger UI.\n\n"  # noqa: E501
+    "The products are streamed as a JSON array, or as NDJSON, one product per line, if the `Accept` header asks "
+    f"for `{NDJSON_CONTENT_TYPE}`.\n\n"
+    "With any of the filters or `sort`, only the matching products are returned, "
+    f"{PRODUCT_QUERY_DEFAULT_LIMIT} at a time unless `limit` is given.",
 )
-def api_products(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
-    """Return all Webhallen products as JSON."""
-    products_data = list(
-        WebhallenJSON.objects.values_list("product_json__product", flat=True).filter(
-            product_json__product__isnull=False,
-        ),
+def api_products(request: HttpRequest, filters: Query[ProductFilters]) -> ORJSONResponse | StreamingHttpResponse:
+    """Return all Webhallen products as JSON, or the ones that match the filters."""
+    if not filters.model_dump(exclude_none=True):
+        if wants_ndjson(request):
+            return StreamingHttpResponse(encode_ndjson(product_documents()), content_type=NDJSON_CONTENT_TYPE)
+        return StreamingHttpResponse(encode_json_array(product_documents()), content_type=JSON_CONTENT_TYPE)
+
+    try:
+        products: QuerySet[WebhallenJSON] = filter_products(filters)
+        paths: list[tuple[str, ...]] = parse_product_fields(filters.fields)
+    except ValueError as e:
+        return ORJSONResponse({"error": str(e)}, status=400)
+
+    # Only the JSON that was asked for is read from the row
+    selected: dict[str, KeyTransform] = (
+        {f"field_{index}": _product_path(path) for index, path in enumerate(paths)}
+        if paths
+        else {"document": KeyTransform("product", "product_json")}
     )
-    return JsonResponse(data=products_data, safe=False)
+    rows: QuerySet = products.values("product_id", **selected)
+    limit: int = filters.limit or PRODUCT_QUERY_DEFAULT_LIMIT
+    sort: str = filters.sort or ("relevance" if filters.q else "-product_id")
+    if sort in {"product_id", "-product_id"}:
+        page, next_key = keyset_page(rows, "product_id", filters.after, limit, descending=sort == "-product_id")
+    elif filters.after is not None:
+        return ORJSONResponse({"error": "?after= only works when sorting by product ID"}, status=400)
+    else:
+        page, next_key = list(rows[:limit]), None
+    return page_response(request, [_project_product(row, paths) for row in page], next_key)
+
+
+@router.get(path="/products/{product_id}", response={200: dict, 404: ErrorOut})
+@decorate_view(conditional_as(WebhallenJSON))
+def api_product(request: HttpRequest, product_id: int) -> ORJSONResponse:  # noqa: ARG001
+    """Return Webhallen product as JSON."""
+    # Only the product is read from the row, not the metadata next to it
+    products: list[dict | None] = list(
+        WebhallenJSON.objects.filter(product_id=product_id)
+        .annotate(product=KeyTransform("product", "product_json"))
+        .values_list("product", flat=True)[:1],
+    )
+    if not products:
+        return ORJSONResponse({"error": f"Product with ID {product_id} not found."}, status=404)
+    return ORJSONResponse(products[0] or {})
 
 
-@router.get(path="/products/{product_id}")
-def api_product(request: HttpRequest, product_id: str) -> JsonResponse:  # noqa: ARG001
-    """Return Webhallen product as JSON."""
-    try:
-        product: WebhallenJSON = get_object_or_404(WebhallenJSON, product_id=product_id)
-        product_json = product.product_json
-        product_data = product_json.get("product", {})
-        return JsonResponse(product_data, safe=False)
-    except Http404:
-        return JsonResponse(data={"error": f"Product with ID {product_id} not found."}, status=404)
-    except Exception as e:  # noqa: BLE001
-        return JsonResponse(data={"error": str(e)}, status=500)
-
-
-@router.get(path="/sitemaps/root")
-def api_sitemaps_root(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
-    """Return all URLs from https://www.webhallen.com/sitemap.xml."""
-    sitemaps_data = list(SitemapRoot.objects.values("loc", "active", "created", "updated"))
-    return JsonResponse(data=sitemaps_data, safe=False)
+@router.get(
+    path="/products/{product_id}/prices",
+    response=PriceHistoryOut,
+    summary="Return the price and stock history of a Webhallen product.",
+    description="Return a point for every time the price, regular price or stock of the product changed in the "
+    "last `days` days, oldest first. The first point is the one that was current when the period started.",
+)
+@decorate_view(conditional_as(WebhallenPricePoint))
+def api_product_prices(
+    request: HttpRequest,  # noqa: ARG001
+    product_id: int,
+    days: int = Query(365, ge=1, le=PRICE_HISTORY_MAX_DAYS),
+) -> ORJSONResponse:
+    """Return the price and stock history of a Webhallen product."""
+    return ORJSONResponse({"product_id": product_id, "prices": price_history(product_id, days=days)})
 
 
-def get_sitemap_data(model: type[models.Model]) -> list[dict[str, str | datetime]]:
-    """Return all URLs from https://www.webhallen.com/sitemap.{sitemap}.xml.
+@router.get(
+    path="/products/{product_id}/revisions",
+    response=RevisionsOut,
+    summary="Return the stored versions of a Webhallen product.",
+    description="Return every version of the product that is stored as a revision, oldest first. A depth of 0 "
+    "means the version is stored as a full snapshot, otherwise as a patch.",
+)
+@decorate_view(conditional_as(WebhallenJSONRevision))
+def api_product_revisions(request: HttpRequest, product_id: int) -> ORJSONResponse:  # noqa: ARG001
+    """Return the stored versions of a Webhallen product."""
+    return ORJSONResponse({"product_id": product_id, "revisions": list_revisions(product_id)})
+
+
+@router.get(
+    path="/products/{product_id}/revisions/{revision_id}",
+    response={200: dict, 404: ErrorOut},
+    summary="Return a stored version of a Webhallen product as JSON.",
+    description="Return the product JSON as it was in the revision, rebuilt from its snapshot and patches.",
+)
+@decorate_view(conditional_as(WebhallenJSONRevision))
+def api_product_revision(request: HttpRequest, product_id: int, revision_id: int) -> ORJSONResponse:  # noqa: ARG001
+    """Return a stored version of a Webhallen product as JSON."""
+    product_json: dict | None = reconstruct(product_id, revision_id=revision_id)
+    if product_json is None:
+        return ORJSONResponse(
+            {"error": f"Revision {revision_id} of product with ID {product_id} not found."},
+            status=404,
+        )
+    return ORJSONResponse(product_json)
+
+
+def sitemap_response(
+    request: HttpRequest,
+    model: type[models.Model],
+    page: PageParams,
+    fields: tuple[str, ...] = SITEMAP_FIELDS,
+) -> ORJSONResponse:
+    """Return all URLs from https://www.webhallen.com/sitemap.{sitemap}.xml, or a page of them.
 
     Args:
+        request: The request.
         model: Sitemap model.
+        page: The page that was asked for, if any.
+        fields: The fields of the model.
 
     Returns:
-        list[dict[str, str | datetime]]: Sitemap data.
+        ORJSONResponse: Sitemap data.
     """
-    return list(model.objects.values("loc", "priority", "active", "created", "updated"))
+    if page.requested:
+        return paginate(request, model.objects.all(), page, key="loc", allowed=fields, default=fields)
+    return ORJSONResponse(list(model.objects.values(*fields)))
 
 
-@router.get(path="/sitemaps/home")
-def api_sitemaps_home(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/root", response=list[SitemapRootOut])
+@decorate_view(conditional_as(SitemapRoot))
+def api_sitemaps_root(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
+    """Return all URLs from https://www.webhallen.com/sitemap.xml."""
+    return sitemap_response(request, SitemapRoot, page, fields=SITEMAP_ROOT_FIELDS)
+
+
+@router.get(path="/sitemaps/home", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapHome))
+def api_sitemaps_home(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.home.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapHome), safe=False)
+    return sitemap_response(request, SitemapHome, page)
 
 
-@router.get(path="/sitemaps/sections")
-def api_sitemaps_sections(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/sections", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapSection))
+def api_sitemaps_sections(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.section.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapSection), safe=False)
+    return sitemap_response(request, SitemapSection, page)
 
 
-@router.get(path="/sitemaps/categories")
-def api_sitemaps_categories(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/categories", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapCategory))
+def api_sitemaps_categories(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.category.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapCategory), safe=False)
+    return sitemap_response(request, SitemapCategory, page)
 
 
-@router.get(path="/sitemaps/campaigns")
-def api_sitemaps_campaigns(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/campaigns", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapCampaign))
+def api_sitemaps_campaigns(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.campaign.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapCampaign), safe=False)
+    return sitemap_response(request, SitemapCampaign, page)
 
 
-@router.get(path="/sitemaps/campaign-lists")
-def api_sitemaps_campaign_lists(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/campaign-lists", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapCampaignList))
+def api_sitemaps_campaign_lists(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.campaignList.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapCampaignList), safe=False)
+    return sitemap_response(request, SitemapCampaignList, page)
 
 
-@router.get(path="/sitemaps/info-pages")
-def api_sitemaps_info_pages(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/info-pages", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapInfoPages))
+def api_sitemaps_info_pages(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.infoPages.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapInfoPages), safe=False)
+    return sitemap_response(request, SitemapInfoPages, page)
 
 
-@router.get(path="/sitemaps/products")
-def api_sitemaps_products(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/products", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapProduct))
+def api_sitemaps_products(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.products.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapProduct), safe=False)
+    return sitemap_response(request, SitemapProduct, page)
 
 
-@router.get(path="/sitemaps/manufacturers")
-def api_sitemaps_manufacturers(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/manufacturers", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapManufacturer))
+def api_sitemaps_manufacturers(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.manufacturer.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapManufacturer), safe=False)
+    return sitemap_response(request, SitemapManufacturer, page)
 
 
-@router.get(path="/sitemaps/articles")
-def api_sitemaps_articles(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sitemaps/articles", response=list[SitemapUrlOut])
+@decorate_view(conditional_as(SitemapArticle))
+def api_sitemaps_articles(request: HttpRequest, page: Query[PageParams]) -> ORJSONResponse:
     """Return all URLs from https://www.webhallen.com/sitemap.article.xml."""
-    return JsonResponse(data=get_sitemap_data(model=SitemapArticle), safe=False)
+    return sitemap_response(request, SitemapArticle, page)
 
 
-@router.get(path="/sections")
-def api_list_sections(request: HttpRequest) -> JsonResponse:  # noqa: ARG001
+@router.get(path="/sections", response=list[SectionOut])
+@decorate_view(conditional_as(WebhallenSection))
+def api_list_sections(request: HttpRequest) -> ORJSONResponse:  # noqa: ARG001
     """Return all sections."""
-    sections_data = list(
-        WebhallenSection.objects.values(
-            "section_id",
-            "url",
-            "meta_title",
-            "active",
-            "icon",
-            "icon_url",
-            "name",
-        ),
-    )
-    return JsonResponse(data=sections_data, safe=False)
+    return ORJSONResponse(list(WebhallenSection.objects.values(*SECTION_FIELDS)))
@@ -0,0 +1,631 @@
+"""Convert WebhallenJSON into the typed WebhallenProduct table.
+
+The products are split into ranges of primary keys with about `range_size` products each, see plan_ranges().
+Every range is converted on its own:
+
+    1. The JSON is read with a server-side cursor, so only `chunk_size` rows are in memory at a time.
+    2. Every row is converted to a tuple in the order of PRODUCT_COLUMNS, see product_row().
+    3. Each chunk of tuples is written with COPY into a staging table and one INSERT ... ON CONFLICT DO UPDATE.
+       Products whose values didn't change are not updated.
+
+With more than one worker the ranges are converted in a process pool. Decoding and converting the JSON is CPU
+bound, so this uses every core instead of one. Each process opens its own database connection.
+
+By default only the products updated since the last run are converted, see WebhallenWatermark.
+"""
+
+from __future__ import annotations
+
+import datetime
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import TYPE_CHECKING
+
+import django
+from cacheops import invalidate_model
+from django.db import connection, connections, transaction
+from rich.console import Console
+
+from webhallen.models import WebhallenJSON, WebhallenProduct, WebhallenWatermark
+from webhallen.watermarks import WATERMARK_OVERLAP
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+    from django.db.backends.utils import CursorWrapper
+
+err_console = Console(stderr=True)
+
+# Name of the watermark in webhallen_watermark
+PRODUCTS_WATERMARK: str = "products"
+
+WEBHALLEN_URL: str = "https://www.webhallen.com"
+
+STAGING_TABLE: str = "webhallen_product_staging"
+
+# Products per primary-key range, the unit of work handed to a worker
+RANGE_SIZE: int = 5000
+
+# Rows fetched from the server-side cursor, and written to the database, at a time
+CHUNK_SIZE: int = 1000
+
+# Largest value an IntegerField can hold
+MAX_INTEGER: int = 2**31 - 1
+
+# Columns in the order product_row() returns them
+PRODUCT_COLUMNS: tuple[str, ...] = (
+    "product_id",
+    "name",
+    "main_title",
+    "sub_title",
+    "description",
+    "meta_title",
+    "meta_description",
+    "canonical_url",
+    "thumbnail",
+    "images_zoom",
+    "images_large",
+    "images_thumb",
+    "section_id",
+    "category_tree",
+    "main_category_path",
+    "categories",
+    "manufacturer",
+    "part_numbers",
+    "eans",
+    "status_codes",
+    "release_date",
+    "minimum_rank_level",
+    "package_size_id",
+    "insurance_id",
+    "is_digital",
+    "discontinued",
+    "phone_subscription",
+    "is_shippable",
+    "is_collectable",
+    "long_delivery_notice",
+    "possible_delivery_methods",
+    "excluded_shipping_methods",
+    "is_fyndware",
+    "fyndware_of",
+    "fyndware_of_description",
+    "fyndware_class",
+    "price",
+    "vat",
+    "price_type",
+    "price_end_at",
+    "price_nearly_over",
+    "price_flash_sale",
+    "regular_price",
+    "regular_price_type",
+    "regular_price_end_at",
+    "regular_price_nearly_over",
+    "regular_price_flash_sale",
+    "lowest_price",
+    "lowest_price_type",
+    "lowest_price_end_at",
+    "lowest_price_nearly_over",
+    "lowest_price_flash_sale",
+    "level_one_price",
+    "level_one_price_type",
+    "level_one_price_end_at",
+    "level_one_price_nearly_over",
+    "level_one_price_flash_sale",
+    "average_rating",
+    "average_rating_type",
+    "energy_marking_rating",
+    "energy_marking_label",
+    "highlighted_review_id",
+    "highlighted_review_user_id",
+    "highlighted_review_text",
+    "highlighted_review_rating",
+    "highlighted_review_upvotes",
+    "highlighted_review_downvotes",
+    "highlighted_review_verified",
+    "highlighted_review_created",
+    "highlighted_review_is_anonymous",
+    "highlighted_review_is_employee",
+    "highlighted_review_product_id",
+    "highlighted_review_is_hype",
+    "source_updated",
+)
+
+# A product is only updated if one of these changed. source_updated is left out, otherwise every change to a
+# value we don't convert, like the stock, would rewrite the row.
+_COMPARED_COLUMNS: tuple[str, ...] = tuple(column for column in PRODUCT_COLUMNS if column != "source_updated")
+
+_COLUMNS: str = ", ".join(PRODUCT_COLUMNS)
+
+UPSERT_SQL: str = f"""
+WITH upserted AS (
+    INSERT INTO webhallen_product AS t ({_COLUMNS}, created, updated)
+    SELECT {_COLUMNS}, now(), now() FROM {STAGING_TABLE}
+    ON CONFLICT (product_id) DO UPDATE SET
+        {", ".join(f"{column} = excluded.{column}" for column in PRODUCT_COLUMNS[1:])},
+        updated = now()
+    WHERE ({", ".join(f"t.{column}" for column in _COMPARED_COLUMNS)})
+        IS DISTINCT FROM ({", ".join(f"excluded.{column}" for column in _COMPARED_COLUMNS)})
+    RETURNING t.xmax = 0 AS created
+)
+SELECT count(*) FILTER (WHERE created), count(*) FILTER (WHERE NOT created) FROM upserted
+"""  # noqa: S608
+
+# Like ADVANCE_WATERMARK_SQL in watermarks.py, for a watermark computed in Python
+ADVANCE_WATERMARK_SQL: str = """
+INSERT INTO webhallen_watermark (name, watermark, updated) VALUES (%(name)s, %(newest)s, now())
+ON CONFLICT (name) DO UPDATE SET
+    watermark = greatest(webhallen_watermark.watermark, excluded.watermark),
+    updated = now()
+"""
+
+# The last product ID of every range of `range_size` products, and of the last range
+RANGE_BOUNDARIES_SQL: str = """
+SELECT product_id FROM (
+    SELECT product_id, row_number() OVER (ORDER BY product_id) AS n, count(*) OVER () AS total
+    FROM webhallen_json
+    {where}
+) products
+WHERE n %% %(range_size)s = 0 OR n = total
+ORDER BY product_id
+"""
+
+
+@dataclass
+class ConversionStats:
+    """What converting one range, or all of them, did."""
+
+    read: int = 0
+    created: int = 0
+    changed: int = 0
+    invalid: int = 0
+    ranges: int = 0
+    seconds: float = 0.0
+    newest: datetime.datetime | None = None
+
+    @property
+    def unchanged(self: ConversionStats) -> int:
+        """Products that were converted and were already up to date."""
+        return self.read - self.invalid - self.created - self.changed
+
+    @property
+    def rows_per_second(self: ConversionStats) -> float:
+        """Products read per second."""
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def add(self: ConversionStats, other: ConversionStats) -> None:
+        """Add the counts of another range to these. The time is not added, ranges run at the same time."""
+        self.read += other.read
+        self.created += other.created
+        self.changed += other.changed
+        self.invalid += other.invalid
+        self.ranges += other.ranges
+        if other.newest and (self.newest is None or other.newest > self.newest):
+            self.newest = other.newest
+
+
+def make_datetime_from_timestamp(date_string: str | None) -> datetime.datetime | None:
+    """Convert a date to a datetime.
+
+    Args:
+        date_string: Datetime as string. For example: "2024-02-22T01:13:46"
+
+    Returns:
+        datetime.datetime: Datetime or None if timestamp is empty or fucked
+    """
+    if not date_string or not isinstance(date_string, str):
+        return None
+
+    try:
+        return datetime.datetime.strptime(date_string, "%Y-%m-%dT%H:%M:%S").astimezone(tz=datetime.UTC)
+    except ValueError:
+        err_console.print(f"Failed to get date from timestamp {date_string!r}")
+        return None
+
+
+def convert_timestamp_to_datetime(timestamp: int | None, date_format: str | None) -> str:
+    """Convert a timestamp to a datetime.
+
+    Example:
+        timestamp=1704059999, format="Y" -> 2023
+        timestamp=1686110400, format="Y-m-d" -> 2023-06-07
+
+    Args:
+        timestamp: Unix timestamp
+        date_format: Format shown on website
+
+    Returns:
+        The parsed date, or an empty string if we don't know it
+    """
+    # -62169966000 seems to be 0000-00-00 00:00:00
+    if not timestamp or not date_format or timestamp == -62169966000:  # noqa: PLR2004
+        return ""
+
+    formats: dict[str, str] = {"Y": "%Y", "Y-m-d": "%Y-%m-%d", "M Y": "%B %Y"}
+    if date_format in formats:
+        return datetime.datetime.fromtimestamp(timestamp, tz=datetime.UTC).strftime(formats[date_format])
+
+    if date_format == "Q \\k\\v\\a\\r\\t\\a\\l\\e\\t Y":
+        # TODO(TheLovinator): #44 Implement this
+        # https://github.com/TheLovinator1/panso.se/issues/44
+        err_console.print(f"Found Q kvartalet Y for {timestamp}")
+    err_console.print(f"Unknown date format: {date_format}")
+    return ""
+
+
+def _text(value: object) -> str | None:
+    """Return the value as text, None if it is missing or empty."""
+    if value is None or (isinstance(value, str) and not value):
+        return None
+    # Postgres text can't contain NUL
+    return (value if isinstance(value, str) else str(value)).replace("\x00", "")
+
+
+def _int(value: object) -> int | None:
+    """Return the value as an integer, None if it isn't one or doesn't fit in an IntegerField."""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = int(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+    return number if -MAX_INTEGER <= number <= MAX_INTEGER else None
+
+
+def _decimal(value: object) -> Decimal | None:
+    """Return a price as a Decimal, None if it isn't a number."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+def _float(value: object) -> float | None:
+    """Return the value as a float, None if it isn't a number."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value: object) -> bool | None:
+    """Return the value if it is a boolean, otherwise None."""
+    return value if isinstance(value, bool) else None
+
+
+def _dict(value: object) -> dict:
+    """Return the value if it is an object, otherwise an empty dict."""
+    return value if isinstance(value, dict) else {}
+
+
+def _join(values: object, key: str | None = None, prefix: str = "") -> str | None:
+    """Join a list as comma separated text.
+
+    Args:
+        values: The list from the JSON.
+        key: Join this key of every object in the list instead of the items themselves.
+        prefix: Put this before every item, e.g. to make URLs absolute.
+
+    Returns:
+        str | None: The items, or None if there were none.
+    """
+    if not isinstance(values, list):
+        return None
+    items: list[str] = []
+    for value in values:
+        item: object = value.get(key) if key and isinstance(value, dict) else value
+        if item is not None and not isinstance(item, dict | list) and str(item):
+            items.append(f"{prefix}{item}")
+    return _text(",".join(items))
+
+
+def make_thumbnail_url(url: object) -> str | None:
+    """Make an absolute URL from a Webhallen path, e.g. /images/product/123?trim.
+
+    Args:
+        url: Path from the JSON.
+
+    Returns:
+        str | None: URL, or None if there was no path.
+    """
+    return f"{WEBHALLEN_URL}{url}" if url and isinstance(url, str) else None
+
+
+def _price(price: dict) -> tuple:
+    """Return the price, type, end_at, nearly_over and flash_sale columns for a price object."""
+    if not price:
+        return (None, None, None, None, None)
+    return (
+        _decimal(price.get("price")),
+        _text(price.get("type")),
+        make_datetime_from_timestamp(price.get("endAt")),
+        bool(price.get("nearlyOver", False)),
+        bool(price.get("flashSale", False)),
+    )
+
+
+def _review(review: dict) -> tuple:
+    """Return the highlighted_review_* columns for the highlighted review."""
+    if not review:
+        return (None,) * 12
+
+    user: dict = _dict(review.get("user"))
+    user_id: str | None = _text(user.get("id")) or ("Anonymous" if review.get("isAnonymous") else None)
+    return (
+        _int(review.get("id")),
+        user_id,
+        _text(review.get("text")),
+        _int(review.get("rating")),
+        _int(review.get("upvotes")),
+        _int(review.get("downvotes")),
+        bool(review.get("verified", False)),
+        make_datetime_from_timestamp(review.get("created")),
+        bool(review.get("isAnonymous", False)),
+        bool(review.get("isEmployee", False)),
+        _int(_dict(review.get("product")).get("id")),
+        bool(review.get("isHype", False)),
+    )
+
+
+def product_row(product_id: int, product_json: dict, source_updated: datetime.datetime) -> tuple | None:
+    """Convert a product's JSON to a WebhallenProduct row.
+
+    Args:
+        product_id: WebhallenJSON.product_id
+        product_json: WebhallenJSON.product_json
+        source_updated: WebhallenJSON.updated
+
+    Returns:
+        tuple | None: The values in the order of PRODUCT_COLUMNS, or None if the JSON has no product.
+    """
+    product: dict = _dict(_dict(product_json).get("product"))
+    if not product or not product.get("id"):
+        return None
+
+    price: dict = _dict(product.get("price"))
+    price_columns: tuple = _price(price)
+    release: dict = _dict(product.get("release"))
+    energy_marking: dict = _dict(product.get("energyMarking"))
+    average_rating: dict = _dict(product.get("averageRating"))
+    fyndware_of: dict = _dict(product.get("fyndwareOf"))
+    return (
+        product_id,
+        _text(product.get("name")),
+        _text(product.get("mainTitle")),
+        _text(product.get("subTitle")),
+        _text(product.get("description")),
+        _text(product.get("metaTitle")),
+        _text(product.get("metaDescription")),
+        _text(product.get("canonicalUrl")),
+        make_thumbnail_url(product.get("thumbnail")),
+        _join(product.get("images"), key="zoom", prefix=WEBHALLEN_URL),
+        _join(product.get("images"), key="large", prefix=WEBHALLEN_URL),
+        _join(product.get("images"), key="thumb", prefix=WEBHALLEN_URL),
+        _int(_dict(product.get("section")).get("id")),
+        _text(product.get("categoryTree")),
+        _join(product.get("mainCategoryPath"), key="id"),
+        _join(product.get("categories"), key="id"),
+        _int(_dict(product.get("manufacturer")).get("id")),
+        _join(product.get("partNumbers")),
+        _join(product.get("eans")),
+        _join(product.get("statusCodes")),
+        _text(convert_timestamp_to_datetime(release.get("timestamp"), release.get("format"))),
+        _int(product.get("minimumRankLevel")),
+        _int(product.get("packageSizeId")),
+        _int(_dict(product.get("insurance")).get("id")),
+        _bool(product.get("isDigital")),
+        _bool(product.get("discontinued")),
+        _bool(product.get("phoneSubscription")),
+        _bool(product.get("isShippable")),
+        _bool(product.get("isCollectable")),
+        _text(product.get("longDeliveryNotice")),
+        _join(product.get("possibleDeliveryMethods")),
+        _join(_dict(product.get("meta")).get("excluded_shipping_methods")),
+        _bool(product.get("isFyndware")),
+        _int(fyndware_of.get("id")),
+        _text(fyndware_of.get("description")),
+        _int(_dict(product.get("fyndwareClass")).get("id")),
+        price_columns[0],
+        _decimal(price.get("vat")),
+        *price_columns[1:],
+        *_price(_dict(product.get("regularPrice"))),
+        *_price(_dict(product.get("lowestPrice"))),
+        *_price(_dict(product.get("levelOnePrice"))),
+        _float(average_rating.get("rating")),
+        _text(average_rating.get("type")),
+        _text(energy_marking.get("rating")),
+        _text(energy_marking.get("label")),
+        *_review(_dict(product.get("reviewHighlight"))),
+        source_updated,
+    )
+
+
+def plan_ranges(since: datetime.datetime | None = None, range_size: int = RANGE_SIZE) -> list[tuple[int | None, int]]:
+    """Split the products into ranges of primary keys with `range_size` products each.
+
+    Args:
+        since: Only count products updated after this.
+        range_size: Products per range.
+
+    Returns:
+        list[tuple[int | None, int]]: (after, upto) for every range, the range is after < product_id <= upto.
+            `after` is None for the first range.
+    """
+    where: str = "WHERE updated > %(since)s" if since else ""
+    with connection.cursor() as cursor:
+        cursor.execute(RANGE_BOUNDARIES_SQL.format(where=where), {"since": since, "range_size": range_size})
+        boundaries: list[int] = [row[0] for row in cursor.fetchall()]
+    if not boundaries:
+        return []
+    return list(zip([None, *boundaries[:-1]], boundaries, strict=True))
+
+
+def _create_staging_table(cursor: CursorWrapper) -> None:
+    """Create an empty staging table with the same columns as webhallen_product for this transaction."""
+    # ON COMMIT DROP only fires on commit, so an earlier run inside the same outer transaction leaves it behind
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {STAGING_TABLE} ON COMMIT DROP AS SELECT {_COLUMNS} FROM webhallen_product WITH NO DATA",  # noqa: E501, S608
+    )
+
+
+def _write_rows(cursor: CursorWrapper, rows: list[tuple], stats: ConversionStats) -> None:
+    """COPY converted rows into the staging table and upsert them into webhallen_product."""
+    if not rows:
+        return
+    cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+    with cursor.copy(f"COPY {STAGING_TABLE} ({_COLUMNS}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+    cursor.execute(UPSERT_SQL)
+    created, changed = cursor.fetchone()
+    stats.created += created
+    stats.changed += changed
+
+
+def convert_range(
+    after: int | None,
+    upto: int | None,
+    since: datetime.datetime | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> ConversionStats:
+    """Convert the products in a range of primary keys.
+
+    The range is converted in one transaction. This is what the worker processes run.
+
+    Args:
+        after: Convert products with a higher product ID than this. None to start from the first product.
+        upto: Convert products up to and including this product ID. None to go to the last product.
+        since: Only convert products updated after this.
+        chunk_size: Rows fetched and written at a time.
+
+    Returns:
+        ConversionStats: What was converted.
+    """
+    started: float = time.perf_counter()
+    stats = ConversionStats(ranges=1)
+    products = WebhallenJSON.objects.nocache().order_by("product_id")
+    if after is not None:
+        products = products.filter(product_id__gt=after)
+    if upto is not None:
+        products = products.filter(product_id__lte=upto)
+    if since is not None:
+        products = products.filter(updated__gt=since)
+
+    rows: list[tuple] = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        _create_staging_table(cursor)
+        for product_id, product_json, updated in products.values_list("product_id", "product_json", "updated").iterator(
+            chunk_size=chunk_size,
+        ):
+            stats.read += 1
+            if stats.newest is None or updated > stats.newest:
+                stats.newest = updated
+
+            row: tuple | None = product_row(product_id, product_json, updated)
+            if row is None:
+                stats.invalid += 1
+                continue
+
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                _write_rows(cursor, rows, stats)
+                rows.clear()
+        _write_rows(cursor, rows, stats)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def _init_worker() -> None:
+    """Set up Django in a new worker process. Every process must open its own database connection."""
+    django.setup()
+    connections.close_all()
+
+
+def _convert_ranges(
+    ranges: list[tuple[int | None, int]],
+    since: datetime.datetime | None,
+    workers: int,
+    chunk_size: int,
+) -> Iterator[ConversionStats]:
+    """Convert the ranges, in a process pool if there is more than one worker, and yield them as they finish."""
+    if workers <= 1 or len(ranges) <= 1:
+        for after, upto in ranges:
+            yield convert_range(after, upto, since, chunk_size)
+        return
+
+    # Forked processes would share our connection otherwise
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures: list[Future] = [pool.submit(convert_range, after, upto, since, chunk_size) for after, upto in ranges]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        except BaseException:
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
+def _watermark_since() -> datetime.datetime | None:
+    """Return when the products converted last time were updated, minus the overlap. None on the first run."""
+    watermark: datetime.datetime | None = (
+        WebhallenWatermark.objects.nocache().filter(name=PRODUCTS_WATERMARK).values_list("watermark", flat=True).first()
+    )
+    return watermark - WATERMARK_OVERLAP if watermark else None
+
+
+def _advance_watermark(newest: datetime.datetime) -> None:
+    """Move the products watermark forward to `newest`. It never moves backwards."""
+    with connection.cursor() as cursor:
+        cursor.execute(ADVANCE_WATERMARK_SQL, {"name": PRODUCTS_WATERMARK, "newest": newest})
+
+
+def convert_products(  # noqa: PLR0913
+    *,
+    workers: int = 1,
+    since: datetime.datetime | None = None,
+    full: bool = False,
+    range_size: int = RANGE_SIZE,
+    chunk_size: int = CHUNK_SIZE,
+    on_range: Callable[[ConversionStats, int], None] | None = None,
+) -> ConversionStats:
+    """Convert WebhallenJSON to WebhallenProduct.
+
+    Args:
+        workers: Processes to convert ranges in. 1 converts everything in this process.
+        since: Only convert products updated after this. The watermark is not moved.
+        full: Convert every product instead of the ones updated since the last run.
+        range_size: Products per range.
+        chunk_size: Rows fetched and written at a time.
+        on_range: Called with the stats of every range when it is done, and the number of ranges.
+
+    Returns:
+        ConversionStats: What was converted, with the wall-clock time in `seconds`.
+    """
+    started: float = time.perf_counter()
+    incremental: bool = since is None and not full
+    if incremental:
+        since = _watermark_since()
+
+    ranges: list[tuple[int | None, int]] = plan_ranges(since, range_size)
+    total = ConversionStats()
+    for stats in _convert_ranges(ranges, since, workers, chunk_size):
+        total.add(stats)
+        if on_range:
+            on_range(stats, len(ranges))
+
+    # An explicit --since can start after the watermark, moving it would skip the products in between
+    if total.newest and (incremental or full):
+        _advance_watermark(total.newest)
+    if total.created or total.changed:
+        invalidate_model(WebhallenProduct)
+
+    total.seconds = time.perf_counter() - started
+    return total
@@ -0,0 +1,219 @@
+"""Concurrent crawler for the Webhallen product API.
+
+scrape_products() fetches one product at a time, so a full refresh is bounded by round-trip latency.
+The crawler instead keeps a number of requests in flight over one shared AsyncScrapingClient, which
+spaces them out per host, so the only thing limiting throughput is how polite we want to be.
+
+Fetched products are handed to a ProductWriter that writes them to the database in batches.
+
+Usage:
+    stats: CrawlStats = asyncio.run(crawl_products(product_ids, writer=ProductWriter()))
+
+The rate and concurrency come from SCRAPING_HOSTS["www.webhallen.com"] in settings.py, unless they are passed in.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING
+
+import httpx
+from asgiref.sync import sync_to_async
+from rich import print
+from rich.console import Console
+
+from panso.scraping import AsyncScrapingClient, HostPolicy, archive_if_enabled
+from panso.scraping.limits import get_host_policy
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from webhallen.writer import ProductWriter
+
+err_console = Console(stderr=True)
+
+WEBHALLEN_HOST: str = "www.webhallen.com"
+
+
+def product_api_url(product_id: int | str) -> str:
+    """Return the Webhallen API URL for a product.
+
+    Args:
+        product_id: The product ID.
+
+    Returns:
+        str: URL to the product JSON.
+    """
+    return f"https://www.webhallen.com/api/v1/product/{product_id}"
+
+
+def product_id_from_url(url: str) -> int | None:
+    """Return the product ID from a product URL.
+
+    Args:
+        url: URL from the product sitemap, e.g. https://www.webhallen.com/se/product/123456-Product-Name
+
+    Returns:
+        int: The product ID, e.g. 123456. None if the URL has no product ID.
+    """
+    match: re.Match[str] | None = re.search(r"\d+", url)
+    return int(match.group()) if match else None
+
+
+def parse_product_response(product_id: int | str, response: httpx.Response) -> dict:
+    """Validate a response from the Webhallen API and add our own metadata to it.
+
+    Args:
+        product_id: The product ID.
+        response: The response from the Webhallen API.
+
+    Raises:
+        httpx.HTTPError: If the response is a HTML page (probably 404) or if the JSON is empty.
+
+    Returns:
+        The product JSON with our metadata added.
+    """
+    product_url: str = product_api_url(product_id)
+    if response.text.startswith("<!DOCTYPE html>"):
+        msg: str = f"Probably 404? {product_url}"
+        raise httpx.HTTPError(msg)
+
+    product_json = response.json()
+    if not product_json:
+        msg: str = f"Empty JSON response for {product_url}"
+        raise httpx.HTTPError(msg)
+
+    product_json = dict(product_json)
+    product_json["metadata"] = {
+        "product_id": str(product_id),
+        "product_url": product_url,
+    }
+    return product_json
+
+
+@dataclass
+class CrawlStats:
+    """What happened during a crawl."""
+
+    fetched: list[int] = field(default_factory=list)
+    failed: dict[int, str] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    finished: float | None = None
+
+    @property
+    def elapsed(self: CrawlStats) -> float:
+        """Seconds the crawl took, or has taken so far."""
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self: CrawlStats) -> float:
+        """Fetched products per second."""
+        return len(self.fetched) / self.elapsed if self.elapsed else 0.0
+
+
+async def fetch_product(client: AsyncScrapingClient, product_id: int) -> dict:
+    """Fetch a single product from the Webhallen API.
+
+    Retries and rate limiting are handled by the client.
+
+    Args:
+        client: The shared HTTP client.
+        product_id: The product ID.
+
+    Returns:
+        The product JSON with our metadata added.
+    """
+    response: httpx.Response = await client.get(product_api_url(product_id))
+    return parse_product_response(product_id, response)
+
+
+async def _crawl_worker(
+    queue: asyncio.Queue[int],
+    client: AsyncScrapingClient,
+    writer: ProductWriter,
+    stats: CrawlStats,
+) -> None:
+    """Fetch products from the queue until it is empty."""
+    while True:
+        try:
+            product_id: int = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+
+        try:
+            product_json: dict = await fetch_product(client, product_id)
+        except (httpx.HTTPError, ValueError) as e:
+            err_console.print(f"Error getting product {product_id}: {e}")
+            stats.failed[product_id] = type(e).__name__
+            continue
+
+        stats.fetched.append(product_id)
+        writer.add(product_id, product_json)
+        if writer.should_flush:
+            await sync_to_async(writer.write)(writer.drain())
+
+
+def crawl_policy(concurrency: int | None = None, rate: float | None = None) -> HostPolicy:
+    """Return the limits for webhallen.com from SCRAPING_HOSTS, with what the caller passed instead.
+
+    Args:
+        concurrency: How many requests we have in flight at the same time. Defaults to the configured concurrency.
+        rate: Maximum requests per second, which also caps the adaptive rate. Defaults to the configured policy.
+
+    Returns:
+        HostPolicy: The policy for the crawl.
+    """
+    configured: HostPolicy = get_host_policy(WEBHALLEN_HOST)
+    if rate is not None:
+        return HostPolicy(rate=rate, concurrency=concurrency or configured.concurrency)
+    if concurrency is not None:
+        return replace(configured, concurrency=concurrency)
+    return configured
+
+
+async def crawl_products(
+    product_ids: Iterable[int],
+    writer: ProductWriter,
+    concurrency: int | None = None,
+    rate: float | None = None,
+    *,
+    replay: bool = False,
+) -> CrawlStats:
+    """Fetch products from the Webhallen API concurrently and write them with `writer`.
+
+    Args:
+        product_ids: The products to fetch.
+        writer: Where fetched products go. Whatever is left in it is flushed before we return.
+        concurrency: How many requests we have in flight at the same time. Defaults to SCRAPING_HOSTS.
+        rate: Maximum requests per second to webhallen.com. Defaults to SCRAPING_HOSTS.
+        replay: Read the products from the response archive instead of the API.
+
+    Returns:
+        CrawlStats: How many products we fetched and which ones failed.
+    """
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for product_id in product_ids:
+        queue.put_nowait(product_id)
+
+    policy: HostPolicy = crawl_policy(concurrency, rate)
+    print(f"Crawling {queue.qsize()} products with {policy.concurrency} workers at {policy.rate} requests/s")
+    stats = CrawlStats()
+
+    client = AsyncScrapingClient(hosts={WEBHALLEN_HOST: policy}, archive=archive_if_enabled(), replay=replay)
+    async with client:
+        workers: list[asyncio.Task] = [
+            asyncio.create_task(_crawl_worker(queue, client, writer, stats)) for _ in range(policy.concurrency)
+        ]
+        await asyncio.gather(*workers)
+
+    await sync_to_async(writer.flush)()
+    stats.finished = time.perf_counter()
+
+    print(f"Crawled {len(stats.fetched)} products in {stats.elapsed:.1f}s ({stats.rate:.1f}/s)")
+    print(f"Wrote {writer.written} products, {writer.skipped} unchanged ({writer.rows_per_second:.0f} rows/s)")
+    if stats.failed:
+        err_console.print(f"{len(stats.failed)} products failed")
+    return stats
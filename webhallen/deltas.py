@@ -0,0 +1,92 @@
+"""JSON Patch (RFC 6902) deltas between two versions of a JSON document.
+
+make_patch() returns the add, remove and replace operations that turn one document into another, and
+apply_patch() applies them. Objects are compared key by key, so a changed stock count is one small replace
+operation instead of a new copy of the whole product. Lists are compared item by item if they have the same
+length, and are replaced as a whole otherwise.
+
+Values are compared with their type, so 1, 1.0 and true are different values, like they are in JSON.
+"""
+
+from __future__ import annotations
+
+import copy
+
+
+def _escape(key: str) -> str:
+    """Escape a key for a JSON Pointer (RFC 6901)."""
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    """Unescape a JSON Pointer token."""
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(source: object, target: object, path: str = "") -> list[dict]:
+    """Return the operations that turn `source` into `target`.
+
+    Args:
+        source: The old document.
+        target: The new document.
+        path: JSON Pointer of the documents, empty for the root.
+
+    Returns:
+        list[dict]: The operations, empty if the documents are equal.
+    """
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations: list[dict] = [
+            {"op": "remove", "path": f"{path}/{_escape(key)}"} for key in source if key not in target
+        ]
+        for key, value in target.items():
+            key_path: str = f"{path}/{_escape(key)}"
+            if key in source:
+                operations.extend(make_patch(source[key], value, key_path))
+            else:
+                operations.append({"op": "add", "path": key_path, "value": value})
+        return operations
+
+    if isinstance(source, list) and isinstance(target, list) and len(source) == len(target):
+        operations = []
+        for index, (old, new) in enumerate(zip(source, target, strict=True)):
+            operations.extend(make_patch(old, new, f"{path}/{index}"))
+        return operations
+
+    if type(source) is type(target) and source == target:
+        return []
+    return [{"op": "replace", "path": path, "value": target}]
+
+
+def apply_patch(document: object, patch: list[dict]) -> object:
+    """Apply operations from make_patch() to a document.
+
+    Args:
+        document: The document to patch. It is not modified.
+        patch: The operations.
+
+    Raises:
+        ValueError: If an operation is not add, remove or replace.
+
+    Returns:
+        object: The patched document.
+    """
+    document = copy.deepcopy(document)
+    for operation in patch:
+        tokens: list[str] = [_unescape(token) for token in operation["path"].split("/")[1:]]
+        if not tokens:
+            document = copy.deepcopy(operation.get("value"))
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        key: str | int = int(tokens[-1]) if isinstance(parent, list) else tokens[-1]
+        if operation["op"] == "remove":
+            del parent[key]
+        elif operation["op"] in {"add", "replace"}:
+            parent[key] = copy.deepcopy(operation["value"])
+        else:
+            msg: str = f"Unsupported JSON Patch operation: {operation['op']}"
+            raise ValueError(msg)
+    return document
@@ -0,0 +1,103 @@
+"""Stream every Webhallen product as a JSON array or as NDJSON, and write them to snapshot files.
+
+The product dump is 130 MB+, so it is never held in memory. product_documents() reads the products from a
+server-side cursor, chunk_size rows at a time, and the encoders in panso/streams.py join each chunk into one
+bytes chunk for the response. Postgres hands us each product as JSON text already, so nothing is parsed or
+serialized in Python.
+
+NDJSON has one product per line. jsonb output never has a raw newline in it, they are escaped in strings.
+
+write_products_snapshot() writes the same dump, and the typed WebhallenProduct table as CSV, to pre-compressed
+files that are served from /snapshots/, see panso/snapshots.py.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.db.models import TextField
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Cast
+
+from panso.snapshots import write_snapshot
+from panso.streams import STREAM_CHUNK_SIZE, encode_csv, encode_json_array, encode_ndjson
+from webhallen.conversion import PRODUCT_COLUMNS
+from webhallen.models import WebhallenJSON, WebhallenProduct
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from django.http import HttpRequest
+
+# The name of the product dump in /snapshots/
+PRODUCTS_SNAPSHOT: str = "webhallen-products"
+
+JSON_CONTENT_TYPE: str = "application/json"
+NDJSON_CONTENT_TYPE: str = "application/x-ndjson"
+
+# Accept header values that mean NDJSON
+NDJSON_MEDIA_TYPES: frozenset[str] = frozenset({
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+    "application/x-jsonlines",
+})
+
+
+def wants_ndjson(request: HttpRequest) -> bool:
+    """If the Accept header asks for NDJSON before it asks for JSON.
+
+    Args:
+        request: The request.
+
+    Returns:
+        bool: True for NDJSON, False for a JSON array.
+    """
+    for media_type in request.headers.get("Accept", "").split(","):
+        media_type = media_type.split(";")[0].strip().lower()  # noqa: PLW2901
+        if media_type in NDJSON_MEDIA_TYPES:
+            return True
+        if media_type == JSON_CONTENT_TYPE:
+            return False
+    return False
+
+
+def product_documents(chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Return the JSON text of every product, read from a server-side cursor.
+
+    Args:
+        chunk_size: Rows fetched at a time.
+
+    Returns:
+        Iterator[str]: The "product" object of every product's JSON.
+    """
+    return (
+        WebhallenJSON.objects.filter(product_json__product__isnull=False)
+        .annotate(document=Cast(KeyTransform("product", "product_json"), output_field=TextField()))
+        .values_list("document", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def write_products_snapshot() -> dict:
+    """Write every product to a new snapshot, as JSON, NDJSON and CSV.
+
+    The JSON and NDJSON are the "product" object of the JSON we scraped, like api_products returns them. The CSV
+    has the columns of WebhallenProduct, so convert the products before this.
+
+    Returns:
+        dict: The manifest of the new snapshot.
+    """
+    return write_snapshot(
+        PRODUCTS_SNAPSHOT,
+        {
+            "json": lambda: encode_json_array(product_documents()),
+            "ndjson": lambda: encode_ndjson(product_documents()),
+            "csv": lambda: encode_csv(
+                PRODUCT_COLUMNS,
+                WebhallenProduct.objects.order_by("product_id")
+                .values_list(*PRODUCT_COLUMNS)
+                .iterator(chunk_size=STREAM_CHUNK_SIZE),
+            ),
+        },
+    )
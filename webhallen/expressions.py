@@ -0,0 +1,68 @@
+"""Typed values from WebhallenJSON.product_json that are indexed.
+
+Each function returns the SQL expression for one value of the product JSON, e.g. the price as a number. The
+same expressions are used for the expression indexes in WebhallenJSON.Meta.indexes and in the queries, because
+Postgres only uses an expression index for a query with the exact same expression.
+
+The webhallen_numeric(), webhallen_integer() and webhallen_boolean() SQL functions are created in migration
+0008. They return NULL for values of the wrong type instead of raising, so a product with a weird price can
+still be saved.
+"""
+
+from __future__ import annotations
+
+from django.contrib.postgres.search import SearchVector
+from django.db import models
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+
+# Configuration for the name search, the product names are Swedish
+SEARCH_CONFIG: str = "swedish"
+
+
+def _product_value(*path: str) -> KeyTransform:
+    """Return product_json -> 'product' -> path[0] -> path[1] ... as jsonb."""
+    expression: KeyTransform = KeyTransform("product", "product_json")
+    for key in path:
+        expression = KeyTransform(key, expression)
+    return expression
+
+
+def product_price() -> models.Func:
+    """The price in SEK, e.g. 1990.00."""
+    return models.Func(
+        _product_value("price", "price"),
+        function="webhallen_numeric",
+        output_field=models.DecimalField(),
+    )
+
+
+def product_section_id() -> models.Func:
+    """The ID of the section, see WebhallenSection."""
+    return models.Func(
+        _product_value("section", "id"),
+        function="webhallen_integer",
+        output_field=models.IntegerField(),
+    )
+
+
+def product_manufacturer_id() -> models.Func:
+    """The ID of the manufacturer."""
+    return models.Func(
+        _product_value("manufacturer", "id"),
+        function="webhallen_integer",
+        output_field=models.IntegerField(),
+    )
+
+
+def product_discontinued() -> models.Func:
+    """If Webhallen has stopped selling the product."""
+    return models.Func(
+        _product_value("discontinued"),
+        function="webhallen_boolean",
+        output_field=models.BooleanField(),
+    )
+
+
+def product_name_vector() -> SearchVector:
+    """The name as a tsvector, for full-text search."""
+    return SearchVector(KeyTextTransform("name", KeyTransform("product", "product_json")), config=SEARCH_CONFIG)
@@ -0,0 +1,32 @@
+"""Content fingerprints for Webhallen product JSON.
+
+Most products don't change between two scrapes. We store a fingerprint of the product JSON in
+WebhallenJSON.content_hash so the writer can tell if a freshly scraped product is different from what
+we already have, without loading and comparing the full JSON.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+import orjson
+
+# Top-level keys that are not part of the product data and must not count as a change.
+# metadata is added by us in parse_product_response().
+VOLATILE_KEYS: frozenset[str] = frozenset({"metadata"})
+
+
+def product_fingerprint(product_json: dict) -> str:
+    """Return a fingerprint of the product JSON.
+
+    The JSON is serialised with sorted keys so the same data always gives the same fingerprint,
+    no matter what order Webhallen sends the keys in.
+
+    Args:
+        product_json: The JSON from the Webhallen API.
+
+    Returns:
+        str: 32 character hex digest.
+    """
+    payload: dict = {key: value for key, value in product_json.items() if key not in VOLATILE_KEYS}
+    return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
@@ -0,0 +1,55 @@
+"""Fill the Webhallen price table from the product history."""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rich import print
+from rich.progress import track
+
+from webhallen.prices import BACKFILL_RANGE_SIZE, backfill_prices, history_product_id_range
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class Command(BaseCommand):
+    """Fill the Webhallen price table from the product history."""
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--range-size",
+            type=int,
+            default=BACKFILL_RANGE_SIZE,
+            help="Product IDs backfilled in one transaction",
+        )
+
+    def handle(self: Command, *args: str, **options: int) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        id_range: tuple[int, int] | None = history_product_id_range()
+        if id_range is None:
+            print("webhallen_history is empty, nothing to backfill")
+            return
+
+        lowest, highest = id_range
+        range_size: int = options["range_size"]
+        starts: range = range(lowest - 1, highest, range_size)
+        started: float = time.perf_counter()
+        added: int = 0
+        try:
+            for after in track(starts, description="Backfilling prices..."):
+                with transaction.atomic():
+                    added += backfill_prices(after, after + range_size)
+        except KeyboardInterrupt:
+            msg = f"Got keyboard interrupt while backfilling prices, {added} points were added"
+            raise CommandError(msg) from KeyboardInterrupt
+
+        seconds: float = time.perf_counter() - started
+        print(f"Added {added} price points for products {lowest}-{highest} in {seconds:.1f}s")
@@ -0,0 +1,82 @@
+"""Move the full copies in webhallen_history into snapshots and patches in webhallen_json_revision."""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rich import print
+from rich.progress import track
+
+from webhallen.prices import history_product_id_range
+from webhallen.revisions import COMPACT_RANGE_SIZE, CompactionStats, compact_history
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class _DryRunError(Exception):
+    """Raised to roll back a range in a dry run."""
+
+
+class Command(BaseCommand):
+    """Move the full copies in webhallen_history into snapshots and patches in webhallen_json_revision.
+
+    The history rows that are moved are deleted. Run backfill_webhallen_prices first, it reads webhallen_history.
+    """
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--range-size",
+            type=int,
+            default=COMPACT_RANGE_SIZE,
+            help="Product IDs compacted in one transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Compact and report the savings, then roll everything back",
+        )
+
+    def handle(self: Command, *args: str, **options: int | bool) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        id_range: tuple[int, int] | None = history_product_id_range()
+        if id_range is None:
+            print("webhallen_history is empty, nothing to compact")
+            return
+
+        lowest, highest = id_range
+        range_size: int = int(options["range_size"])
+        dry_run: bool = bool(options["dry_run"])
+        started: float = time.perf_counter()
+        stats = CompactionStats()
+        try:
+            for after in track(range(lowest - 1, highest, range_size), description="Compacting history..."):
+                try:
+                    with transaction.atomic():
+                        range_stats: CompactionStats = compact_history(after, after + range_size)
+                        if dry_run:
+                            raise _DryRunError  # noqa: TRY301
+                except _DryRunError:
+                    pass
+                stats.add(range_stats)
+        except KeyboardInterrupt:
+            msg = f"Got keyboard interrupt while compacting history, {stats.versions} versions were compacted"
+            raise CommandError(msg) from KeyboardInterrupt
+
+        seconds: float = time.perf_counter() - started
+        verb: str = "Would compact" if dry_run else "Compacted"
+        print(
+            f"{verb} {stats.versions} versions of {stats.products} products into {stats.snapshots} snapshots and "
+            f"{stats.versions - stats.snapshots} patches in {seconds:.1f}s",
+        )
+        print(
+            f"{stats.original_bytes / 1_000_000:.1f} MB of JSON became {stats.compacted_bytes / 1_000_000:.1f} MB "
+            f"({stats.ratio:.1f}x smaller)",
+        )
@@ -0,0 +1,53 @@
+"""Scrape every product in the Webhallen product sitemap."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webhallen.tasks import crawl_webhallen_products
+
+if TYPE_CHECKING:
+    from django.core.management.base import CommandParser
+
+
+class Command(BaseCommand):
+    """Scrape every product in the Webhallen product sitemap."""
+
+    help: str = __doc__ or ""  # noqa: A003
+    requires_migrations_checks = True
+
+    def add_arguments(self: Command, parser: CommandParser) -> None:  # noqa: PLR6301
+        """Add our arguments."""
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Requests in flight at the same time, defaults to SCRAPING_HOSTS",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Maximum requests per second, defaults to SCRAPING_HOSTS",
+        )
+        parser.add_argument("--batch-size", type=int, default=None, help="Products per database write")
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Read the products from the response archive instead of the Webhallen API",
+        )
+
+    def handle(self: Command, *args: str, **options: float | bool | None) -> None:  # noqa: PLR6301, ARG002
+        """Handle the command."""
+        try:
+            crawl_webhallen_products(
+                concurrency=options["concurrency"],
+                rate=options["rate"],
+                batch_size=options["batch_size"],
+                replay=options["replay"],
+            )
+        except KeyboardInterrupt:
+            msg = "Got keyboard interrupt while crawling Webhallen"
+            raise CommandError(msg) from KeyboardInterrupt
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.8 on 2026-10-18 04:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0002_alter_sitemaparticle_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenProductQueue',
+            fields=[
+                ('product_id', models.IntegerField(help_text='Product ID', primary_key=True, serialize=False)),
+                ('loc', models.URLField(help_text='URL from the product sitemap')),
+                ('next_fetch_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the product should be fetched next')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Failed fetches since the last successful one')),
+                ('last_status', models.TextField(blank=True, choices=[('ok', 'OK'), ('error', 'Error')], help_text='Last fetch status', null=True)),
+                ('last_fetched_at', models.DateTimeField(blank=True, help_text='When the product was last fetched', null=True)),
+                ('lease_owner', models.TextField(blank=True, help_text='Worker that has claimed the product', null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, help_text='When the claim runs out', null=True)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Created')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='Updated')),
+            ],
+            options={
+                'verbose_name': 'Webhallen product queue entry',
+                'verbose_name_plural': 'Webhallen product queue',
+                'db_table': 'webhallen_product_queue',
+                'db_table_comment': 'Table storing which Webhallen products to fetch and when',
+                'ordering': ['next_fetch_at'],
+                'indexes': [models.Index(fields=['next_fetch_at'], name='webhallen_queue_next_fetch')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.8 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+from webhallen.fingerprint import product_fingerprint
+
+
+def fill_content_hash(apps, schema_editor):
+    """Fingerprint the products we already have so the next scrape can skip unchanged ones."""
+    WebhallenJSON = apps.get_model("webhallen", "WebhallenJSON")
+    batch = []
+    for product in WebhallenJSON.objects.only("product_id", "product_json").iterator(chunk_size=2000):
+        product.content_hash = product_fingerprint(product.product_json or {})
+        batch.append(product)
+        if len(batch) >= 2000:
+            WebhallenJSON.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    WebhallenJSON.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0003_webhallenproductqueue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhallenjson',
+            name='content_hash',
+            field=models.TextField(blank=True, help_text='Fingerprint of the product JSON', null=True),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.8 on 2026-10-18 04:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0004_webhallenjson_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenProductRetry',
+            fields=[
+                ('product_id', models.IntegerField(help_text='Product ID', primary_key=True, serialize=False)),
+                ('status', models.TextField(choices=[('pending', 'Pending'), ('dead', 'Dead')], default='pending', help_text='Retry status')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Failed fetches since the last successful one')),
+                ('error_class', models.TextField(help_text='Exception class of the last failure, e.g. ConnectTimeout')),
+                ('error_message', models.TextField(blank=True, default='', help_text='Exception message of the last failure')),
+                ('next_attempt_at', models.DateTimeField(blank=True, default=django.utils.timezone.now, help_text='When the retry is scheduled. Empty for dead products.', null=True)),
+                ('last_failed_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the product last failed')),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Created')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='Updated')),
+            ],
+            options={
+                'verbose_name': 'Webhallen product retry',
+                'verbose_name_plural': 'Webhallen product retries',
+                'db_table': 'webhallen_product_retry',
+                'db_table_comment': 'Table storing Webhallen products that failed to fetch',
+                'ordering': ['next_attempt_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='webhallen_retry_due')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.8 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0005_webhallenproductretry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenWatermark',
+            fields=[
+                ('name', models.TextField(help_text='Name of the derivation, e.g. sections', primary_key=True, serialize=False)),
+                ('watermark', models.DateTimeField(help_text='Newest WebhallenJSON.updated that has been processed')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='Updated')),
+            ],
+            options={
+                'verbose_name': 'Webhallen watermark',
+                'verbose_name_plural': 'Webhallen watermarks',
+                'db_table': 'webhallen_watermark',
+                'db_table_comment': 'Table storing how far each derivation from webhallen_json has got',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='webhallenjson',
+            index=models.Index(fields=['updated'], name='webhallen_json_updated'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0006_webhallenwatermark_webhallen_json_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenProduct',
+            fields=[
+                ('product_id', models.IntegerField(help_text='Product ID', primary_key=True, serialize=False)),
+                ('name', models.TextField(blank=True, help_text='Name', null=True)),
+                ('main_title', models.TextField(blank=True, help_text='Main title', null=True)),
+                ('sub_title', models.TextField(blank=True, help_text='Sub title', null=True)),
+                ('description', models.TextField(blank=True, help_text='Description, HTML', null=True)),
+                ('meta_title', models.TextField(blank=True, help_text='Meta title', null=True)),
+                ('meta_description', models.TextField(blank=True, help_text='Meta description', null=True)),
+                ('canonical_url', models.TextField(blank=True, help_text='Canonical URL', null=True)),
+                ('thumbnail', models.URLField(blank=True, help_text='Thumbnail URL', null=True)),
+                ('images_zoom', models.TextField(blank=True, help_text='Comma separated zoom image URLs', null=True)),
+                ('images_large', models.TextField(blank=True, help_text='Comma separated large image URLs', null=True)),
+                ('images_thumb', models.TextField(blank=True, help_text='Comma separated thumbnail image URLs', null=True)),
+                ('section_id', models.IntegerField(blank=True, help_text='Section ID', null=True)),
+                ('category_tree', models.TextField(blank=True, help_text='Category tree, e.g. Datorkomponenter/RAM', null=True)),
+                ('main_category_path', models.TextField(blank=True, help_text='Comma separated main category IDs', null=True)),
+                ('categories', models.TextField(blank=True, help_text='Comma separated category IDs', null=True)),
+                ('manufacturer', models.IntegerField(blank=True, help_text='Manufacturer ID', null=True)),
+                ('part_numbers', models.TextField(blank=True, help_text='Comma separated part numbers', null=True)),
+                ('eans', models.TextField(blank=True, help_text='Comma separated EANs', null=True)),
+                ('status_codes', models.TextField(blank=True, help_text='Comma separated status codes', null=True)),
+                ('release_date', models.TextField(blank=True, help_text='Release date as shown on the website', null=True)),
+                ('minimum_rank_level', models.IntegerField(blank=True, help_text='Minimum member level', null=True)),
+                ('package_size_id', models.IntegerField(blank=True, help_text='Package size ID', null=True)),
+                ('insurance_id', models.IntegerField(blank=True, help_text='Insurance ID', null=True)),
+                ('is_digital', models.BooleanField(help_text='Is a digital product', null=True)),
+                ('discontinued', models.BooleanField(help_text='Is discontinued', null=True)),
+                ('phone_subscription', models.BooleanField(help_text='Is a phone subscription', null=True)),
+                ('is_shippable', models.BooleanField(help_text='Can be shipped', null=True)),
+                ('is_collectable', models.BooleanField(help_text='Can be collected in a store', null=True)),
+                ('long_delivery_notice', models.TextField(blank=True, help_text='Long delivery notice', null=True)),
+                ('possible_delivery_methods', models.TextField(blank=True, help_text='Comma separated delivery methods', null=True)),
+                ('excluded_shipping_methods', models.TextField(blank=True, help_text='Comma separated shipping methods', null=True)),
+                ('is_fyndware', models.BooleanField(help_text='Is fyndware (returned or demo product)', null=True)),
+                ('fyndware_of', models.IntegerField(blank=True, help_text='Product ID of the original product', null=True)),
+                ('fyndware_of_description', models.TextField(blank=True, help_text='What is wrong with the fyndware', null=True)),
+                ('fyndware_class', models.IntegerField(blank=True, help_text='Fyndware class ID', null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, help_text='Price', max_digits=12, null=True)),
+                ('vat', models.DecimalField(blank=True, decimal_places=2, help_text='VAT', max_digits=12, null=True)),
+                ('price_type', models.TextField(blank=True, help_text='Price type, e.g. campaign', null=True)),
+                ('price_end_at', models.DateTimeField(blank=True, help_text='When the price ends', null=True)),
+                ('price_nearly_over', models.BooleanField(help_text='Price is nearly over', null=True)),
+                ('price_flash_sale', models.BooleanField(help_text='Price is a flash sale', null=True)),
+                ('regular_price', models.DecimalField(blank=True, decimal_places=2, help_text='Price', max_digits=12, null=True)),
+                ('regular_price_type', models.TextField(blank=True, help_text='Regular price type', null=True)),
+                ('regular_price_end_at', models.DateTimeField(blank=True, help_text='When the regular price ends', null=True)),
+                ('regular_price_nearly_over', models.BooleanField(help_text='Regular price is nearly over', null=True)),
+                ('regular_price_flash_sale', models.BooleanField(help_text='Regular price is a flash sale', null=True)),
+                ('lowest_price', models.DecimalField(blank=True, decimal_places=2, help_text='Price', max_digits=12, null=True)),
+                ('lowest_price_type', models.TextField(blank=True, help_text='Lowest price type', null=True)),
+                ('lowest_price_end_at', models.DateTimeField(blank=True, help_text='When the lowest price ends', null=True)),
+                ('lowest_price_nearly_over', models.BooleanField(help_text='Lowest price is nearly over', null=True)),
+                ('lowest_price_flash_sale', models.BooleanField(help_text='Lowest price is a flash sale', null=True)),
+                ('level_one_price', models.DecimalField(blank=True, decimal_places=2, help_text='Price', max_digits=12, null=True)),
+                ('level_one_price_type', models.TextField(blank=True, help_text='Level one price type', null=True)),
+                ('level_one_price_end_at', models.DateTimeField(blank=True, help_text='When the level one price ends', null=True)),
+                ('level_one_price_nearly_over', models.BooleanField(help_text='Level one price is nearly over', null=True)),
+                ('level_one_price_flash_sale', models.BooleanField(help_text='Level one price is a flash sale', null=True)),
+                ('average_rating', models.FloatField(blank=True, help_text='Average rating', null=True)),
+                ('average_rating_type', models.TextField(blank=True, help_text='Average rating type', null=True)),
+                ('energy_marking_rating', models.TextField(blank=True, help_text='Energy rating, e.g. A', null=True)),
+                ('energy_marking_label', models.TextField(blank=True, help_text='Energy label URL', null=True)),
+                ('highlighted_review_id', models.IntegerField(blank=True, help_text='Highlighted review ID', null=True)),
+                ('highlighted_review_user_id', models.TextField(blank=True, help_text='User ID, or Anonymous', null=True)),
+                ('highlighted_review_text', models.TextField(blank=True, help_text='Highlighted review text', null=True)),
+                ('highlighted_review_rating', models.IntegerField(blank=True, help_text='Highlighted review rating', null=True)),
+                ('highlighted_review_upvotes', models.IntegerField(blank=True, help_text='Highlighted review upvotes', null=True)),
+                ('highlighted_review_downvotes', models.IntegerField(blank=True, help_text='Highlighted review downvotes', null=True)),
+                ('highlighted_review_verified', models.BooleanField(help_text='Reviewer bought the product', null=True)),
+                ('highlighted_review_created', models.DateTimeField(blank=True, help_text='Highlighted review created', null=True)),
+                ('highlighted_review_is_anonymous', models.BooleanField(help_text='Reviewer is anonymous', null=True)),
+                ('highlighted_review_is_employee', models.BooleanField(help_text='Reviewer works at Webhallen', null=True)),
+                ('highlighted_review_product_id', models.IntegerField(blank=True, help_text='Reviewed product ID', null=True)),
+                ('highlighted_review_is_hype', models.BooleanField(help_text='Review is a hype review', null=True)),
+                ('source_updated', models.DateTimeField(help_text='WebhallenJSON.updated of the JSON this was converted from')),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='Created')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='Updated')),
+            ],
+            options={
+                'verbose_name': 'Webhallen product',
+                'verbose_name_plural': 'Webhallen products',
+                'db_table': 'webhallen_product',
+                'db_table_comment': 'Table storing Webhallen products converted from webhallen_json',
+                'ordering': ['-product_id'],
+            },
+        ),
+    ]
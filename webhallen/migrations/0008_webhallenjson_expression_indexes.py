@@ -0,0 +1,72 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:08
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.fields.json
+
+# Typed values from the product JSON, or NULL if the value has another type. See webhallen/expressions.py.
+CREATE_FUNCTIONS = r"""
+CREATE OR REPLACE FUNCTION webhallen_numeric(value jsonb) RETURNS numeric
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN jsonb_typeof(value) = 'number' THEN value::numeric
+        WHEN jsonb_typeof(value) = 'string' AND value #>> '{}' ~ '^-?[0-9]+(\.[0-9]+)?$' THEN (value #>> '{}')::numeric
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION webhallen_integer(value jsonb) RETURNS integer
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN jsonb_typeof(value) = 'number' AND value::numeric = trunc(value::numeric)
+            AND value::numeric BETWEEN -2147483648 AND 2147483647 THEN value::numeric::integer
+        WHEN jsonb_typeof(value) = 'string' AND value #>> '{}' ~ '^-?[0-9]{1,9}$' THEN (value #>> '{}')::integer
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION webhallen_boolean(value jsonb) RETURNS boolean
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE WHEN jsonb_typeof(value) = 'boolean' THEN value::boolean END
+$$;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS webhallen_numeric(jsonb);
+DROP FUNCTION IF EXISTS webhallen_integer(jsonb);
+DROP FUNCTION IF EXISTS webhallen_boolean(jsonb);
+"""
+
+
+class Migration(migrations.Migration):
+
+    # The indexes are created without locking webhallen_json, which can't be done in a transaction
+    atomic = False
+
+    dependencies = [
+        ('webhallen', '0007_webhallenproduct'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTIONS, reverse_sql=DROP_FUNCTIONS),
+        AddIndexConcurrently(
+            model_name='webhallenjson',
+            index=models.Index(models.Func(django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('product', 'product_json'))), function='webhallen_numeric', output_field=models.DecimalField()), name='webhallen_json_price'),
+        ),
+        AddIndexConcurrently(
+            model_name='webhallenjson',
+            index=models.Index(models.Func(django.db.models.fields.json.KeyTransform('id', django.db.models.fields.json.KeyTransform('section', django.db.models.fields.json.KeyTransform('product', 'product_json'))), function='webhallen_integer', output_field=models.IntegerField()), models.Func(django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('product', 'product_json'))), function='webhallen_numeric', output_field=models.DecimalField()), name='webhallen_json_section_price'),
+        ),
+        AddIndexConcurrently(
+            model_name='webhallenjson',
+            index=models.Index(models.Func(django.db.models.fields.json.KeyTransform('id', django.db.models.fields.json.KeyTransform('manufacturer', django.db.models.fields.json.KeyTransform('product', 'product_json'))), function='webhallen_integer', output_field=models.IntegerField()), models.Func(django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('price', django.db.models.fields.json.KeyTransform('product', 'product_json'))), function='webhallen_numeric', output_field=models.DecimalField()), name='webhallen_json_maker_price'),
+        ),
+        AddIndexConcurrently(
+            model_name='webhallenjson',
+            index=models.Index(models.Func(django.db.models.fields.json.KeyTransform('discontinued', django.db.models.fields.json.KeyTransform('product', 'product_json')), function='webhallen_boolean', output_field=models.BooleanField()), name='webhallen_json_discontinued'),
+        ),
+        AddIndexConcurrently(
+            model_name='webhallenjson',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector(django.db.models.fields.json.KeyTextTransform('name', django.db.models.fields.json.KeyTransform('product', 'product_json')), config='swedish'), name='webhallen_json_name_search'),
+        ),
+    ]
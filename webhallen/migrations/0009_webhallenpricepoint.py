@@ -0,0 +1,36 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:11
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0008_webhallenjson_expression_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenPricePoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.IntegerField(help_text='Product ID')),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the price or stock changed')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, help_text='Price', max_digits=12, null=True)),
+                ('regular_price', models.DecimalField(blank=True, decimal_places=2, help_text='Price when there is no campaign', max_digits=12, null=True)),
+                ('stock_web', models.IntegerField(blank=True, help_text='Products in stock for web orders', null=True)),
+                ('stock_stores', models.IntegerField(blank=True, help_text='Products in stock in all stores', null=True)),
+                ('stock_supplier', models.IntegerField(blank=True, help_text='Products in stock at the supplier', null=True)),
+            ],
+            options={
+                'verbose_name': 'Webhallen price point',
+                'verbose_name_plural': 'Webhallen price points',
+                'db_table': 'webhallen_price',
+                'db_table_comment': 'Table storing the price and stock of Webhallen products every time they change',
+                'ordering': ['product_id', 'recorded_at'],
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['recorded_at'], name='webhallen_price_recorded_at'), models.Index(fields=['product_id', 'recorded_at'], include=('price', 'regular_price', 'stock_web', 'stock_stores', 'stock_supplier'), name='webhallen_price_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0009_webhallenpricepoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhallenJSONRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.IntegerField(help_text='Product ID')),
+                ('recorded_at', models.DateTimeField(help_text='When the product got this version')),
+                ('history_type', models.CharField(choices=[('+', 'Created'), ('~', 'Changed'), ('-', 'Deleted')], help_text='Type of change', max_length=1)),
+                ('depth', models.PositiveSmallIntegerField(help_text='0 for a snapshot, otherwise patches since the snapshot')),
+                ('document', models.JSONField(help_text='The product JSON for a snapshot, a JSON Patch for the others')),
+                ('content_hash', models.TextField(help_text='Fingerprint of the product JSON in this version')),
+            ],
+            options={
+                'verbose_name': 'Webhallen JSON revision',
+                'verbose_name_plural': 'Webhallen JSON revisions',
+                'db_table': 'webhallen_json_revision',
+                'db_table_comment': 'Table storing every version of the Webhallen product JSON as snapshots and patches',
+                'ordering': ['product_id', 'recorded_at', 'id'],
+                'indexes': [models.Index(fields=['product_id', 'recorded_at', 'id'], name='webhallen_revision_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 05:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhallen', '0010_webhallenjsonrevision'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='webhallenpricepoint',
+            name='webhallen_price_recorded_at',
+        ),
+    ]
@@ -1,6 +1,11 @@
 from __future__ import annotations
 
 from webhallen.models.json import WebhallenJSON
+from webhallen.models.prices import WebhallenPricePoint
+from webhallen.models.product import WebhallenProduct
+from webhallen.models.queue import WebhallenProductQueue
+from webhallen.models.retry import WebhallenProductRetry
+from webhallen.models.revision import WebhallenJSONRevision
 from webhallen.models.section import WebhallenSection
 from webhallen.models.sitemaps import (
     SitemapArticle,
@@ -14,10 +19,17 @@ from webhallen.models.sitemaps import (
     SitemapRoot,
     SitemapSection,
 )
+from webhallen.models.watermark import WebhallenWatermark
 
 __all__: list[str] = [
     "WebhallenJSON",
+    "WebhallenJSONRevision",
+    "WebhallenPricePoint",
+    "WebhallenProduct",
+    "WebhallenProductQueue",
+    "WebhallenProductRetry",
     "WebhallenSection",
+    "WebhallenWatermark",
     "SitemapRoot",
     "SitemapHome",
     "SitemapSection",
@@ -4,9 +4,18 @@ from __future__ import annotations
 
 import typing
 
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from simple_history.models import HistoricalRecords
 
+from webhallen.expressions import (
+    product_discontinued,
+    product_manufacturer_id,
+    product_name_vector,
+    product_price,
+    product_section_id,
+)
+
 
 class WebhallenJSON(models.Model):
     """Model definition for Webhallen.
@@ -22,11 +31,12 @@ class WebhallenJSON(models.Model):
 
     product_id = models.IntegerField(primary_key=True, help_text="Product ID")
     product_json = models.JSONField(help_text="Product JSON")
+    content_hash = models.TextField(null=True, blank=True, help_text="Fingerprint of the product JSON")
     created = models.DateTimeField(auto_now_add=True, help_text="Created")
     updated = models.DateTimeField(auto_now=True, help_text="Updated")
     history = HistoricalRecords(
         table_name="webhallen_history",
-        excluded_fields=["created", "updated"],
+        excluded_fields=["created", "updated", "content_hash"],
     )
 
     class Meta:
@@ -37,6 +47,16 @@ class WebhallenJSON(models.Model):
         verbose_name_plural: str = "Webhallen JSON Entries"
         db_table: str = "webhallen_json"
         db_table_comment: str = "Table storing JSON data from Webhallen API"
+        indexes: typing.ClassVar[list] = [
+            # Derivations like create_sections only read the products updated since their last run
+            models.Index(fields=["updated"], name="webhallen_json_updated"),
+            # Filters and sorting in /api/v1/webhallen/products, see webhallen/expressions.py
+            models.Index(product_price(), name="webhallen_json_price"),
+            models.Index(product_section_id(), product_price(), name="webhallen_json_section_price"),
+            models.Index(product_manufacturer_id(), product_price(), name="webhallen_json_maker_price"),
+            models.Index(product_discontinued(), name="webhallen_json_discontinued"),
+            GinIndex(product_name_vector(), name="webhallen_json_name_search"),
+        ]
 
     def __str__(self: WebhallenJSON) -> str:
         """Human-readable, or informal, string representation of Webhallen.
@@ -0,0 +1,58 @@
+"""Model for the price and stock of Webhallen products over time.
+
+A row is added every time the price, the regular price or the stock of a product changes, see
+webhallen/prices.py. It is a much smaller way to get the price history of a product than reading every
+version of its JSON from webhallen_history.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import models
+from django.utils import timezone
+
+
+class WebhallenPricePoint(models.Model):
+    """The price and stock of a product from `recorded_at` until the next point."""
+
+    product_id = models.IntegerField(help_text="Product ID")
+    recorded_at = models.DateTimeField(default=timezone.now, help_text="When the price or stock changed")
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Price")
+    regular_price = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Price when there is no campaign",
+    )
+    stock_web = models.IntegerField(null=True, blank=True, help_text="Products in stock for web orders")
+    stock_stores = models.IntegerField(null=True, blank=True, help_text="Products in stock in all stores")
+    stock_supplier = models.IntegerField(null=True, blank=True, help_text="Products in stock at the supplier")
+
+    class Meta:
+        """Meta definition for WebhallenPricePoint."""
+
+        ordering: typing.ClassVar[list] = ["product_id", "recorded_at"]
+        verbose_name: str = "Webhallen price point"
+        verbose_name_plural: str = "Webhallen price points"
+        db_table: str = "webhallen_price"
+        db_table_comment: str = "Table storing the price and stock of Webhallen products every time they change"
+        indexes: typing.ClassVar[list] = [
+            # The history of one product, and its latest point, from the index alone. There is no index on
+            # recorded_at alone: backfill_webhallen_prices adds old points after new ones, so a BRIN index on
+            # it would cover every block, and nothing reads points by time without a product.
+            models.Index(
+                fields=["product_id", "recorded_at"],
+                include=["price", "regular_price", "stock_web", "stock_stores", "stock_supplier"],
+                name="webhallen_price_product",
+            ),
+        ]
+
+    def __str__(self: WebhallenPricePoint) -> str:
+        """Human-readable, or informal, string representation of a price point.
+
+        Returns:
+            str: Product ID, when and price
+        """
+        return f"{self.product_id} - {self.recorded_at} - {self.price}"
@@ -0,0 +1,126 @@
+"""Model for Webhallen products as typed columns.
+
+WebhallenJSON keeps the product JSON exactly as the Webhallen API returned it. WebhallenProduct is the same
+product converted to one column per value, so it can be filtered, sorted and indexed without decoding JSON.
+It is derived data: rewrite_webhallen fills it from WebhallenJSON, see webhallen/conversion.py, and it has no
+history of its own.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import models
+
+
+class WebhallenProduct(models.Model):
+    """A Webhallen product converted from WebhallenJSON."""
+
+    product_id = models.IntegerField(primary_key=True, help_text="Product ID")
+
+    name = models.TextField(null=True, blank=True, help_text="Name")
+    main_title = models.TextField(null=True, blank=True, help_text="Main title")
+    sub_title = models.TextField(null=True, blank=True, help_text="Sub title")
+    description = models.TextField(null=True, blank=True, help_text="Description, HTML")
+    meta_title = models.TextField(null=True, blank=True, help_text="Meta title")
+    meta_description = models.TextField(null=True, blank=True, help_text="Meta description")
+    canonical_url = models.TextField(null=True, blank=True, help_text="Canonical URL")
+    thumbnail = models.URLField(null=True, blank=True, help_text="Thumbnail URL")
+    images_zoom = models.TextField(null=True, blank=True, help_text="Comma separated zoom image URLs")
+    images_large = models.TextField(null=True, blank=True, help_text="Comma separated large image URLs")
+    images_thumb = models.TextField(null=True, blank=True, help_text="Comma separated thumbnail image URLs")
+
+    section_id = models.IntegerField(null=True, blank=True, help_text="Section ID")
+    category_tree = models.TextField(null=True, blank=True, help_text="Category tree, e.g. Datorkomponenter/RAM")
+    main_category_path = models.TextField(null=True, blank=True, help_text="Comma separated main category IDs")
+    categories = models.TextField(null=True, blank=True, help_text="Comma separated category IDs")
+    manufacturer = models.IntegerField(null=True, blank=True, help_text="Manufacturer ID")
+    part_numbers = models.TextField(null=True, blank=True, help_text="Comma separated part numbers")
+    eans = models.TextField(null=True, blank=True, help_text="Comma separated EANs")
+    status_codes = models.TextField(null=True, blank=True, help_text="Comma separated status codes")
+    release_date = models.TextField(null=True, blank=True, help_text="Release date as shown on the website")
+
+    minimum_rank_level = models.IntegerField(null=True, blank=True, help_text="Minimum member level")
+    package_size_id = models.IntegerField(null=True, blank=True, help_text="Package size ID")
+    insurance_id = models.IntegerField(null=True, blank=True, help_text="Insurance ID")
+    is_digital = models.BooleanField(null=True, help_text="Is a digital product")
+    discontinued = models.BooleanField(null=True, help_text="Is discontinued")
+    phone_subscription = models.BooleanField(null=True, help_text="Is a phone subscription")
+    is_shippable = models.BooleanField(null=True, help_text="Can be shipped")
+    is_collectable = models.BooleanField(null=True, help_text="Can be collected in a store")
+    long_delivery_notice = models.TextField(null=True, blank=True, help_text="Long delivery notice")
+    possible_delivery_methods = models.TextField(null=True, blank=True, help_text="Comma separated delivery methods")
+    excluded_shipping_methods = models.TextField(null=True, blank=True, help_text="Comma separated shipping methods")
+
+    is_fyndware = models.BooleanField(null=True, help_text="Is fyndware (returned or demo product)")
+    fyndware_of = models.IntegerField(null=True, blank=True, help_text="Product ID of the original product")
+    fyndware_of_description = models.TextField(null=True, blank=True, help_text="What is wrong with the fyndware")
+    fyndware_class = models.IntegerField(null=True, blank=True, help_text="Fyndware class ID")
+
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Price")
+    vat = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="VAT")
+    price_type = models.TextField(null=True, blank=True, help_text="Price type, e.g. campaign")
+    price_end_at = models.DateTimeField(null=True, blank=True, help_text="When the price ends")
+    price_nearly_over = models.BooleanField(null=True, help_text="Price is nearly over")
+    price_flash_sale = models.BooleanField(null=True, help_text="Price is a flash sale")
+
+    regular_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Price")
+    regular_price_type = models.TextField(null=True, blank=True, help_text="Regular price type")
+    regular_price_end_at = models.DateTimeField(null=True, blank=True, help_text="When the regular price ends")
+    regular_price_nearly_over = models.BooleanField(null=True, help_text="Regular price is nearly over")
+    regular_price_flash_sale = models.BooleanField(null=True, help_text="Regular price is a flash sale")
+
+    lowest_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Price")
+    lowest_price_type = models.TextField(null=True, blank=True, help_text="Lowest price type")
+    lowest_price_end_at = models.DateTimeField(null=True, blank=True, help_text="When the lowest price ends")
+    lowest_price_nearly_over = models.BooleanField(null=True, help_text="Lowest price is nearly over")
+    lowest_price_flash_sale = models.BooleanField(null=True, help_text="Lowest price is a flash sale")
+
+    level_one_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Price")
+    level_one_price_type = models.TextField(null=True, blank=True, help_text="Level one price type")
+    level_one_price_end_at = models.DateTimeField(null=True, blank=True, help_text="When the level one price ends")
+    level_one_price_nearly_over = models.BooleanField(null=True, help_text="Level one price is nearly over")
+    level_one_price_flash_sale = models.BooleanField(null=True, help_text="Level one price is a flash sale")
+
+    average_rating = models.FloatField(null=True, blank=True, help_text="Average rating")
+    average_rating_type = models.TextField(null=True, blank=True, help_text="Average rating type")
+    energy_marking_rating = models.TextField(null=True, blank=True, help_text="Energy rating, e.g. A")
+    energy_marking_label = models.TextField(null=True, blank=True, help_text="Energy label URL")
+
+    highlighted_review_id = models.IntegerField(null=True, blank=True, help_text="Highlighted review ID")
+    highlighted_review_user_id = models.TextField(null=True, blank=True, help_text="User ID, or Anonymous")
+    highlighted_review_text = models.TextField(null=True, blank=True, help_text="Highlighted review text")
+    highlighted_review_rating = models.IntegerField(null=True, blank=True, help_text="Highlighted review rating")
+    highlighted_review_upvotes = models.IntegerField(null=True, blank=True, help_text="Highlighted review upvotes")
+    highlighted_review_downvotes = models.IntegerField(null=True, blank=True, help_text="Highlighted review downvotes")
+    highlighted_review_verified = models.BooleanField(null=True, help_text="Reviewer bought the product")
+    highlighted_review_created = models.DateTimeField(null=True, blank=True, help_text="Highlighted review created")
+    highlighted_review_is_anonymous = models.BooleanField(null=True, help_text="Reviewer is anonymous")
+    highlighted_review_is_employee = models.BooleanField(null=True, help_text="Reviewer works at Webhallen")
+    highlighted_review_product_id = models.IntegerField(null=True, blank=True, help_text="Reviewed product ID")
+    highlighted_review_is_hype = models.BooleanField(null=True, help_text="Review is a hype review")
+
+    source_updated = models.DateTimeField(help_text="WebhallenJSON.updated of the JSON this was converted from")
+    created = models.DateTimeField(auto_now_add=True, help_text="Created")
+    updated = models.DateTimeField(auto_now=True, help_text="Updated")
+
+    class Meta:
+        """Meta definition for WebhallenProduct."""
+
+        ordering: typing.ClassVar[list] = ["-product_id"]
+        verbose_name: str = "Webhallen product"
+        verbose_name_plural: str = "Webhallen products"
+        db_table: str = "webhallen_product"
+        db_table_comment: str = "Table storing Webhallen products converted from webhallen_json"
+
+    def __str__(self: WebhallenProduct) -> str:
+        """Human-readable, or informal, string representation of a Webhallen product.
+
+        Returns:
+            str: Product ID and name
+        """
+        return f"{self.product_id} - {self.name}"
+
+    def get_absolute_url(self: WebhallenProduct) -> str:
+        """Return a fully-qualified path for a Webhallen product."""
+        return f"/api/v1/webhallen/products/{self.product_id}"
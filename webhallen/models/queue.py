@@ -0,0 +1,58 @@
+"""Model for the Webhallen product work queue.
+
+Every product in the product sitemap gets a row here. Workers claim a batch of rows that are due,
+fetch them and then push next_fetch_at forward. See webhallen/queue.py for how rows are claimed.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import models
+from django.utils import timezone
+
+
+class WebhallenProductQueue(models.Model):
+    """A product that we want to fetch from the Webhallen API.
+
+    A worker owns a row while lease_owner is set and lease_expires_at is in the future.
+    If the worker dies, the lease runs out and another worker can claim the row again.
+    """
+
+    class Status(models.TextChoices):
+        """What happened the last time we fetched the product."""
+
+        OK = "ok", "OK"
+        ERROR = "error", "Error"
+
+    product_id = models.IntegerField(primary_key=True, help_text="Product ID")
+    loc = models.URLField(help_text="URL from the product sitemap")
+    next_fetch_at = models.DateTimeField(default=timezone.now, help_text="When the product should be fetched next")
+    attempts = models.PositiveIntegerField(default=0, help_text="Failed fetches since the last successful one")
+    last_status = models.TextField(null=True, blank=True, choices=Status.choices, help_text="Last fetch status")
+    last_fetched_at = models.DateTimeField(null=True, blank=True, help_text="When the product was last fetched")
+    lease_owner = models.TextField(null=True, blank=True, help_text="Worker that has claimed the product")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, help_text="When the claim runs out")
+
+    created = models.DateTimeField(auto_now_add=True, help_text="Created")
+    updated = models.DateTimeField(auto_now=True, help_text="Updated")
+
+    class Meta:
+        """Meta definition for WebhallenProductQueue."""
+
+        ordering: typing.ClassVar[list] = ["next_fetch_at"]
+        verbose_name: str = "Webhallen product queue entry"
+        verbose_name_plural: str = "Webhallen product queue"
+        db_table: str = "webhallen_product_queue"
+        db_table_comment: str = "Table storing which Webhallen products to fetch and when"
+        indexes: typing.ClassVar[list] = [
+            models.Index(fields=["next_fetch_at"], name="webhallen_queue_next_fetch"),
+        ]
+
+    def __str__(self: WebhallenProductQueue) -> str:
+        """Human-readable, or informal, string representation of a queue entry.
+
+        Returns:
+            str: Product ID and when it should be fetched next
+        """
+        return f"{self.product_id} - {self.next_fetch_at}"
@@ -0,0 +1,59 @@
+"""Model for Webhallen products that failed to fetch.
+
+A product gets a row here when fetching it fails and loses it when a later fetch works. Retries are scheduled
+as delayed Celery tasks, see webhallen/retries.py. After WEBHALLEN_RETRY_MAX_ATTEMPTS failures the row is
+marked as dead and we stop trying, so products that always fail can be found with one query.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import models
+from django.utils import timezone
+
+
+class WebhallenProductRetry(models.Model):
+    """A product that failed to fetch and when we will try it again."""
+
+    class Status(models.TextChoices):
+        """If we are still retrying the product."""
+
+        PENDING = "pending", "Pending"
+        DEAD = "dead", "Dead"
+
+    product_id = models.IntegerField(primary_key=True, help_text="Product ID")
+    status = models.TextField(choices=Status.choices, default=Status.PENDING, help_text="Retry status")
+    attempts = models.PositiveIntegerField(default=0, help_text="Failed fetches since the last successful one")
+    error_class = models.TextField(help_text="Exception class of the last failure, e.g. ConnectTimeout")
+    error_message = models.TextField(blank=True, default="", help_text="Exception message of the last failure")
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        null=True,
+        blank=True,
+        help_text="When the retry is scheduled. Empty for dead products.",
+    )
+    last_failed_at = models.DateTimeField(default=timezone.now, help_text="When the product last failed")
+
+    created = models.DateTimeField(auto_now_add=True, help_text="Created")
+    updated = models.DateTimeField(auto_now=True, help_text="Updated")
+
+    class Meta:
+        """Meta definition for WebhallenProductRetry."""
+
+        ordering: typing.ClassVar[list] = ["next_attempt_at"]
+        verbose_name: str = "Webhallen product retry"
+        verbose_name_plural: str = "Webhallen product retries"
+        db_table: str = "webhallen_product_retry"
+        db_table_comment: str = "Table storing Webhallen products that failed to fetch"
+        indexes: typing.ClassVar[list] = [
+            models.Index(fields=["status", "next_attempt_at"], name="webhallen_retry_due"),
+        ]
+
+    def __str__(self: WebhallenProductRetry) -> str:
+        """Human-readable, or informal, string representation of a retry.
+
+        Returns:
+            str: Product ID, status and how many times it has failed
+        """
+        return f"{self.product_id} - {self.status} ({self.attempts} attempts, {self.error_class})"
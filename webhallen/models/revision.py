@@ -0,0 +1,57 @@
+"""Model for the delta-encoded history of Webhallen product JSON.
+
+With WEBHALLEN_HISTORY_MODE set to "delta", ProductWriter stores every version of a product here instead of
+as a full copy in webhallen_history. Most versions are a JSON Patch from the version before. Every
+WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL versions there is a full copy, a snapshot, so rebuilding a version never
+applies more than that many patches. See webhallen/revisions.py.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import models
+
+
+class WebhallenJSONRevision(models.Model):
+    """A version of a product's JSON, stored as a snapshot or as a patch from the version before."""
+
+    class HistoryType(models.TextChoices):
+        """The same history types as django-simple-history."""
+
+        CREATED = "+", "Created"
+        CHANGED = "~", "Changed"
+        DELETED = "-", "Deleted"
+
+    product_id = models.IntegerField(help_text="Product ID")
+    recorded_at = models.DateTimeField(help_text="When the product got this version")
+    history_type = models.CharField(max_length=1, choices=HistoryType.choices, help_text="Type of change")
+    depth = models.PositiveSmallIntegerField(help_text="0 for a snapshot, otherwise patches since the snapshot")
+    document = models.JSONField(help_text="The product JSON for a snapshot, a JSON Patch for the others")
+    content_hash = models.TextField(help_text="Fingerprint of the product JSON in this version")
+
+    class Meta:
+        """Meta definition for WebhallenJSONRevision."""
+
+        ordering: typing.ClassVar[list] = ["product_id", "recorded_at", "id"]
+        verbose_name: str = "Webhallen JSON revision"
+        verbose_name_plural: str = "Webhallen JSON revisions"
+        db_table: str = "webhallen_json_revision"
+        db_table_comment: str = "Table storing every version of the Webhallen product JSON as snapshots and patches"
+        indexes: typing.ClassVar[list] = [
+            models.Index(fields=["product_id", "recorded_at", "id"], name="webhallen_revision_product"),
+        ]
+
+    def __str__(self: WebhallenJSONRevision) -> str:
+        """Human-readable, or informal, string representation of a revision.
+
+        Returns:
+            str: Product ID, when and if it is a snapshot
+        """
+        kind: str = "snapshot" if self.depth == 0 else f"patch {self.depth}"
+        return f"{self.product_id} - {self.recorded_at} ({kind})"
+
+    @property
+    def is_snapshot(self: WebhallenJSONRevision) -> bool:
+        """If the document is the full product JSON."""
+        return self.depth == 0
@@ -55,8 +55,6 @@ class WebhallenSection(models.Model):
     icon_url = models.URLField(null=True, blank=True, help_text="Icon URL")
     name = models.TextField(null=True, blank=True, help_text="Name")
 
-    # TODO(TheLovinator): #52 URL is broken for everything except Presentkort
-    # https://github.com/TheLovinator1/panso.se/issues/52
     url = models.URLField(null=True, blank=True, help_text="URL")
 
     class Meta:
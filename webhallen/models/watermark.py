@@ -0,0 +1,33 @@
+"""Model for how far derived tables have been brought up to date.
+
+Tasks that derive data from WebhallenJSON, like create_sections, only look at products whose `updated` is after
+their watermark and then move the watermark forward, so a run with nothing new costs one indexed query.
+"""
+
+from __future__ import annotations
+
+from django.db import models
+
+
+class WebhallenWatermark(models.Model):
+    """The newest WebhallenJSON.updated a derivation has processed."""
+
+    name = models.TextField(primary_key=True, help_text="Name of the derivation, e.g. sections")
+    watermark = models.DateTimeField(help_text="Newest WebhallenJSON.updated that has been processed")
+    updated = models.DateTimeField(auto_now=True, help_text="Updated")
+
+    class Meta:
+        """Meta definition for WebhallenWatermark."""
+
+        verbose_name: str = "Webhallen watermark"
+        verbose_name_plural: str = "Webhallen watermarks"
+        db_table: str = "webhallen_watermark"
+        db_table_comment: str = "Table storing how far each derivation from webhallen_json has got"
+
+    def __str__(self: WebhallenWatermark) -> str:
+        """Human-readable, or informal, string representation of a watermark.
+
+        Returns:
+            str: Name and watermark
+        """
+        return f"{self.name} - {self.watermark}"
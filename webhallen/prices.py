@@ -0,0 +1,152 @@
+"""Price and stock history for Webhallen products.
+
+Every time ProductWriter saves products, record_prices() adds a WebhallenPricePoint for the ones whose price,
+regular price or stock is different from their latest point. Products where only something else changed, like
+the description, don't get a point.
+
+History from before the price table existed is read from webhallen_history with backfill_prices(), see the
+backfill_webhallen_prices command. It adds the points a product would have got had it been recorded all
+along, up to the product's first recorded point, so it can be run again without adding anything twice.
+
+The values are read from the JSON with the same SQL functions as the expression indexes, see
+webhallen/expressions.py, so a price that isn't a number is stored as NULL instead of failing the write.
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING
+
+from django.db import connection
+from django.utils import timezone
+
+from webhallen.models import WebhallenPricePoint
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+_COLUMNS: str = "price, regular_price, stock_web, stock_stores, stock_supplier"
+
+# The values of a point, from the product JSON in `s.product_json`. Stores are the numbered keys in stock.
+VALUES_SQL: str = """
+webhallen_numeric(s.product_json #> '{product,price,price}')::numeric(12, 2) AS price,
+webhallen_numeric(s.product_json #> '{product,regularPrice,price}')::numeric(12, 2) AS regular_price,
+webhallen_integer(s.product_json #> '{product,stock,web}') AS stock_web,
+CASE WHEN jsonb_typeof(s.product_json #> '{product,stock}') = 'object' THEN (
+    SELECT sum(webhallen_integer(stock.value))::integer
+    FROM jsonb_each(s.product_json #> '{product,stock}') AS stock
+    WHERE stock.key ~ '^[0-9]+$'
+) END AS stock_stores,
+webhallen_integer(s.product_json #> '{product,stock,supplier}') AS stock_supplier
+"""
+
+# Add a point for the products whose values differ from their latest point
+RECORD_PRICES_SQL: str = f"""
+INSERT INTO webhallen_price (product_id, recorded_at, {_COLUMNS})
+SELECT p.product_id, now(), p.price, p.regular_price, p.stock_web, p.stock_stores, p.stock_supplier
+FROM (
+    SELECT s.product_id, {VALUES_SQL} FROM webhallen_json s WHERE s.product_id = ANY(%(product_ids)s)
+) p
+LEFT JOIN LATERAL (
+    SELECT {_COLUMNS} FROM webhallen_price l
+    WHERE l.product_id = p.product_id
+    ORDER BY l.recorded_at DESC
+    LIMIT 1
+) last ON true
+WHERE (last.price, last.regular_price, last.stock_web, last.stock_stores, last.stock_supplier)
+    IS DISTINCT FROM (p.price, p.regular_price, p.stock_web, p.stock_stores, p.stock_supplier)
+"""  # noqa: S608
+
+# Add a point for every version in webhallen_history whose values differ from the version before it, for the
+# products in a range and the history from before their first recorded point
+BACKFILL_PRICES_SQL: str = f"""
+INSERT INTO webhallen_price (product_id, recorded_at, {_COLUMNS})
+SELECT c.product_id, c.recorded_at, c.price, c.regular_price, c.stock_web, c.stock_stores, c.stock_supplier
+FROM (
+    SELECT
+        v.*,
+        lag(v.price) OVER w AS last_price,
+        lag(v.regular_price) OVER w AS last_regular_price,
+        lag(v.stock_web) OVER w AS last_stock_web,
+        lag(v.stock_stores) OVER w AS last_stock_stores,
+        lag(v.stock_supplier) OVER w AS last_stock_supplier
+    FROM (
+        SELECT s.product_id, s.history_date AS recorded_at, {VALUES_SQL}
+        FROM webhallen_history s
+        WHERE s.product_id > %(after)s AND s.product_id <= %(upto)s AND s.history_type <> '-'
+            AND s.history_date < coalesce(
+                (SELECT min(p.recorded_at) FROM webhallen_price p WHERE p.product_id = s.product_id),
+                'infinity'
+            )
+    ) v
+    WINDOW w AS (PARTITION BY v.product_id ORDER BY v.recorded_at)
+) c
+WHERE (c.last_price, c.last_regular_price, c.last_stock_web, c.last_stock_stores, c.last_stock_supplier)
+    IS DISTINCT FROM (c.price, c.regular_price, c.stock_web, c.stock_stores, c.stock_supplier)
+"""  # noqa: S608
+
+# Product IDs in one backfill_prices() call
+BACKFILL_RANGE_SIZE: int = 10000
+
+
+def record_prices(product_ids: Iterable[int]) -> int:
+    """Add a price point for the products whose price or stock changed.
+
+    Call this after the products have been written to webhallen_json, in the same transaction.
+
+    Args:
+        product_ids: The products that were written.
+
+    Returns:
+        int: How many points were added.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_PRICES_SQL, {"product_ids": product_ids})
+        return cursor.rowcount
+
+
+def history_product_id_range() -> tuple[int, int] | None:
+    """Return the lowest and highest product ID in webhallen_history, or None if it is empty."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(product_id), max(product_id) FROM webhallen_history")
+        lowest, highest = cursor.fetchone()
+    return None if lowest is None else (lowest, highest)
+
+
+def backfill_prices(after: int, upto: int) -> int:
+    """Add price points from webhallen_history for the products in a range.
+
+    Args:
+        after: Backfill products with a higher product ID than this.
+        upto: Backfill products up to and including this product ID.
+
+    Returns:
+        int: How many points were added.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(BACKFILL_PRICES_SQL, {"after": after, "upto": upto})
+        return cursor.rowcount
+
+
+def price_history(product_id: int, days: int = 365) -> list[dict]:
+    """Return the price points of a product for the last `days` days.
+
+    The point that was current when the period started is included, so the first price is known even if it
+    hasn't changed in the whole period.
+
+    Args:
+        product_id: The product ID.
+        days: How many days back to go.
+
+    Returns:
+        list[dict]: The points, oldest first.
+    """
+    start: datetime.datetime = timezone.now() - datetime.timedelta(days=days)
+    fields: tuple[str, ...] = ("recorded_at", "price", "regular_price", "stock_web", "stock_stores", "stock_supplier")
+    points = WebhallenPricePoint.objects.filter(product_id=product_id)
+    previous: dict | None = points.filter(recorded_at__lt=start).order_by("-recorded_at").values(*fields).first()
+    recent: list[dict] = list(points.filter(recorded_at__gte=start).order_by("recorded_at").values(*fields))
+    return [previous, *recent] if previous else recent
@@ -0,0 +1,134 @@
+"""Lease-based work queue for Webhallen products.
+
+The queue lives in the webhallen_product_queue table. Any number of workers can drain it at the same time:
+
+    1. claim_products() locks a batch of due rows with SELECT ... FOR UPDATE SKIP LOCKED, so two workers
+       never get the same product, and writes a lease with the worker name and an expiry time.
+    2. The worker fetches the products.
+    3. complete_products() records the result, pushes next_fetch_at forward and releases the lease.
+
+If a worker crashes between 1 and 3, only the products it had leased are delayed. They become claimable
+again when the lease expires.
+"""
+
+from __future__ import annotations
+
+import datetime
+from typing import TYPE_CHECKING
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rich import print
+from rich.console import Console
+
+from webhallen.crawler import product_id_from_url
+from webhallen.models import SitemapProduct, WebhallenProductQueue
+
+if TYPE_CHECKING:
+    from webhallen.crawler import CrawlStats
+
+err_console = Console(stderr=True)
+
+
+def sync_product_queue(chunk_size: int = 1000) -> int:
+    """Add every active product in the product sitemap to the queue.
+
+    Products that are already in the queue are left alone so we don't reset their schedule.
+
+    Args:
+        chunk_size: How many rows we insert at a time.
+
+    Returns:
+        int: How many products we tried to add.
+    """
+    entries: list[WebhallenProductQueue] = []
+    total: int = 0
+    for loc in SitemapProduct.objects.filter(active=True).values_list("loc", flat=True).iterator(chunk_size):
+        product_id: int | None = product_id_from_url(loc)
+        if not product_id:
+            err_console.print(f"Could not get product ID from {loc}")
+            continue
+
+        entries.append(WebhallenProductQueue(product_id=product_id, loc=loc))
+        if len(entries) >= chunk_size:
+            WebhallenProductQueue.objects.bulk_create(entries, ignore_conflicts=True)
+            total += len(entries)
+            entries = []
+
+    WebhallenProductQueue.objects.bulk_create(entries, ignore_conflicts=True)
+    total += len(entries)
+    print(f"Synced {total} products to the product queue")
+    return total
+
+
+def claim_products(owner: str, limit: int = 200, lease: datetime.timedelta | None = None) -> list[int]:
+    """Claim a batch of products that are due to be fetched.
+
+    Rows that another worker has locked are skipped instead of waited on, and rows with an expired
+    lease are treated as free.
+
+    Args:
+        owner: Name of the worker, stored on the row so we can see who has it.
+        limit: Maximum number of products to claim.
+        lease: How long the worker gets before someone else can claim the products. Defaults to 10 minutes.
+
+    Returns:
+        list[int]: The product IDs we claimed.
+    """
+    now: datetime.datetime = timezone.now()
+    lease = lease or datetime.timedelta(minutes=10)
+    with transaction.atomic():
+        product_ids: list[int] = list(
+            WebhallenProductQueue.objects.select_for_update(skip_locked=True)
+            .filter(next_fetch_at__lte=now)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .order_by("next_fetch_at")
+            .values_list("product_id", flat=True)[:limit],
+        )
+        WebhallenProductQueue.objects.filter(product_id__in=product_ids).update(
+            lease_owner=owner,
+            lease_expires_at=now + lease,
+        )
+    return product_ids
+
+
+def complete_products(
+    owner: str,
+    stats: CrawlStats,
+    refresh_interval: datetime.timedelta | None = None,
+    retry_delay: datetime.timedelta | None = None,
+) -> None:
+    """Record the result of a crawl and release the leases.
+
+    Only rows that are still leased by `owner` are updated. If our lease ran out and another worker took
+    the product, their result wins.
+
+    Args:
+        owner: Name of the worker that claimed the products.
+        stats: The result of the crawl.
+        refresh_interval: When a fetched product should be fetched again. Defaults to 24 hours.
+        retry_delay: When a failed product should be tried again. Defaults to 1 hour.
+    """
+    now: datetime.datetime = timezone.now()
+    refresh_interval = refresh_interval or datetime.timedelta(hours=24)
+    retry_delay = retry_delay or datetime.timedelta(hours=1)
+    leased = WebhallenProductQueue.objects.filter(lease_owner=owner)
+
+    with transaction.atomic():
+        leased.filter(product_id__in=stats.fetched).update(
+            attempts=0,
+            last_status=WebhallenProductQueue.Status.OK,
+            last_fetched_at=now,
+            next_fetch_at=now + refresh_interval,
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+        leased.filter(product_id__in=list(stats.failed)).update(
+            attempts=F("attempts") + 1,
+            last_status=WebhallenProductQueue.Status.ERROR,
+            last_fetched_at=now,
+            next_fetch_at=now + retry_delay,
+            lease_owner=None,
+            lease_expires_at=None,
+        )
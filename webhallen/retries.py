@@ -0,0 +1,141 @@
+"""Retry bookkeeping for Webhallen products that failed to fetch.
+
+Instead of sleeping between attempts while holding a worker, a failed product is written to the
+webhallen_product_retry table and a Celery task is scheduled for later with an ETA. The worker moves on to the
+next product straight away.
+
+    1. record_failure() counts the failure, saves the error and picks when to try again. The delay doubles with
+       every failure. After WEBHALLEN_RETRY_MAX_ATTEMPTS failures the product is marked as dead instead.
+    2. The scheduled task calls claim_retry() first. Only the task scheduled for the current attempt gets the
+       product, so a message that Redis delivered twice, or an old one, does nothing.
+    3. A successful fetch calls clear_retries() and the row is deleted.
+
+If a scheduled task is lost, for example because Redis was restarted, due_retries() finds the products whose
+retry is overdue so they can be scheduled again.
+
+Products we gave up on:
+    WebhallenProductRetry.objects.filter(status=WebhallenProductRetry.Status.DEAD)
+"""
+
+from __future__ import annotations
+
+import datetime
+import random
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from webhallen.models import WebhallenProductRetry
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+# How long a claimed retry is ours before due_retries() thinks its task was lost
+CLAIM_LEASE: datetime.timedelta = datetime.timedelta(minutes=10)
+
+# ETA tasks can start a little before next_attempt_at if the worker's clock is ahead of ours
+CLAIM_SLACK: datetime.timedelta = datetime.timedelta(seconds=30)
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    """Return how long to wait before the next attempt.
+
+    The delay doubles with every failure, starting at WEBHALLEN_RETRY_BASE_DELAY and capped at
+    WEBHALLEN_RETRY_MAX_DELAY. A random part of up to half the delay is taken off so products that failed
+    together are not retried together.
+
+    Args:
+        attempts: How many times the product has failed, 1 after the first failure.
+
+    Returns:
+        datetime.timedelta: The delay.
+    """
+    delay: float = min(
+        settings.WEBHALLEN_RETRY_MAX_DELAY,
+        settings.WEBHALLEN_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0),
+    )
+    return datetime.timedelta(seconds=delay * random.uniform(0.5, 1.0))  # noqa: S311
+
+
+def record_failure(product_id: int, error: BaseException | str) -> WebhallenProductRetry:
+    """Count a failed fetch and decide when to try again, or that we give up.
+
+    Args:
+        product_id: The product ID.
+        error: The exception, or the name of the exception class if that is all we have.
+
+    Returns:
+        WebhallenProductRetry: The row, with next_attempt_at set for a pending retry.
+    """
+    now: datetime.datetime = timezone.now()
+    with transaction.atomic():
+        retry, _ = WebhallenProductRetry.objects.select_for_update().get_or_create(product_id=product_id)
+        retry.attempts += 1
+        retry.error_class = error if isinstance(error, str) else type(error).__name__
+        retry.error_message = "" if isinstance(error, str) else str(error)
+        retry.last_failed_at = now
+
+        if retry.attempts >= settings.WEBHALLEN_RETRY_MAX_ATTEMPTS:
+            retry.status = WebhallenProductRetry.Status.DEAD
+            retry.next_attempt_at = None
+        else:
+            retry.status = WebhallenProductRetry.Status.PENDING
+            retry.next_attempt_at = now + retry_delay(retry.attempts)
+        retry.save()
+    return retry
+
+
+def claim_retry(product_id: int, attempt: int) -> bool:
+    """Take a scheduled retry before fetching the product.
+
+    The claim moves next_attempt_at CLAIM_LEASE into the future, so due_retries() leaves the product alone while
+    we work on it.
+
+    Args:
+        product_id: The product ID.
+        attempt: The attempt count the task was scheduled for.
+
+    Returns:
+        bool: If we got it. False if the product has been fetched, given up on or claimed by someone else since.
+    """
+    now: datetime.datetime = timezone.now()
+    claimed: int = WebhallenProductRetry.objects.filter(
+        product_id=product_id,
+        attempts=attempt,
+        status=WebhallenProductRetry.Status.PENDING,
+        next_attempt_at__lte=now + CLAIM_SLACK,
+    ).update(next_attempt_at=now + CLAIM_LEASE)
+    return bool(claimed)
+
+
+def clear_retries(product_ids: Iterable[int]) -> int:
+    """Forget the failures of products that we have now fetched.
+
+    Args:
+        product_ids: The products that were fetched.
+
+    Returns:
+        int: How many retries were removed.
+    """
+    deleted, _ = WebhallenProductRetry.objects.filter(product_id__in=list(product_ids)).delete()
+    return deleted
+
+
+def due_retries(limit: int = 1000) -> list[WebhallenProductRetry]:
+    """Return pending retries whose task should have run by now but hasn't.
+
+    Args:
+        limit: Maximum number of retries to return.
+
+    Returns:
+        list[WebhallenProductRetry]: The overdue retries, oldest first.
+    """
+    overdue: datetime.datetime = timezone.now() - CLAIM_LEASE
+    return list(
+        WebhallenProductRetry.objects.filter(
+            status=WebhallenProductRetry.Status.PENDING,
+            next_attempt_at__lte=overdue,
+        ).order_by("next_attempt_at")[:limit],
+    )
@@ -0,0 +1,285 @@
+"""Delta-encoded history of Webhallen product JSON.
+
+With WEBHALLEN_HISTORY_MODE set to "delta", ProductWriter calls record_revisions() instead of creating full
+copies in webhallen_history. A new version is stored as a JSON Patch from the version before, see deltas.py,
+unless one of these is true. In that case it is stored as a snapshot, a full copy:
+
+    - It is the first version we have of the product.
+    - The version before it has WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL - 1 patches since its snapshot.
+    - The latest revision is not what webhallen_json had, e.g. because the product was saved in "full" mode
+      in between, so a patch from webhallen_json would not continue the chain.
+
+A patch for a changed price or stock count is a few hundred bytes, a copy of the product is tens of kilobytes.
+
+reconstruct() rebuilds any version from the snapshot before it and the patches in between.
+
+compact_history() moves the existing full copies in webhallen_history into revisions. Run
+backfill_webhallen_prices before it, the backfill reads webhallen_history.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import orjson
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from webhallen.deltas import apply_patch, make_patch
+from webhallen.fingerprint import product_fingerprint
+from webhallen.models import WebhallenJSON, WebhallenJSONRevision
+
+if TYPE_CHECKING:
+    import datetime
+    from collections.abc import Iterable
+
+# The depth and fingerprint of the newest revision of each product
+LATEST_REVISIONS_SQL: str = """
+SELECT DISTINCT ON (product_id) product_id, depth, content_hash
+FROM webhallen_json_revision
+WHERE product_id = ANY(%(product_ids)s)
+ORDER BY product_id, recorded_at DESC, id DESC
+"""
+
+# Product IDs in one compact_history() call
+COMPACT_RANGE_SIZE: int = 1000
+
+
+class RevisionChainError(Exception):
+    """The revisions between a snapshot and the version we want are missing or out of order."""
+
+
+@dataclass
+class CompactionStats:
+    """What compacting webhallen_history did."""
+
+    products: int = 0
+    versions: int = 0
+    snapshots: int = 0
+    original_bytes: int = 0
+    compacted_bytes: int = 0
+
+    @property
+    def ratio(self: CompactionStats) -> float:
+        """How many times smaller the revisions are than the copies they replace."""
+        return self.original_bytes / self.compacted_bytes if self.compacted_bytes else 0.0
+
+    def add(self: CompactionStats, other: CompactionStats) -> None:
+        """Add the counts of another range to these."""
+        self.products += other.products
+        self.versions += other.versions
+        self.snapshots += other.snapshots
+        self.original_bytes += other.original_bytes
+        self.compacted_bytes += other.compacted_bytes
+
+
+def delta_history_enabled() -> bool:
+    """If product history is stored as revisions instead of full copies."""
+    return settings.WEBHALLEN_HISTORY_MODE == "delta"
+
+
+def _latest_revisions(product_ids: list[int]) -> dict[int, tuple[int, str]]:
+    """Return the depth and fingerprint of the newest revision of each product that has one."""
+    with connection.cursor() as cursor:
+        cursor.execute(LATEST_REVISIONS_SQL, {"product_ids": product_ids})
+        return {product_id: (depth, content_hash) for product_id, depth, content_hash in cursor.fetchall()}
+
+
+def _document_size(document: object) -> int:
+    return len(orjson.dumps(document))
+
+
+def record_revisions(
+    products: Iterable[WebhallenJSON],
+    previous: dict[int, tuple[dict, str | None]],
+    recorded_at: datetime.datetime | None = None,
+) -> int:
+    """Add a revision for every product that was written.
+
+    Args:
+        products: The products that were written, with their content_hash set.
+        previous: The JSON and content_hash the changed products had in webhallen_json before they were written.
+        recorded_at: When the products were written, now if not given.
+
+    Returns:
+        int: How many revisions were added.
+    """
+    products = list(products)
+    if not products:
+        return 0
+
+    recorded_at = recorded_at or timezone.now()
+    interval: int = settings.WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL
+    latest: dict[int, tuple[int, str]] = _latest_revisions([product.product_id for product in products])
+    revisions: list[WebhallenJSONRevision] = []
+    for product in products:
+        content_hash: str = product.content_hash or product_fingerprint(product.product_json)
+        revision = WebhallenJSONRevision(
+            product_id=product.product_id,
+            recorded_at=recorded_at,
+            history_type=WebhallenJSONRevision.HistoryType.CHANGED,
+            depth=0,
+            document=product.product_json,
+            content_hash=content_hash,
+        )
+
+        last: tuple[int, str] | None = latest.get(product.product_id)
+        if product.product_id not in previous:
+            revision.history_type = WebhallenJSONRevision.HistoryType.CREATED
+        elif last is not None and last[0] + 1 < interval:
+            previous_json, previous_hash = previous[product.product_id]
+            if last[1] == (previous_hash or product_fingerprint(previous_json)):
+                revision.depth = last[0] + 1
+                revision.document = make_patch(previous_json, product.product_json)
+        revisions.append(revision)
+
+    WebhallenJSONRevision.objects.bulk_create(revisions)
+    return len(revisions)
+
+
+def list_revisions(product_id: int) -> list[dict]:
+    """Return the revisions of a product, oldest first, without their documents.
+
+    Args:
+        product_id: The product ID.
+
+    Returns:
+        list[dict]: id, recorded_at, history_type and depth of every revision.
+    """
+    return list(
+        WebhallenJSONRevision.objects.filter(product_id=product_id)
+        .order_by("recorded_at", "id")
+        .values("id", "recorded_at", "history_type", "depth"),
+    )
+
+
+def reconstruct(
+    product_id: int,
+    revision_id: int | None = None,
+    at: datetime.datetime | None = None,
+) -> dict | None:
+    """Rebuild a version of a product's JSON.
+
+    Args:
+        product_id: The product ID.
+        revision_id: The revision to rebuild. The newest revision if neither this nor `at` is given.
+        at: Rebuild the version the product had at this time.
+
+    Raises:
+        RevisionChainError: If the revisions can't be put together.
+
+    Returns:
+        dict | None: The product JSON, or None if there is no such revision.
+    """
+    revisions = WebhallenJSONRevision.objects.filter(product_id=product_id)
+    targets = revisions
+    if revision_id is not None:
+        targets = targets.filter(id=revision_id)
+    elif at is not None:
+        targets = targets.filter(recorded_at__lte=at)
+
+    target: dict | None = targets.order_by("-recorded_at", "-id").values("id", "recorded_at", "depth").first()
+    if target is None:
+        return None
+
+    # The snapshot is exactly `depth` revisions before the target
+    chain: list[tuple[int, object]] = list(
+        revisions.filter(
+            Q(recorded_at__lt=target["recorded_at"]) | Q(recorded_at=target["recorded_at"], id__lte=target["id"]),
+        )
+        .order_by("-recorded_at", "-id")
+        .values_list("depth", "document")[: target["depth"] + 1],
+    )
+    chain.reverse()
+    if [depth for depth, _ in chain] != list(range(target["depth"] + 1)):
+        msg: str = f"Revision {target['id']} of product {product_id} can't be rebuilt, its revisions are broken"
+        raise RevisionChainError(msg)
+
+    document: object = chain[0][1]
+    for _, patch in chain[1:]:
+        document = apply_patch(document, patch)
+    return document
+
+
+def compact_history(after: int, upto: int, chunk_size: int = 500) -> CompactionStats:
+    """Move the full copies in webhallen_history for a range of products into revisions.
+
+    Only versions from before a product's first revision are moved, so running this again, or after delta mode
+    has been turned on, doesn't add anything twice. Every patch is checked by applying it before the copy it
+    replaces is deleted. Run it in a transaction.
+
+    Args:
+        after: Compact products with a higher product ID than this.
+        upto: Compact products up to and including this product ID.
+        chunk_size: History rows read, and revisions written, at a time.
+
+    Raises:
+        RevisionChainError: If a patch doesn't rebuild the version it was made from.
+
+    Returns:
+        CompactionStats: How many versions were compacted and how much smaller they are.
+    """
+    interval: int = settings.WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL
+    history = WebhallenJSON.history.filter(product_id__gt=after, product_id__lte=upto)
+    first_revisions: dict[int, datetime.datetime] = dict(
+        WebhallenJSONRevision.objects.filter(product_id__gt=after, product_id__lte=upto)
+        .values("product_id")
+        .annotate(first=Min("recorded_at"))
+        .values_list("product_id", "first"),
+    )
+
+    stats = CompactionStats()
+    revisions: list[WebhallenJSONRevision] = []
+    compacted: list[int] = []
+    product_id: int | None = None
+    previous: object = None
+    depth: int = 0
+    rows = history.order_by("product_id", "history_date", "history_id").values_list(
+        "history_id",
+        "product_id",
+        "history_date",
+        "history_type",
+        "product_json",
+    )
+    for history_id, row_product_id, history_date, history_type, product_json in rows.iterator(chunk_size=chunk_size):
+        first_revision: datetime.datetime | None = first_revisions.get(row_product_id)
+        if first_revision is not None and history_date >= first_revision:
+            continue
+
+        if row_product_id != product_id:
+            product_id, previous, depth = row_product_id, None, 0
+            stats.products += 1
+
+        revision = WebhallenJSONRevision(
+            product_id=row_product_id,
+            recorded_at=history_date,
+            history_type=history_type,
+            depth=0,
+            document=product_json,
+            content_hash=product_fingerprint(product_json),
+        )
+        if previous is not None and depth + 1 < interval:
+            patch: list[dict] = make_patch(previous, product_json)
+            if apply_patch(previous, patch) != product_json:
+                msg: str = f"Patch for history row {history_id} doesn't rebuild it"
+                raise RevisionChainError(msg)
+            revision.depth, revision.document = depth + 1, patch
+
+        depth, previous = revision.depth, product_json
+        stats.versions += 1
+        stats.snapshots += revision.depth == 0
+        stats.original_bytes += _document_size(product_json)
+        stats.compacted_bytes += _document_size(revision.document)
+        revisions.append(revision)
+        compacted.append(history_id)
+        if len(revisions) >= chunk_size:
+            WebhallenJSONRevision.objects.bulk_create(revisions)
+            revisions.clear()
+
+    WebhallenJSONRevision.objects.bulk_create(revisions)
+    for start in range(0, len(compacted), chunk_size):
+        WebhallenJSON.history.filter(history_id__in=compacted[start : start + chunk_size]).delete()
+    return stats
@@ -0,0 +1,165 @@
+"""Section ID to section URL lookup for Webhallen.
+
+The product JSON only has the section ID, e.g. 8. The section URL, e.g.
+https://www.webhallen.com/se/section/8-Datorkomponenter, is in the section sitemap, so we build a dict from
+section ID to URL once from SitemapSection and look every product's section up in it.
+
+The dict is cached in the Django cache (Redis in production) under the version of the section sitemap table, see
+models_version() in products/versions.py. The version changes with every write that changes a row in the table,
+so a cached index is never older than the sitemap it was built from.
+
+derive_sections() creates and updates the WebhallenSection rows from the products. It only reads the section
+object of products that changed since the last run, see WebhallenWatermark, and writes every section in the same
+statement, so a run where nothing changed is one indexed query, plus reading the version of the section sitemap.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+
+from cacheops import invalidate_model
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from products.versions import models_version
+from webhallen.models import SitemapSection, WebhallenSection
+from webhallen.watermarks import ADVANCE_WATERMARK_SQL, SINCE_SQL, watermark_params
+
+# https://www.webhallen.com/se/section/8-Datorkomponenter -> 8
+SECTION_URL_RE: re.Pattern[str] = re.compile(r"/se/section/(\d+)-")
+
+# Sections that are not in the section sitemap, and the closest page we have for them
+SECTION_URL_FALLBACKS: dict[int, str] = {
+    19: "https://www.webhallen.com/se/info/28-Kop-presentkort",  # Presentkort
+}
+
+# Cached indexes for old versions are left to expire
+SECTION_INDEX_TIMEOUT: int = 60 * 60 * 24 * 7  # 1 week
+
+# Section icons are SVGs that Webhallen colors for us
+SECTION_ICON_URL: str = "https://cdn.webhallen.com/api/dynimg/category/{icon}/1A1A1D"
+
+# Name of the watermark in webhallen_watermark
+SECTIONS_WATERMARK: str = "sections"
+
+# One statement: read the section of every product updated since the watermark, keep the newest version of every
+# section, upsert the sections that are new or different and move the watermark forward.
+DERIVE_SECTIONS_SQL: str = f"""
+WITH changed AS (
+    SELECT j.product_json -> 'product' -> 'section' AS section, j.updated
+    FROM webhallen_json j
+    WHERE j.updated > ({SINCE_SQL})
+), sections AS (
+    SELECT DISTINCT ON ((section ->> 'id')::integer)
+        (section ->> 'id')::integer AS section_id,
+        nullif(section ->> 'metaTitle', '') AS meta_title,
+        (section ->> 'active')::boolean AS active,
+        nullif(section ->> 'icon', '') AS icon,
+        section ->> 'name' AS name
+    FROM changed
+    WHERE jsonb_typeof(section -> 'id') = 'number'
+    ORDER BY (section ->> 'id')::integer, updated DESC
+), upserted AS (
+    INSERT INTO webhallen_section AS t (section_id, meta_title, active, icon, icon_url, name, url, created, updated)
+    SELECT
+        s.section_id,
+        s.meta_title,
+        s.active,
+        s.icon,
+        replace(%(icon_url)s, '{{icon}}', s.icon),
+        s.name,
+        %(urls)s::jsonb ->> s.section_id::text,
+        now(),
+        now()
+    FROM sections s
+    ON CONFLICT (section_id) DO UPDATE SET
+        meta_title = excluded.meta_title,
+        active = excluded.active,
+        icon = excluded.icon,
+        icon_url = excluded.icon_url,
+        name = excluded.name,
+        url = excluded.url,
+        updated = now()
+    WHERE (t.meta_title, t.active, t.icon, t.icon_url, t.name, t.url) IS DISTINCT FROM (
+        excluded.meta_title, excluded.active, excluded.icon, excluded.icon_url, excluded.name, excluded.url
+    )
+    RETURNING t.section_id, t.xmax = 0 AS created
+), watermark AS ({ADVANCE_WATERMARK_SQL})
+SELECT
+    (SELECT count(*) FROM changed),
+    array(SELECT section_id FROM upserted WHERE created),
+    array(SELECT section_id FROM upserted WHERE NOT created)
+"""  # noqa: S608
+
+
+@dataclass
+class SectionChanges:
+    """What a derive_sections() run did."""
+
+    scanned: int = 0
+    created: int = 0
+    changed: int = 0
+
+
+def build_section_index() -> dict[int, str]:
+    """Build the section ID to URL dict from the section sitemap.
+
+    Returns:
+        dict[int, str]: Section URLs keyed by section ID, including SECTION_URL_FALLBACKS.
+    """
+    index: dict[int, str] = dict(SECTION_URL_FALLBACKS)
+    for loc in SitemapSection.objects.filter(active=True).order_by("loc").values_list("loc", flat=True):
+        match: re.Match[str] | None = SECTION_URL_RE.search(loc)
+        if match:
+            index[int(match.group(1))] = loc
+    return index
+
+
+def get_section_index() -> dict[int, str]:
+    """Return the section index for the current section sitemap, from the cache if we have it.
+
+    Returns:
+        dict[int, str]: Section URLs keyed by section ID.
+    """
+    version: str | None = models_version(SitemapSection)
+    if version is None:
+        return build_section_index()
+
+    key: str = f"webhallen:section-index:{version}"
+    index: dict[int, str] | None = cache.get(key)
+    if index is None:
+        index = build_section_index()
+        cache.set(key, index, timeout=SECTION_INDEX_TIMEOUT)
+    return index
+
+
+def derive_sections(*, full: bool = False) -> SectionChanges:
+    """Create and update sections from the products that changed since the last run.
+
+    Args:
+        full: Read every product instead of the ones updated since the watermark.
+
+    Returns:
+        SectionChanges: How many products were read and how many sections were created and changed.
+    """
+    section_urls: dict[int, str] = get_section_index()
+    params: dict[str, object] = {
+        **watermark_params(SECTIONS_WATERMARK, full=full),
+        "icon_url": SECTION_ICON_URL,
+        "urls": json.dumps(section_urls),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(DERIVE_SECTIONS_SQL, params)
+        scanned, created, changed = cursor.fetchone()
+
+        if created or changed:
+            WebhallenSection.history.bulk_history_create(WebhallenSection.objects.nocache().filter(pk__in=created))
+            WebhallenSection.history.bulk_history_create(
+                WebhallenSection.objects.nocache().filter(pk__in=changed),
+                update=True,
+            )
+            invalidate_model(WebhallenSection)
+
+    return SectionChanges(scanned=scanned, created=len(created), changed=len(changed))
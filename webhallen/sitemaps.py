@@ -0,0 +1,278 @@
+"""Load Webhallen's sitemaps into the Sitemap* models.
+
+A sitemap is streamed with stream_sitemap() straight into a temporary staging table with COPY, so memory
+use stays the same no matter how many products Webhallen has. The staging table is then compared with the
+Sitemap* table in three set-based statements:
+
+    - added: URLs in the sitemap that we don't have yet are inserted.
+    - changed: URLs we have whose priority changed, or that had been removed and are back, are updated.
+    - removed: URLs we have that are no longer in the sitemap get active=False.
+
+Only the rows that changed get a history row, and the table only gets a new version in table_version, see
+products/versions.py, if something changed.
+
+ingest_sitemaps() downloads any number of sitemaps at the same time, each to a temporary file, and loads
+them into the database one at a time as they finish, so a full refresh takes about as long as the slowest
+sitemap instead of the sum of all of them.
+"""
+
+from __future__ import annotations
+
+import functools
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING
+
+import httpx
+from cacheops import invalidate_model
+from django.db import connection, models, transaction
+from rich.console import Console
+
+from panso.scraping import SitemapEntry, get_client, parse_sitemap, stream_sitemap
+from webhallen.models import (
+    SitemapArticle,
+    SitemapCampaign,
+    SitemapCampaignList,
+    SitemapCategory,
+    SitemapHome,
+    SitemapInfoPages,
+    SitemapManufacturer,
+    SitemapProduct,
+    SitemapSection,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from django.db.backends.utils import CursorWrapper
+
+    from panso.scraping import ScrapingClient
+
+err_console = Console(stderr=True)
+
+ROOT_SITEMAP: str = "https://www.webhallen.com/sitemap.xml"
+
+# Every sitemap in the root sitemap and the model we store it in
+SITEMAPS: list[tuple[str, type[models.Model]]] = [
+    ("https://www.webhallen.com/sitemap.product.xml", SitemapProduct),
+    ("https://www.webhallen.com/sitemap.manufacturer.xml", SitemapManufacturer),
+    ("https://www.webhallen.com/sitemap.article.xml", SitemapArticle),
+    ("https://www.webhallen.com/sitemap.infoPages.xml", SitemapInfoPages),
+    ("https://www.webhallen.com/sitemap.home.xml", SitemapHome),
+    ("https://www.webhallen.com/sitemap.section.xml", SitemapSection),
+    ("https://www.webhallen.com/sitemap.category.xml", SitemapCategory),
+    ("https://www.webhallen.com/sitemap.campaign.xml", SitemapCampaign),
+    ("https://www.webhallen.com/sitemap.campaignList.xml", SitemapCampaignList),
+]
+
+STAGING_TABLE: str = "webhallen_sitemap_staging"
+
+# Downloaded sitemaps are kept in memory up to this size and then moved to disk
+SPOOL_SIZE: int = 8 * 1024 * 1024
+READ_SIZE: int = 64 * 1024
+
+
+@dataclass
+class SitemapDiff:
+    """What changed in a sitemap since the last time we loaded it."""
+
+    total: int = 0
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    fetch_seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    @property
+    def unchanged(self: SitemapDiff) -> int:
+        """URLs that are in the sitemap and didn't change."""
+        return self.total - self.added - self.changed
+
+
+def _load_staging_table(cursor: CursorWrapper, entries: Iterable[SitemapEntry]) -> int:
+    """Create the staging table for this transaction and COPY the entries into it.
+
+    Returns:
+        int: How many different URLs we got.
+    """
+    # ON COMMIT DROP only fires on commit, so an earlier run inside the same outer transaction leaves it behind
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {STAGING_TABLE} (loc text NOT NULL, priority double precision) ON COMMIT DROP",
+    )
+    with cursor.copy(f"COPY {STAGING_TABLE} (loc, priority) FROM STDIN") as copy:
+        for entry in entries:
+            copy.write_row((entry.loc, entry.priority))
+
+    # A URL can be in the sitemap more than once, keep the first one
+    cursor.execute(
+        f"DELETE FROM {STAGING_TABLE} a USING {STAGING_TABLE} b WHERE a.loc = b.loc AND a.ctid > b.ctid",  # noqa: S608
+    )
+    cursor.execute(f"CREATE INDEX ON {STAGING_TABLE} (loc)")
+    cursor.execute(f"ANALYZE {STAGING_TABLE}")
+    cursor.execute(f"SELECT count(*) FROM {STAGING_TABLE}")  # noqa: S608
+    return cursor.fetchone()[0]
+
+
+def _diff_statements(table: str, *, has_priority: bool) -> dict[str, str]:
+    """Return the SQL for the added, changed and removed URLs. Every statement returns the URLs it touched."""
+    if has_priority:
+        insert: str = (
+            f"INSERT INTO {table} (loc, priority, active, created, updated) "  # noqa: S608
+            f"SELECT s.loc, s.priority, true, now(), now() FROM {STAGING_TABLE} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.loc = s.loc) RETURNING loc"
+        )
+        update: str = (
+            f"UPDATE {table} t SET priority = s.priority, active = true, updated = now() "  # noqa: S608
+            f"FROM {STAGING_TABLE} s WHERE t.loc = s.loc "
+            "AND (t.active IS NOT TRUE OR t.priority IS DISTINCT FROM s.priority) RETURNING t.loc"
+        )
+    else:
+        insert = (
+            f"INSERT INTO {table} (loc, active, created, updated) "  # noqa: S608
+            f"SELECT s.loc, true, now(), now() FROM {STAGING_TABLE} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.loc = s.loc) RETURNING loc"
+        )
+        update = (
+            f"UPDATE {table} t SET active = true, updated = now() "  # noqa: S608
+            f"FROM {STAGING_TABLE} s WHERE t.loc = s.loc AND t.active IS NOT TRUE RETURNING t.loc"
+        )
+
+    remove: str = (
+        f"UPDATE {table} t SET active = false, updated = now() "  # noqa: S608
+        f"WHERE t.active IS NOT FALSE AND NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} s WHERE s.loc = t.loc) "
+        "RETURNING t.loc"
+    )
+    return {"added": insert, "changed": update, "removed": remove}
+
+
+def _create_history(model_class: type[models.Model], locs: list[str], *, update: bool, chunk_size: int) -> None:
+    """Create history rows for the URLs we inserted or updated with SQL."""
+    for start in range(0, len(locs), chunk_size):
+        objects: list[models.Model] = list(
+            model_class.objects.nocache().filter(loc__in=locs[start : start + chunk_size]),
+        )
+        model_class.history.bulk_history_create(objects, update=update, batch_size=chunk_size)
+
+
+def save_sitemap_entries(
+    model_class: type[models.Model],
+    entries: Iterable[SitemapEntry],
+    chunk_size: int = 1000,
+) -> SitemapDiff:
+    """Make `model_class` match the sitemap and return what changed.
+
+    Args:
+        model_class: The Sitemap* model to write to.
+        entries: Every entry in the sitemap, e.g. from stream_sitemap().
+        chunk_size: How many history rows we create at a time.
+
+    Returns:
+        SitemapDiff: How many URLs were added, changed and removed.
+    """
+    table: str = connection.ops.quote_name(model_class._meta.db_table)  # noqa: SLF001
+    statements: dict[str, str] = _diff_statements(table, has_priority=hasattr(model_class, "priority"))
+    diff = SitemapDiff()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        diff.total = _load_staging_table(cursor, entries)
+
+        for change in ("changed", "added", "removed"):
+            if change == "removed" and not diff.total:
+                # An empty sitemap is much more likely to be a broken sitemap than Webhallen removing everything
+                err_console.print(f"{model_class.__name__}: sitemap is empty, not marking anything as removed")
+                continue
+
+            cursor.execute(statements[change])
+            locs: list[str] = [row[0] for row in cursor.fetchall()]
+            setattr(diff, change, len(locs))
+            _create_history(model_class, locs, update=change != "added", chunk_size=chunk_size)
+
+        invalidate_model(model_class)
+
+    return diff
+
+
+def ingest_sitemap(url: str, model_class: type[models.Model]) -> SitemapDiff:
+    """Download a sitemap and make `model_class` match it.
+
+    Args:
+        url: URL to the sitemap.
+        model_class: The Sitemap* model to write to.
+
+    Returns:
+        SitemapDiff: How many URLs were added, changed and removed.
+    """
+    return save_sitemap_entries(model_class, stream_sitemap(url))
+
+
+def sitemap_name(url: str) -> str:
+    """Return the file name of a sitemap, e.g. sitemap.product.xml."""
+    return url.rsplit("/", 1)[-1]
+
+
+def download_sitemap(url: str, client: ScrapingClient | None = None) -> tuple[IO[bytes], float]:
+    """Download a sitemap to a temporary file.
+
+    Args:
+        url: URL to the sitemap.
+        client: The client to use. Defaults to the shared client.
+
+    Returns:
+        tuple[IO[bytes], float]: The file, rewound to the start, and how many seconds the download took.
+    """
+    client = client or get_client()
+    started: float = time.perf_counter()
+    file: IO[bytes] = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        with client.stream(url) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                file.write(chunk)
+    except BaseException:
+        file.close()
+        raise
+
+    file.seek(0)
+    return file, time.perf_counter() - started
+
+
+def ingest_sitemaps(
+    sitemaps: list[tuple[str, type[models.Model]]],
+    client: ScrapingClient | None = None,
+) -> dict[str, SitemapDiff]:
+    """Download sitemaps concurrently and load each one into its model as soon as it has been downloaded.
+
+    The downloads run in threads. The database writes happen in the calling thread, one sitemap at a time.
+    A sitemap that fails to download is logged and left out of the result; the others are still loaded.
+
+    Args:
+        sitemaps: URL and Sitemap* model for each sitemap.
+        client: The client to use. Defaults to the shared client.
+
+    Returns:
+        dict[str, SitemapDiff]: What changed in each sitemap, keyed by sitemap name.
+    """
+    diffs: dict[str, SitemapDiff] = {}
+    with ThreadPoolExecutor(max_workers=len(sitemaps) or 1, thread_name_prefix="sitemap") as pool:
+        futures: dict[Future, tuple[str, type[models.Model]]] = {
+            pool.submit(download_sitemap, url, client): (url, model_class) for url, model_class in sitemaps
+        }
+        for future in as_completed(futures):
+            url, model_class = futures[future]
+            try:
+                file, fetch_seconds = future.result()
+            except httpx.HTTPError as e:
+                err_console.print(f"Error downloading {url}: {e}")
+                continue
+
+            with file:
+                started: float = time.perf_counter()
+                chunks: Iterator[bytes] = iter(functools.partial(file.read, READ_SIZE), b"")
+                diff: SitemapDiff = save_sitemap_entries(model_class, parse_sitemap(chunks))
+                diff.write_seconds = time.perf_counter() - started
+            diff.fetch_seconds = fetch_seconds
+            diffs[sitemap_name(url)] = diff
+    return diffs
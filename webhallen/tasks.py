@@ -9,90 +9,103 @@ Tasks:
         Scrape a single product from Webhallen API and return the JSON.
     - scrape_products
         Scrape products from Webhallen sitemap and save them to the database.
+    - fetch_webhallen_product
+        Fetch one product and save it, scheduling a retry if it fails.
+    - requeue_webhallen_retries
+        Schedule retries again whose task got lost.
+    - crawl_webhallen_products
+        Scrape all products in the product sitemap concurrently and save them to the database in batches.
+    - enqueue_webhallen_products
+        Add every product in the product sitemap to the product queue.
+    - drain_webhallen_product_queue
+        Claim products from the product queue and scrape them until the queue is empty or we run out of time.
     - create_sections
-        Loop through all JSON objects and create sections.
+        Create and update sections from the products that changed since the last run.
     - scrape_sitemaps
-        Scrape all sitemaps.
+        Scrape all sitemaps concurrently.
+    - write_webhallen_snapshot
+        Convert the products that changed and write every product to the pre-compressed snapshot files.
 """
 
 from __future__ import annotations
 
+import asyncio
+import os
 import re
-from functools import lru_cache
+import socket
+import time
+from dataclasses import asdict
+from typing import TYPE_CHECKING
 
 import httpx
-import orjson
 from celery import shared_task
-from django.db import models, transaction
 from rich import print
 from rich.console import Console
 from rich.progress import track
-from sitemap_parser.exporter import JSONExporter
-from sitemap_parser.sitemap_parser import SiteMapParser
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-
-from webhallen.models import (
-    SitemapArticle,
-    SitemapCampaign,
-    SitemapCampaignList,
-    SitemapCategory,
-    SitemapHome,
-    SitemapInfoPages,
-    SitemapManufacturer,
-    SitemapProduct,
-    SitemapRoot,
-    SitemapSection,
-    WebhallenJSON,
-    WebhallenSection,
+
+from panso.scraping import get_client, metrics, stream_sitemap
+from webhallen.conversion import ConversionStats, convert_products
+from webhallen.crawler import (
+    CrawlStats,
+    crawl_products,
+    parse_product_response,
+    product_api_url,
+    product_id_from_url,
 )
+from webhallen.export import write_products_snapshot
+from webhallen.models import SitemapProduct, SitemapRoot, WebhallenProductRetry
+from webhallen.queue import claim_products, complete_products, sync_product_queue
+from webhallen.retries import claim_retry, clear_retries, due_retries, record_failure
+from webhallen.sections import SectionChanges, derive_sections
+from webhallen.sitemaps import ROOT_SITEMAP, SITEMAPS, SitemapDiff, ingest_sitemap, ingest_sitemaps
+from webhallen.writer import ProductWriter
+
+if TYPE_CHECKING:
+    from django.db import models
 
 err_console = Console(stderr=True)
 
 
-@retry(stop=stop_after_attempt(3))
-def scrape_sitemap_root() -> None:
-    """Scrape the root sitemap."""
-    sitemap = "https://www.webhallen.com/sitemap.xml"
-    sm = SiteMapParser(sitemap)
-    json_exporter = JSONExporter(sm)
-    urls_json = json_exporter.export_sitemaps()
-    urls_json = orjson.loads(urls_json)
-    sitemap_objects: list[SitemapRoot] = [SitemapRoot(loc=url["loc"], active=True) for url in urls_json]
-    with transaction.atomic():
-        SitemapRoot.objects.bulk_create(sitemap_objects)
-    print(f"Done scraping sitemap.xml, {len(sitemap_objects)} sitemaps found")
-
-
-@retry(stop=stop_after_attempt(3))
-def scrape_sitemap(url: str, model_class: type[models.Model], model_name: str) -> None:
-    """Scrape a sitemap.xml and store the data in the specified model."""
-    sm = SiteMapParser(url)
-    json_exporter = JSONExporter(sm)
-    urls_json = json_exporter.export_urls()
-    urls_json = orjson.loads(urls_json)
-
-    sitemap_objects: list[models.Model] = [
-        model_class(loc=url["loc"], active=True, priority=url["priority"]) for url in urls_json
-    ]
-
-    with transaction.atomic():
-        model_class.objects.bulk_create(
-            sitemap_objects,
-            update_fields=["active", "priority"],
-            ignore_conflicts=True,
-        )
+def scrape_sitemap_root() -> dict[str, int]:
+    """Scrape the root sitemap.
+
+    Returns:
+        dict[str, int]: How many sitemaps were added, changed and removed.
+    """
+    diff: SitemapDiff = ingest_sitemap(ROOT_SITEMAP, SitemapRoot)
+    print(f"Done scraping sitemap.xml, {diff.total} sitemaps found")
+    return asdict(diff)
+
 
-    print(f"Done scraping {model_name}, {len(sitemap_objects)} urls found")
+def scrape_sitemap(url: str, model_class: type[models.Model], model_name: str) -> dict[str, int]:
+    """Scrape a sitemap.xml and make the specified model match it.
+
+    Args:
+        url: URL to the sitemap.
+        model_class: The Sitemap* model to write to.
+        model_name: Name of the sitemap, for logging.
+
+    Returns:
+        dict[str, int]: How many URLs were added, changed and removed.
+    """
+    diff: SitemapDiff = ingest_sitemap(url, model_class)
+    print(
+        f"Done scraping {model_name}, {diff.total} urls found: "
+        f"{diff.added} added, {diff.changed} changed, {diff.removed} removed",
+    )
+    return asdict(diff)
 
 
 # TODO(TheLovinator): Remove Rich and use logging instead  # noqa: TD003
 err_console = Console(stderr=True)
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_random_exponential(multiplier=1, max=30))
 def scrape_product(product_id: str, product_url: str) -> dict:
     """Scrape a single product from Webhallen API and return the JSON.
 
+    The request is sent once. Failed products are retried later with schedule_retry() instead of
+    sleeping here.
+
     Args:
         product_id: The product ID.
         product_url: URL to API. This contains the JSON.
@@ -103,26 +116,19 @@ def scrape_product(product_id: str, product_url: str) -> dict:
         httpx.HTTPError: If the JSON is empty.
 
     Returns:
-        The JSON response.
+        The JSON response with our metadata added.
     """
     try:
-        response: httpx.Response = httpx.get(product_url)
+        response: httpx.Response = get_client().get(product_url, retry=False)
     except httpx.HTTPError as e:
         err_console.print(f"Error getting product {product_id}: {e}")
         raise e from None
 
-    if response.text.startswith("<!DOCTYPE html>"):
-        msg: str = f"Probably 404? https://www.webhallen.com/api/v1/product/{product_id}"
-        err_console.print(msg)
-        raise httpx.HTTPError(msg)
-
-    product_json = response.json()
-    if not product_json:
-        msg: str = f"Empty JSON response for https://www.webhallen.com/api/v1/product/{product_id}"
-        err_console.print(f"Error getting product {product_id}: {msg}")
-        raise httpx.HTTPError(msg)
-
-    return dict(product_json)
+    try:
+        return parse_product_response(product_id, response)
+    except httpx.HTTPError as e:
+        err_console.print(f"Error getting product {product_id}: {e}")
+        raise
 
 
 @shared_task(
@@ -138,14 +144,9 @@ def scrape_products() -> None:
     # TODO(TheLovinator): #39 Use Celery Beat to scrape products every 24 hours
     # https://github.com/TheLovinator1/panso.se/issues/39
     sitemap = "https://www.webhallen.com/sitemap.product.xml"
-    sm = SiteMapParser(sitemap)
-    json_exporter = JSONExporter(sm)
-    urls_json = json_exporter.export_urls()
-    urls_json = orjson.loads(urls_json)
-
-    print(f"Got {len(urls_json)} products from Webhallen sitemap")
-    for url in track(urls_json, description="Scraping products...", total=len(urls_json)):
-        loc: str = url["loc"]
+    writer = ProductWriter()
+    for entry in track(stream_sitemap(sitemap), description="Scraping products..."):
+        loc: str = entry.loc
 
         product_id: str | None = match.group() if (match := re.search(r"\d+", loc)) else None
         if not product_id:
@@ -155,165 +156,286 @@ def scrape_products() -> None:
         product_url: str = f"https://www.webhallen.com/api/v1/product/{product_id}"
         print(f"GET {product_url}")
 
-        product_json: dict = scrape_product(product_id, product_url)
+        try:
+            product_json: dict = scrape_product(product_id, product_url)
+        except (httpx.HTTPError, ValueError) as e:
+            schedule_retry(record_failure(int(product_id), e))
+            continue
 
-        # Add our own metadata
-        metadata: dict[str, str] = {
-            "product_id": product_id,
-            "product_url": product_url,
-        }
-        product_json["metadata"] = metadata
+        writer.add(int(product_id), product_json)
+        if writer.should_flush:
+            write_products(writer)
 
-        product, created = WebhallenJSON.objects.get_or_create(
-            product_id=product_id,
-            defaults={"product_json": product_json},
+    write_products(writer)
+    print("Done!")
+    write_webhallen_snapshot.delay()
+
+
+def write_products(writer: ProductWriter) -> None:
+    """Write the products the writer has buffered in one batch, and forget the failures of those products.
+
+    Products that haven't changed since last time are not written again, but their failures are forgotten too.
+
+    Args:
+        writer: The writer with the scraped products.
+    """
+    batch: dict[int, dict] = writer.drain()
+    writer.write(batch)
+    clear_retries(batch)
+
+
+def schedule_retry(retry: WebhallenProductRetry) -> None:
+    """Schedule fetch_webhallen_product for a failed product at its next_attempt_at.
+
+    Args:
+        retry: What record_failure() returned. Nothing is scheduled for dead products.
+    """
+    if retry.status == WebhallenProductRetry.Status.DEAD:
+        err_console.print(
+            f"Giving up on product {retry.product_id} after {retry.attempts} attempts: {retry.error_class}",
         )
+        return
 
-        if created:
-            print(f"Created {product_id}")
-        product.save()
+    fetch_webhallen_product.apply_async(
+        args=(retry.product_id,),
+        kwargs={"attempt": retry.attempts},
+        eta=retry.next_attempt_at,
+    )
 
-    print("Done!")
 
+@shared_task(
+    name="fetch_webhallen_product",
+    soft_time_limit=60,
+    queue="webhallen",
+)
+def fetch_webhallen_product(product_id: int, attempt: int | None = None) -> bool:
+    """Fetch one product and save it, scheduling a retry if it fails.
 
-@lru_cache(maxsize=20)
-def get_section_url(section_id: str | None) -> str | None:
-    """Return section URL."""
-    if not section_id:
-        err_console.print(f"Error getting section URL for {section_id}")
-        return None
+    Args:
+        product_id: The product ID.
+        attempt: The attempt this task was scheduled for by schedule_retry(). If the product has been fetched
+            or scheduled again since, the task does nothing.
 
-    sections = WebhallenSection.objects.all()
-    for section in sections:
-        section_url: str | None = section.url
-        if not section_url:
-            continue
-        section_name: str = section.name or ""
-        if section_url.startswith(f"https://www.webhallen.com/se/section/{section_id}-"):
-            print(f"{section_id} - {section_name}")
-            print(f"\t{section_url}")
-            return section_url
+    Returns:
+        bool: If the product was fetched.
+    """
+    if attempt is not None and not claim_retry(product_id, attempt):
+        print(f"Retry {attempt} of product {product_id} is stale, skipping")
+        return False
 
-    section_id_presentkort = 19
-    if section_id == section_id_presentkort:
-        # Has no URL so we use something close
-        return "https://www.webhallen.com/se/info/28-Kop-presentkort"
+    try:
+        product_json: dict = scrape_product(str(product_id), product_api_url(product_id))
+    except (httpx.HTTPError, ValueError) as e:
+        schedule_retry(record_failure(product_id, e))
+        return False
 
-    err_console.print(f"Error getting section URL for {section_id}")
-    return None
+    writer = ProductWriter(batch_size=1)
+    writer.add(product_id, product_json)
+    writer.flush()
+    clear_retries([product_id])
+    return True
 
 
-@lru_cache(maxsize=20)
-def get_section_icon_url(icon: str | None, name: str | None) -> str | None:
-    """Return section icon URL.
+@shared_task(
+    name="requeue_webhallen_retries",
+    soft_time_limit=60,
+    queue="webhallen",
+)
+def requeue_webhallen_retries(limit: int = 1000) -> int:
+    """Schedule retries again whose task should have run long ago, e.g. because Redis lost it.
 
     Args:
-        icon: Section icon name
-        name: Section name
+        limit: Maximum number of retries to schedule.
+
+    Returns:
+        int: How many retries were scheduled.
+    """
+    retries: list[WebhallenProductRetry] = due_retries(limit=limit)
+    for retry in retries:
+        fetch_webhallen_product.apply_async(args=(retry.product_id,), kwargs={"attempt": retry.attempts})
+
+    print(f"Requeued {len(retries)} overdue retries")
+    return len(retries)
+
+
+def get_product_ids() -> list[int]:
+    """Return the product IDs for every active URL in the product sitemap.
+
+    The product sitemap is scraped by scrape_sitemaps, so we don't have to download it again.
 
     Returns:
-        str: URL to section icon
+        list[int]: Product IDs, e.g. 123456 for https://www.webhallen.com/se/product/123456-Product-Name
     """
-    # TODO(TheLovinator): #40 Save icon to disk and return URL?
-    # https://github.com/TheLovinator1/panso.se/issues/40
-    icon_hex_color: str = "1A1A1D"
-    if not icon:
-        if name != "Presentkort":
-            err_console.print(f"Error getting section icon URL for {name}")
-        return None
-    icon_url: str = f"https://cdn.webhallen.com/api/dynimg/category/{icon}/{icon_hex_color}"
+    product_ids: list[int] = []
+    for loc in SitemapProduct.objects.filter(active=True).values_list("loc", flat=True).iterator():
+        product_id: int | None = product_id_from_url(loc)
+        if not product_id:
+            err_console.print(f"Could not get product ID from {loc}")
+            continue
+        product_ids.append(product_id)
+    return product_ids
 
-    print(f"\t{icon_url}")
-    return icon_url
 
+@shared_task(
+    name="crawl_webhallen_products",
+    max_retries=7,
+    retry_backoff=5,
+    soft_time_limit=60 * 60 * 12,
+    queue="webhallen",
+)
+def crawl_webhallen_products(
+    concurrency: int | None = None,
+    rate: float | None = None,
+    batch_size: int | None = None,
+    *,
+    replay: bool = False,
+) -> None:
+    """Scrape all products in the product sitemap concurrently and save them to the database in batches.
 
-def mark_sections_inactive() -> None:
-    """Mark all sections as inactive."""
-    sections = WebhallenSection.objects.all()
-    for section in sections:
-        section.active = False
-    WebhallenSection.objects.bulk_update(sections, ["active"])
+    Args:
+        concurrency: How many requests we have in flight at the same time. Defaults to SCRAPING_HOSTS.
+        rate: Maximum requests per second to webhallen.com. Defaults to SCRAPING_HOSTS.
+        batch_size: How many products we write to the database at a time. Defaults to WEBHALLEN_WRITER_BATCH_SIZE.
+        replay: Read the products from the response archive instead of the API.
+    """
+    writer = ProductWriter(batch_size=batch_size)
+    stats: CrawlStats = asyncio.run(
+        crawl_products(get_product_ids(), writer=writer, concurrency=concurrency, rate=rate, replay=replay),
+    )
+    for product_id, error in stats.failed.items():
+        err_console.print(f"Failed to get {product_id}: {error}")
+
+    # Products from the archive say nothing about whether Webhallen works now
+    if not replay:
+        clear_retries(stats.fetched)
+        for product_id, error in stats.failed.items():
+            schedule_retry(record_failure(product_id, error))
+    metrics.print_summary()
+    write_webhallen_snapshot.delay()
 
 
 @shared_task(
-    bind=True,
-    name="create_webhallen_sections",
+    name="enqueue_webhallen_products",
     max_retries=7,
     retry_backoff=5,
     soft_time_limit=60,
     queue="webhallen",
 )
-def create_sections() -> None:
-    """Loop through all JSON objects and create sections."""
-    mark_sections_inactive()
-
-    new_sections = []
-    products = WebhallenJSON.objects.all()
-    for json in track(products, description="Processing...", total=products.count()):
-        product_json: dict = dict(json.product_json).get("product", {})
-        if not product_json:
-            err_console.print(f"Error getting product JSON {json.product_id}")
-            continue
+def enqueue_webhallen_products() -> None:
+    """Add every product in the product sitemap to the product queue."""
+    sync_product_queue()
 
-        section: dict = product_json.get("section", {})
-        if not section:
-            err_console.print(f"Error getting section JSON {json.product_id}")
-            continue
 
-        section_id: str | None = section.get("id")
-        meta_title: str | None = product_json.get("metaTitle")
-        active: bool | None = section.get("active")
-        name: str | None = section.get("name")
-        url: str | None = get_section_url(section_id=section_id)
-        icon: str | None = section.get("icon")
-        icon_url: str | None = get_section_icon_url(icon=icon, name=name)
-
-        new_sections.append(
-            WebhallenSection(
-                section_id=section_id,
-                url=url,
-                meta_title=meta_title,
-                active=active,
-                icon=icon,
-                icon_url=icon_url,
-                name=name,
-            ),
-        )
+@shared_task(
+    name="drain_webhallen_product_queue",
+    max_retries=7,
+    retry_backoff=5,
+    soft_time_limit=60 * 60,
+    queue="webhallen",
+)
+def drain_webhallen_product_queue(
+    batch_size: int = 200,
+    time_budget: int = 50 * 60,
+    concurrency: int | None = None,
+    rate: float | None = None,
+) -> None:
+    """Claim products from the product queue and scrape them until the queue is empty or we run out of time.
 
-    with transaction.atomic():
-        sections: list[WebhallenSection] = WebhallenSection.objects.bulk_create(
-            new_sections,
-            update_fields=["url", "meta_title", "active", "icon", "icon_url", "name"],
-            ignore_conflicts=True,
+    Start as many of these as you want, on as many hosts as you want. Each one only gets products that
+    nobody else has claimed.
+
+    Args:
+        batch_size: How many products we claim at a time. This is also how much work is lost if we crash.
+        time_budget: Seconds after which we stop claiming new batches, so we finish before soft_time_limit.
+        concurrency: How many requests we have in flight at the same time. Defaults to SCRAPING_HOSTS.
+        rate: Maximum requests per second to webhallen.com from this worker. Defaults to SCRAPING_HOSTS.
+    """
+    owner: str = f"{socket.gethostname()}:{os.getpid()}"
+    deadline: float = time.monotonic() + time_budget
+    writer = ProductWriter()
+
+    while time.monotonic() < deadline:
+        product_ids: list[int] = claim_products(owner=owner, limit=batch_size)
+        if not product_ids:
+            print("Product queue is empty")
+            break
+
+        stats: CrawlStats = asyncio.run(
+            crawl_products(product_ids, writer=writer, concurrency=concurrency, rate=rate),
         )
-        print(f"Created {len(sections)} sections" if sections else "No sections created")
+        complete_products(owner=owner, stats=stats)
+
+    metrics.print_summary()
+
+
+@shared_task(
+    name="create_webhallen_sections",
+    max_retries=7,
+    retry_backoff=5,
+    soft_time_limit=60,
+    queue="webhallen",
+)
+def create_sections(*, full: bool = False) -> dict[str, int]:
+    """Create and update sections from the products that changed since the last run.
+
+    Args:
+        full: Read every product instead of only the ones updated since the last run.
+
+    Returns:
+        dict[str, int]: How many products were read and how many sections were created and changed.
+    """
+    changes: SectionChanges = derive_sections(full=full)
+    print(
+        f"Read the section of {changes.scanned} products: "
+        f"{changes.created} sections created, {changes.changed} changed",
+    )
+    return asdict(changes)
 
 
 @shared_task(
-    bind=True,
     name="scrape_sitemaps",
     max_retries=7,
     retry_backoff=5,
     soft_time_limit=60,
     queue="webhallen",
 )
-def scrape_sitemaps() -> None:
-    """Scrape all sitemaps."""
-    # TODO(TheLovinator): #41 Should we use Celery jobs instead of loop?
-    # https://github.com/TheLovinator1/panso.se/issues/41
-    sitemaps = [
-        ("https://www.webhallen.com/sitemap.product.xml", SitemapProduct, "sitemap.product.xml"),
-        ("https://www.webhallen.com/sitemap.manufacturer.xml", SitemapManufacturer, "sitemap.manufacturer.xml"),
-        ("https://www.webhallen.com/sitemap.article.xml", SitemapArticle, "sitemap.article.xml"),
-        ("https://www.webhallen.com/sitemap.infoPages.xml", SitemapInfoPages, "sitemap.infoPages.xml"),
-        ("https://www.webhallen.com/sitemap.home.xml", SitemapHome, "sitemap.home.xml"),
-        ("https://www.webhallen.com/sitemap.section.xml", SitemapSection, "sitemap.section.xml"),
-        ("https://www.webhallen.com/sitemap.category.xml", SitemapCategory, "sitemap.category.xml"),
-        ("https://www.webhallen.com/sitemap.campaign.xml", SitemapCampaign, "sitemap.campaign.xml"),
-        ("https://www.webhallen.com/sitemap.campaignList.xml", SitemapCampaignList, "sitemap.campaignList.xml"),
-    ]
-
-    for url, model_class, model_name in sitemaps:
-        scrape_sitemap(url=url, model_class=model_class, model_name=model_name)
-
-    scrape_sitemap_root()  # Needs to be standalone because it doesn't have priority
+def scrape_sitemaps() -> dict[str, dict[str, int | float]]:
+    """Scrape all sitemaps.
+
+    The sitemaps are downloaded at the same time and written to the database one after another.
+
+    Returns:
+        dict[str, dict[str, int | float]]: What changed in each sitemap and how long it took, keyed by sitemap name.
+    """
+    started: float = time.perf_counter()
+    diffs: dict[str, SitemapDiff] = ingest_sitemaps([*SITEMAPS, (ROOT_SITEMAP, SitemapRoot)])
+    for name, diff in diffs.items():
+        print(
+            f"{name}: {diff.total} urls, {diff.added} added, {diff.changed} changed, {diff.removed} removed "
+            f"(fetch {diff.fetch_seconds:.1f}s, write {diff.write_seconds:.1f}s)",
+        )
+    print(f"Scraped {len(diffs)} sitemaps in {time.perf_counter() - started:.1f}s")
+    return {name: asdict(diff) for name, diff in diffs.items()}
+
+
+@shared_task(
+    name="write_webhallen_snapshot",
+    soft_time_limit=60 * 30,
+    queue="webhallen",
+)
+def write_webhallen_snapshot() -> dict:
+    """Convert the products that changed and write every product to the pre-compressed snapshot files.
+
+    Returns:
+        dict: The manifest of the new snapshot.
+    """
+    conversion: ConversionStats = convert_products()
+    print(f"Converted {conversion.created} new and {conversion.changed} changed products")
+
+    manifest: dict = write_products_snapshot()
+    sizes: str = ", ".join(
+        f"{name} {files['identity']['size']:,} bytes ({files['br']['size']:,} with brotli)"
+        for name, files in manifest["formats"].items()
+    )
+    print(f"Wrote snapshot {manifest['version']}: {sizes}")
+    return manifest
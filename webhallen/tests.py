@@ -7,13 +7,56 @@ https://docs.djangoproject.com/en/5.0/topics/testing/
 
 from __future__ import annotations
 
+import csv
+import datetime
+import tempfile
+import typing
+from decimal import Decimal
+from pathlib import Path
 from typing import TYPE_CHECKING
+from unittest import mock
 
-from django.test import TestCase
+import httpx
+import orjson
+import pytest
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from panso.scraping import HostPolicy, ScrapeMetrics, ScrapingClient, SitemapEntry
+from panso.streams import encode_json_array
+from products.versions import models_version
+from webhallen import tasks
+from webhallen.api import SectionOut, SitemapRootOut, SitemapUrlOut
+from webhallen.conversion import PRODUCT_COLUMNS, ConversionStats, convert_products, plan_ranges, product_row
+from webhallen.crawler import CrawlStats, crawl_policy, parse_product_response
+from webhallen.deltas import apply_patch, make_patch
+from webhallen.export import PRODUCTS_SNAPSHOT, product_documents
+from webhallen.models import (
+    SitemapHome,
+    SitemapProduct,
+    SitemapRoot,
+    SitemapSection,
+    WebhallenJSON,
+    WebhallenJSONRevision,
+    WebhallenPricePoint,
+    WebhallenProduct,
+    WebhallenProductQueue,
+    WebhallenProductRetry,
+    WebhallenSection,
+    WebhallenWatermark,
+)
+from webhallen.prices import backfill_prices, price_history
+from webhallen.queue import claim_products, complete_products, sync_product_queue
+from webhallen.retries import claim_retry, clear_retries, due_retries, record_failure
+from webhallen.revisions import compact_history, reconstruct
+from webhallen.sections import SectionChanges, build_section_index, derive_sections, get_section_index
+from webhallen.sitemaps import SitemapDiff, ingest_sitemaps, save_sitemap_entries
+from webhallen.writer import ProductWriter
 
 if TYPE_CHECKING:
-    from django.http import HttpResponse
+    from django.http import HttpResponse, StreamingHttpResponse
 
 
 class WebhallenTests(TestCase):
@@ -35,15 +78,55 @@ class WebhallenAPITests(TestCase):
     # https://github.com/TheLovinator1/panso.se/issues/31
     def test_api_products(self: WebhallenAPITests) -> None:
         """Test the API endpoint for all products."""
-        response: HttpResponse = self.client.get("/api/v1/webhallen/products")
+        response: StreamingHttpResponse = self.client.get("/api/v1/webhallen/products")
         assert response.status_code == 200
         assert response["Content-Type"] == "application/json"
-        assert response.json() == []
+        assert orjson.loads(b"".join(response.streaming_content)) == []
+
+    def test_api_products_stream(self: WebhallenAPITests) -> None:
+        """Test that the products are streamed in chunks as a JSON array or as NDJSON."""
+        for product_id in range(1, 4):
+            WebhallenJSON.objects.create(product_id=product_id, product_json={"product": {"id": product_id, "a": "\n"}})
+        WebhallenJSON.objects.create(product_id=4, product_json={"error": "not found"})
+
+        chunks: list[bytes] = list(encode_json_array(product_documents(chunk_size=2), chunk_size=2))
+        assert len(chunks) == 3
+        assert [product["id"] for product in orjson.loads(b"".join(chunks))] == [3, 2, 1]
+
+        response: StreamingHttpResponse = self.client.get(
+            "/api/v1/webhallen/products",
+            headers={"Accept": "application/x-ndjson, application/json;q=0.9"},
+        )
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines: list[bytes] = b"".join(response.streaming_content).splitlines()
+        assert [orjson.loads(line) for line in lines] == [{"id": product_id, "a": "\n"} for product_id in (3, 2, 1)]
 
     def test_api_product(self: WebhallenAPITests) -> None:
         """Test the API endpoint for a single product."""
-        # TODO(TheLovinator): #31 Add product data to the test database and test the API endpoint.
-        # https://github.com/TheLovinator1/panso.se/issues/31
+        WebhallenJSON.objects.create(product_id=1, product_json={"product": {"id": 1, "name": "Grafikkort"}})
+        WebhallenJSON.objects.create(product_id=2, product_json={"error": "Not found"})
+
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products/1")
+        assert response["Content-Type"] == "application/json"
+        assert response.json() == {"id": 1, "name": "Grafikkort"}
+        assert self.client.get("/api/v1/webhallen/products/2").json() == {}
+
+        response = self.client.get("/api/v1/webhallen/products/3")
+        assert response.status_code == 404
+        assert response.json() == {"error": "Product with ID 3 not found."}
+
+    def test_response_schemas(self: WebhallenAPITests) -> None:
+        """Test that the rows read with the precomputed field lists match the response schemas."""
+        WebhallenSection.objects.create(section_id=8, name="Grafikkort", url="https://www.webhallen.com/se/8")
+        SitemapHome.objects.create(loc="https://www.webhallen.com/se", priority=0.5, active=True)
+        SitemapRoot.objects.create(loc="https://www.webhallen.com/sitemap.home.xml", active=True)
+
+        sections: list[dict] = self.client.get("/api/v1/webhallen/sections").json()
+        assert [SectionOut.model_validate(section).name for section in sections] == ["Grafikkort"]
+        home: list[dict] = self.client.get("/api/v1/webhallen/sitemaps/home").json()
+        assert SitemapUrlOut.model_validate(home[0]).priority == 0.5
+        root: list[dict] = self.client.get("/api/v1/webhallen/sitemaps/root").json()
+        assert set(root[0]) == set(SitemapRootOut.model_fields)
 
     def test_api_sitemaps_root(self: WebhallenAPITests) -> None:
         """Test the API endpoint for the root sitemap."""
@@ -121,3 +204,671 @@ class WebhallenAPITests(TestCase):
         assert response.status_code == 200
         assert response["Content-Type"] == "application/json"
         assert response.json() == []
+
+
+class CrawlerTests(SimpleTestCase):
+    """Tests for the Webhallen product crawler."""
+
+    def test_parse_product_response(self: CrawlerTests) -> None:
+        """Test that we add our metadata to the product JSON."""
+        response = httpx.Response(200, json={"product": {"id": 1, "name": "Test"}})
+        product_json: dict = parse_product_response(1, response)
+        assert product_json["product"]["name"] == "Test"
+        assert product_json["metadata"] == {
+            "product_id": "1",
+            "product_url": "https://www.webhallen.com/api/v1/product/1",
+        }
+
+    def test_crawl_policy(self: CrawlerTests) -> None:
+        """Test that the crawl uses the limits from SCRAPING_HOSTS unless they are passed in."""
+        assert crawl_policy() == HostPolicy(rate=8.0, concurrency=16, max_rate=16.0)
+        assert crawl_policy(concurrency=4) == HostPolicy(rate=8.0, concurrency=4, max_rate=16.0)
+        assert crawl_policy(rate=2.0) == HostPolicy(rate=2.0, concurrency=16)
+
+        with override_settings(SCRAPING_HOSTS={"www.webhallen.com": {"rate": 1.0, "concurrency": 2}}):
+            assert crawl_policy() == HostPolicy(rate=1.0, concurrency=2)
+
+    def test_parse_product_response_html(self: CrawlerTests) -> None:
+        """Test that a HTML page is treated as an error."""
+        response = httpx.Response(200, text="<!DOCTYPE html><html></html>")
+        with pytest.raises(httpx.HTTPError):
+            parse_product_response(1, response)
+
+
+class ProductWriterTests(TestCase):
+    """Tests for the buffered product writer."""
+
+    def test_write_batch(self: ProductWriterTests) -> None:
+        """Test that buffered products are written and updated."""
+        writer = ProductWriter(batch_size=2)
+        writer.add(1, {"product": {"name": "One"}})
+        assert not writer.full
+        writer.add(2, {"product": {"name": "Two"}})
+        assert writer.full
+        assert writer.flush() == 2
+        assert len(writer) == 0
+
+        writer.add(1, {"product": {"name": "One again"}})
+        writer.flush()
+        assert WebhallenJSON.objects.count() == 2
+        assert WebhallenJSON.objects.get(product_id=1).product_json["product"]["name"] == "One again"
+
+    def test_skip_unchanged(self: ProductWriterTests) -> None:
+        """Test that a product with the same content is not written again."""
+        writer = ProductWriter()
+        writer.add(1, {"product": {"name": "One", "price": 100}, "metadata": {"product_id": "1"}})
+        assert writer.flush() == 1
+
+        # Same product, keys in a different order and different metadata
+        writer.add(1, {"metadata": {"product_id": "one"}, "product": {"price": 100, "name": "One"}})
+        assert writer.flush() == 0
+        assert writer.skipped == 1
+        assert WebhallenJSON.history.filter(product_id=1).count() == 1
+
+        writer.add(1, {"product": {"name": "One", "price": 90}})
+        assert writer.flush() == 1
+        assert list(WebhallenJSON.history.filter(product_id=1).values_list("history_type", flat=True)) == ["~", "+"]
+
+
+class ProductQueueTests(TestCase):
+    """Tests for the lease-based product queue."""
+
+    def setUp(self: ProductQueueTests) -> None:
+        SitemapProduct.objects.create(loc="https://www.webhallen.com/se/product/1-One", active=True)
+        SitemapProduct.objects.create(loc="https://www.webhallen.com/se/product/2-Two", active=True)
+        SitemapProduct.objects.create(loc="https://www.webhallen.com/se/product/3-Three", active=False)
+        sync_product_queue()
+
+    def test_sync_product_queue(self: ProductQueueTests) -> None:
+        """Test that only active sitemap products are queued and that syncing twice is harmless."""
+        sync_product_queue()
+        assert sorted(WebhallenProductQueue.objects.values_list("product_id", flat=True)) == [1, 2]
+
+    def test_claim_and_complete(self: ProductQueueTests) -> None:
+        """Test that claimed products can't be claimed again until they are completed."""
+        claimed: list[int] = claim_products(owner="worker-1", limit=10)
+        assert sorted(claimed) == [1, 2]
+        assert claim_products(owner="worker-2", limit=10) == []
+
+        complete_products(owner="worker-1", stats=CrawlStats(fetched=[1], failed={2: "HTTPError"}))
+        ok: WebhallenProductQueue = WebhallenProductQueue.objects.get(product_id=1)
+        failed: WebhallenProductQueue = WebhallenProductQueue.objects.get(product_id=2)
+        assert ok.last_status == WebhallenProductQueue.Status.OK
+        assert ok.lease_owner is None
+        assert failed.last_status == WebhallenProductQueue.Status.ERROR
+        assert failed.attempts == 1
+
+        # Neither is due yet
+        assert claim_products(owner="worker-2", limit=10) == []
+
+
+@override_settings(WEBHALLEN_RETRY_MAX_ATTEMPTS=3, WEBHALLEN_RETRY_BASE_DELAY=60, WEBHALLEN_RETRY_MAX_DELAY=600)
+class ProductRetryTests(TestCase):
+    """Tests for the retry table and the delayed retry tasks."""
+
+    def test_record_failure_until_dead(self: ProductRetryTests) -> None:
+        """Test that failures are counted with their error and that we give up after the last attempt."""
+        first: WebhallenProductRetry = record_failure(1, httpx.ConnectTimeout("timed out"))
+        assert first.attempts == 1
+        assert first.error_class == "ConnectTimeout"
+        assert first.error_message == "timed out"
+        assert first.status == WebhallenProductRetry.Status.PENDING
+        assert timezone.now() < first.next_attempt_at <= timezone.now() + datetime.timedelta(seconds=60)
+
+        second: WebhallenProductRetry = record_failure(1, "HTTPError")
+        assert second.attempts == 2
+        assert second.error_class == "HTTPError"
+
+        dead: WebhallenProductRetry = record_failure(1, "HTTPError")
+        assert dead.status == WebhallenProductRetry.Status.DEAD
+        assert dead.next_attempt_at is None
+        assert list(WebhallenProductRetry.objects.filter(status="dead").values_list("product_id", flat=True)) == [1]
+
+    def test_claim_retry_once(self: ProductRetryTests) -> None:
+        """Test that only one task gets a due retry and that stale tasks get nothing."""
+        record_failure(1, "HTTPError")
+        assert not claim_retry(1, attempt=1), "not due yet"
+
+        WebhallenProductRetry.objects.filter(product_id=1).update(next_attempt_at=timezone.now())
+        assert not claim_retry(1, attempt=0), "scheduled for an older attempt"
+        assert claim_retry(1, attempt=1)
+        assert not claim_retry(1, attempt=1), "already claimed"
+
+    def test_due_retries_and_clear(self: ProductRetryTests) -> None:
+        """Test that overdue retries are found and that fetched products are forgotten."""
+        record_failure(1, "HTTPError")
+        record_failure(2, "HTTPError")
+        WebhallenProductRetry.objects.filter(product_id=1).update(
+            next_attempt_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+        assert [retry.product_id for retry in due_retries()] == [1]
+
+        assert clear_retries([1, 3]) == 1
+        assert list(WebhallenProductRetry.objects.values_list("product_id", flat=True)) == [2]
+
+    def test_write_products_clears_retries(self: ProductRetryTests) -> None:
+        """Test that a batch of scraped products is written at once and their failures are forgotten."""
+        record_failure(1, "HTTPError")
+        record_failure(3, "HTTPError")
+        writer = ProductWriter()
+        writer.add(1, {"product": {"name": "One"}})
+        writer.add(2, {"product": {"name": "Two"}})
+
+        tasks.write_products(writer)
+        assert not len(writer)
+        assert writer.written == 2
+        assert list(WebhallenProductRetry.objects.values_list("product_id", flat=True)) == [3]
+
+    def test_fetch_failure_schedules_retry(self: ProductRetryTests) -> None:
+        """Test that a failed fetch is scheduled with an ETA instead of retried in the worker."""
+        error = httpx.ReadTimeout("slow")
+        with (
+            mock.patch.object(tasks, "scrape_product", side_effect=error),
+            mock.patch.object(tasks.fetch_webhallen_product, "apply_async") as apply_async,
+        ):
+            assert tasks.fetch_webhallen_product(1) is False
+
+        retry: WebhallenProductRetry = WebhallenProductRetry.objects.get(product_id=1)
+        apply_async.assert_called_once_with(args=(1,), kwargs={"attempt": 1}, eta=retry.next_attempt_at)
+
+        # The scheduled task succeeds and the retry is gone
+        WebhallenProductRetry.objects.filter(product_id=1).update(next_attempt_at=timezone.now())
+        with mock.patch.object(tasks, "scrape_product", return_value={"product": {"name": "One"}}):
+            assert tasks.fetch_webhallen_product(1, attempt=1) is True
+        assert not WebhallenProductRetry.objects.exists()
+        assert WebhallenJSON.objects.filter(product_id=1).exists()
+
+
+class SitemapIngestTests(TestCase):
+    """Tests for making the Sitemap* models match a sitemap."""
+
+    def test_added_changed_and_removed(self: SitemapIngestTests) -> None:
+        """Test that a second run only touches the URLs that changed."""
+        entries: list[SitemapEntry] = [
+            SitemapEntry(loc=f"https://www.webhallen.com/se/product/{i}-Product", priority=0.5) for i in range(5)
+        ]
+        first: SitemapDiff = save_sitemap_entries(SitemapProduct, iter(entries), chunk_size=2)
+        assert (first.total, first.added, first.changed, first.removed) == (5, 5, 0, 0)
+        assert SitemapProduct.objects.filter(priority=0.5, active=True).count() == 5
+        assert SitemapProduct.history.filter(history_type="+").count() == 5
+
+        # Product 0 changes priority, product 4 is delisted and product 5 is new. Product 1 is listed twice.
+        entries = [
+            SitemapEntry(loc="https://www.webhallen.com/se/product/0-Product", priority=0.9),
+            *entries[1:4],
+            entries[1],
+            SitemapEntry(loc="https://www.webhallen.com/se/product/5-Product", priority=0.5),
+        ]
+        second: SitemapDiff = save_sitemap_entries(SitemapProduct, entries)
+        assert (second.total, second.added, second.changed, second.removed) == (5, 1, 1, 1)
+        assert second.unchanged == 3
+        assert SitemapProduct.objects.get(loc="https://www.webhallen.com/se/product/0-Product").priority == 0.9
+        assert SitemapProduct.objects.get(loc="https://www.webhallen.com/se/product/4-Product").active is False
+        assert SitemapProduct.history.filter(history_type="~").count() == 2
+
+    def test_empty_sitemap_removes_nothing(self: SitemapIngestTests) -> None:
+        """Test that an empty sitemap doesn't mark every URL as removed."""
+        save_sitemap_entries(SitemapProduct, [SitemapEntry(loc="https://www.webhallen.com/se/product/1-A")])
+        diff: SitemapDiff = save_sitemap_entries(SitemapProduct, [])
+        assert diff.removed == 0
+        assert SitemapProduct.objects.get().active is True
+
+    def test_root_sitemap_can_be_loaded_twice(self: SitemapIngestTests) -> None:
+        """Test that SitemapRoot, which has no priority, can be loaded again without conflicts."""
+        entries: list[SitemapEntry] = [SitemapEntry(loc="https://www.webhallen.com/sitemap.home.xml")]
+        assert save_sitemap_entries(SitemapRoot, entries).added == 1
+        again: SitemapDiff = save_sitemap_entries(SitemapRoot, entries)
+        assert (again.added, again.changed, again.removed) == (0, 0, 0)
+        assert SitemapRoot.objects.get().active is True
+
+    def test_unchanged_sitemap_keeps_etag(self: SitemapIngestTests) -> None:
+        """Test that loading a sitemap that didn't change doesn't give its API endpoint a new ETag."""
+        entries: list[SitemapEntry] = [SitemapEntry(loc="https://www.webhallen.com/se/section/8-Datorkomponenter")]
+        save_sitemap_entries(SitemapSection, entries)
+        etag: str = self.client.get("/api/v1/webhallen/sitemaps/sections")["ETag"]
+
+        save_sitemap_entries(SitemapSection, entries)
+        response: HttpResponse = self.client.get("/api/v1/webhallen/sitemaps/sections", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+        save_sitemap_entries(SitemapSection, [])
+        save_sitemap_entries(SitemapSection, [SitemapEntry(loc="https://www.webhallen.com/se/section/18-Fyndvaror")])
+        response = self.client.get("/api/v1/webhallen/sitemaps/sections", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_ingest_sitemaps_concurrently(self: SitemapIngestTests) -> None:
+        """Test that every sitemap is loaded and that a broken one doesn't stop the others."""
+        sitemaps: dict[str, bytes] = {
+            "/sitemap.product.xml": b"<urlset><url><loc>https://www.webhallen.com/se/product/1-A</loc></url></urlset>",
+            "/sitemap.xml": b"<sitemapindex><sitemap><loc>https://www.webhallen.com/sitemap.product.xml</loc>"
+            b"</sitemap></sitemapindex>",
+        }
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path not in sitemaps:
+                return httpx.Response(404)
+            return httpx.Response(200, content=sitemaps[request.url.path])
+
+        client = ScrapingClient(collector=ScrapeMetrics(), transport=httpx.MockTransport(handler))
+        with client:
+            diffs: dict[str, SitemapDiff] = ingest_sitemaps(
+                [
+                    ("https://www.webhallen.com/sitemap.product.xml", SitemapProduct),
+                    ("https://www.webhallen.com/sitemap.home.xml", SitemapHome),
+                    ("https://www.webhallen.com/sitemap.xml", SitemapRoot),
+                ],
+                client=client,
+            )
+
+        assert set(diffs) == {"sitemap.product.xml", "sitemap.xml"}
+        assert diffs["sitemap.product.xml"].added == 1
+        assert diffs["sitemap.product.xml"].fetch_seconds > 0
+        assert SitemapRoot.objects.filter(loc="https://www.webhallen.com/sitemap.product.xml").exists()
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class SectionIndexTests(TestCase):
+    """Tests for the section ID to URL index."""
+
+    def setUp(self: SectionIndexTests) -> None:
+        cache.clear()
+        save_sitemap_entries(
+            SitemapSection,
+            [
+                SitemapEntry("https://www.webhallen.com/se/section/8-Datorkomponenter"),
+                SitemapEntry("https://www.webhallen.com/se/section/18-Fyndvaror"),
+                SitemapEntry("https://www.webhallen.com/se/campaign/1-Not-A-Section"),
+            ],
+        )
+
+    def test_build_section_index(self: SectionIndexTests) -> None:
+        """Test that section IDs are parsed from the sitemap and that Presentkort gets its fallback."""
+        index: dict[int, str] = build_section_index()
+        assert index[8] == "https://www.webhallen.com/se/section/8-Datorkomponenter"
+        assert index[18] == "https://www.webhallen.com/se/section/18-Fyndvaror"
+        assert index[19] == "https://www.webhallen.com/se/info/28-Kop-presentkort"
+        assert len(index) == 3
+
+    def test_index_follows_sitemap_version(self: SectionIndexTests) -> None:
+        """Test that the cached index is reused until the section sitemap changes."""
+        version: str | None = models_version(SitemapSection)
+        assert version is not None
+        assert 8 in get_section_index()
+
+        # Unchanged sitemap, same version and the cached index
+        save_sitemap_entries(
+            SitemapSection,
+            [
+                SitemapEntry("https://www.webhallen.com/se/section/8-Datorkomponenter"),
+                SitemapEntry("https://www.webhallen.com/se/section/18-Fyndvaror"),
+                SitemapEntry("https://www.webhallen.com/se/campaign/1-Not-A-Section"),
+            ],
+        )
+        assert models_version(SitemapSection) == version
+        with self.assertNumQueries(1):
+            # Only the version, the index comes from the cache
+            get_section_index()
+
+        save_sitemap_entries(SitemapSection, [SitemapEntry("https://www.webhallen.com/se/section/18-Fyndvaror")])
+        assert models_version(SitemapSection) != version
+        assert 8 not in get_section_index()
+
+    def test_create_sections(self: SectionIndexTests) -> None:
+        """Test that create_sections gets the section URL from the section sitemap."""
+        WebhallenJSON.objects.create(
+            product_id=1,
+            product_json={"product": {"section": {"id": 8, "name": "Datorkomponenter", "icon": "datorkomponenter"}}},
+        )
+        tasks.create_sections()
+        section: WebhallenSection = WebhallenSection.objects.get(section_id=8)
+        assert section.url == "https://www.webhallen.com/se/section/8-Datorkomponenter"
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class DeriveSectionsTests(TestCase):
+    """Tests for creating sections from the products that changed."""
+
+    def setUp(self: DeriveSectionsTests) -> None:
+        cache.clear()
+        section: dict = {"id": 8, "name": "Datorkomponenter", "icon": "datorkomponenter", "active": True}
+        WebhallenJSON.objects.create(product_id=1, product_json={"product": {"section": section}})
+        WebhallenJSON.objects.create(product_id=2, product_json={"product": {"section": section}})
+        WebhallenJSON.objects.create(product_id=3, product_json={"product": {"name": "No section"}})
+
+    def test_first_run_creates_sections(self: DeriveSectionsTests) -> None:
+        """Test that every section is created once, with its icon URL, and that the watermark is saved."""
+        changes: SectionChanges = derive_sections()
+        assert changes == SectionChanges(scanned=3, created=1, changed=0)
+
+        section: WebhallenSection = WebhallenSection.objects.get(section_id=8)
+        assert section.name == "Datorkomponenter"
+        assert section.active is True
+        assert section.icon_url == "https://cdn.webhallen.com/api/dynimg/category/datorkomponenter/1A1A1D"
+        assert section.history.count() == 1
+
+        newest = WebhallenJSON.objects.latest("updated").updated
+        assert WebhallenWatermark.objects.get(name="sections").watermark == newest
+
+    def test_only_changed_products_are_read(self: DeriveSectionsTests) -> None:
+        """Test that products from before the watermark are skipped and that changed sections are updated."""
+        derive_sections()
+        WebhallenJSON.objects.update(updated=timezone.now() - datetime.timedelta(days=1))
+        WebhallenWatermark.objects.update(watermark=timezone.now() - datetime.timedelta(hours=1))
+
+        # The section sitemap version, SAVEPOINT, the statement and RELEASE SAVEPOINT. The section index comes
+        # from the cache.
+        with self.assertNumQueries(4):
+            assert derive_sections() == SectionChanges(scanned=0, created=0, changed=0)
+
+        renamed: dict = {"id": 8, "name": "Komponenter", "icon": "datorkomponenter", "active": True}
+        product: WebhallenJSON = WebhallenJSON.objects.get(product_id=2)
+        product.product_json = {"product": {"section": renamed}}
+        product.save()
+
+        assert derive_sections() == SectionChanges(scanned=1, created=0, changed=1)
+        assert WebhallenSection.objects.get(section_id=8).name == "Komponenter"
+        assert derive_sections(full=True) == SectionChanges(scanned=3, created=0, changed=0)
+
+
+class ProductConversionTests(TestCase):
+    """Tests for converting WebhallenJSON to WebhallenProduct."""
+
+    product: typing.ClassVar[dict] = {
+        "id": 1,
+        "name": "Grafikkort",
+        "price": {"price": "1990.00", "vat": 398, "type": None, "endAt": "2024-02-22T01:13:46", "nearlyOver": False},
+        "regularPrice": {"price": "2490.00", "type": "regular"},
+        "section": {"id": 8},
+        "manufacturer": {"id": 42},
+        "eans": ["4711081774585", "4711081774592"],
+        "images": [{"zoom": "/images/1/zoom", "thumb": "/images/1/thumb"}],
+        "discontinued": False,
+        "averageRating": {"rating": 4.5, "type": "webhallen"},
+        "reviewHighlight": {"id": 7, "isAnonymous": True, "rating": 5, "product": {"id": 1}},
+    }
+
+    def setUp(self: ProductConversionTests) -> None:
+        WebhallenJSON.objects.create(product_id=1, product_json={"product": self.product})
+        WebhallenJSON.objects.create(product_id=2, product_json={"product": {**self.product, "id": 2, "price": {}}})
+        WebhallenJSON.objects.create(product_id=3, product_json={"error": "Not found"})
+
+    def test_product_row_matches_columns(self: ProductConversionTests) -> None:
+        """Test that a row has a value for every column and every column is a field of the model."""
+        row: tuple | None = product_row(1, {"product": self.product}, timezone.now())
+        assert row is not None
+        assert len(row) == len(PRODUCT_COLUMNS)
+
+        fields: set[str] = {field.column for field in WebhallenProduct._meta.concrete_fields}  # noqa: SLF001
+        assert fields - set(PRODUCT_COLUMNS) == {"created", "updated"}
+        assert product_row(3, {"error": "Not found"}, timezone.now()) is None
+
+    def test_write_webhallen_snapshot(self: ProductConversionTests) -> None:
+        """Test that the snapshot task converts the products and writes them as JSON, NDJSON and CSV."""
+        with tempfile.TemporaryDirectory() as tmp, override_settings(SNAPSHOT_DIR=Path(tmp)):
+            manifest: dict = tasks.write_webhallen_snapshot()
+            assert set(manifest["formats"]) == {"json", "ndjson", "csv"}
+
+            directory: Path = Path(tmp) / PRODUCTS_SNAPSHOT / manifest["version"]
+            products: list[dict] = orjson.loads((directory / f"{PRODUCTS_SNAPSHOT}.json").read_bytes())
+            assert sorted(product["id"] for product in products) == [1, 2]
+
+            rows: list[list[str]] = list(csv.reader((directory / f"{PRODUCTS_SNAPSHOT}.csv").open(encoding="utf-8")))
+            assert rows[0] == list(PRODUCT_COLUMNS)
+            assert [row[:2] for row in rows[1:]] == [["1", "Grafikkort"], ["2", "Grafikkort"]]
+
+    def test_plan_ranges(self: ProductConversionTests) -> None:
+        """Test that the ranges cover every product once."""
+        assert plan_ranges(range_size=2) == [(None, 2), (2, 3)]
+        assert plan_ranges(range_size=10) == [(None, 3)]
+        assert plan_ranges(since=timezone.now() + datetime.timedelta(days=1)) == []
+
+    def test_convert_products(self: ProductConversionTests) -> None:
+        """Test that the products are converted to typed columns and that unchanged products are not rewritten."""
+        stats: ConversionStats = convert_products(range_size=2)
+        assert (stats.read, stats.created, stats.changed, stats.invalid, stats.ranges) == (3, 2, 0, 1, 2)
+
+        product: WebhallenProduct = WebhallenProduct.objects.get(product_id=1)
+        assert product.name == "Grafikkort"
+        assert product.price == Decimal("1990.00")
+        assert product.vat == Decimal(398)
+        assert product.regular_price == Decimal("2490.00")
+        assert product.price_end_at == datetime.datetime(2024, 2, 22, 1, 13, 46).astimezone(tz=datetime.UTC)
+        assert product.section_id == 8
+        assert product.manufacturer == 42
+        assert product.eans == "4711081774585,4711081774592"
+        assert product.images_zoom == "https://www.webhallen.com/images/1/zoom"
+        assert product.images_large is None
+        assert product.discontinued is False
+        assert product.average_rating == 4.5
+        assert product.highlighted_review_user_id == "Anonymous"
+        assert WebhallenProduct.objects.get(product_id=2).price is None
+
+        # Nothing changed since the watermark
+        WebhallenJSON.objects.update(updated=timezone.now() - datetime.timedelta(days=1))
+        WebhallenWatermark.objects.update(watermark=timezone.now() - datetime.timedelta(hours=1))
+        assert convert_products().read == 0
+        stats = convert_products(full=True)
+        assert (stats.read, stats.created, stats.changed) == (3, 0, 0)
+
+    def test_convert_changed_products_since(self: ProductConversionTests) -> None:
+        """Test that --since only converts the products updated after it and leaves the watermark alone."""
+        convert_products()
+        watermark: datetime.datetime = WebhallenWatermark.objects.get(name="products").watermark
+        WebhallenJSON.objects.update(updated=timezone.now() - datetime.timedelta(days=2))
+
+        document: WebhallenJSON = WebhallenJSON.objects.get(product_id=2)
+        document.product_json = {"product": {**self.product, "id": 2, "name": "Ny"}}
+        document.save()
+
+        stats: ConversionStats = convert_products(since=timezone.now() - datetime.timedelta(days=1))
+        assert (stats.read, stats.created, stats.changed) == (1, 0, 1)
+        assert WebhallenProduct.objects.get(product_id=2).name == "Ny"
+        assert WebhallenWatermark.objects.get(name="products").watermark == watermark
+
+
+class ProductFilterTests(TestCase):
+    """Tests for filtering and sorting /api/v1/webhallen/products."""
+
+    def setUp(self: ProductFilterTests) -> None:
+        products: list[dict] = [
+            {"id": 1, "name": "Grafikkort RTX 4070", "price": {"price": "6990.00"}, "section": {"id": 8}},
+            {"id": 2, "name": "Grafikkort RTX 4090", "price": {"price": "21990.00"}, "section": {"id": 8}},
+            {"id": 3, "name": "Tangentbord", "price": {"price": "990.00"}, "section": {"id": 3}, "discontinued": True},
+            {"id": 4, "name": "Mus", "price": {"price": "not a price"}, "manufacturer": {"id": 42}},
+        ]
+        for product in products:
+            WebhallenJSON.objects.create(product_id=product["id"], product_json={"product": product})
+
+    def get_ids(self: ProductFilterTests, query: str) -> list[int]:
+        response: HttpResponse = self.client.get(f"/api/v1/webhallen/products?{query}")
+        assert response.status_code == 200
+        content: bytes = b"".join(response.streaming_content) if response.streaming else response.content
+        return [product["id"] for product in orjson.loads(content)]
+
+    def test_without_filters_returns_everything(self: ProductFilterTests) -> None:
+        """Test that the endpoint still returns every product when nothing is asked for."""
+        assert sorted(self.get_ids("")) == [1, 2, 3, 4]
+
+    def test_filters(self: ProductFilterTests) -> None:
+        """Test every filter on its own."""
+        assert self.get_ids("section=8") == [2, 1]
+        assert self.get_ids("manufacturer=42") == [4]
+        assert self.get_ids("min_price=1000&max_price=7000") == [1]
+        assert self.get_ids("discontinued=true") == [3]
+        assert self.get_ids("q=grafikkort") == [2, 1]
+
+    def test_sort_and_limit(self: ProductFilterTests) -> None:
+        """Test that sorting by price leaves out products without a price and that limit is applied."""
+        assert self.get_ids("sort=price") == [3, 1, 2]
+        assert self.get_ids("sort=-price&limit=2") == [2, 1]
+        assert self.get_ids("sort=product_id&section=8") == [1, 2]
+
+    def test_pages(self: ProductFilterTests) -> None:
+        """Test that the products can be paged through by following the Link header, in either direction."""
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products?limit=3")
+        assert [product["id"] for product in response.json()] == [4, 3, 2]
+        assert response["Link"] == '<http://testserver/api/v1/webhallen/products?limit=3&after=2>; rel="next"'
+        assert self.get_ids("limit=3&after=2") == [1]
+        assert self.get_ids("sort=product_id&after=2") == [3, 4]
+        assert self.client.get("/api/v1/webhallen/products?sort=price&after=2").status_code == 400
+
+    def test_fields(self: ProductFilterTests) -> None:
+        """Test that only the JSON paths that were asked for are returned, with the id."""
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products?fields=name,price.price,nope&section=8")
+        assert response.json() == [
+            {"id": 2, "name": "Grafikkort RTX 4090", "price": {"price": "21990.00"}, "nope": None},
+            {"id": 1, "name": "Grafikkort RTX 4070", "price": {"price": "6990.00"}, "nope": None},
+        ]
+        assert self.client.get("/api/v1/webhallen/products?fields=price,price.price").status_code == 400
+        assert self.client.get("/api/v1/webhallen/products?fields=price..price").status_code == 400
+
+    def test_sitemap_pages(self: ProductFilterTests) -> None:
+        """Test that the sitemap endpoints can be paged through by URL."""
+        for loc in ("https://www.webhallen.com/b", "https://www.webhallen.com/a"):
+            SitemapHome.objects.create(loc=loc)
+
+        response: HttpResponse = self.client.get("/api/v1/webhallen/sitemaps/home?limit=1&fields=loc")
+        assert response.json() == [{"loc": "https://www.webhallen.com/a"}]
+        assert "after=https%3A%2F%2Fwww.webhallen.com%2Fa" in response["Link"]
+
+    def test_relevance_needs_search(self: ProductFilterTests) -> None:
+        """Test that sorting by relevance without a search is an error."""
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products?sort=relevance")
+        assert response.status_code == 400
+        assert self.client.get("/api/v1/webhallen/products?limit=5000").status_code == 422
+
+
+class PriceHistoryTests(TestCase):
+    """Tests for the price and stock history."""
+
+    def write(self: PriceHistoryTests, name: str, price: str, stock: dict | None = None) -> None:
+        product: dict = {"id": 1, "name": name, "price": {"price": price}, "stock": stock or {"web": 5, "1": 2}}
+        ProductWriter(batch_size=1).write({1: {"product": product}})
+
+    def test_points_are_added_when_price_or_stock_changes(self: PriceHistoryTests) -> None:
+        """Test that a point is only added when the price or the stock changed."""
+        self.write("Mus", "199.00")
+        self.write("Mus med kabel", "199.00")
+        self.write("Mus med kabel", "149.00")
+        self.write("Mus med kabel", "149.00", stock={"web": 0, "1": 2, "2": 3, "supplier": 10})
+
+        points: list[WebhallenPricePoint] = list(WebhallenPricePoint.objects.filter(product_id=1))
+        assert [point.price for point in points] == [Decimal("199.00"), Decimal("149.00"), Decimal("149.00")]
+        assert (points[-1].stock_web, points[-1].stock_stores, points[-1].stock_supplier) == (0, 5, 10)
+        assert points[0].stock_stores == 2
+
+    def test_backfill_from_history(self: PriceHistoryTests) -> None:
+        """Test that the history is turned into points once, without the versions where the price didn't change."""
+        self.write("Mus", "199.00")
+        self.write("Mus med kabel", "199.00")
+        self.write("Mus med kabel", "149.00")
+        WebhallenPricePoint.objects.all().delete()
+
+        assert backfill_prices(0, 10) == 2
+        assert backfill_prices(0, 10) == 0
+        assert list(WebhallenPricePoint.objects.values_list("price", flat=True)) == [
+            Decimal("199.00"),
+            Decimal("149.00"),
+        ]
+
+    def test_price_history_endpoint(self: PriceHistoryTests) -> None:
+        """Test that the endpoint returns the period and the point that was current when it started."""
+        now: datetime.datetime = timezone.now()
+        WebhallenPricePoint.objects.create(product_id=1, recorded_at=now - datetime.timedelta(days=800), price=300)
+        WebhallenPricePoint.objects.create(product_id=1, recorded_at=now - datetime.timedelta(days=400), price=250)
+        WebhallenPricePoint.objects.create(product_id=1, recorded_at=now - datetime.timedelta(days=10), price=200)
+
+        assert [point["price"] for point in price_history(1)] == [Decimal(250), Decimal(200)]
+
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products/1/prices?days=30")
+        assert response.status_code == 200
+        assert [point["price"] for point in response.json()["prices"]] == ["250.00", "200.00"]
+        assert self.client.get("/api/v1/webhallen/products/2/prices").json() == {"product_id": 2, "prices": []}
+
+
+class DeltaTests(SimpleTestCase):
+    """Tests for the JSON Patch deltas."""
+
+    def test_patch_round_trip(self: DeltaTests) -> None:
+        """Test that applying a patch turns the old document into the new one without changing the old one."""
+        source: dict = {"product": {"id": 1, "price": {"price": "199.00"}, "a/b": 1, "tags": [1, 2], "old": True}}
+        target: dict = {"product": {"id": 1, "price": {"price": "149.00"}, "a/b": 2, "tags": [1, 2, 3], "new": 1}}
+
+        patch: list[dict] = make_patch(source, target)
+        assert apply_patch(source, patch) == target
+        assert source["product"]["price"]["price"] == "199.00"
+        assert {"op": "replace", "path": "/product/price/price", "value": "149.00"} in patch
+        assert {"op": "replace", "path": "/product/a~1b", "value": 2} in patch
+        assert make_patch(target, target) == []
+
+    def test_values_are_compared_with_their_type(self: DeltaTests) -> None:
+        """Test that 1 and true are different values, like they are in JSON."""
+        assert make_patch({"a": 1}, {"a": True}) == [{"op": "replace", "path": "/a", "value": True}]
+        assert apply_patch([1], [{"op": "replace", "path": "", "value": {"b": 2}}]) == {"b": 2}
+
+
+@override_settings(WEBHALLEN_HISTORY_MODE="delta", WEBHALLEN_HISTORY_SNAPSHOT_INTERVAL=3)
+class RevisionTests(TestCase):
+    """Tests for the delta-encoded product history."""
+
+    def version(self: RevisionTests, number: int) -> dict:
+        description: str = "En mus med kabel. " * 20
+        return {"product": {"id": 1, "description": description, "price": {"price": f"{100 + number}.00"}}}
+
+    def test_writer_stores_snapshots_and_patches(self: RevisionTests) -> None:
+        """Test that every version can be rebuilt and that there is a snapshot every third version."""
+        for number in range(5):
+            ProductWriter(batch_size=1).write({1: self.version(number)})
+
+        revisions: list[WebhallenJSONRevision] = list(WebhallenJSONRevision.objects.filter(product_id=1))
+        assert [revision.depth for revision in revisions] == [0, 1, 2, 0, 1]
+        assert [revision.history_type for revision in revisions] == ["+", "~", "~", "~", "~"]
+        assert not WebhallenJSON.history.exists()
+        for number, revision in enumerate(revisions):
+            assert reconstruct(1, revision_id=revision.id) == self.version(number)
+        assert reconstruct(1) == self.version(4)
+        assert reconstruct(1, at=revisions[1].recorded_at) == self.version(1)
+        assert reconstruct(2) is None
+
+    def test_snapshot_when_chain_is_broken(self: RevisionTests) -> None:
+        """Test that a version saved outside the writer makes the next revision a snapshot."""
+        ProductWriter(batch_size=1).write({1: self.version(0)})
+        WebhallenJSON.objects.filter(product_id=1).update(product_json=self.version(1), content_hash=None)
+        ProductWriter(batch_size=1).write({1: self.version(2)})
+
+        assert list(WebhallenJSONRevision.objects.values_list("depth", flat=True)) == [0, 0]
+        assert reconstruct(1) == self.version(2)
+
+    def test_compact_history(self: RevisionTests) -> None:
+        """Test that full copies are moved into revisions once and can be rebuilt."""
+        with override_settings(WEBHALLEN_HISTORY_MODE="full"):
+            for number in range(4):
+                ProductWriter(batch_size=1).write({1: self.version(number)})
+        ProductWriter(batch_size=1).write({1: self.version(4)})
+
+        stats = compact_history(0, 10)
+        assert (stats.products, stats.versions, stats.snapshots) == (1, 4, 2)
+        assert stats.compacted_bytes < stats.original_bytes
+        assert not WebhallenJSON.history.exists()
+        assert compact_history(0, 10).versions == 0
+
+        # The write in delta mode had no revision to continue from, so it is a snapshot
+        revisions: list[WebhallenJSONRevision] = list(WebhallenJSONRevision.objects.filter(product_id=1))
+        assert [revision.depth for revision in revisions] == [0, 1, 2, 0, 0]
+        assert [reconstruct(1, revision_id=revision.id) for revision in revisions] == [
+            self.version(number) for number in range(5)
+        ]
+
+    def test_revision_endpoints(self: RevisionTests) -> None:
+        """Test that the revisions are listed and can be fetched as JSON."""
+        ProductWriter(batch_size=1).write({1: self.version(0)})
+        ProductWriter(batch_size=1).write({1: self.version(1)})
+
+        response: HttpResponse = self.client.get("/api/v1/webhallen/products/1/revisions")
+        assert response.status_code == 200
+        revisions: list[dict] = response.json()["revisions"]
+        assert [revision["depth"] for revision in revisions] == [0, 1]
+
+        response = self.client.get(f"/api/v1/webhallen/products/1/revisions/{revisions[1]['id']}")
+        assert response.json() == self.version(1)
+        assert self.client.get(f"/api/v1/webhallen/products/2/revisions/{revisions[1]['id']}").status_code == 404
@@ -13,9 +13,11 @@ from cacheops import cached_view
 from django.http import HttpRequest, HttpResponse
 from django.template import Template, loader
 
+from products.versions import conditional_as
 from webhallen.models import WebhallenSection
 
 
+@conditional_as(WebhallenSection)
 @cached_view
 def index(request: HttpRequest) -> HttpResponse:
     """/webhallen/ index page.
@@ -0,0 +1,50 @@
+"""SQL for derivations that only read the WebhallenJSON rows updated since their last run.
+
+A derivation is one statement with a `changed` CTE that selects the products where `updated > (SINCE_SQL)`, and
+ADVANCE_WATERMARK_SQL as a CTE that moves the derivation's watermark to the newest `updated` it read:
+
+    WITH changed AS (
+        SELECT j.product_json, j.updated FROM webhallen_json j WHERE j.updated > ({SINCE_SQL})
+    ), ..., watermark AS ({ADVANCE_WATERMARK_SQL})
+    SELECT ...
+
+Run it with the parameters from watermark_params(). See WebhallenWatermark.
+"""
+
+from __future__ import annotations
+
+import datetime
+
+# Products are also read again if they were updated this long before the watermark. A transaction that started
+# before our last run but committed after it has an `updated` that is older than the watermark.
+WATERMARK_OVERLAP: datetime.timedelta = datetime.timedelta(minutes=10)
+
+# Products updated after this are read. Everything when %(full)s is true or the derivation has never run.
+SINCE_SQL: str = """
+CASE WHEN %(full)s THEN '-infinity'::timestamptz ELSE coalesce(
+    (SELECT watermark FROM webhallen_watermark WHERE name = %(name)s) - %(overlap)s,
+    '-infinity'::timestamptz
+) END
+"""
+
+# Move the watermark to the newest product in `changed`. It never moves backwards.
+ADVANCE_WATERMARK_SQL: str = """
+INSERT INTO webhallen_watermark (name, watermark, updated)
+SELECT %(name)s, max(updated), now() FROM changed HAVING max(updated) IS NOT NULL
+ON CONFLICT (name) DO UPDATE SET
+    watermark = greatest(webhallen_watermark.watermark, excluded.watermark),
+    updated = now()
+"""
+
+
+def watermark_params(name: str, *, full: bool = False) -> dict[str, object]:
+    """Return the query parameters SINCE_SQL and ADVANCE_WATERMARK_SQL need.
+
+    Args:
+        name: Name of the derivation, e.g. sections.
+        full: Read every product, not only the ones updated since the watermark.
+
+    Returns:
+        dict[str, object]: The parameters.
+    """
+    return {"name": name, "full": full, "overlap": WATERMARK_OVERLAP}
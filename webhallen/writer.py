@@ -0,0 +1,164 @@
+"""Buffered database writer for scraped Webhallen products.
+
+The crawler hands every product it fetches to a ProductWriter instead of saving it straight away.
+The writer keeps the products in memory until it has a full batch, or until the flush interval has passed,
+and then writes the batch with one INSERT ... ON CONFLICT DO UPDATE and one INSERT for the history rows.
+
+Products whose fingerprint matches the one we already have are skipped, so an unchanged product costs
+no UPDATE, no history row and no cacheops invalidation. Written products whose price or stock changed also
+get a WebhallenPricePoint, see webhallen/prices.py.
+
+With WEBHALLEN_HISTORY_MODE set to "delta", the history is written as revisions, see webhallen/revisions.py,
+instead of full copies in webhallen_history.
+
+Batch size and flush interval default to WEBHALLEN_WRITER_BATCH_SIZE and WEBHALLEN_WRITER_FLUSH_INTERVAL
+in settings.py.
+"""
+
+from __future__ import annotations
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+from rich import print
+
+from webhallen.fingerprint import product_fingerprint
+from webhallen.models import WebhallenJSON
+from webhallen.prices import record_prices
+from webhallen.revisions import delta_history_enabled, record_revisions
+
+
+class ProductWriter:
+    """Collect scraped products and write them to the database in batches.
+
+    Args:
+        batch_size: How many products we buffer before the batch is considered full.
+        flush_interval: Seconds after which we write whatever we have, even if the batch isn't full.
+    """
+
+    def __init__(self: ProductWriter, batch_size: int | None = None, flush_interval: float | None = None) -> None:
+        """Create an empty writer."""
+        self.batch_size: int = batch_size or settings.WEBHALLEN_WRITER_BATCH_SIZE
+        self.flush_interval: float = flush_interval or settings.WEBHALLEN_WRITER_FLUSH_INTERVAL
+        self.written: int = 0
+        self.skipped: int = 0
+        self.write_seconds: float = 0.0
+        self._buffer: dict[int, dict] = {}
+        self._last_flush: float = time.monotonic()
+
+    def __len__(self: ProductWriter) -> int:
+        """Number of products waiting to be written."""
+        return len(self._buffer)
+
+    @property
+    def full(self: ProductWriter) -> bool:
+        """If we have enough products buffered to write a batch."""
+        return len(self._buffer) >= self.batch_size
+
+    @property
+    def should_flush(self: ProductWriter) -> bool:
+        """If the batch is full or the buffered products have waited longer than the flush interval."""
+        waited: float = time.monotonic() - self._last_flush
+        return self.full or (bool(self._buffer) and waited >= self.flush_interval)
+
+    @property
+    def rows_per_second(self: ProductWriter) -> float:
+        """How many products per second we have written, counting only the time spent writing."""
+        return self.written / self.write_seconds if self.write_seconds else 0.0
+
+    def add(self: ProductWriter, product_id: int, product_json: dict) -> None:
+        """Add a scraped product to the buffer.
+
+        Args:
+            product_id: The product ID.
+            product_json: The JSON from the Webhallen API, including our metadata.
+        """
+        self._buffer[product_id] = product_json
+
+    def drain(self: ProductWriter) -> dict[int, dict]:
+        """Take everything out of the buffer.
+
+        This is separate from write() so the crawler can empty the buffer in the event loop
+        and hand the batch to a thread without other coroutines adding to it while it is written.
+
+        Returns:
+            The buffered products, keyed by product ID.
+        """
+        batch, self._buffer = self._buffer, {}
+        self._last_flush = time.monotonic()
+        return batch
+
+    def write(self: ProductWriter, batch: dict[int, dict]) -> int:
+        """Write a batch of products to the database.
+
+        New and changed products are upserted in one statement and their history rows and
+        price points are created in bulk, so the number of round-trips doesn't grow with the batch size.
+
+        Args:
+            batch: Products keyed by product ID. Usually from drain().
+
+        Returns:
+            How many products were written. Unchanged products are not counted.
+        """
+        if not batch:
+            return 0
+
+        started: float = time.perf_counter()
+        fingerprints: dict[int, str] = {
+            product_id: product_fingerprint(product_json) for product_id, product_json in batch.items()
+        }
+        stored: dict[int, str | None] = dict(
+            WebhallenJSON.objects.nocache()
+            .filter(product_id__in=list(batch))
+            .values_list("product_id", "content_hash"),
+        )
+        products: list[WebhallenJSON] = [
+            WebhallenJSON(product_id=product_id, product_json=product_json, content_hash=fingerprints[product_id])
+            for product_id, product_json in batch.items()
+            if stored.get(product_id) != fingerprints[product_id]
+        ]
+        self.skipped += len(batch) - len(products)
+
+        if products:
+            created: list[WebhallenJSON] = [product for product in products if product.product_id not in stored]
+            changed: list[WebhallenJSON] = [product for product in products if product.product_id in stored]
+            delta: bool = delta_history_enabled()
+            with transaction.atomic():
+                # A patch is made from the JSON we have now, so read it before it is overwritten
+                previous: dict[int, tuple[dict, str | None]] = {}
+                if delta and changed:
+                    previous = {
+                        product_id: (product_json, content_hash)
+                        for product_id, product_json, content_hash in WebhallenJSON.objects.nocache()
+                        .filter(product_id__in=[product.product_id for product in changed])
+                        .values_list("product_id", "product_json", "content_hash")
+                    }
+                WebhallenJSON.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=["product_id"],
+                    update_fields=["product_json", "content_hash", "updated"],
+                )
+                if delta:
+                    record_revisions(products, previous)
+                else:
+                    WebhallenJSON.history.bulk_history_create(created)
+                    WebhallenJSON.history.bulk_history_create(changed, update=True)
+                record_prices(product.product_id for product in products)
+
+        self.written += len(products)
+        self.write_seconds += time.perf_counter() - started
+        print(
+            f"Wrote {len(products)} products, {len(batch) - len(products)} unchanged "
+            f"({self.written} in total, {self.rows_per_second:.0f} rows/s)",
+        )
+        return len(products)
+
+    def flush(self: ProductWriter) -> int:
+        """Write everything that is buffered.
+
+        Returns:
+            How many products were written.
+        """
+        return self.write(self.drain())